@@ -14,6 +14,7 @@ class TTSProsody(object):
         self.input_names = self.net.get_input_names(self.graph_name)
         self.output_names = self.net.get_output_names(self.graph_name)
         self.input_shape = self.net.get_input_shape(self.graph_name, self.input_names[0])
+        self.batch_size = self.input_shape[0]
         self.max_length = self.input_shape[1]
 
         self.tokenizer = BertTokenizer.from_pretrained(bert_dir)
@@ -44,6 +45,31 @@ class TTSProsody(object):
 
         return char_embeds
 
+    def get_char_embeds_batch(self, texts):
+        """
+        Run BERT over several texts, packing up to `batch_size` texts into one call,
+        padded to the longest text of the call. Returns one [n_tokens, hidden] array per text.
+        """
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [self.text2Token(text) for text in texts[start:start + self.batch_size]]
+            seq_len = max(len(input_ids) for input_ids in batch)
+            assert seq_len <= self.max_length
+            input_ids_array = np.zeros((len(batch), seq_len), dtype=np.int32)
+            input_masks_array = np.zeros((len(batch), seq_len), dtype=np.int32)
+            type_ids_array = np.zeros((len(batch), seq_len), dtype=np.int32)
+            for i, input_ids in enumerate(batch):
+                input_ids_array[i, :len(input_ids)] = input_ids
+                input_masks_array[i, :len(input_ids)] = 1
+
+            input_data = {self.input_names[0]: input_ids_array,
+                          self.input_names[1]: input_masks_array,
+                          self.input_names[2]: type_ids_array}
+            output_data = self.net.process(self.graph_name, input_data)
+            char_embeds = output_data[self.output_names[0]]
+            results.extend(char_embeds[i, :len(input_ids)] for i, input_ids in enumerate(batch))
+        return results
+
     def expand_for_phone(self, char_embeds: np.ndarray, length):  # length of phones for char
         assert char_embeds.shape[0] >= len(length)
 
@@ -0,0 +1,83 @@
+import threading
+import numpy as np
+
+
+class PCMBuffer:
+    """
+    Growable float32 buffer holding one utterance of 16-bit PCM audio.
+
+    int16 samples are converted straight into the preallocated storage, so the
+    VAD-clipped utterance can be handed to Whisper as a float32 array without
+    joining byte chunks, writing a wav file and decoding it again with ffmpeg.
+    """
+    def __init__(self, capacity=16000 * 30):
+        self.data = np.empty(capacity, dtype=np.float32)
+        self.size = 0
+
+    def _reserve(self, size):
+        if size <= self.data.shape[0]:
+            return
+        capacity = max(size, self.data.shape[0] * 2)
+        data = np.empty(capacity, dtype=np.float32)
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    def append(self, pcm):
+        """
+        Args:
+            pcm: int16 PCM bytes, or an int16/float32 numpy array
+        """
+        if isinstance(pcm, (bytes, bytearray, memoryview)):
+            pcm = np.frombuffer(pcm, dtype=np.int16)
+        n = pcm.shape[0]
+        self._reserve(self.size + n)
+        out = self.data[self.size:self.size + n]
+        if pcm.dtype == np.int16:
+            np.multiply(pcm, 1.0 / 32768, out=out, casting='unsafe')
+        else:
+            out[:] = pcm
+        self.size += n
+        return self
+
+    def load(self, pcm):
+        self.clear()
+        return self.append(pcm)
+
+    def view(self):
+        """float32 view of the buffered samples, valid until the next append/clear."""
+        return self.data[:self.size]
+
+    def clear(self):
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+
+class PCMBufferPool:
+    """
+    Per-session PCM buffers. Each session gets its own buffer, so concurrent
+    sessions never share audio storage, and released buffers are recycled
+    instead of being reallocated for every new session.
+    """
+    def __init__(self, capacity=16000 * 30):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.free_buffers = []
+
+    def get(self, session_id=0):
+        with self.lock:
+            buffer = self.buffers.get(session_id)
+            if buffer is None:
+                buffer = self.free_buffers.pop() if self.free_buffers else PCMBuffer(self.capacity)
+                buffer.clear()
+                self.buffers[session_id] = buffer
+            return buffer
+
+    def release(self, session_id=0):
+        with self.lock:
+            buffer = self.buffers.pop(session_id, None)
+            if buffer is not None:
+                buffer.clear()
+                self.free_buffers.append(buffer)
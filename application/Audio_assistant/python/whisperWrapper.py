@@ -427,15 +427,21 @@ class WhisperWrapper():
         self.loop_profile = self.args.pop("loop_profile")
 
 
-    def transcribe(self, audio_path):
+    def transcribe(self, audio):
+        """
+        audio: the path to the audio file, or a float32 waveform array in 16 kHz
+        """
         os.environ["LOG_LEVEL"] = "-1"
         os.environ["TOKENIZERS_PARALLELISM"] = "true"
         self.model.init_cnt()
         print()
         print("{:=^100}".format(f" Start "))
-        print(f"### audio_path: {os.path.basename(audio_path)}")
+        if isinstance(audio, str):
+            print(f"### audio_path: {os.path.basename(audio)}")
+        else:
+            print(f"### audio duration: {audio.shape[-1] / SAMPLE_RATE:.2f}s")
         audio_start_time = time.time()
-        result = transcribe(self.model, audio_path, temperature=self.temperature, **self.args)
+        result = transcribe(self.model, audio, temperature=self.temperature, **self.args)
         # self.writer(result, audio_path, self.writer_args)
         cpu_time = time.time() - audio_start_time - self.model.time
         if self.loop_profile:
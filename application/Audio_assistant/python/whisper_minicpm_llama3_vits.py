@@ -18,6 +18,9 @@ import wave
 from funasr import AutoModel
 import numpy as np
 import os
+import re
+import queue as queue_module
+import threading
 import multiprocessing
 
 # vits
@@ -30,6 +33,8 @@ logging.basicConfig(level=logging.INFO)
 from datetime import datetime
 
 import whisperWrapper
+from pcm_buffer import PCMBufferPool
+from frontend_cache import FrontEndCache
 import sys
 sys.path.append("./XTTS")
 from XTTS.api import TTS
@@ -267,7 +272,9 @@ class VITS:
         self.input_shape = self.net.get_input_shape(self.graph_name, self.input_names[0])
         self.max_length = self.input_shape[1]
 
-        self.tts_front = VITS_PinYin(args.bert_model, args.devid, hasBert=True)
+        self.tts_front = VITS_PinYin(args.bert_model, args.devid, hasBert=True,
+                                     cache_size=args.cache_size, cache_dir=args.cache_dir,
+                                     cache_disk_mb=args.cache_disk_mb)
         self.inference_time = 0.0
         self.sample_rate = 16000
         self.stage_factor = 900.0
@@ -344,14 +351,11 @@ class VITS:
 
         # Continue splitting the text until the remaining text is shorter than max_length
         while len(text) > max_length:
-            # Assume we need to split at the max_length, then search left for the nearest punctuation
-            split_pos = max_length
-            # Search left for the nearest punctuation
-            while split_pos > 0 and text[split_pos] not in punctuation:
-                split_pos -= 1
+            # Search left of max_length for the nearest punctuation, text[0] is never a split point
+            split_pos = max(text.rfind(p, 1, max_length + 1) for p in punctuation)
 
             # If no punctuation is found to the left, split at the original max_length
-            if split_pos == 0:
+            if split_pos <= 0:
                 split_pos = max_length
 
             # Split the text and add to the list
@@ -406,6 +410,130 @@ class VITS:
 
 
 
+class ClauseSplitter:
+    """
+    Cut the text streamed by the LLM into clauses that can be synthesized on their own.
+    A clause ends at a punctuation mark once it has at least `min_length` characters,
+    and is cut at `max_length` characters if no punctuation shows up. The streamed
+    chunks are fed as they are, the spaces between them are part of the text, and only
+    the finished clauses are stripped.
+    """
+    def __init__(self, max_length, min_length=4, punctuation="。！？，、；：,.!?;:"):
+        self.max_length = max_length
+        self.min_length = min_length
+        self.pattern = re.compile("[" + re.escape(punctuation) + "]")
+        self.text = ''
+
+    def _find_break(self):
+        match = self.pattern.search(self.text, max(self.min_length - 1, 0))
+        if match is not None and match.start() < self.max_length:
+            return match.start()
+        if len(self.text) > self.max_length:
+            return self.max_length - 1
+        return -1
+
+    def feed(self, text):
+        self.text += text
+        self.text = self.text.lstrip()
+        clauses = []
+        pos = self._find_break()
+        while pos >= 0:
+            clause = self.text[:pos + 1].strip()
+            if clause:
+                clauses.append(clause)
+            self.text = self.text[pos + 1:].lstrip()
+            pos = self._find_break()
+        return clauses
+
+    def flush(self):
+        text, self.text = self.text.strip(), ''
+        return [text] if text else []
+
+
+class PipelinedVITS:
+    """
+    Two-stage VITS synthesis for streaming output. The text front-end (pinyin and BERT
+    char embeddings) runs in its own thread, so clause N+1 is prepared while the acoustic
+    model synthesizes clause N, and the audio of every clause goes to the player as soon
+    as it is ready.
+    """
+    def __init__(self, tts_model, play_queue, profile=False):
+        self.tts_model = tts_model
+        self.play_queue = play_queue
+        self.profile = profile
+        self.text_queue = queue_module.Queue()
+        self.feature_queue = queue_module.Queue()
+        self.reset_stats()
+        for target in (self._front_end_loop, self._acoustic_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+
+    def reset_stats(self):
+        self.response_start_time = None
+        self.first_audio_latency = None
+        self.front_end_time = 0.0
+        self.acoustic_time = 0.0
+        self.audio_duration = 0.0
+
+    def submit(self, clause):
+        if self.response_start_time is None:
+            self.response_start_time = time.time()
+        print('\n------audio seg: ', clause)
+        self.text_queue.put(clause)
+
+    def end(self):
+        """Mark the end of the current answer, the player receives None after its last clause."""
+        self.text_queue.put(None)
+
+    def _front_end_loop(self):
+        while True:
+            clause = self.text_queue.get()
+            if clause is None:
+                # always forwarded, the acoustic loop and the player wait for it
+                self.feature_queue.put(None)
+                continue
+            try:
+                if len(clean_chinese(clause)) == 0:
+                    continue
+                start_time = time.time()
+                x, char_embeds = self.tts_model.tts_front.text_to_inputs(clause)
+                self.front_end_time += time.time() - start_time
+            except Exception:
+                logging.exception("tts front-end failed, skipping clause: %s", clause)
+                continue
+            self.feature_queue.put((x, np.expand_dims(char_embeds, 0)))
+
+    def _acoustic_loop(self):
+        while True:
+            item = self.feature_queue.get()
+            if item is None:
+                if self.profile:
+                    self.print_stats()
+                self.reset_stats()
+                self.play_queue.put(None)
+                continue
+            try:
+                start_time = time.time()
+                audio = self.tts_model(*item)
+                self.acoustic_time += time.time() - start_time
+            except Exception as e:
+                print(e)
+                continue
+            if len(audio) == 0:
+                continue
+            if self.first_audio_latency is None and self.response_start_time is not None:
+                self.first_audio_latency = time.time() - self.response_start_time
+            self.audio_duration += len(audio) / self.tts_model.sample_rate
+            self.play_queue.put(audio)
+
+    def print_stats(self):
+        if self.audio_duration == 0:
+            return
+        console.print(f"\ntts time to first audio: {self.first_audio_latency:.2f} seconds, audio: {self.audio_duration:.2f} seconds")
+        console.print(f"tts front-end took {self.front_end_time:.2f} seconds, RTF: {self.front_end_time / self.audio_duration:.3f}")
+        console.print(f"tts acoustic model took {self.acoustic_time:.2f} seconds, RTF: {self.acoustic_time / self.audio_duration:.3f}")
+
+
 def is_chinese(uchar):
     if uchar >= u'\u4e00' and uchar <= u'\u9fa5':
         return True
@@ -442,13 +570,15 @@ def load_pinyin_dict():
 
 
 class VITS_PinYin:
-    def __init__(self, bert_model, dev_id, hasBert=True):
+    def __init__(self, bert_model, dev_id, hasBert=True, cache_size=1024, cache_dir=None, cache_disk_mb=256):
         load_pinyin_dict()
         from bert import TTSProsody
         self.hasBert = hasBert
         if self.hasBert:
             self.prosody = TTSProsody(bert_model, dev_id)
         self.inference_time = 0.0
+        self.cache = FrontEndCache(cache_size, cache_dir, namespace=os.path.basename(bert_model),
+                                   max_disk_mb=cache_disk_mb)
 
     def get_phoneme4pinyin(self, pinyins):
         result = []
@@ -462,7 +592,7 @@ class VITS_PinYin:
                 count_phone.append(2)
         return result, count_phone
 
-    def chinese_to_phonemes(self, text):
+    def text_to_chars(self, text):
         text = clean_chinese(text)
         phonemes = ["sil"]
         chars = ['[PAD]']
@@ -483,6 +613,10 @@ class VITS_PinYin:
         count_phone.append(1)
         chars.append('[PAD]')
         chars = "".join(chars)
+        return phonemes, chars, count_phone
+
+    def chinese_to_phonemes(self, text):
+        phonemes, chars, count_phone = self.text_to_chars(text)
         char_embeds = None
 
         if self.hasBert:
@@ -492,6 +626,51 @@ class VITS_PinYin:
             char_embeds = self.prosody.expand_for_phone(char_embeds, count_phone)
         return " ".join(phonemes), char_embeds
 
+    def text_to_inputs(self, text):
+        return self.batch_text_to_inputs([text])[0]
+
+    def batch_text_to_inputs(self, texts):
+        """
+        Return (phoneme ids, expanded char embeds) for every text. Results come from
+        self.cache when possible; the uncached texts are converted to pinyin and sent
+        to BERT together, and then added to the cache.
+        """
+        entries = {}
+        pending = {}
+        for text in texts:
+            key = self.cache.normalize(text)
+            if key in entries or key in pending:
+                continue
+            cached = self.cache.get(text)
+            if cached is not None:
+                entries[key] = cached
+                continue
+            phonemes, chars, count_phone = self.text_to_chars(text)
+            input_ids = np.array(cleaned_text_to_sequence(" ".join(phonemes)), dtype=np.int32)
+            pending[key] = (text, input_ids, chars, count_phone)
+
+        if pending:
+            items = list(pending.items())
+            if self.hasBert:
+                start_time = time.time()
+                char_embeds_list = self.prosody.get_char_embeds_batch([item[2] for _, item in items])
+                self.inference_time +=  time.time() - start_time
+            else:
+                char_embeds_list = [None] * len(items)
+            for (key, (text, input_ids, chars, count_phone)), char_embeds in zip(items, char_embeds_list):
+                if char_embeds is not None:
+                    char_embeds = char_embeds[:len(count_phone)].astype(np.float32)
+                entries[key] = (input_ids, char_embeds, count_phone)
+                self.cache.put(text, input_ids, char_embeds, count_phone)
+
+        results = []
+        for text in texts:
+            input_ids, char_embeds, count_phone = entries[self.cache.normalize(text)]
+            if char_embeds is not None:
+                char_embeds = self.prosody.expand_for_phone(char_embeds, count_phone)
+            results.append((input_ids, char_embeds))
+        return results
+
     def correct_pinyin_tone3(self, text):
         pinyin_list = lazy_pinyin(text,
                                   style=Style.TONE3,
@@ -562,12 +741,27 @@ def run_tts(queue, play_queue, tts_model_config):
     elif args_global.tts_type == "vits":
         tts_model = VITS(tts_model_config)
         tts_model.init()
+    vits_stream = None
+    if args_global.tts_type == "vits" and args_global.streaming_output:
+        # synthesize clause by clause instead of waiting for min_tts_input_len characters
+        vits_stream = PipelinedVITS(tts_model, play_queue, args_global.profile)
+        clause_splitter = ClauseSplitter(int(tts_model.max_length / 2 - 5))
     print("start T2S model ...")
     full_out_audio_data = []
 
     while True:
         try:
             llm_response = queue.get()
+            if vits_stream is not None:
+                if llm_response is None:
+                    for clause in clause_splitter.flush():
+                        vits_stream.submit(clause)
+                    vits_stream.end()
+                    continue
+                resp_text = llm_response[9:] if 'Answer:' in llm_response else llm_response
+                for clause in clause_splitter.feed(resp_text):
+                    vits_stream.submit(clause)
+                continue
             with timer:
                 whole_resp_text = ''
                 if llm_response is not None:
@@ -593,14 +787,10 @@ def run_tts(queue, play_queue, tts_model_config):
                 print('\n------audio out content: ', whole_resp_text)
                 if args_global.tts_type == "vits":
                     split_items = tts_model.split_text_near_punctuation(whole_resp_text, int(tts_model.max_length / 2 - 5))
-                    for split_item in split_items:
+                    split_items = [split_item for split_item in split_items if len(split_item) > 0]
+                    for split_item, (x, char_embeds) in zip(split_items, tts_model.tts_front.batch_text_to_inputs(split_items)):
                         print('\n------audio seg: ', split_item)
-                        if len(split_item) == 0:
-                            continue
-                        phonemes, char_embeds = tts_model.tts_front.chinese_to_phonemes(split_item)
-                        input_ids = cleaned_text_to_sequence(phonemes)
                         char_embeds = np.expand_dims(char_embeds, 0)
-                        x = np.array(input_ids, dtype=np.int32)
                         if args_global.streaming_output:
                             play_queue.put(tts_model(x, char_embeds))
                         else:
@@ -626,7 +816,7 @@ def run_tts(queue, play_queue, tts_model_config):
 
 class Pipeline():
     "pipeline for asr-->llm-->tts. "
-    def __init__(self, asr_model=None, llm_model=None):
+    def __init__(self, asr_model=None, llm_model=None, session_id=0):
         self.asr_model = asr_model
         self.llm_model = llm_model
         self.chunk_ms = 200 # 1000 # ms
@@ -637,9 +827,12 @@ class Pipeline():
         self.audio_fs = 16000
         self.question_prefix = "，请用中文回答。"
         self.latency_start_time = None
+        # every session owns its utterance buffer and (in file mode) its wav file
+        self.session_id = session_id
+        self.pcm_pool = PCMBufferPool()
     
-    def run_asr(self, audio_path:str):
-        return self.asr_model.transcribe(audio_path) 
+    def run_asr(self, audio):
+        return self.asr_model.transcribe(audio) 
     
     def run_llm(self, text:str, queue):
         return self.llm_model.gen_response(text, queue)
@@ -663,17 +856,25 @@ class Pipeline():
         return array
 
     def inference(self, clip_audio, params, queue):
-        # sf.write("whisper_input.wav", clip_audio, fs)
+        """
+        Args:
+          clip_audio:
+            A float32 array of the VAD-clipped utterance, in [-1, 1)
+        """
         try:
             st = time.time()
-            with wave.open('whisper_input.wav','wb') as wavWrite:
-                wavWrite.setparams(params) 
-                wavWrite.writeframes(clip_audio) 
+            if args_global.asr_input == "file":
+                asr_input = "whisper_input_{}.wav".format(self.session_id)
+                with wave.open(asr_input,'wb') as wavWrite:
+                    wavWrite.setparams(params) 
+                    wavWrite.writeframes((clip_audio * 32768).astype(np.int16).tobytes()) 
+            else:
+                asr_input = clip_audio
             et = time.time()
-            print("write audio cost: ", et-st)
+            print("prepare asr input cost: ", et-st)
 
             with timer:
-                asr_prompt = self.run_asr("whisper_input.wav")
+                asr_prompt = self.run_asr(asr_input)
             asr_time = timer.run_time
             print("\nasr cost: ", asr_time)
 
@@ -738,6 +939,7 @@ class Pipeline():
     def forward(self, queue, audio_seq_queue, microphone_devid:int=None, output_audio_path:str=None, speaker_wav:str=None):
         global voiced_frames
         timer = Timer()
+        pcm_buffer = self.pcm_pool.get(self.session_id)
 
         self.latency_start_time = multiprocessing.Value('d', -1)
         play_process = multiprocessing.Process(target=self.play, args=(audio_seq_queue, self.audio_fs))
@@ -791,23 +993,22 @@ class Pipeline():
                     for seg in res[0]["value"]:
                         if seg[0] != -1 and seg[1] == -1:
                             self.speech_start = True
-                            voiced_frames.append(message)
+                            pcm_buffer.append(message_arr)
                         elif seg[0] != -1 and seg[1] != -1:
                             self.latency_start_time.value = time.time()
-                            self.inference(message, params, queue)
+                            self.inference(message_arr, params, queue)
                             self.cache = {}
                             num_questions += 1
                         elif seg[0] == -1 and seg[1] != -1:
                             self.speech_start = False
-                            voiced_frames.append(message)
-                            clip_audio = b''.join(voiced_frames)
+                            pcm_buffer.append(message_arr)
                             self.latency_start_time.value = time.time()
-                            self.inference(clip_audio, params, queue)
+                            self.inference(pcm_buffer.view(), params, queue)
                             self.cache = {}
                             num_questions += 1
-                            voiced_frames = []
+                            pcm_buffer.clear()
                 elif self.speech_start:
-                    voiced_frames.append(message)
+                    pcm_buffer.append(message_arr)
                 else:
                     self.cache = {}
             else:
@@ -816,8 +1017,9 @@ class Pipeline():
                     clip_audio = vad_collector(fs, sub_message)
                     if clip_audio is not None:
                         self.latency_start_time.value = time.time()
-                        self.inference(clip_audio, params, queue)
+                        self.inference(pcm_buffer.load(clip_audio).view(), params, queue)
                         num_questions += 1
+                        pcm_buffer.clear()
             if num_questions > 0:
                 if args_global.audio_in is None and not args_global.output_file:
                     queue.put("我还有什么可以帮您，您可以继续提问！")
@@ -831,20 +1033,21 @@ class Pipeline():
                     print("microphone running ...")
                 else:
                     print("next segment running ...")
-        if len(voiced_frames) > 0:
-            if self.use_fsmn_vad:
-                clip_audio = b''.join(voiced_frames)
-            else:
-                clip_audio = b''.join([f.bytes for f in voiced_frames])
+        # pcm_buffer is cleared after every inference, so here it only holds the unprocessed tail
+        if not self.use_fsmn_vad and len(voiced_frames) > 0:
+            pcm_buffer.load(b''.join([f.bytes for f in voiced_frames]))
+        if len(pcm_buffer) > 0:
             self.latency_start_time.value = time.time()
-            self.inference(clip_audio, params, queue)
+            self.inference(pcm_buffer.view(), params, queue)
             self.cache = {}
+            pcm_buffer.clear()
             queue.put(None) # end
             while queue.qsize():
                 time.sleep(1)
             while audio_seq_queue.qsize():
                 time.sleep(1)
 
+        self.pcm_pool.release(self.session_id)
         time.sleep(2) # for the last string (its length < min_output_text_len)
 
 
@@ -873,6 +1076,9 @@ def set_argparser(name:str):
         parser.add_argument('--vits_model', type=str, default='../BM1688/vits/vits_chinese_128_bm1688_f16_1core.bmodel', help='path of bmodel')
         parser.add_argument('--bert_model', type=str, default='../BM1688/vits/bert_1688_f32_1core.bmodel', help='path of bert config')
         parser.add_argument('-d', '--devid', type=int, default=0, help='device id')
+        parser.add_argument('--cache_size', type=int, default=1024, help='number of sentences kept in the front-end memory cache, 0 to disable')
+        parser.add_argument('--cache_dir', type=str, default=None, help='directory of the on-disk front-end cache, disabled by default')
+        parser.add_argument('--cache_disk_mb', type=float, default=256, help='size limit of the on-disk front-end cache in MB, least recently used files beyond it are removed')
         return parser
 
     def xtts_parser():
@@ -914,6 +1120,7 @@ parser_global.add_argument("--tts_out_language", type=str, default="zh-cn", help
 parser_global.add_argument("--tts_speaker", type=str, default="Daisy Studious", help="tts speaker id or speaker wav path, only valid for xtts")
 parser_global.add_argument("--microphone_devid", type=int, default=0, help="microphone device id, valid when --audio_in=None")
 parser_global.add_argument("--audio_devid", type=int, default=None, help="play audio device id, valid when --output_file=False, default: use default device")
+parser_global.add_argument("--asr_input", type=str, default="memory", choices=["memory", "file"], help="pass the clipped utterance to ASR as an in-memory array, or through a wav file")
 parser_global.add_argument("--min_tts_input_len", type=int, default=30, help="minimum TTS input text length")
 args_global, _ = parser_global.parse_known_args()
 
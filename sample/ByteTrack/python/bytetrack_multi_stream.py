@@ -0,0 +1,137 @@
+# ===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+# ===----------------------------------------------------------------------===#
+
+import os
+import sys
+sys.path.append("detector/yolov5/")
+from yolov5_opencv import YOLOv5
+from tracker.byte_tracker import ByteTracker
+from tracker.utils.parser import get_config
+from bytetrack_opencv import plot_bboxes, yolov5_arg
+# the decoding thread and per-stream state are shared with DeepSORT/python/deepsort_multi_stream.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../DeepSORT/python"))
+from stream_reader import Stream, is_live
+import cv2
+import argparse
+import queue
+import logging
+logging.basicConfig(level=logging.INFO)
+import time
+import numpy as np
+
+
+def split_detections(det):
+    bbox = []
+    confs = []
+    clss = []
+    for idx in range(det.shape[0]):
+        x1, y1, x2, y2, conf, cls = det[idx]
+        if x2 - x1 != 0 and y2 - y1 != 0:
+            bbox.append([x1, y1, x2, y2])
+            confs.append(float(conf))
+            clss.append(int(cls))
+    return bbox, confs, clss
+
+
+def process_batch(detector, batch):
+    """
+    One detector call per detector batch for `batch`, a list of (stream, frame) from
+    different streams; then every stream's tracker is updated with its own detections.
+    """
+    detector_results = []
+    for start in range(0, len(batch), detector.batch_size):
+        detector_results += detector([frame for _, frame in batch[start:start + detector.batch_size]])
+
+    for (stream, frame), det in zip(batch, detector_results):
+        bbox, confs, clss = split_detections(det)
+        outputs = stream.tracker._tracker_update(bbox, confs, clss, frame)
+        stream.frame_num += 1
+        stream.last_time = time.time()
+        bboxes2draw = []
+        for x1, y1, width, high, cls_id, track_id in outputs:
+            bboxes2draw.append((int(x1), int(y1), int(x1+width), int(y1+high), cls_id, track_id))
+            stream.mot_saver.write("{},{},{},{},{},{},1,-1,-1,-1\n".format(
+                stream.tracker.frame_id, track_id, x1, y1, width, high))
+        if stream.save_dir is not None:
+            image = plot_bboxes(frame, bboxes2draw)
+            cv2.imwrite("{}/{}.jpg".format(stream.save_dir, stream.frame_num), image)
+
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--inputs', type=str, nargs='+', default=['../datasets/test_car_person_1080P.mp4'], help='videos, rtsp/rtmp urls or camera ids, one per stream')
+    parser.add_argument('--bmodel_detector', type=str, default='../models/BM1684X/yolov5s_v6.1_3output_int8_4b.bmodel', help='path of detector bmodel')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--queue_size', type=int, default=4, help='decoded frames queued per stream')
+    parser.add_argument('--realtime', action='store_true', help='drop the oldest queued frame of a stream when it is full, also for video files; always on for live streams')
+    parser.add_argument('--save_images', action='store_true', help='save the frames with the tracks drawn to results/streams/<stream id>/')
+    parser.add_argument('--log_interval', type=float, default=5.0, help='seconds between per-stream stats logs')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = argsparser()
+    cfg = get_config()
+    cfg.merge_from_file("configs/bytetrack.yaml")
+    os.makedirs("results/mot_eval", exist_ok=True)
+    # one detector for all streams, a tracker per stream
+    detector = YOLOv5(yolov5_arg(args.bmodel_detector, args.dev_id, cfg.DETECTOR.CONF_THRE, cfg.DETECTOR.NMS_THRE))
+    streams = []
+    for stream_id, input in enumerate(args.inputs):
+        tracker = ByteTracker(
+            min_box_area=cfg.BYTETRACK.MIN_BOX_AREA,
+            track_thresh=cfg.BYTETRACK.TRACK_THRESH,
+            track_buffer=cfg.BYTETRACK.TRACK_BUFFER,
+            match_thresh=cfg.BYTETRACK.MATCH_THRESH
+        )
+        streams.append(Stream(stream_id, input, tracker, args.queue_size, is_live(input, args.realtime), args.save_images))
+    for stream in streams:
+        stream.start_time = time.time()
+        stream.reader.start()
+
+    start_time = time.time()
+    last_log = start_time
+    batch_num, frame_num = 0, 0
+    while not all(stream.reader.done() for stream in streams):
+        # at most one frame per stream and batch, so no stream starves the others
+        batch = []
+        for stream in streams:
+            try:
+                batch.append((stream, stream.reader.frames.get_nowait()))
+            except queue.Empty:
+                pass
+        if not batch:
+            time.sleep(0.001)
+            continue
+        process_batch(detector, batch)
+        batch_num += 1
+        frame_num += len(batch)
+        if time.time() - last_log > args.log_interval:
+            last_log = time.time()
+            for stream in streams:
+                logging.info(stream.stats())
+
+    total_time = time.time() - start_time
+    for stream in streams:
+        stream.mot_saver.close()
+        logging.info(stream.stats())
+    frame_num = max(frame_num, 1)
+    logging.info("streams: {}, frames: {}, total fps: {:.2f}, avg frames per batch: {:.2f}".format(
+        len(streams), frame_num, frame_num / max(total_time, 1e-6), frame_num / max(batch_num, 1)))
+    logging.info("------------------Detector Predict Time Info ----------------------")
+    logging.info("preprocess_time(ms): {:.2f}".format(detector.preprocess_time / frame_num * 1000))
+    logging.info("inference_time(ms): {:.2f}".format(detector.inference_time / frame_num * 1000))
+    logging.info("postprocess_time(ms): {:.2f}".format(detector.postprocess_time / frame_num * 1000))
+    logging.info("------------------ByteTrack Tracker Time Info ----------------------")
+    logging.info("bytetrack_track_time(ms): {:.2f}".format(sum(stream.tracker.track_time for stream in streams) / frame_num * 1000))
+    logging.info("-------------------------------------------------------------------")
+
+if __name__ == '__main__':
+    main()
@@ -157,10 +157,11 @@ class STrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-    def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
-        )
+    def re_activate(self, new_track, frame_id, new_id=False, kalman_updated=False):
+        if not kalman_updated:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
+            )
         self.tracklet_len = 0
         self.state = TrackState.Tracked
         self.is_activated = True
@@ -169,20 +170,21 @@ class STrack(BaseTrack):
             self.track_id = self.next_id()
         self.score = new_track.score
 
-    def update(self, new_track, frame_id):
+    def update(self, new_track, frame_id, kalman_updated=False):
         """
         Update a matched track
         :type new_track: STrack
         :type frame_id: int
-        :type update_feature: bool
+        :type kalman_updated: bool, the kalman update was already done by STrackPool.update
         :return:
         """
         self.frame_id = frame_id
         self.tracklet_len += 1
 
-        new_tlwh = new_track.tlwh
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
+        if not kalman_updated:
+            new_tlwh = new_track.tlwh
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, self.tlwh_to_xyah(new_tlwh))
         self.state = TrackState.Tracked
         self.is_activated = True
 
@@ -239,10 +241,95 @@ class STrack(BaseTrack):
         ret[2:] += ret[:2]
         return ret
 
+    @staticmethod
+    def tlbr_to_xyah(tlbrs):
+        """Vectorized (n, 4) tlbr -> (n, 4) xyah."""
+        tlbrs = np.asarray(tlbrs, dtype=np.float64).reshape(-1, 4)
+        ret = np.empty_like(tlbrs)
+        ret[:, 3] = tlbrs[:, 3] - tlbrs[:, 1]
+        ret[:, 2] = (tlbrs[:, 2] - tlbrs[:, 0]) / ret[:, 3]
+        ret[:, :2] = (tlbrs[:, :2] + tlbrs[:, 2:]) / 2
+        return ret
+
+    @staticmethod
+    def xyah_to_tlbr(xyahs):
+        """Vectorized (n, 4) xyah -> (n, 4) tlbr, the array form of STrack.tlbr."""
+        w = xyahs[:, 2] * xyahs[:, 3]
+        ret = np.empty((len(xyahs), 4), dtype=np.float32)
+        ret[:, 0] = xyahs[:, 0] - w / 2
+        ret[:, 1] = xyahs[:, 1] - xyahs[:, 3] / 2
+        ret[:, 2] = ret[:, 0] + w
+        ret[:, 3] = ret[:, 1] + xyahs[:, 3]
+        return ret
+
+    @staticmethod
+    def multi_tlbr(stracks):
+        """(n, 4) tlbr of activated stracks, computed from their stacked means."""
+        if len(stracks) == 0:
+            return np.zeros((0, 4), dtype=np.float32)
+        return STrack.xyah_to_tlbr(np.asarray([st.mean[:4] for st in stracks]))
+
     def __repr__(self):
         return 'OT_{}_({}-{})'.format(self.track_id, self.start_frame, self.end_frame)
 
 
+class STrackPool(object):
+    """
+    Structure-of-arrays state of the stracks associated in one frame.
+
+    The means (n, 8), covariances (n, 8, 8), tlbr (n, 4) and scores (n,) of all
+    stracks are kept in contiguous numpy buffers, so the kalman predict and update
+    run once for all tracks and the IoU matrices are computed from `tlbr` in one
+    vectorized call. The stracks keep views of their rows, the buffers are built
+    again every frame from the stracks.
+    """
+
+    def __init__(self, stracks):
+        self.stracks = stracks
+        n = len(stracks)
+        self.mean = np.zeros((n, 8))
+        self.covariance = np.zeros((n, 8, 8))
+        self.score = np.zeros((n,), dtype=np.float32)
+        self.tracked = np.zeros((n,), dtype=bool)
+        for i, st in enumerate(stracks):
+            self.mean[i] = st.mean
+            self.covariance[i] = st.covariance
+            self.score[i] = st.score
+            self.tracked[i] = st.state == TrackState.Tracked
+        self.tlbr = STrack.xyah_to_tlbr(self.mean[:, :4])
+
+    def __len__(self):
+        return len(self.stracks)
+
+    def _write_back(self, rows):
+        for i in rows:
+            self.stracks[i].mean = self.mean[i]
+            self.stracks[i].covariance = self.covariance[i]
+
+    def predict(self, kalman_filter):
+        """Kalman predict of all tracks, the height velocity of not tracked tracks is reset."""
+        if len(self) == 0:
+            return
+        mean = self.mean.copy()
+        mean[~self.tracked, 7] = 0
+        self.mean, self.covariance = kalman_filter.multi_predict(
+            mean, self.covariance)
+        self.tlbr = STrack.xyah_to_tlbr(self.mean[:, :4])
+        self._write_back(range(len(self)))
+
+    def update(self, kalman_filter, rows, det_tlbrs):
+        """Kalman update of the tracks `rows` with their matched detections (m, 4) tlbr."""
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        if len(rows) == 0:
+            return
+        mean, covariance = kalman_filter.multi_update(
+            self.mean[rows], self.covariance[rows], STrack.tlbr_to_xyah(det_tlbrs))
+        self.mean[rows] = mean
+        self.covariance[rows] = covariance
+        self.tlbr[rows] = STrack.xyah_to_tlbr(mean[:, :4])
+        self._write_back(rows)
+
+
 class BYTETracker(object):
     def __init__(self, track_thresh, track_buffer, match_thresh, frame_rate=30):
         self.tracked_stracks = []  # type: list[STrack]
@@ -311,22 +398,25 @@ class BYTETracker(object):
 
         ''' Step 2: First association, with high score detection boxes'''
         strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
+        pool = STrackPool(strack_pool)
         # Predict the current location with KF
-        STrack.multi_predict(strack_pool)
-        dists = matching.iou_distance(strack_pool, detections)
+        pool.predict(self.kalman_filter)
+        dists = matching.iou_distance(pool.tlbr, dets)
 
-        dists = matching.fuse_score(dists, detections)
+        dists = matching.fuse_score(dists, scores_keep)
         matches, u_track, u_detection = matching.linear_assignment(
             dists, thresh=self.match_thresh)
 
+        if len(matches) > 0:
+            pool.update(self.kalman_filter, matches[:, 0], dets[matches[:, 1]])
         for itracked, idet in matches:
             track = strack_pool[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_id)
+                track.update(det, self.frame_id, kalman_updated=True)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_id, new_id=False)
+                track.re_activate(det, self.frame_id, new_id=False, kalman_updated=True)
                 refind_stracks.append(track)
 
         ''' Step 3: Second association, with low score detection boxes'''
@@ -337,20 +427,19 @@ class BYTETracker(object):
                                  (tlbr, s, c) in zip(dets_second, scores_second, cls_second)]
         else:
             detections_second = []
-        r_tracked_stracks = [strack_pool[i]
-                             for i in u_track if strack_pool[i].state == TrackState.Tracked]
-        dists = matching.iou_distance(r_tracked_stracks, detections_second)
+        r_rows = np.asarray([i for i in u_track if pool.tracked[i]], dtype=np.int64)
+        r_tracked_stracks = [strack_pool[i] for i in r_rows]
+        dists = matching.iou_distance(pool.tlbr[r_rows], dets_second)
         matches, u_track, u_detection_second = matching.linear_assignment(
             dists, thresh=0.5)
+        if len(matches) > 0:
+            pool.update(self.kalman_filter, r_rows[matches[:, 0]], dets_second[matches[:, 1]])
         for itracked, idet in matches:
+            # r_tracked_stracks are all in the Tracked state
             track = r_tracked_stracks[itracked]
             det = detections_second[idet]
-            if track.state == TrackState.Tracked:
-                track.update(det, self.frame_id)
-                activated_starcks.append(track)
-            else:
-                track.re_activate(det, self.frame_id, new_id=False)
-                refind_stracks.append(track)
+            track.update(det, self.frame_id, kalman_updated=True)
+            activated_starcks.append(track)
 
         for it in u_track:
             track = r_tracked_stracks[it]
@@ -435,7 +524,8 @@ def sub_stracks(tlista, tlistb):
 
 
 def remove_duplicate_stracks(stracksa, stracksb):
-    pdist = matching.iou_distance(stracksa, stracksb)
+    pdist = matching.iou_distance(
+        STrack.multi_tlbr(stracksa), STrack.multi_tlbr(stracksb))
     pairs = np.where(pdist < 0.15)
     dupa, dupb = list(), list()
     for p, q in zip(*pairs):
@@ -188,17 +188,44 @@ class KalmanFilter(object):
             self._std_weight_velocity * mean[:, 3]]
         sqr = np.square(np.r_[std_pos, std_vel]).T
 
-        motion_cov = []
-        for i in range(len(mean)):
-            motion_cov.append(np.diag(sqr[i]))
-        motion_cov = np.asarray(motion_cov)
+        motion_cov = np.zeros((len(mean), 8, 8))
+        motion_cov[:, np.arange(8), np.arange(8)] = sqr
 
         mean = np.dot(mean, self._motion_mat.T)
-        left = np.dot(self._motion_mat, covariance).transpose((1, 0, 2))
-        covariance = np.dot(left, self._motion_mat.T) + motion_cov
+        covariance = np.matmul(np.matmul(
+            self._motion_mat, covariance), self._motion_mat.T) + motion_cov
 
         return mean, covariance
 
+    def multi_project(self, mean, covariance):
+        """Project state distributions to measurement space (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the object states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrics of the object states.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx4 projected means and Nx4x4 projected covariance
+            matrics of the given state estimates.
+        """
+        std = [
+            self._std_weight_position * mean[:, 3],
+            self._std_weight_position * mean[:, 3],
+            1e-1 * np.ones_like(mean[:, 3]),
+            self._std_weight_position * mean[:, 3]]
+        sqr = np.square(np.r_[std]).T
+
+        innovation_cov = np.zeros((len(mean), 4, 4))
+        innovation_cov[:, np.arange(4), np.arange(4)] = sqr
+
+        mean = np.dot(mean, self._update_mat.T)
+        covariance = np.matmul(np.matmul(
+            self._update_mat, covariance), self._update_mat.T)
+        return mean, covariance + innovation_cov
+
     def update(self, mean, covariance, measurement):
         """Run Kalman filter correction step.
 
@@ -233,6 +260,34 @@ class KalmanFilter(object):
             kalman_gain, projected_cov, kalman_gain.T))
         return new_mean, new_covariance
 
+    def multi_update(self, mean, covariance, measurements):
+        """Run Kalman filter correction step (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional predicted mean matrix.
+        covariance : ndarray
+            The Nx8x8 dimensional predicted covariance matrics.
+        measurements : ndarray
+            The Nx4 dimensional measurement matrix, the i-th row (x, y, a, h)
+            is the measurement of the i-th state.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+        """
+        projected_mean, projected_cov = self.multi_project(mean, covariance)
+
+        # kalman_gain = P * H^T * S^-1, S is symmetric so solve S * K^T = H * P
+        kalman_gain = np.linalg.solve(
+            projected_cov, np.matmul(self._update_mat, covariance)).transpose((0, 2, 1))
+        innovation = measurements - projected_mean
+
+        new_mean = mean + np.matmul(kalman_gain, innovation[:, :, None])[:, :, 0]
+        new_covariance = covariance - np.matmul(np.matmul(
+            kalman_gain, projected_cov), kalman_gain.transpose((0, 2, 1)))
+        return new_mean, new_covariance
+
     def gating_distance(self, mean, covariance, measurements,
                         only_position=False, metric='maha'):
         """Compute gating distance between state distribution and measurements.
@@ -276,3 +331,40 @@ class KalmanFilter(object):
             return squared_maha
         else:
             raise ValueError('invalid distance metric')
+
+    def multi_gating_distance(self, mean, covariance, measurements,
+                              only_position=False, metric='maha'):
+        """Compute gating distance between state distributions and measurements
+        (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of N state distributions.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrics of N state distributions.
+        measurements : ndarray
+            An Mx4 dimensional matrix of M measurements in format (x, y, a, h).
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+        Returns
+        -------
+        ndarray
+            Returns an NxM matrix, where element (i, j) is the squared
+            Mahalanobis distance between state i and `measurements[j]`.
+        """
+        mean, covariance = self.multi_project(mean, covariance)
+        if only_position:
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+
+        d = measurements[None, :, :] - mean[:, None, :]
+        if metric == 'gaussian':
+            return np.sum(d * d, axis=2)
+        elif metric == 'maha':
+            cholesky_factor = np.linalg.cholesky(covariance)
+            z = np.linalg.solve(cholesky_factor, d.transpose((0, 2, 1)))
+            squared_maha = np.sum(z * z, axis=1)
+            return squared_maha
+        else:
+            raise ValueError('invalid distance metric')
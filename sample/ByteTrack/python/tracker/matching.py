@@ -79,22 +79,28 @@ def ious(atlbrs, btlbrs):
     return ious
 
 
+def tlbrs(tracks):
+    """
+    Stack the tlbr of a track list into an (n, 4) array, arrays pass through
+    :type tracks: list[STrack] | list[tlbr] | np.ndarray
+    """
+    if isinstance(tracks, np.ndarray):
+        return tracks.reshape(-1, 4)
+    if len(tracks) > 0 and isinstance(tracks[0], np.ndarray):
+        return np.asarray(tracks).reshape(-1, 4)
+    return np.asarray([track.tlbr for track in tracks], dtype=np.float32).reshape(-1, 4)
+
+
 def iou_distance(atracks, btracks):
     """
     Compute cost based on IoU
-    :type atracks: list[STrack]
-    :type btracks: list[STrack]
+    :type atracks: list[STrack] | np.ndarray
+    :type btracks: list[STrack] | np.ndarray
 
     :rtype cost_matrix np.ndarray
     """
 
-    if (len(atracks) > 0 and isinstance(atracks[0], np.ndarray)) or (len(btracks) > 0 and isinstance(btracks[0], np.ndarray)):
-        atlbrs = atracks
-        btlbrs = btracks
-    else:
-        atlbrs = [track.tlbr for track in atracks]
-        btlbrs = [track.tlbr for track in btracks]
-    _ious = ious(atlbrs, btlbrs)
+    _ious = ious(tlbrs(atracks), tlbrs(btracks))
     cost_matrix = 1 - _ious
 
     return cost_matrix
@@ -149,10 +155,11 @@ def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
+    means = np.asarray([track.mean for track in tracks])
+    covariances = np.asarray([track.covariance for track in tracks])
+    gating_distance = kf.multi_gating_distance(
+        means, covariances, measurements, only_position)
+    cost_matrix[gating_distance > gating_threshold] = np.inf
     return cost_matrix
 
 
@@ -162,12 +169,12 @@ def fuse_motion(kf, cost_matrix, tracks, detections, only_position=False, lambda
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position, metric='maha')
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
-        cost_matrix[row] = lambda_ * cost_matrix[row] + \
-            (1 - lambda_) * gating_distance
+    means = np.asarray([track.mean for track in tracks])
+    covariances = np.asarray([track.covariance for track in tracks])
+    gating_distance = kf.multi_gating_distance(
+        means, covariances, measurements, only_position, metric='maha')
+    cost_matrix[gating_distance > gating_threshold] = np.inf
+    cost_matrix = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
     return cost_matrix
 
 
@@ -187,13 +194,17 @@ def fuse_iou(cost_matrix, tracks, detections):
 
 
 def fuse_score(cost_matrix, detections):
+    """
+    :type detections: list[STrack] | np.ndarray of detection scores
+    """
     if cost_matrix.size == 0:
         return cost_matrix
     iou_sim = 1 - cost_matrix
-    det_scores = np.array([det.score for det in detections])
-    det_scores = np.expand_dims(det_scores, axis=0).repeat(
-        cost_matrix.shape[0], axis=0)
-    fuse_sim = iou_sim * det_scores
+    if isinstance(detections, np.ndarray):
+        det_scores = detections
+    else:
+        det_scores = np.array([det.score for det in detections])
+    fuse_sim = iou_sim * det_scores[None, :]
     fuse_cost = 1 - fuse_sim
     return fuse_cost
 
@@ -232,28 +243,21 @@ def bbox_overlaps(bboxes1,
     ious = np.zeros((rows, cols), dtype=np.float32)
     if rows * cols == 0:
         return ious
-    exchange = False
-    if bboxes1.shape[0] > bboxes2.shape[0]:
-        bboxes1, bboxes2 = bboxes2, bboxes1
-        ious = np.zeros((cols, rows), dtype=np.float32)
-        exchange = True
     area1 = (bboxes1[:, 2] - bboxes1[:, 0] + extra_length) * (
         bboxes1[:, 3] - bboxes1[:, 1] + extra_length)
     area2 = (bboxes2[:, 2] - bboxes2[:, 0] + extra_length) * (
         bboxes2[:, 3] - bboxes2[:, 1] + extra_length)
-    for i in range(bboxes1.shape[0]):
-        x_start = np.maximum(bboxes1[i, 0], bboxes2[:, 0])
-        y_start = np.maximum(bboxes1[i, 1], bboxes2[:, 1])
-        x_end = np.minimum(bboxes1[i, 2], bboxes2[:, 2])
-        y_end = np.minimum(bboxes1[i, 3], bboxes2[:, 3])
-        overlap = np.maximum(x_end - x_start + extra_length, 0) * np.maximum(
-            y_end - y_start + extra_length, 0)
-        if mode == 'iou':
-            union = area1[i] + area2 - overlap
-        else:
-            union = area1[i] if not exchange else area2
-        union = np.maximum(union, eps)
-        ious[i, :] = overlap / union
-    if exchange:
-        ious = ious.T
+    # whole (n, k) matrix in one broadcast instead of a loop over rows
+    x_start = np.maximum(bboxes1[:, None, 0], bboxes2[None, :, 0])
+    y_start = np.maximum(bboxes1[:, None, 1], bboxes2[None, :, 1])
+    x_end = np.minimum(bboxes1[:, None, 2], bboxes2[None, :, 2])
+    y_end = np.minimum(bboxes1[:, None, 3], bboxes2[None, :, 3])
+    overlap = np.maximum(x_end - x_start + extra_length, 0) * np.maximum(
+        y_end - y_start + extra_length, 0)
+    if mode == 'iou':
+        union = area1[:, None] + area2[None, :] - overlap
+    else:
+        union = np.broadcast_to(area1[:, None], overlap.shape)
+    union = np.maximum(union, eps)
+    ious = overlap / union
     return ious
@@ -66,12 +66,14 @@ class C3D:
         self.decode_time += time.time() - start_decode
         return input_frame_array_batch
     
+    def preprocess_frame(self, frame):
+        # resize, center crop and mean subtraction of one frame, [112, 112, 3]
+        return self.center_crop(cv2.resize(frame, (171, 128))) - np.array([[[104.0, 117.0, 123.0]]])
+
     def preprocess(self, input_frame_array):
         input_numpy_array = []
         for frame in input_frame_array:
-            tmp_ = self.center_crop(cv2.resize(frame, (171, 128)))
-            tmp = tmp_ - np.array([[[104.0, 117.0, 123.0]]])
-            input_numpy_array.append(tmp)
+            input_numpy_array.append(self.preprocess_frame(frame))
         while len(input_numpy_array) < self.input_shape[2]:
             input_numpy_array.append(input_numpy_array[-1])
         if self.input_dtype == sail.BM_FLOAT32:
@@ -81,6 +83,14 @@ class C3D:
         input_numpy_array = np.transpose(input_numpy_array, (3, 0, 1, 2))
         return input_numpy_array
           
+    def inference(self, preprocessed_video_data):
+        start_inference = time.time()
+        input_tensor = sail.Tensor(self.handle, preprocessed_video_data)
+        input_tensors = {self.input_name: input_tensor}
+        self.net.process(self.graph_name, input_tensors, self.output_tensors)
+        self.inference_time += time.time() - start_inference
+        return self.output_tensors[self.output_name].asnumpy()
+
     def __call__(self, input_frame_array_batch):
         vid_num = len(input_frame_array_batch)
         start_preprocess = time.time()
@@ -95,12 +105,7 @@ class C3D:
             preprocessed_video_data = np.zeros(self.input_shape)
             preprocessed_video_data[:vid_num] = np.stack(preprocessed_video_data_raw)
         self.preprocess_time += time.time() - start_preprocess
-        start_inference = time.time()
-        input_tensor = sail.Tensor(self.handle, preprocessed_video_data)
-        input_tensors = {self.input_name: input_tensor}
-        self.net.process(self.graph_name, input_tensors, self.output_tensors)
-        self.inference_time += time.time() - start_inference        
-        output_tensor = self.output_tensors[self.output_name].asnumpy()
+        output_tensor = self.inference(preprocessed_video_data)
         
         start_postprocess = time.time()
         result_list = []
@@ -0,0 +1,153 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import time
+import os
+import sys
+import queue
+import numpy as np
+import argparse
+import sophon.sail as sail
+import logging
+import json
+from c3d_opencv import C3D
+# the prefetching reader thread is shared with the multi-stream trackers
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../DeepSORT/python"))
+from stream_reader import StreamReader, is_live
+logging.basicConfig(level=logging.INFO)
+
+class FrameRing:
+    """
+    The last `length` preprocessed frames in a [C, length, H, W] array, so every frame is
+    preprocessed once and reused by all the windows that overlap it.
+    """
+    def __init__(self, length, frame_shape, dtype):
+        height, width, channels = frame_shape
+        self.frames = np.zeros((channels, length, height, width), dtype=dtype)
+        self.length = length
+        self.count = 0
+
+    def push(self, frame):
+        self.frames[:, self.count % self.length] = np.moveaxis(frame, -1, 0)
+        self.count += 1
+
+    def window(self, out):
+        # oldest frame first; before the ring is full the last frame is repeated, as the decode of the models does
+        start = max(self.count - self.length, 0)
+        order = np.minimum(np.arange(start, start + self.length), self.count - 1) % self.length
+        np.take(self.frames, order, axis=1, out=out)
+
+
+def check_args(args):
+    if not os.path.exists(args.bmodel):
+        raise FileNotFoundError('{} is not existed.'.format(args.bmodel))
+    with open(args.classnames, 'r') as f:
+        return [line.strip('\n') for line in f.readlines()]
+
+def run_stream(model, args, class_names, frame_shape, input_shape):
+    """
+    Sliding-window recognition of args.input with `model`, a C3D or a SlowFast with the same
+    preprocess_frame/inference interface (SlowFast/python/slowfast_stream.py calls this too).
+    frame_shape: [H, W, C] of a preprocessed frame
+    input_shape: shape of the inference input, its dim 2 is the window length
+    """
+    # creat save path
+    output_dir = "./results"
+    if not os.path.exists(output_dir):
+        os.mkdir(output_dir)
+    window = input_shape[2]
+    stride = args.stride if args.stride > 0 else window // 2
+    dtype = np.int8 if model.input_dtype == sail.BM_INT8 else np.float32
+    ring = FrameRing(window, frame_shape, dtype)
+    # one window in batch slot 0, the other slots stay zero
+    input_data = np.zeros(input_shape, dtype=dtype)
+
+    reader = StreamReader(args.input, args.queue_size, is_live(args.input, args.realtime))
+    reader.start()
+
+    def predict(frame_id, arrive_time):
+        ring.window(input_data[0])
+        output = model.inference(input_data)[0]
+        start_postprocess = time.time()
+        prob = np.exp(output - np.max(output))
+        prob /= np.sum(prob)
+        pred_idx = int(np.argmax(prob))
+        model.postprocess_time += time.time() - start_postprocess
+        latency = time.time() - arrive_time
+        logging.info("frame {}: {} ({:.3f}), latency(ms): {:.2f}".format(frame_id, class_names[pred_idx], prob[pred_idx], latency * 1000))
+        return {"frame": frame_id, "label": class_names[pred_idx], "score": float(prob[pred_idx])}, latency
+
+    results = []
+    latency_sum = 0.0
+    frame_id = 0
+    pushed_since_predict = 0
+    start_time = time.time()
+    while not reader.done():
+        try:
+            frame = reader.frames.get(timeout=0.01)
+        except queue.Empty:
+            continue
+        arrive_time = time.time()
+        frame_id += 1
+        if (frame_id - 1) % model.step != 0:
+            continue
+        start_preprocess = time.time()
+        ring.push(model.preprocess_frame(frame))
+        model.preprocess_time += time.time() - start_preprocess
+        pushed_since_predict += 1
+        if ring.count < window or (ring.count > window and pushed_since_predict < stride):
+            continue
+        result, latency = predict(frame_id, arrive_time)
+        results.append(result)
+        latency_sum += latency
+        pushed_since_predict = 0
+    if ring.count > 0 and (ring.count < window or args.flush and pushed_since_predict > 0):
+        # short input or the frames after the last window
+        result, latency = predict(frame_id, time.time())
+        results.append(result)
+        latency_sum += latency
+    total_time = time.time() - start_time
+
+    name = os.path.splitext(os.path.basename(args.input.rstrip('/')))[0] or "camera"
+    json_name = os.path.split(args.bmodel)[-1] + "_{}_stream_python.json".format(name)
+    with open(os.path.join(output_dir, json_name), 'w') as jf:
+        json.dump(results, jf, indent=4, ensure_ascii=False)
+    logging.info("result saved in {}".format(os.path.join(output_dir, json_name)))
+
+    window_num = max(len(results), 1)
+    sampled_num = max(ring.count, 1)
+    logging.info("frames: {}, dropped: {}, sampled: {}, windows: {}, fps: {:.2f}".format(
+        reader.decode_num, reader.drop_num, ring.count, len(results), frame_id / max(total_time, 1e-6)))
+    logging.info("decode_time(ms): {:.2f}".format(reader.decode_time / max(reader.decode_num, 1) * 1000))
+    logging.info("preprocess_time per sampled frame(ms): {:.2f}".format(model.preprocess_time / sampled_num * 1000))
+    logging.info("inference_time per window(ms): {:.2f}".format(model.inference_time / window_num * 1000))
+    logging.info("postprocess_time per window(ms): {:.2f}".format(model.postprocess_time / window_num * 1000))
+    logging.info("latency per window(ms): {:.2f}".format(latency_sum / window_num * 1000))
+
+def main(args):
+    class_names = check_args(args)
+    c3d = C3D(args)
+    run_stream(c3d, args, class_names, (c3d.input_shape[3], c3d.input_shape[4], c3d.input_shape[1]), c3d.input_shape)
+
+def argsparser(bmodel='../models/BM1684X/c3d_fp32_1b.bmodel', classnames='../datasets/ucf_names.txt'):
+    parser = argparse.ArgumentParser(prog=sys.argv[0])
+    parser.add_argument('--input', type=str, required=True, help='video file, rtsp/rtmp url or camera id')
+    parser.add_argument('--bmodel', type=str, default=bmodel, help='path of bmodel')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--classnames', type=str, default=classnames, help='path of names')
+    parser.add_argument('--stride', type=int, default=0, help='sampled frames between predictions, 0 means half the window')
+    parser.add_argument('--queue_size', type=int, default=32, help='decoded frames queued by the reader thread')
+    parser.add_argument('--realtime', action='store_true', help='drop the oldest queued frame when the queue is full, also for video files; always on for live streams')
+    parser.add_argument('--flush', action='store_true', help='also predict on the last window when the input ends between two predictions')
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
+    print('all done.')
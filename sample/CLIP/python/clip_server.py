@@ -7,7 +7,9 @@
 #
 #===----------------------------------------------------------------------===#
 import numpy as np
-from queue import Queue
+import time
+from queue import Queue, Empty
+from collections import OrderedDict, deque
 
 import clip
 from zeroshot_predict import *
@@ -24,7 +26,10 @@ config_default = {
     "text_model":os.path.join(script_dir,"../models/BM1684X/clip_text_vitb32_bm1684x_f16_1b.bmodel"),
     "dev_id":0,
     "input_image_queue_size": 20,
-    "result_queue_size": 20
+    "result_queue_size": 20,
+    "max_batch_size": None,     # 一次encode_image最多合并的图片数，None表示使用image bmodel的batch size
+    "batch_wait_ms": 10,        # 凑batch时等待后续请求的最长时间
+    "text_cache_size": 64       # 缓存文本特征的标签组数量
 }
 
 class ClipServer:
@@ -33,6 +38,7 @@ class ClipServer:
         """
         初始化clip_engine, input_image_queue
         """
+        config = dict(config_default, **config)
         # 初始化clip_engine, load bmodel, self.clip_engine is (model, preprocess) 
         self.clip_engine, self.preprocess = clip.load(config["image_model"], config["text_model"], config["dev_id"]) 
         """
@@ -40,26 +46,41 @@ class ClipServer:
         {
             "id": int,
             "image": numpy.ndarray,
-            "text": list[str]
+            "texts": list[str]
         }
         """
         self.input_image_queue = Queue(config["input_image_queue_size"])    # 后端服务器调用此接口，传入图片队列
         
         """
-        result_queue内部是多个dict, 用id确保每个数据项在队列中都有唯一的标识符
-        TODO: 这里不涉及到batch_size, 后续可以考虑添加
+        results按完成顺序保存结果, 以id为key, 可以按id取回(get_result), 也可以按完成顺序取回(get_batch_result)
         {
             "id": int,
-            "image": numpy.ndarray,
             "texts": list[str],
-            "similarity": numpy.ndarray
+            "similarity": list[float]
         }
         """
-        self.result_queue = Queue(config["result_queue_size"])    # 后端服务器调用此接口，传入结果队列
-        
+        self.result_queue_size = config["result_queue_size"]
+        self.results = OrderedDict()
+        self.results_cond = threading.Condition()
+
+        # 在batch_wait_ms内到达的请求合并为一个batch, 一次encode_image
+        self.max_batch_size = config["max_batch_size"] or self.clip_engine.image_net_batch_size
+        self.batch_wait = config["batch_wait_ms"] / 1000.
+        # 标签组 -> 归一化后的文本特征
+        self.text_cache_size = config["text_cache_size"]
+        self.text_features_cache = OrderedDict()
+
+        # 统计信息
+        self.push_times = {}
+        self.latencies = deque(maxlen=1000)
+        self.image_num = 0
+        self.device_slot_num = 0
+        self.batch_num = 0
+
         # 线程标志位
         self.running = True
-        self.existing_ids = set()  # 用于存储已存在的id
+        self.existing_ids = set()  # 用于存储未取回结果的id
+        self.lock = threading.Lock()
         # 启动线程
         self.predict_thread = threading.Thread(target=self.predict, args=())
         self.predict_thread.daemon = True # 设置为守护线程，主线程结束时，子线程也结束
@@ -74,62 +95,142 @@ class ClipServer:
             {
                 "id": int,
                 "image": numpy.ndarray,
-                "text": list[str]
+                "texts": list[str]
             }
         """
-        if data["id"] in self.existing_ids:
-            raise ValueError(f"ID {data['id']} already exists in the queue.")
-        
-        self.existing_ids.add(data["id"])
+        with self.lock:
+            if data["id"] in self.existing_ids:
+                raise ValueError(f"ID {data['id']} already exists in the queue.")
+            self.existing_ids.add(data["id"])
+            self.push_times[data["id"]] = time.time()
         self.input_image_queue.put(data)    # 非pipeline预测，直接调用demo
         print("==================================================")
         print("push success,id:",data["id"],data["texts"])
         print("==================================================")
 
+    def collect_batch(self):
+        """
+        取出一个batch的请求: 阻塞等待第一个请求, 之后最多等待batch_wait秒凑满max_batch_size
+        """
+        try:
+            batch = [self.input_image_queue.get(timeout=0.1)]
+        except Empty:
+            return []
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.input_image_queue.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def get_text_features(self, texts):
+        key = tuple(texts)
+        text_features = self.text_features_cache.get(key)
+        if text_features is None:
+            text_features = self.clip_engine.encode_text(clip.tokenize(list(texts)))
+            text_features /= np.linalg.norm(text_features, axis=-1, keepdims=True)
+            self.text_features_cache[key] = text_features
+            while len(self.text_features_cache) > self.text_cache_size:
+                self.text_features_cache.popitem(last=False)
+        else:
+            self.text_features_cache.move_to_end(key)
+        return text_features
+
     def predict(self):
         """
-        这个推理函数将被当前class的init线程调用,修改input_image_queue、result_queue, 执行预测
+        这个推理函数将被当前class的init线程调用, 从input_image_queue凑batch, 执行预测, 按id写回结果
         """
         while self.running:
+            batch = self.collect_batch()
+            if not batch:
+                continue
+            ids = [data["id"] for data in batch]
+            print("==================================================")
+            print("predict batch,ids:",ids)
+            print("==================================================")
             try:
-                # get data ，队列为空则线程阻塞
-                data = self.input_image_queue.get()
-                print("==================================================")
-                print("predict success,id:",data["id"],data["texts"])
-                print("==================================================")
-                # self.existing_ids.remove(data["id"])  # 从集合中移除已处理的id
-                # Tokenize
-                text_inputs = clip.tokenize(data["texts"])
-                # Preprocess
-                image_input = np.expand_dims(self.preprocess(data["image"]), axis=0)
-                # Predict
-                values, indices = self.clip_engine.predict(image_input, text_inputs)
-                # Text: {text[indices[i]]}, Similarity: {values[i].item()}
-                texts = [data["texts"][index] for index in indices]
-                # 将 similarity 转换为 Python 的原生 float 类型
-                similarity = [float(value) for value in values]
-                print("indices",indices)
-                # push result 
-                self.result_queue.put({
-                    "id": data["id"],
-                    # "image": data["image"],
-                    "texts": texts,
-                    "similarity": similarity
-                })
-                print("predict success,id:",data["id"])
+                # Preprocess, 一个batch只调用一次encode_image
+                image_input = np.stack([self.preprocess(data["image"]) for data in batch])
+                image_features = self.clip_engine.encode_image(image_input)
+                image_features /= np.linalg.norm(image_features, axis=-1, keepdims=True)
+                image_slots = -(-len(batch) // self.clip_engine.image_net_batch_size) * self.clip_engine.image_net_batch_size
+                for data, image_feature in zip(batch, image_features):
+                    text_features = self.get_text_features(data["texts"])
+                    similarity = self.clip_engine.softmax((100.0 * np.dot(image_feature[None], text_features.T)), axis=-1) #计算相似度，并转换为概率分布
+                    values, indices = self.clip_engine.topk(similarity[0], min(len(data["texts"]), self.clip_engine.top_k))
+                    # Text: {text[indices[i]]}, Similarity: {values[i].item()}
+                    texts = [data["texts"][index] for index in indices]
+                    # 将 similarity 转换为 Python 的原生 float 类型
+                    similarity = [float(value) for value in values]
+                    self.put_result({
+                        "id": data["id"],
+                        "texts": texts,
+                        "similarity": similarity
+                    })
+                self.batch_num += 1
+                self.image_num += len(batch)
+                self.device_slot_num += image_slots
+                print("predict success,ids:",ids)
             except Exception as e:
-                print("predict error,id:",data["id"])
+                print("predict error,ids:",ids)
                 print(e)
+                for data in batch:
+                    self.put_result({"id": data["id"], "error": str(e)})
+
+    def put_result(self, result):
+        with self.results_cond:
+            # 结果未被取走时阻塞, 与原先有界result_queue的行为一致
+            while len(self.results) >= self.result_queue_size and self.running:
+                self.results_cond.wait(0.1)
+            self.results[result["id"]] = result
+            push_time = self.push_times.pop(result["id"], None)
+            if push_time is not None:
+                self.latencies.append(time.time() - push_time)
+            self.results_cond.notify_all()
+
+    def pop_result(self, id):
+        result = self.results.pop(id)
+        with self.lock:
+            self.existing_ids.discard(id)
+        self.results_cond.notify_all()
+        return result
 
     def pipeline_predict(self, image_path, texts):
         # TODO:
         return self.clip.predict(image_path, texts)
 
-    # 返回结果
+    # 按id返回结果, timeout为None时一直等待
+    def get_result(self, id, timeout=None):
+        with self.results_cond:
+            if not self.results_cond.wait_for(lambda: id in self.results, timeout):
+                return None
+            return self.pop_result(id)
+
+    # 按完成顺序返回结果
     def get_batch_result(self):
-        if self.result_queue.empty():
-            return None
-        return self.result_queue.get()
+        with self.results_cond:
+            if not self.results:
+                return None
+            return self.pop_result(next(iter(self.results)))
+
+    def get_stats(self):
+        """
+        batch_fill: 真实图片数 / encode_image实际占用的bmodel batch槽位数
+        latency: push_image到结果写回的时间
+        """
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "batch_num": self.batch_num,
+            "image_num": self.image_num,
+            "avg_batch_size": self.image_num / self.batch_num if self.batch_num else 0.0,
+            "batch_fill": self.image_num / self.device_slot_num if self.device_slot_num else 0.0,
+            "latency_p50(ms)": float(np.percentile(latencies, 50)),
+            "latency_p99(ms)": float(np.percentile(latencies, 99)),
+        }
 
     def stop(self):
         self.running = False
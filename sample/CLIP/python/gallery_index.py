@@ -0,0 +1,163 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import os
+import json
+import numpy as np
+import logging
+
+
+class GalleryIndex:
+    """
+    Append-only index of normalized CLIP image embeddings.
+
+    index_dir/
+        meta.json        dim, dtype and number of committed rows
+        embeddings.bin   (count, dim) float16 or int8 rows, opened as a memmap
+        scales.bin       (count,) float32 per-row scales, only for int8
+        manifest.jsonl   one {"id": ...} line per row
+
+    Rows and manifest lines are appended to the end of the files and meta.json is rewritten
+    last, so an interrupted append leaves the index at its previous count.
+    """
+    def __init__(self, index_dir, dim=None, dtype="float16"):
+        assert dtype in ["float16", "int8"], "dtype must be float16 or int8"
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        self.meta_path = os.path.join(index_dir, "meta.json")
+        self.embeddings_path = os.path.join(index_dir, "embeddings.bin")
+        self.scales_path = os.path.join(index_dir, "scales.bin")
+        self.manifest_path = os.path.join(index_dir, "manifest.jsonl")
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if dim is not None and dim != meta["dim"]:
+                raise ValueError("index dim is {}, got {}".format(meta["dim"], dim))
+            self.dim, self.dtype, self.count = meta["dim"], meta["dtype"], meta["count"]
+        else:
+            if dim is None:
+                raise ValueError("dim is required to create a new index")
+            self.dim, self.dtype, self.count = dim, dtype, 0
+
+        self.ids = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(self.ids) == self.count:
+                        break
+                    self.ids.append(json.loads(line)["id"])
+        self.id_set = set(self.ids)
+        self.embeddings = None
+        self.scales = None
+        self.open()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, id):
+        return id in self.id_set
+
+    def open(self):
+        if self.count == 0:
+            self.embeddings, self.scales = None, None
+            return
+        self.embeddings = np.memmap(self.embeddings_path, dtype=self.dtype, mode="r", shape=(self.count, self.dim))
+        if self.dtype == "int8":
+            self.scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(self.count,))
+
+    def _truncate(self, path, size):
+        # drop the tail written by an interrupted append
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def add(self, ids, features):
+        """
+        Append rows. features: (n, dim) float, normalized here. ids: n json serializable ids.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        assert features.shape == (len(ids), self.dim), "features must be ({}, {})".format(len(ids), self.dim)
+        if len(ids) == 0:
+            return
+        features = features / np.linalg.norm(features, axis=-1, keepdims=True)
+
+        itemsize = np.dtype(self.dtype).itemsize
+        self._truncate(self.embeddings_path, self.count * self.dim * itemsize)
+        if self.dtype == "int8":
+            self._truncate(self.scales_path, self.count * 4)
+            scales = np.maximum(np.abs(features).max(axis=-1), 1e-12) / 127.
+            rows = np.clip(np.round(features / scales[:, None]), -127, 127).astype(np.int8)
+            with open(self.scales_path, "ab") as f:
+                f.write(scales.astype(np.float32).tobytes())
+        else:
+            rows = features.astype(np.float16)
+        with open(self.embeddings_path, "ab") as f:
+            f.write(rows.tobytes())
+
+        with open(self.manifest_path, "r+" if os.path.exists(self.manifest_path) else "w", encoding="utf-8") as f:
+            # skip the committed lines, overwrite anything after them
+            for _ in range(self.count):
+                f.readline()
+            f.seek(f.tell())
+            f.truncate()
+            for id in ids:
+                f.write(json.dumps({"id": id}, ensure_ascii=False) + "\n")
+
+        self.count += len(ids)
+        self.ids.extend(ids)
+        self.id_set.update(ids)
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "count": self.count}, f)
+        os.replace(tmp_path, self.meta_path)
+        self.open()
+
+    def block(self, start, end):
+        block = np.asarray(self.embeddings[start:end], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:end, None]
+        return block
+
+    def search(self, queries, top_k=5, block_size=65536):
+        """
+        Cosine top-k over the whole index, scanning the memmap block by block so the memory
+        stays bounded by block_size rows whatever the index size.
+
+        Args:
+            queries: (q, dim) float query features, normalized here
+        Returns:
+            list of q lists of (id, score), best first
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        queries = queries / np.linalg.norm(queries, axis=-1, keepdims=True)
+        num_queries = queries.shape[0]
+        if self.count == 0:
+            return [[] for _ in range(num_queries)]
+        top_k = min(top_k, self.count)
+
+        best_scores = np.full((num_queries, 0), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((num_queries, 0), dtype=np.int64)
+        for start in range(0, self.count, block_size):
+            end = min(start + block_size, self.count)
+            scores = queries @ self.block(start, end).T   # (q, block)
+            k = min(top_k, end - start)
+            part = np.argpartition(-scores, k - 1, axis=-1)[:, :k]
+            scores = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=-1)], axis=-1)
+            indices = np.concatenate([best_indices, part + start], axis=-1)
+            if scores.shape[1] > top_k:
+                keep = np.argpartition(-scores, top_k - 1, axis=-1)[:, :top_k]
+                scores = np.take_along_axis(scores, keep, axis=-1)
+                indices = np.take_along_axis(indices, keep, axis=-1)
+            best_scores, best_indices = scores, indices
+
+        order = np.argsort(-best_scores, axis=-1)
+        best_scores = np.take_along_axis(best_scores, order, axis=-1)
+        best_indices = np.take_along_axis(best_indices, order, axis=-1)
+        logging.debug("searched {} rows for {} queries".format(self.count, num_queries))
+        return [[(self.ids[i], float(s)) for i, s in zip(indices, scores)] for indices, scores in zip(best_indices, best_scores)]
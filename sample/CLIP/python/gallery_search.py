@@ -0,0 +1,111 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import os
+import time
+import cv2
+import clip
+import argparse
+import logging
+import numpy as np
+from gallery_index import GalleryIndex
+logging.basicConfig(level=logging.INFO)
+
+IMAGE_EXTS = ['.jpg', '.png', '.jpeg', '.bmp', '.webp']
+
+
+def build_index(model, preprocess, args):
+    index = GalleryIndex(args.index_dir, dim=model.embed_dim, dtype=args.index_dtype)
+    image_paths = []
+    for root, dirs, filenames in os.walk(args.image_dir):
+        filenames.sort()
+        for filename in filenames:
+            if os.path.splitext(filename)[-1].lower() not in IMAGE_EXTS:
+                continue
+            image_path = os.path.abspath(os.path.join(root, filename))
+            # incremental: images already in the index are not encoded again
+            if image_path not in index:
+                image_paths.append(image_path)
+    logging.info("index has {} images, {} new images to encode".format(len(index), len(image_paths)))
+
+    start_time = time.time()
+    for start_idx in range(0, len(image_paths), args.batch_size):
+        ids, images = [], []
+        for image_path in image_paths[start_idx:start_idx + args.batch_size]:
+            image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                logging.error("{} imdecode is None.".format(image_path))
+                continue
+            ids.append(image_path)
+            images.append(preprocess(image))
+        if not ids:
+            continue
+        index.add(ids, model.encode_image(np.stack(images)))
+        logging.info("encoded {}/{} images".format(min(start_idx + args.batch_size, len(image_paths)), len(image_paths)))
+    if image_paths:
+        logging.info("image_encode(ms): {:.2f}".format(model.encode_image_time / len(image_paths) * 1000))
+        logging.info("index time(s): {:.2f}".format(time.time() - start_time))
+    return index
+
+
+def search_index(model, preprocess, args):
+    index = GalleryIndex(args.index_dir)
+    if args.query_image is not None:
+        image = cv2.imdecode(np.fromfile(args.query_image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        query_names = [args.query_image]
+        queries = model.encode_image(np.expand_dims(preprocess(image), axis=0))
+    else:
+        query_names = args.text
+        queries = model.encode_text(clip.tokenize(args.text))
+
+    start_time = time.time()
+    results = index.search(queries, top_k=args.top_k, block_size=args.block_size)
+    logging.info("search {} queries over {} images, time(ms): {:.2f}".format(len(query_names), len(index), (time.time() - start_time) * 1000))
+    for name, result in zip(query_names, results):
+        logging.info("Query: {}".format(name))
+        for id, score in result:
+            logging.info("    {:.4f} {}".format(score, id))
+    return results
+
+
+def main(args):
+    if args.mode == 'index':
+        if not os.path.isdir(args.image_dir):
+            raise FileNotFoundError('{} is not existed.'.format(args.image_dir))
+    elif not os.path.exists(os.path.join(args.index_dir, 'meta.json')):
+        raise FileNotFoundError('{} is not an index dir.'.format(args.index_dir))
+
+    model, preprocess = clip.load(args.image_model, args.text_model, args.dev_id)
+    if args.mode == 'index':
+        build_index(model, preprocess, args)
+    else:
+        search_index(model, preprocess, args)
+
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--mode', type=str, default='search', choices=['index', 'search'], help='index: add the images of image_dir to the index, search: query the index')
+    parser.add_argument('--index_dir', type=str, default='./gallery_index', help='dir of the embedding index')
+    parser.add_argument('--image_dir', type=str, default='./datasets', help='image dir to index, only new images are encoded')
+    parser.add_argument('--index_dtype', type=str, default='float16', choices=['float16', 'int8'], help='storage type of a new index')
+    parser.add_argument('--batch_size', type=int, default=16, help='number of images encoded per encode_image call')
+    parser.add_argument('--text', nargs='+', default=['a dog'], help='text queries')
+    parser.add_argument('--query_image', type=str, default=None, help='image query, used instead of --text if set')
+    parser.add_argument('--top_k', type=int, default=5, help='number of results per query')
+    parser.add_argument('--block_size', type=int, default=65536, help='index rows scored per block')
+    parser.add_argument('--image_model', type=str, default='./models/BM1684X/clip_image_vitb32_bm1684x_f16_1b.bmodel', help='path of image bmodel')
+    parser.add_argument('--text_model', type=str, default='./models/BM1684X/clip_text_vitb32_bm1684x_f16_1b.bmodel', help='path of text bmodel')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
+    print('all done.')
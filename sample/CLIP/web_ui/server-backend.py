@@ -85,9 +85,14 @@ class Call_Clip_server:
         print("push_data:",data)
 
 
-    def get_result(self):
-        result = self.clip_server.get_batch_result()
-        return result
+    def get_result(self, id=None):
+        # 有id时只返回该请求的结果，多个前端同时请求时不会取到别人的结果
+        if id is None:
+            return self.clip_server.get_batch_result()
+        return self.clip_server.get_result(id, timeout=0)
+
+    def get_stats(self):
+        return self.clip_server.get_stats()
 
 @app.route('/push_data', methods=['POST'])
 def call_clip_server_push_data():
@@ -120,7 +125,7 @@ def call_clip_server_push_data():
 @app.route('/get_result', methods=['GET'])
 def call_clip_server_get_result():
     id = request.args.get('id')
-    result = clip_server_instance.get_result()
+    result = clip_server_instance.get_result(int(id) if id is not None else None)
     if result == None:
         return jsonify({"error": "result is None,you should sent data first"}), 400
 
@@ -129,6 +134,12 @@ def call_clip_server_get_result():
     return jsonify(result)
 
 
+@app.route('/stats', methods=['GET'])
+def call_clip_server_get_stats():
+    # batch填充率和请求延迟p50/p99
+    return jsonify(clip_server_instance.get_stats())
+
+
 def argsparser():
     parser = argparse.ArgumentParser(prog=__file__)
     parser.add_argument('--host', type=str, default='0.0.0.0', help='host')
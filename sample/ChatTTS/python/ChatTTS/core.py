@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 import tempfile
 from dataclasses import dataclass, asdict
@@ -21,6 +22,13 @@ from .utils import (
 from .utils import logger as utils_logger
 from .norm import Normalizer
 
+class StreamDecodeState:
+    """Progress of the incremental decode of one streamed utterance."""
+    def __init__(self):
+        self.num_tokens = 0  # tokens covered by the last decoded window
+        self.emitted = 0     # samples yielded so far
+        self.tail = None     # decoded samples after `emitted`, held back for the next window
+
 class Chat:
     def __init__(self, logger=logging.getLogger(__name__)):
         self.version = "1.0.0"
@@ -39,6 +47,7 @@ class Chat:
             self.sha256_map: Dict[str, str] = load(f)
 
         self.context = GPT.Context()
+        self.decode_time = 0.0
 
     def has_loaded(self, use_decoder=False):
         not_finish = False
@@ -116,6 +125,14 @@ class Chat:
         stream_batch: int = 24
         stream_speed: int = 12000
         pass_first_n_batches: int = 2
+        # stream: decode only the new tokens plus stream_left_context tokens of context per yield,
+        # hold back the audio of the last stream_right_context tokens until more tokens arrive and
+        # cross-fade stream_crossfade samples at the seams, instead of decoding the whole utterance
+        # and slicing stream_speed samples off it
+        stream_incremental: bool = True
+        stream_left_context: int = 48
+        stream_right_context: int = 12
+        stream_crossfade: int = 1024
 
     def infer(
         self,
@@ -131,6 +148,7 @@ class Chat:
         params_infer_code=InferCodeParams(),
     ):
         self.context.set(False)
+        self.decode_time = 0.0
         res_gen = self._infer(
             text,
             stream,
@@ -148,6 +166,61 @@ class Chat:
         else:
             return next(res_gen)
 
+    def infer_batch(
+        self,
+        texts: List[str],
+        lang=None,
+        skip_refine_text=False,
+        use_decoder=True,
+        do_text_normalization=True,
+        do_homophone_replacement=True,
+        params_refine_text=RefineTextParams(),
+        params_infer_code=InferCodeParams(),
+        pack_gap: int = 24,
+    ) -> List[torch.Tensor]:
+        """
+        Synthesize a list of sentences, e.g. a paragraph split at punctuation, for throughput.
+
+        Only decoding is batched. The GPT bmodel has batch 1 and a single kv cache, so the
+        codes are generated one sentence after another and GPT time is the same as calling
+        `infer` per sentence; the gain comes from fewer decoder + vocos calls.
+        Decoding is packed: the codes of several sentences are laid out along the time axis
+        of one decoder input, `pack_gap` zero tokens apart so that neighbouring sentences do
+        not leak into each other, and go through one decoder + vocos call.
+
+        Returns:
+            one (1, samples) waveform per sentence, in the order of `texts`
+        """
+        assert self.has_loaded(use_decoder=use_decoder)
+        assert len(texts), 'texts should not be empty'
+        self.context.set(False)
+        self.decode_time = 0.0
+
+        texts = [
+            self.normalizer(
+                t,
+                do_text_normalization,
+                do_homophone_replacement,
+                lang,
+            )
+            for t in texts
+        ]
+        if not skip_refine_text:
+            refined_texts = []
+            for text in texts:
+                refined = self._refine_text([text], params_refine_text)
+                text_tokens = [i[i.less(self.tokenizer.convert_tokens_to_ids('[break_0]'))] for i in refined.ids]
+                refined_texts += self.tokenizer.batch_decode(text_tokens)
+                refined.destroy()
+            texts = refined_texts
+
+        src_list = []
+        for text in texts:
+            result = next(self._infer_code([text], False, use_decoder, params_infer_code))
+            src_list.append((result.hiddens if use_decoder else result.ids)[0])
+            result.destroy()
+        return self._decode_packed(src_list, use_decoder, pack_gap, params_infer_code)
+
     def interrupt(self):
         self.context.set(True)
 
@@ -259,12 +332,25 @@ class Chat:
         if stream:
             length = 0
             pass_batch_count = 0
+            if params_infer_code.stream_incremental:
+                decode_state = StreamDecodeState()
+                src = None
         for result in self._infer_code(
             text,
             stream,
             use_decoder,
             params_infer_code,
         ):
+            if stream and params_infer_code.stream_incremental:
+                src = (result.hiddens if use_decoder else result.ids)[0]
+                result.destroy()
+                pass_batch_count += 1
+                if pass_batch_count <= params_infer_code.pass_first_n_batches:
+                    continue
+                new_wavs = self._decode_stream_window(src, use_decoder, decode_state, params_infer_code)
+                if new_wavs.size(-1) > 0:
+                    yield new_wavs
+                continue
             wavs = self._decode_to_wavs(
                 result.hiddens if use_decoder else result.ids,
                 use_decoder,
@@ -283,16 +369,22 @@ class Chat:
                 yield new_wavs
             else:
                 yield wavs
-        if stream and length < wavs.shape[1]:
+        if stream and params_infer_code.stream_incremental:
+            if src is not None:
+                new_wavs = self._decode_stream_window(src, use_decoder, decode_state, params_infer_code, final=True)
+                if new_wavs.size(-1) > 0:
+                    yield new_wavs
+        elif stream and length < wavs.shape[1]:
             new_wavs = wavs[:, length:]
             yield new_wavs
 
     @torch.inference_mode()
-    def _vocos_decode(self, spec: torch.Tensor) -> np.ndarray:
+    def _vocos_decode(self, spec: torch.Tensor, num_frames: Optional[int] = None) -> np.ndarray:
         mag, x, y = self.vocos([spec.numpy()])
-        mag = torch.from_numpy(mag)
-        x = torch.from_numpy(x)
-        y = torch.from_numpy(y)
+        # the ISTFT only needs the frames of the real length, not the padded ones
+        mag = torch.from_numpy(mag[..., :num_frames])
+        x = torch.from_numpy(x[..., :num_frames])
+        y = torch.from_numpy(y[..., :num_frames])
         S = mag * (x + 1j * y)
         audio = self.postprocess(S)
         return audio
@@ -318,6 +410,18 @@ class Chat:
             batch_result[i].narrow(1, 0, src.size(0)).copy_(src.permute(1, 0))
             del src
         del_all(result_list)
+        return self._decode_padded(batch_result, real_len, use_decoder)
+
+    @torch.inference_mode()
+    def _decode_padded(
+        self,
+        batch_result: torch.Tensor,
+        real_len: int,
+        use_decoder: bool,
+    ):
+        """Decoder (or dvae) + vocos of a (1, C, max_x_len) input whose first real_len tokens are used."""
+        start_time = time.time()
+        max_x_len = self.decoder.input_shape[-1]
         if use_decoder:
             mel_specs = torch.from_numpy(self.decoder([batch_result.numpy()])[0])
             del batch_result
@@ -331,13 +435,110 @@ class Chat:
                 mode="constant",
                 value=0,
             )
-        wavs = self._vocos_decode(mel_specs)
+        # frames per token, plus a few frames of margin so the ISTFT overlap-add of the kept samples is complete
+        frames_per_token = mel_specs.size(-1) // max_x_len
+        self.samples_per_token = frames_per_token * self.postprocess.hop_length
+        num_frames = min(mel_specs.size(-1), real_len * frames_per_token + 2 * frames_per_token + 4)
+        wavs = self._vocos_decode(mel_specs, num_frames)
         del mel_specs
         # clip wav to real length len*()
-        wavs = wavs[:, :int(float(real_len/max_x_len)*wavs.size(-1))]
+        wavs = wavs[:, :real_len * frames_per_token * self.postprocess.hop_length]
+        self.decode_time += time.time() - start_time
 
         return wavs
 
+    @torch.inference_mode()
+    def _decode_packed(
+        self,
+        src_list: List[torch.Tensor],
+        use_decoder: bool,
+        gap: int,
+        params: InferCodeParams,
+    ) -> List[torch.Tensor]:
+        """
+        Decode several (len, C) code/hidden sequences, packing as many as fit, `gap` tokens apart,
+        into one decoder input. Sequences longer than the decoder input go through the windowed
+        stream decode.
+        """
+        max_x_len = self.decoder.input_shape[-1]
+        wavs_list = [None] * len(src_list)
+        packs, pack, used = [], [], 0
+        for idx, src in enumerate(src_list):
+            if src.size(0) > max_x_len:
+                state = StreamDecodeState()
+                chunks = []
+                for end in range(max_x_len // 2, src.size(0), max_x_len // 2):
+                    chunks.append(self._decode_stream_window(src.narrow(0, 0, end), use_decoder, state, params))
+                chunks.append(self._decode_stream_window(src, use_decoder, state, params, final=True))
+                wavs_list[idx] = torch.cat(chunks, dim=1)
+                continue
+            start = used + gap if pack else 0
+            if start + src.size(0) > max_x_len:
+                packs.append(pack)
+                pack, start = [], 0
+            pack.append((idx, start))
+            used = start + src.size(0)
+        if pack:
+            packs.append(pack)
+
+        for pack in packs:
+            first = src_list[pack[0][0]]
+            batch_result = torch.zeros((1, first.size(1), max_x_len), dtype=first.dtype)
+            for idx, start in pack:
+                batch_result[0].narrow(1, start, src_list[idx].size(0)).copy_(src_list[idx].permute(1, 0))
+            idx, start = pack[-1]
+            wavs = self._decode_padded(batch_result, start + src_list[idx].size(0), use_decoder)
+            for idx, start in pack:
+                wavs_list[idx] = wavs[:, start * self.samples_per_token:(start + src_list[idx].size(0)) * self.samples_per_token].clone()
+        return wavs_list
+
+    @torch.inference_mode()
+    def _decode_stream_window(
+        self,
+        src: torch.Tensor,
+        use_decoder: bool,
+        state: StreamDecodeState,
+        params: InferCodeParams,
+        final: bool = False,
+    ):
+        """
+        Decode the tokens of `src` (all tokens generated so far) that are new since the last call,
+        with up to params.stream_left_context tokens of already yielded context, and return the
+        samples not yielded yet. Unless `final`, the samples of the last stream_right_context tokens,
+        which lack right context, and the stream_crossfade samples before them are held back; the
+        next window decodes them again and cross-fades the first stream_crossfade samples.
+        """
+        num_tokens = src.size(0)
+        if num_tokens == state.num_tokens:
+            if not final or state.tail is None:
+                return torch.zeros((1, 0))
+            new_wavs, state.tail = state.tail, None
+            state.emitted += new_wavs.size(-1)
+            return new_wavs
+
+        # the window is at most the decoder input length, so utterances may be longer than it
+        start = max(0, num_tokens - self.decoder.input_shape[-1])
+        if state.emitted > 0:
+            start = max(start, state.emitted // self.samples_per_token - params.stream_left_context)
+        wavs = self._decode_to_wavs([src.narrow(0, start, num_tokens - start)], use_decoder)
+        offset = start * self.samples_per_token
+        assert offset <= state.emitted, "stream_batch too large for the decoder input length"
+
+        end = offset + wavs.size(-1)
+        if not final:
+            end -= params.stream_right_context * self.samples_per_token + params.stream_crossfade
+            if end <= state.emitted:
+                return torch.zeros((1, 0))
+        new_wavs = wavs[:, state.emitted - offset:end - offset].clone()
+        if state.tail is not None:
+            n = min(params.stream_crossfade, state.tail.size(-1), new_wavs.size(-1))
+            fade_in = (torch.arange(n, dtype=new_wavs.dtype) + 0.5) / n
+            new_wavs[:, :n] = state.tail[:, :n] * (1 - fade_in) + new_wavs[:, :n] * fade_in
+        state.tail = None if final else wavs[:, end - offset:].clone()
+        state.emitted = end
+        state.num_tokens = num_tokens
+        return new_wavs
+
     @torch.no_grad()
     def _infer_code(
         self,
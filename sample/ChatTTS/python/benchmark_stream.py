@@ -0,0 +1,70 @@
+import ChatTTS
+import torch
+import time as time
+import os
+import argparse
+os.environ["OPENBLAS_NUM_THREADS"] = "16"
+
+# Streamed synthesis of the same text with the incremental and the full (re-decode everything,
+# slice the new samples) vocoder paths: time to first audio, total time and decoder + vocos time.
+inputs_en = """
+chat T T S is a text to speech model designed for dialogue applications.
+[uv_break]it supports mixed language input [uv_break]and offers multi speaker
+capabilities with precise control over prosodic elements like
+[uv_break]laughter[uv_break][laugh], [uv_break]pauses, [uv_break]and intonation.
+[uv_break]it delivers natural and expressive speech,[uv_break]so please
+[uv_break] use the project responsibly at your own risk.[uv_break]
+""".replace('\n', '')
+sample_rate = 24000
+
+def run(chat, text, spk_emb, incremental, args):
+    torch.manual_seed(args.seed)
+    start = time.time()
+    first_audio = None
+    wav_len = 0
+    for wav in chat.infer(text,
+                          skip_refine_text=True, use_decoder=True, stream=True,
+                          params_infer_code=ChatTTS.Chat.InferCodeParams(
+                              prompt="[speed_5]",
+                              temperature=0.3,
+                              spk_emb=spk_emb,
+                              show_tqdm=False,
+                              max_new_token=args.max_new_token,
+                              stream_batch=args.stream_batch,
+                              stream_incremental=incremental)):
+        if first_audio is None:
+            first_audio = time.time() - start
+        wav_len += wav.shape[1] / sample_rate
+    total = time.time() - start
+    print("{:>11} | first audio(s): {:.3f} | total(s): {:.3f} | decoder+vocos(s): {:.3f} | audio(s): {:.2f} | RTF: {:.3f}".format(
+        "incremental" if incremental else "full", first_audio, total, chat.decode_time, wav_len, total / max(wav_len, 1e-6)))
+
+def main(args):
+    chat = ChatTTS.Chat()
+    chat.load(local_path=args.model_path, tpu_id=args.dev_id)
+    torch.set_num_threads(4)
+    torch.manual_seed(args.seed)
+    spk_emb = chat.sample_random_speaker_num()
+    text = " ".join([inputs_en] * args.repeat)
+    for mode in args.modes:
+        try:
+            run(chat, text, spk_emb, mode == "incremental", args)
+        except (AssertionError, RuntimeError) as e:
+            # the full path decodes the whole utterance in one decoder call
+            print("{:>11} | failed: {}".format(mode, e))
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--model_path', type=str, default='../models', help='dir of the bmodels')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--repeat', type=int, default=2, help='times the test text is repeated, longer texts make longer utterances')
+    parser.add_argument('--modes', type=str, nargs='+', default=['full', 'incremental'], choices=['full', 'incremental'], help='stream decode paths to run')
+    parser.add_argument('--stream_batch', type=int, default=24, help='tokens per stream yield')
+    parser.add_argument('--max_new_token', type=int, default=2048, help='max audio tokens')
+    parser.add_argument('--seed', type=int, default=1222, help='torch seed, the same tokens are generated in every mode')
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
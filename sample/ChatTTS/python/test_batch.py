@@ -0,0 +1,40 @@
+import ChatTTS
+import torch
+import torchaudio
+import re
+import time as time
+import os
+os.environ["OPENBLAS_NUM_THREADS"] = "16"
+chat = ChatTTS.Chat()
+chat.load(local_path='../models')
+torch.set_num_threads(4)
+inputs_en = """
+chat T T S is a text to speech model designed for dialogue applications.
+[uv_break]it supports mixed language input [uv_break]and offers multi speaker
+capabilities with precise control over prosodic elements like
+[uv_break]laughter[uv_break][laugh], [uv_break]pauses, [uv_break]and intonation.
+[uv_break]it delivers natural and expressive speech,[uv_break]so please
+[uv_break] use the project responsibly at your own risk.[uv_break]
+""".replace('\n', '')
+# split the paragraph into sentences: codes are generated per sentence, decoding is packed
+sentences = [s.strip() for s in re.split(r'(?<=[.!?。！？])', inputs_en) if s.strip()]
+
+sample_rate = 24000
+torch.manual_seed(1222)
+start = time.time()
+wavs = chat.infer_batch(sentences,
+                        skip_refine_text=True, use_decoder=True,
+                        params_infer_code = ChatTTS.Chat.InferCodeParams(
+                            prompt="[speed_5]",
+                            temperature=0.3,
+                            spk_emb=chat.sample_random_speaker_num()))
+time_cost = time.time() - start
+
+# 0.2s of silence between sentences
+silence = torch.zeros((1, int(0.2 * sample_rate)))
+wav = torch.cat([w for pair in zip(wavs, [silence] * len(wavs)) for w in pair][:-1], dim=1)
+wav_len = wav.shape[1] / sample_rate
+
+print("sentences: {}, decoder+vocos time(s): {:.3f}".format(len(sentences), chat.decode_time))
+print("Real-Time Factor(RTF): ", time_cost / wav_len)
+torchaudio.save("test_batch.wav", wav, sample_rate=sample_rate)
@@ -0,0 +1,67 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import argparse
+import time
+import logging
+import numpy as np
+from deep_sort.sort.nn_matching import NearestNeighborDistanceMetric
+from deep_sort.sort.detection import Detection
+from deep_sort.sort.tracker import Tracker
+logging.basicConfig(level=logging.INFO)
+
+# Tracker.predict + Tracker.update time per frame versus the number of targets,
+# on synthetic detections and re-ID features. Needs no TPU.
+
+def synthetic_frames(num_targets, num_frames, feature_dim, rng):
+    pos = rng.uniform(0, 1800, (num_targets, 2))
+    vel = rng.normal(0, 3, (num_targets, 2))
+    wh = rng.uniform(30, 80, (num_targets, 2))
+    identities = rng.normal(size=(num_targets, feature_dim)).astype(np.float32)
+    frames = []
+    for _ in range(num_frames):
+        pos += vel
+        keep = rng.uniform(size=num_targets) > 0.05
+        tlwh = np.concatenate([pos, wh], axis=1)[keep] + rng.normal(0, 1, (keep.sum(), 4))
+        features = identities[keep] + 0.1 * rng.normal(size=(keep.sum(), feature_dim)).astype(np.float32)
+        frames.append([Detection(tlwh[i], 0, 0.9, features[i]) for i in range(len(tlwh))])
+    return frames
+
+def main(args):
+    rng = np.random.default_rng(0)
+    logging.info("frames: {}, feature_dim: {}, nn_budget: {}".format(args.frames, args.feature_dim, args.nn_budget))
+    for num_targets in args.num_targets:
+        frames = synthetic_frames(num_targets, args.frames, args.feature_dim, rng)
+        metric = NearestNeighborDistanceMetric("cosine", args.max_dist, args.nn_budget)
+        tracker = Tracker(metric, max_iou_distance=0.7, max_age=70, n_init=3)
+        update_time = 0.0
+        for frame_id, detections in enumerate(frames):
+            start_time = time.time()
+            tracker.predict()
+            tracker.update(detections)
+            # the first frames only create tracks
+            if frame_id >= args.warmup:
+                update_time += time.time() - start_time
+        num_frames = max(1, args.frames - args.warmup)
+        logging.info("targets: {:4d}, tracks: {:4d}, update time per frame(ms): {:.2f}".format(
+            num_targets, len(tracker.tracks), update_time / num_frames * 1000))
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--num_targets', type=int, nargs='+', default=[25, 50, 100, 200, 400], help='numbers of targets per frame to benchmark')
+    parser.add_argument('--frames', type=int, default=100, help='frames per run')
+    parser.add_argument('--warmup', type=int, default=10, help='frames not timed at the start of each run')
+    parser.add_argument('--feature_dim', type=int, default=512, help='re-ID feature dim')
+    parser.add_argument('--nn_budget', type=int, default=100, help='samples kept per track')
+    parser.add_argument('--max_dist', type=float, default=0.2, help='max cosine distance')
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
@@ -11,8 +11,9 @@ import cv2
 import logging
 import sophon.sail as sail
 import time
+from concurrent.futures import ThreadPoolExecutor
 class Extractor(object):
-    def __init__(self, model_path, dev_id):
+    def __init__(self, model_path, dev_id, pipeline=True):
         self.net = sail.Engine(model_path, dev_id, sail.IOMode.SYSIO)
         logging.info("load {} success!".format(model_path))
         self.graph_name = self.net.get_graph_names()[0]
@@ -25,50 +26,77 @@ class Extractor(object):
         self.size = (self.net_w, self.net_h)
         self.mean = [0.406, 0.456, 0.485] #BGR
         self.std = [0.225, 0.224, 0.229]
+        # (x / 255 - mean) / std == x * scale - bias, per BGR channel
+        self.scale = (1. / (255. * np.array(self.std))).astype(np.float32)
+        self.bias = (np.array(self.mean) / np.array(self.std)).astype(np.float32)
+        # two sets of buffers: batch N+1 is preprocessed into one while batch N is inferred from the other
+        self.crop_buffers = [np.zeros((self.batch_size, self.net_h, self.net_w, 3), dtype=np.uint8) for _ in range(2)]
+        self.input_buffers = [np.zeros(self.input_shape, dtype=np.float32) for _ in range(2)]
+        self.executor = ThreadPoolExecutor(max_workers=1) if pipeline else None
         self.preprocess_time = 0.0
         self.inference_time = 0.0
-    def preprocess(self, im_batch):            
+
+    def preprocess(self, im_batch, buffer_id=0):
+        """
+        Resize the crops into a uint8 batch buffer and normalize the whole batch at once.
+        The rows after len(im_batch) keep stale data, their features are dropped.
+        Returns the float32 (batch_size, 3, net_h, net_w) RGB input buffer.
+        """
         if len(im_batch) > self.batch_size:
             raise KeyError("Batchsize incorrect! Must less than bmodel batchsize")
-        preprocessed_numpy_array = [] #shape: [self.batch_size, 3, 128, 64]
-        for im in im_batch:
-            resized = cv2.resize(im.astype(np.float32) / 255., self.size)
-            meaned = resized - [[self.mean]]
-            stded = meaned / [[self.std]] #shape: [128,64,3]
-            transposed = np.transpose(stded, (2, 0, 1))[::-1] #shape: [3, 128, 64], bgr2rgb
-            preprocessed_numpy_array.append(transposed)
-        if len(preprocessed_numpy_array) == self.batch_size:
-            input_numpy_array = preprocessed_numpy_array
-        else:
-            input_numpy_array = np.zeros(self.input_shape, dtype='float32')
-            input_numpy_array[:len(preprocessed_numpy_array)] = preprocessed_numpy_array
-        return input_numpy_array
+        crops = self.crop_buffers[buffer_id]
+        input_array = self.input_buffers[buffer_id]
+        num = len(im_batch)
+        for i, im in enumerate(im_batch):
+            cv2.resize(im, self.size, dst=crops[i])
+        batch = crops[:num].astype(np.float32)
+        batch *= self.scale
+        batch -= self.bias
+        # NHWC bgr -> NCHW rgb
+        input_array[:num] = batch[..., ::-1].transpose((0, 3, 1, 2))
+        return input_array
+
+    def _timed_preprocess(self, im_batch, buffer_id):
+        start_preprocess = time.time()
+        input_batch = self.preprocess(im_batch, buffer_id)
+        return input_batch, time.time() - start_preprocess
 
     def __call__(self, im_crops):
-        i = 0
+        batches = [im_crops[i:i + self.batch_size] for i in range(0, len(im_crops), self.batch_size)]
         features = []
-        while i < len(im_crops):
-            im_batch = im_crops[i:min(i + self.batch_size, len(im_crops))]
-            start_preprocess = time.time()
-            
-            # temp = cv2.imread("../cpp/deepsort_bmcv/temp/0.jpg")
-            # temp = cv2.cvtColor(temp, cv2.COLOR_BGR2RGB)
-            # temp = np.transpose(temp, (2, 0, 1))
-            # for i in temp:
-            #     for j in i:
-            #         print(j)
-            #         exit(1)
-            # temp_batch=[]
-            # temp_batch.append(temp)
-            # input_batch = self.preprocess(temp_batch)
-            
-            input_batch = self.preprocess(im_batch)
-            self.preprocess_time += time.time() - start_preprocess
+        if not batches:
+            return features
+        if self.executor is not None:
+            next_batch = self.executor.submit(self._timed_preprocess, batches[0], 0)
+        for idx, im_batch in enumerate(batches):
+            if self.executor is not None:
+                input_batch, preprocess_time = next_batch.result()
+                if idx + 1 < len(batches):
+                    # preprocess batch N+1 while batch N is inferred
+                    next_batch = self.executor.submit(self._timed_preprocess, batches[idx + 1], (idx + 1) % 2)
+            else:
+                input_batch, preprocess_time = self._timed_preprocess(im_batch, 0)
+            self.preprocess_time += preprocess_time
             input_data = {self.input_name: input_batch}
             start_inference = time.time()
             features_batch = self.net.process(self.graph_name, input_data)[self.output_name]
             self.inference_time += time.time() - start_inference
-            features.extend(features_batch)
-            i += self.batch_size
+            features.extend(features_batch[:len(im_batch)])
+
+        return features
+
+    def close(self):
+        """Stop the preprocessing thread. A closed extractor keeps working without the pipeline."""
+        # getattr: __del__ also runs when __init__ failed before the executor was created
+        if getattr(self, "executor", None) is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-        return features
\ No newline at end of file
+    def __del__(self):
+        self.close()
@@ -18,14 +18,14 @@ __all__ = ['DeepSort']
 
 
 class DeepSort(object):
-    def __init__(self, model_path, dev_id, max_dist=0.2, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=70, n_init=3, nn_budget=100):
+    def __init__(self, model_path, dev_id, max_dist=0.2, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=70, n_init=3, nn_budget=100, extractor=None):
         self.min_confidence = min_confidence
         self.nms_max_overlap = nms_max_overlap
 
-        self.extractor = Extractor(model_path, dev_id)
+        # several trackers (e.g. one per stream) can share one extractor
+        self.extractor = extractor if extractor is not None else Extractor(model_path, dev_id)
 
         max_cosine_distance = max_dist
-        nn_budget = 100
         metric = NearestNeighborDistanceMetric(
             "cosine", max_cosine_distance, nn_budget)
         self.tracker = Tracker(
@@ -34,11 +34,16 @@ class DeepSort(object):
         self.postprocess_time = 0.0
         self.crop_num = 0
 
-    def update(self, bbox_xywh, confidences, clss, ori_img, frame_id):
+    def update(self, bbox_xywh, confidences, clss, ori_img, frame_id, features=None):
+        """
+        features: re-ID features of the boxes, computed from the crops of get_crops, e.g. in one
+        extractor call shared by several trackers. Extracted here if None.
+        """
         self.height, self.width = ori_img.shape[:2]
         bbox_xywh = np.array(bbox_xywh)
         # generate detections
-        features = self._get_features(bbox_xywh, ori_img)
+        if features is None:
+            features = self._get_features(bbox_xywh, ori_img)
         start_postprocess = time.time()
         bbox_tlwh = self._xywh_to_tlwh(bbox_xywh)
         detections = [Detection(bbox_tlwh[i], clss[i], conf, features[i]) for i, conf in enumerate(
@@ -98,12 +103,17 @@ class DeepSort(object):
         h = int(y2-y1)
         return t, l, w, h
 
-    def _get_features(self, bbox_xywh, ori_img):
+    def get_crops(self, bbox_xywh, ori_img):
+        self.height, self.width = ori_img.shape[:2]
         im_crops = []
         for box in bbox_xywh:
             x1, y1, x2, y2 = self._xywh_to_xyxy(box)
             im = ori_img[y1:y2, x1:x2]
             im_crops.append(im)
+        return im_crops
+
+    def _get_features(self, bbox_xywh, ori_img):
+        im_crops = self.get_crops(bbox_xywh, ori_img)
         if im_crops:
             self.crop_num += len(im_crops)
             features = self.extractor(im_crops)
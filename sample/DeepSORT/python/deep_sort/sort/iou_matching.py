@@ -39,6 +39,40 @@ def iou(bbox, candidates):
     return area_intersection / (area_bbox + area_candidates - area_intersection)
 
 
+def multi_iou(bboxes, candidates):
+    """Computer intersection over union of every bbox with every candidate.
+
+    Parameters
+    ----------
+    bboxes : ndarray
+        An Nx4 matrix of bounding boxes in format `(top left x, top left y,
+        width, height)`.
+    candidates : ndarray
+        An Mx4 matrix of candidate bounding boxes in the same format.
+
+    Returns
+    -------
+    ndarray
+        The NxM intersection over union, element (i, j) is
+        `iou(bboxes[i], candidates)[j]`.
+
+    """
+    bboxes_tl = bboxes[:, None, :2]
+    bboxes_br = bboxes[:, None, :2] + bboxes[:, None, 2:]
+    candidates_tl = candidates[None, :, :2]
+    candidates_br = candidates[None, :, :2] + candidates[None, :, 2:]
+
+    tl = np.maximum(bboxes_tl, candidates_tl)
+    br = np.minimum(bboxes_br, candidates_br)
+    wh = np.maximum(0., br - tl)
+
+    area_intersection = wh.prod(axis=2)
+    area_bboxes = bboxes[:, 2:].prod(axis=1)
+    area_candidates = candidates[:, 2:].prod(axis=1)
+    return area_intersection / (
+        area_bboxes[:, None] + area_candidates[None, :] - area_intersection)
+
+
 def iou_cost(tracks, detections, track_indices=None,
              detection_indices=None):
     """An intersection over union distance metric.
@@ -70,12 +104,12 @@ def iou_cost(tracks, detections, track_indices=None,
         detection_indices = np.arange(len(detections))
 
     cost_matrix = np.zeros((len(track_indices), len(detection_indices)))
-    for row, track_idx in enumerate(track_indices):
-        if tracks[track_idx].time_since_update > 1:
-            cost_matrix[row, :] = linear_assignment.INFTY_COST
-            continue
-
-        bbox = tracks[track_idx].to_tlwh()
-        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
-        cost_matrix[row, :] = 1. - iou(bbox, candidates)
+    if cost_matrix.size == 0:
+        return cost_matrix
+    bboxes = np.asarray([tracks[i].to_tlwh() for i in track_indices])
+    candidates = np.asarray([detections[i].tlwh for i in detection_indices])
+    cost_matrix[:] = 1. - multi_iou(bboxes, candidates)
+    too_old = np.asarray(
+        [tracks[i].time_since_update > 1 for i in track_indices])
+    cost_matrix[too_old, :] = linear_assignment.INFTY_COST
     return cost_matrix
@@ -122,6 +122,45 @@ class KalmanFilter(object):
 
         return mean, covariance
 
+    def multi_predict(self, mean, covariance):
+        """Run Kalman filter prediction step (Vectorized version).
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the object states at the previous
+            time step.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the object states at
+            the previous time step.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the mean matrix and covariance matrices of the predicted
+            states.
+
+        """
+        std_pos = [
+            self._std_weight_position * mean[:, 3],
+            self._std_weight_position * mean[:, 3],
+            1e-2 * np.ones_like(mean[:, 3]),
+            self._std_weight_position * mean[:, 3]]
+        std_vel = [
+            self._std_weight_velocity * mean[:, 3],
+            self._std_weight_velocity * mean[:, 3],
+            1e-5 * np.ones_like(mean[:, 3]),
+            self._std_weight_velocity * mean[:, 3]]
+        motion_cov = np.zeros((len(mean), 8, 8))
+        motion_cov[:, np.arange(8), np.arange(8)] = np.square(
+            np.r_[std_pos, std_vel]).T
+
+        mean = np.dot(mean, self._motion_mat.T)
+        covariance = np.matmul(np.matmul(
+            self._motion_mat, covariance), self._motion_mat.T) + motion_cov
+
+        return mean, covariance
+
     def project(self, mean, covariance):
         """Project state distribution to measurement space.
 
@@ -151,6 +190,37 @@ class KalmanFilter(object):
             self._update_mat, covariance, self._update_mat.T))
         return mean, covariance + innovation_cov
 
+    def multi_project(self, mean, covariance):
+        """Project state distributions to measurement space (Vectorized
+        version).
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the states.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx4 projected means and Nx4x4 projected covariance
+            matrices of the given state estimates.
+
+        """
+        std = [
+            self._std_weight_position * mean[:, 3],
+            self._std_weight_position * mean[:, 3],
+            1e-1 * np.ones_like(mean[:, 3]),
+            self._std_weight_position * mean[:, 3]]
+        innovation_cov = np.zeros((len(mean), 4, 4))
+        innovation_cov[:, np.arange(4), np.arange(4)] = np.square(np.r_[std]).T
+
+        mean = np.dot(mean, self._update_mat.T)
+        covariance = np.matmul(np.matmul(
+            self._update_mat, covariance), self._update_mat.T)
+        return mean, covariance + innovation_cov
+
     def update(self, mean, covariance, measurement):
         """Run Kalman filter correction step.
 
@@ -185,6 +255,37 @@ class KalmanFilter(object):
             kalman_gain, projected_cov, kalman_gain.T))
         return new_mean, new_covariance
 
+    def multi_update(self, mean, covariance, measurements):
+        """Run Kalman filter correction step (Vectorized version).
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional predicted mean matrix.
+        covariance : ndarray
+            The Nx8x8 dimensional predicted covariance matrices.
+        measurements : ndarray
+            The Nx4 dimensional measurement matrix, row i is the (x, y, a, h)
+            measurement of state i.
+
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+
+        """
+        projected_mean, projected_cov = self.multi_project(mean, covariance)
+
+        # kalman_gain = P * H^T * S^-1, S is symmetric so solve S * K^T = H * P
+        kalman_gain = np.linalg.solve(
+            projected_cov, np.matmul(self._update_mat, covariance)).transpose((0, 2, 1))
+        innovation = measurements - projected_mean
+
+        new_mean = mean + np.matmul(kalman_gain, innovation[:, :, None])[:, :, 0]
+        new_covariance = covariance - np.matmul(np.matmul(
+            kalman_gain, projected_cov), kalman_gain.transpose((0, 2, 1)))
+        return new_mean, new_covariance
+
     def gating_distance(self, mean, covariance, measurements,
                         only_position=False):
         """Compute gating distance between state distribution and measurements.
@@ -227,3 +328,39 @@ class KalmanFilter(object):
             overwrite_b=True)
         squared_maha = np.sum(z * z, axis=0)
         return squared_maha
+
+    def multi_gating_distance(self, mean, covariance, measurements,
+                              only_position=False):
+        """Compute gating distance between N state distributions and M
+        measurements (Vectorized version).
+
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the state distributions.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the state
+            distributions.
+        measurements : ndarray
+            An Mx4 dimensional matrix of M measurements in format (x, y, a, h).
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+
+        Returns
+        -------
+        ndarray
+            Returns an NxM matrix, where element (i, j) is the squared
+            Mahalanobis distance between state i and `measurements[j]`.
+
+        """
+        mean, covariance = self.multi_project(mean, covariance)
+        if only_position:
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+
+        cholesky_factor = np.linalg.cholesky(covariance)
+        d = measurements[None, :, :] - mean[:, None, :]
+        z = np.linalg.solve(cholesky_factor, d.transpose((0, 2, 1)))
+        squared_maha = np.sum(z * z, axis=1)
+        return squared_maha
@@ -96,6 +96,127 @@ def _nn_cosine_distance(x, y):
     return distances.min(axis=0)
 
 
+class FeatureGallery(object):
+    """
+    Ring buffers of the most recent features of each target, all in one
+    preallocated (capacity, budget, dim) matrix.
+
+    Each target owns one slot of `budget` rows; once the slot is full the
+    oldest row is overwritten. Slots of removed targets are reused and the
+    matrix doubles when all slots are taken. With `budget` None the rows of a
+    slot grow instead, so no sample is ever dropped.
+
+    Parameters
+    ----------
+    budget : Optional[int]
+        Maximum number of samples kept per target.
+    capacity : int
+        Initial number of target slots.
+
+    """
+
+    def __init__(self, budget=None, capacity=64):
+        self.budget = budget
+        self._rows = budget if budget is not None else 16
+        self._capacity = max(1, capacity)
+        self.features = None
+        self.counts = np.zeros((self._capacity,), dtype=np.int64)
+        self.heads = np.zeros((self._capacity,), dtype=np.int64)
+        self.slots = {}
+        self._free = list(range(self._capacity - 1, -1, -1))
+
+    def __contains__(self, target):
+        return target in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _grow_slots(self):
+        capacity = self._capacity
+        self._capacity *= 2
+        self.features = np.concatenate(
+            [self.features, np.zeros_like(self.features)])
+        self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+        self.heads = np.concatenate([self.heads, np.zeros_like(self.heads)])
+        self._free = list(range(self._capacity - 1, capacity - 1, -1)) + self._free
+
+    def _grow_rows(self, rows):
+        # only without budget: rows are never overwritten, so heads == counts
+        while self._rows < rows:
+            self._rows *= 2
+        features = np.zeros(
+            (self._capacity, self._rows, self.features.shape[2]), dtype=np.float32)
+        features[:, :self.features.shape[1]] = self.features
+        self.features = features
+
+    def _slot(self, target):
+        slot = self.slots.get(target)
+        if slot is None:
+            if not self._free:
+                self._grow_slots()
+            slot = self._free.pop()
+            self.counts[slot] = 0
+            self.heads[slot] = 0
+            self.slots[target] = slot
+        return slot
+
+    def add(self, features, targets):
+        """Append the NxM `features` to the ring buffers of their `targets`,
+        in order."""
+        features = np.asarray(features, dtype=np.float32)
+        if len(features) == 0:
+            return
+        if self.features is None:
+            self.features = np.zeros(
+                (self._capacity, self._rows, features.shape[1]), dtype=np.float32)
+        slots = np.asarray([self._slot(t) for t in targets], dtype=np.int64)
+
+        # rank of each feature among the new features of its target
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+        group_sizes = np.diff(np.r_[starts, len(slots)])
+        ranks = np.empty_like(order)
+        ranks[order] = np.arange(len(slots)) - np.repeat(starts, group_sizes)
+        num_new = np.zeros_like(self.counts)
+        np.add.at(num_new, slots, 1)
+
+        if self.budget is None:
+            self._grow_rows(int((self.counts + num_new).max()))
+            keep = np.ones(len(slots), dtype=bool)
+        else:
+            # only the last `budget` new features of a target survive
+            keep = ranks >= num_new[slots] - self.budget
+        rows = (self.heads[slots] + ranks) % self._rows
+        self.features[slots[keep], rows[keep]] = features[keep]
+        self.heads = (self.heads + num_new) % self._rows
+        self.counts = np.minimum(self.counts + num_new, self._rows)
+
+    def retain(self, targets):
+        """Release the slots of all targets not in `targets`."""
+        targets = set(targets)
+        for target in [t for t in self.slots if t not in targets]:
+            self._free.append(self.slots.pop(target))
+
+    def samples(self, target):
+        """The kept samples of `target`, oldest first."""
+        slot = self.slots[target]
+        count = self.counts[slot]
+        rows = (self.heads[slot] - count + np.arange(count)) % self._rows
+        return self.features[slot, rows]
+
+    def gather(self, targets):
+        """The (len(targets), rows, dim) samples of `targets` and the mask of the
+        valid rows, None if all rows are valid."""
+        slots = np.asarray([self.slots[t] for t in targets], dtype=np.int64)
+        counts = self.counts[slots]
+        rows = int(counts.max()) if len(counts) > 0 else 0
+        samples = self.features[slots, :rows]
+        if (counts == rows).all():
+            return samples, None
+        return samples, np.arange(rows)[None, :] < counts[:, None]
+
+
 class NearestNeighborDistanceMetric(object):
     """
     A nearest neighbor distance metric that, for each target, returns
@@ -114,9 +235,9 @@ class NearestNeighborDistanceMetric(object):
 
     Attributes
     ----------
-    samples : Dict[int -> List[ndarray]]
-        A dictionary that maps from target identities to the list of samples
-        that have been observed so far.
+    gallery : FeatureGallery
+        The samples observed so far of every target, `budget` rows per target
+        in one matrix. Cosine samples are stored normalized.
 
     """
 
@@ -130,9 +251,15 @@ class NearestNeighborDistanceMetric(object):
         else:
             raise ValueError(
                 "Invalid metric; must be either 'euclidean' or 'cosine'")
+        self.metric = metric
         self.matching_threshold = matching_threshold
         self.budget = budget
-        self.samples = {}
+        self.gallery = FeatureGallery(budget)
+
+    @property
+    def samples(self):
+        """Dict[int -> ndarray] of the samples of every target."""
+        return {target: self.gallery.samples(target) for target in self.gallery.slots}
 
     def partial_fit(self, features, targets, active_targets):
         """Update the distance metric with new data.
@@ -147,11 +274,11 @@ class NearestNeighborDistanceMetric(object):
             A list of targets that are currently present in the scene.
 
         """
-        for feature, target in zip(features, targets):
-            self.samples.setdefault(target, []).append(feature)
-            if self.budget is not None:
-                self.samples[target] = self.samples[target][-self.budget:]
-        self.samples = {k: self.samples[k] for k in active_targets}
+        features = np.asarray(features, dtype=np.float32)
+        if self.metric == "cosine" and len(features) > 0:
+            features = features / np.linalg.norm(features, axis=1, keepdims=True)
+        self.gallery.add(features, targets)
+        self.gallery.retain(active_targets)
 
     def distance(self, features, targets):
         """Compute distance between features and targets.
@@ -171,7 +298,29 @@ class NearestNeighborDistanceMetric(object):
             `targets[i]` and `features[j]`.
 
         """
-        cost_matrix = np.zeros((len(targets), len(features)))
-        for i, target in enumerate(targets):
-            cost_matrix[i, :] = self._metric(self.samples[target], features)
-        return cost_matrix
+        if len(targets) == 0 or len(features) == 0:
+            return np.zeros((len(targets), len(features)))
+        features = np.asarray(features, dtype=np.float32)
+        samples, valid = self.gallery.gather(targets)
+        num_targets, rows, dim = samples.shape
+        if self.metric == "cosine":
+            # samples are stored normalized, the smallest distance is the
+            # largest dot product
+            features = features / np.linalg.norm(features, axis=1, keepdims=True)
+            # one matmul for all samples of all targets
+            dots = np.dot(samples.reshape(-1, dim), features.T).reshape(
+                num_targets, rows, len(features))
+            if valid is not None:
+                dots[~valid] = -np.inf
+            distances = 1. - dots.max(axis=1)
+        else:
+            dots = np.dot(samples.reshape(-1, dim), features.T).reshape(
+                num_targets, rows, len(features))
+            a2 = np.square(samples).sum(axis=2)
+            b2 = np.square(features).sum(axis=1)
+            distances = np.maximum(
+                -2. * dots + a2[:, :, None] + b2[None, None, :], 0.)
+            if valid is not None:
+                distances[~valid] = np.inf
+            distances = distances.min(axis=1)
+        return distances.astype(np.float64)
@@ -1,4 +1,5 @@
 # vim: expandtab:ts=4:sw=4
+from .track_store import TrackStore
 
 
 class TrackState:
@@ -40,13 +41,20 @@ class Track:
     feature : Optional[ndarray]
         Feature vector of the detection this track originates from. If not None,
         this feature is added to the `features` cache.
+    store : Optional[TrackStore]
+        The store holding the Kalman state of this track. Tracks of one tracker
+        share a store, so their states are predicted and updated together.
+        Defaults to a private store.
 
     Attributes
     ----------
     mean : ndarray
-        Mean vector of the initial state distribution.
+        Mean vector of the state distribution, a row of `store.mean`.
     covariance : ndarray
-        Covariance matrix of the initial state distribution.
+        Covariance matrix of the state distribution, a row of
+        `store.covariance`.
+    slot : int
+        The slot of this track in `store`.
     track_id : int
         A unique track identifier.
     hits : int
@@ -64,10 +72,10 @@ class Track:
     """
 
     def __init__(self, mean, cls_, covariance, track_id, n_init, max_age,
-                 feature=None):
-        self.mean = mean
+                 feature=None, store=None):
+        self.store = store if store is not None else TrackStore(capacity=1)
+        self.slot = self.store.allocate(mean, covariance)
         self.cls_ = cls_
-        self.covariance = covariance
         self.track_id = track_id
         self.hits = 1
         self.age = 1
@@ -81,6 +89,22 @@ class Track:
         self._n_init = n_init
         self._max_age = max_age
 
+    @property
+    def mean(self):
+        return self.store.mean[self.slot]
+
+    @mean.setter
+    def mean(self, mean):
+        self.store.mean[self.slot] = mean
+
+    @property
+    def covariance(self):
+        return self.store.covariance[self.slot]
+
+    @covariance.setter
+    def covariance(self, covariance):
+        self.store.covariance[self.slot] = covariance
+
     def to_tlwh(self):
         """Get current position in bounding box format `(top left x, top left y,
         width, height)`.
@@ -110,7 +134,7 @@ class Track:
         ret[2:] = ret[:2] + ret[2:]
         return ret
 
-    def predict(self, kf):
+    def predict(self, kf, kalman_predicted=False):
         """Propagate the state distribution to the current time step using a
         Kalman filter prediction step.
 
@@ -118,13 +142,17 @@ class Track:
         ----------
         kf : kalman_filter.KalmanFilter
             The Kalman filter.
+        kalman_predicted : Optional[bool]
+            If True, the state was already predicted by `TrackStore.predict`
+            and only the track bookkeeping is done.
 
         """
-        self.mean, self.covariance = kf.predict(self.mean, self.covariance)
+        if not kalman_predicted:
+            self.mean, self.covariance = kf.predict(self.mean, self.covariance)
         self.age += 1
         self.time_since_update += 1
 
-    def update(self, kf, detection):
+    def update(self, kf, detection, kalman_updated=False):
         """Perform Kalman filter measurement update step and update the feature
         cache.
 
@@ -134,10 +162,14 @@ class Track:
             The Kalman filter.
         detection : Detection
             The associated detection.
+        kalman_updated : Optional[bool]
+            If True, the state was already updated by `TrackStore.update` and
+            only the feature cache and track bookkeeping are updated.
 
         """
-        self.mean, self.covariance = kf.update(
-            self.mean, self.covariance, detection.to_xyah())
+        if not kalman_updated:
+            self.mean, self.covariance = kf.update(
+                self.mean, self.covariance, detection.to_xyah())
         self.features.append(detection.feature)
         self.cls_ = detection.cls_
 
@@ -0,0 +1,72 @@
+# vim: expandtab:ts=4:sw=4
+import numpy as np
+
+
+class TrackStore(object):
+    """
+    Array-backed Kalman state of a set of tracks.
+
+    The means and covariances of all tracks live in two preallocated buffers
+    (capacity x 8 and capacity x 8 x 8), one slot per track, so that the
+    Kalman predict and update of all tracks of a frame run as single
+    vectorized calls. Slots of deleted tracks are reused; the buffers double
+    when they are full.
+
+    Parameters
+    ----------
+    capacity : int
+        Initial number of slots.
+
+    Attributes
+    ----------
+    mean : ndarray
+        The capacity x 8 dimensional mean matrix.
+    covariance : ndarray
+        The capacity x 8 x 8 dimensional covariance matrices.
+
+    """
+
+    def __init__(self, capacity=64):
+        capacity = max(1, capacity)
+        self.mean = np.zeros((capacity, 8))
+        self.covariance = np.zeros((capacity, 8, 8))
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.mean) - len(self._free)
+
+    def _grow(self):
+        capacity = len(self.mean)
+        self.mean = np.concatenate([self.mean, np.zeros_like(self.mean)])
+        self.covariance = np.concatenate(
+            [self.covariance, np.zeros_like(self.covariance)])
+        self._free = list(range(2 * capacity - 1, capacity - 1, -1)) + self._free
+
+    def allocate(self, mean, covariance):
+        """Store a new state and return its slot."""
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.mean[slot] = mean
+        self.covariance[slot] = covariance
+        return slot
+
+    def release(self, slot):
+        self._free.append(slot)
+
+    def predict(self, kf, slots):
+        """Kalman predict of the states in `slots`, in place."""
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == 0:
+            return
+        self.mean[slots], self.covariance[slots] = kf.multi_predict(
+            self.mean[slots], self.covariance[slots])
+
+    def update(self, kf, slots, measurements):
+        """Kalman update of the states in `slots` with the Nx4 (x, y, a, h)
+        `measurements`, in place."""
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(slots) == 0:
+            return
+        self.mean[slots], self.covariance[slots] = kf.multi_update(
+            self.mean[slots], self.covariance[slots], measurements)
@@ -5,6 +5,7 @@ from . import kalman_filter
 from . import linear_assignment
 from . import iou_matching
 from .track import Track
+from .track_store import TrackStore
 
 
 class Tracker:
@@ -16,6 +17,7 @@ class Tracker:
         self.n_init = n_init
 
         self.kf = kalman_filter.KalmanFilter()
+        self.store = TrackStore()
         self.tracks = []
         self._next_id = 1
 
@@ -24,8 +26,9 @@ class Tracker:
 
         This function should be called once every time step, before `update`.
         """
+        self.store.predict(self.kf, [t.slot for t in self.tracks])
         for track in self.tracks:
-            track.predict(self.kf)
+            track.predict(self.kf, kalman_predicted=True)
 
     def update(self, detections):
         """Perform measurement update and track management.
@@ -41,13 +44,20 @@ class Tracker:
             self._match(detections)
 
         # Update track set.
+        if len(matches) > 0:
+            self.store.update(
+                self.kf, [self.tracks[i].slot for i, _ in matches],
+                np.asarray([detections[j].to_xyah() for _, j in matches]))
         for track_idx, detection_idx in matches:
             self.tracks[track_idx].update(
-                self.kf, detections[detection_idx])
+                self.kf, detections[detection_idx], kalman_updated=True)
         for track_idx in unmatched_tracks:
             self.tracks[track_idx].mark_missed()
         for detection_idx in unmatched_detections:
             self._initiate_track(detections[detection_idx])
+        for t in self.tracks:
+            if t.is_deleted():
+                self.store.release(t.slot)
         self.tracks = [t for t in self.tracks if not t.is_deleted()]
 
         # Update distance metric.
@@ -60,14 +70,13 @@ class Tracker:
             targets += [track.track_id for _ in track.features]
             track.features = []
         self.metric.partial_fit(
-            np.asarray(features), np.asarray(targets), active_targets)
+            np.asarray(features, dtype=np.float32), np.asarray(targets), active_targets)
 
     def _match(self, detections):
 
         def gated_metric(tracks, dets, track_indices, detection_indices):
-            features = np.array([dets[i].feature for i in detection_indices])
-            targets = np.array([tracks[i].track_id for i in track_indices])
-            cost_matrix = self.metric.distance(features, targets)
+            rows = [confirmed_rows[i] for i in track_indices]
+            cost_matrix = appearance_cost[np.ix_(rows, detection_indices)]
             cost_matrix = linear_assignment.gate_cost_matrix(
                 self.kf, cost_matrix, tracks, dets, track_indices,
                 detection_indices)
@@ -80,6 +89,18 @@ class Tracker:
         unconfirmed_tracks = [
             i for i, t in enumerate(self.tracks) if not t.is_confirmed()]
 
+        # Appearance distance of all confirmed tracks to all detections in one
+        # call, the cascade levels only take their rows and columns.
+        # A frame without detections is normal input: no cost to compute, and
+        # both matching stages return before looking at it.
+        confirmed_rows = {k: row for row, k in enumerate(confirmed_tracks)}
+        if len(detections) > 0:
+            features = np.asarray([d.feature for d in detections], dtype=np.float32).reshape(len(detections), -1)
+            appearance_cost = self.metric.distance(
+                features, [self.tracks[i].track_id for i in confirmed_tracks])
+        else:
+            appearance_cost = np.zeros((len(confirmed_tracks), 0))
+
         # Associate confirmed tracks using appearance features.
         matches_a, unmatched_tracks_a, unmatched_detections = \
             linear_assignment.matching_cascade(
@@ -105,5 +126,5 @@ class Tracker:
         mean, covariance = self.kf.initiate(detection.to_xyah())
         self.tracks.append(Track(
             mean, detection.cls_, covariance, self._next_id, self.n_init, self.max_age,
-            detection.feature))
+            detection.feature, store=self.store))
         self._next_id += 1
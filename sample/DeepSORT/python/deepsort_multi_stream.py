@@ -0,0 +1,154 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+
+import sys
+sys.path.append("detector/yolov5/")
+from yolov5_opencv import YOLOv5
+from deep_sort.deep_sort import DeepSort
+from deep_sort.deep.feature_extractor import Extractor
+from deep_sort.utils.parser import get_config
+from deepsort_opencv import plot_bboxes, yolov5_arg
+from stream_reader import Stream, is_live
+import cv2
+import argparse
+import os
+import queue
+import logging
+logging.basicConfig(level=logging.INFO)
+import time
+import numpy as np
+
+
+def split_detections(det):
+    bbox_xywh = [] # center x, y
+    confs = []
+    clss = []
+    for idx in range(det.shape[0]):
+        x1, y1, x2, y2, conf, cls = det[idx]
+        if x2 - x1 != 0 and y2 - y1 != 0:
+            bbox_xywh.append([int((x1+x2)/2), int((y1+y2)/2), x2-x1, y2-y1])
+            confs.append(float(conf))
+            clss.append(int(cls))
+    return np.array(bbox_xywh).reshape(-1, 4), confs, clss
+
+
+def process_batch(detector, extractor, batch):
+    """
+    One detector call per detector batch and one extractor call for the crops of all frames
+    of `batch`, a list of (stream, frame) from different streams; then every stream's
+    tracker is updated with its own detections and features.
+    """
+    detector_results = []
+    for start in range(0, len(batch), detector.batch_size):
+        detector_results += detector([frame for _, frame in batch[start:start + detector.batch_size]])
+
+    dets, crops, crop_nums = [], [], []
+    for (stream, frame), det in zip(batch, detector_results):
+        bbox_xywh, confs, clss = split_detections(det)
+        frame_crops = stream.tracker.get_crops(bbox_xywh, frame)
+        dets.append((bbox_xywh, confs, clss))
+        crops += frame_crops
+        crop_nums.append(len(frame_crops))
+    features = extractor(crops) if crops else []
+
+    # a frame without detections gets an empty feature slice, Tracker.update takes an empty frame
+    offset = 0
+    for (stream, frame), (bbox_xywh, confs, clss), crop_num in zip(batch, dets, crop_nums):
+        stream.frame_num += 1
+        stream.last_time = time.time()
+        outputs = stream.tracker.update(bbox_xywh, confs, clss, frame, stream.frame_num,
+                                        features=features[offset:offset + crop_num])
+        offset += crop_num
+        for x1, y1, x2, y2, cls_, track_id in outputs:
+            stream.mot_saver.write("{},{},{},{},{},{},1,-1,-1,-1\n".format(
+                stream.frame_num, track_id, x1, y1, x2 - x1, y2 - y1))
+        if stream.save_dir is not None:
+            image = plot_bboxes(frame, outputs)
+            cv2.imwrite("{}/{}.jpg".format(stream.save_dir, stream.frame_num), image)
+    return len(crops)
+
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--inputs', type=str, nargs='+', default=['../datasets/test_car_person_1080P.mp4'], help='videos, rtsp/rtmp urls or camera ids, one per stream')
+    parser.add_argument('--bmodel_detector', type=str, default='../models/BM1684X/yolov5s_v6.1_3output_int8_4b.bmodel', help='path of detector bmodel')
+    parser.add_argument('--bmodel_extractor', type=str, default='../models/BM1684X/extractor_fp16_4b.bmodel', help='path of extractor bmodel')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--queue_size', type=int, default=4, help='decoded frames queued per stream')
+    parser.add_argument('--realtime', action='store_true', help='drop the oldest queued frame of a stream when it is full, also for video files; always on for live streams')
+    parser.add_argument('--save_images', action='store_true', help='save the frames with the tracks drawn to results/streams/<stream id>/')
+    parser.add_argument('--log_interval', type=float, default=5.0, help='seconds between per-stream stats logs')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = argsparser()
+    cfg = get_config()
+    cfg.merge_from_file("configs/deep_sort.yaml")
+    os.makedirs("results/mot_eval", exist_ok=True)
+    # one detector and one extractor for all streams, a tracker per stream
+    detector = YOLOv5(yolov5_arg(args.bmodel_detector, args.dev_id, cfg.DETECTOR.CONF_THRE, cfg.DETECTOR.NMS_THRE))
+    extractor = Extractor(args.bmodel_extractor, args.dev_id)
+    streams = []
+    for stream_id, input in enumerate(args.inputs):
+        tracker = DeepSort(args.bmodel_extractor, args.dev_id,
+                           max_dist=cfg.DEEPSORT.MAX_DIST, min_confidence=cfg.DEEPSORT.MIN_CONFIDENCE,
+                           nms_max_overlap=cfg.DEEPSORT.NMS_MAX_OVERLAP, max_iou_distance=cfg.DEEPSORT.MAX_IOU_DISTANCE,
+                           max_age=cfg.DEEPSORT.MAX_AGE, n_init=cfg.DEEPSORT.N_INIT, nn_budget=cfg.DEEPSORT.NN_BUDGET,
+                           extractor=extractor)
+        streams.append(Stream(stream_id, input, tracker, args.queue_size, is_live(input, args.realtime), args.save_images))
+    for stream in streams:
+        stream.start_time = time.time()
+        stream.reader.start()
+
+    start_time = time.time()
+    last_log = start_time
+    batch_num, frame_num, crop_num = 0, 0, 0
+    while not all(stream.reader.done() for stream in streams):
+        # at most one frame per stream and batch, so no stream starves the others
+        batch = []
+        for stream in streams:
+            try:
+                batch.append((stream, stream.reader.frames.get_nowait()))
+            except queue.Empty:
+                pass
+        if not batch:
+            time.sleep(0.001)
+            continue
+        crop_num += process_batch(detector, extractor, batch)
+        batch_num += 1
+        frame_num += len(batch)
+        if time.time() - last_log > args.log_interval:
+            last_log = time.time()
+            for stream in streams:
+                logging.info(stream.stats())
+
+    total_time = time.time() - start_time
+    extractor.close()
+    for stream in streams:
+        stream.mot_saver.close()
+        logging.info(stream.stats())
+    frame_num = max(frame_num, 1)
+    logging.info("streams: {}, frames: {}, total fps: {:.2f}, avg frames per batch: {:.2f}".format(
+        len(streams), frame_num, frame_num / max(total_time, 1e-6), frame_num / max(batch_num, 1)))
+    logging.info("------------------Detector Predict Time Info ----------------------")
+    logging.info("preprocess_time(ms): {:.2f}".format(detector.preprocess_time / frame_num * 1000))
+    logging.info("inference_time(ms): {:.2f}".format(detector.inference_time / frame_num * 1000))
+    logging.info("postprocess_time(ms): {:.2f}".format(detector.postprocess_time / frame_num * 1000))
+    logging.info("------------------Deepsort Tracker Time Info ----------------------")
+    crop_num = max(crop_num, 1)
+    logging.info("preprocess_time(ms): {:.2f}".format(extractor.preprocess_time / crop_num * 1000))
+    logging.info("inference_time(ms): {:.2f}".format(extractor.inference_time / crop_num * 1000))
+    logging.info("postprocess_time(ms): {:.2f}".format(sum(stream.tracker.postprocess_time for stream in streams) / frame_num * 1000))
+    logging.info("avg crop num: {:.2f}".format(crop_num / frame_num))
+    logging.info("-------------------------------------------------------------------")
+
+if __name__ == '__main__':
+    main()
@@ -194,6 +194,7 @@ def main():
         cap.release()
         videoWriter.release()
         mot_saver.close()
+    deepsort.extractor.close()
     # calculate speed  
     decode_time = decode_time / frame_num
     encode_time = encode_time / frame_num
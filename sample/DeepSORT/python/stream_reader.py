@@ -0,0 +1,97 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+"""
+Decoding thread and per-stream state of the multi-stream trackers. Also used by
+ByteTrack/python/bytetrack_multi_stream.py and, for the reader, by C3D/python/c3d_stream.py
+and SlowFast/python/slowfast_stream.py, which add this directory to sys.path.
+"""
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+LIVE_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://')
+
+
+def is_live(input, realtime=False):
+    """Camera ids and network streams are live; `realtime` treats video files as live too."""
+    return realtime or input.isdigit() or input.startswith(LIVE_PREFIXES)
+
+
+class StreamReader(threading.Thread):
+    """
+    Decodes one input into a bounded queue. For live streams the oldest queued frame is
+    dropped when the queue is full, so a slow consumer sees the latest frames; for files
+    the reader waits.
+    """
+    def __init__(self, input, queue_size, live):
+        super().__init__(daemon=True)
+        self.cap = cv2.VideoCapture(int(input) if input.isdigit() else input)
+        if not self.cap.isOpened():
+            raise FileNotFoundError('{} open failed.'.format(input))
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.live = live
+        self.decode_num = 0
+        self.drop_num = 0
+        self.decode_time = 0.0
+        self.finished = False
+
+    def run(self):
+        while True:
+            start_decode = time.time()
+            ret, frame = self.cap.read()
+            if not ret or frame is None:
+                break
+            self.decode_time += time.time() - start_decode
+            self.decode_num += 1
+            if not self.live:
+                self.frames.put(frame)
+                continue
+            try:
+                self.frames.put_nowait(frame)
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.drop_num += 1
+                except queue.Empty:
+                    pass
+                self.frames.put_nowait(frame)
+        self.cap.release()
+        self.finished = True
+
+    def done(self):
+        return self.finished and self.frames.empty()
+
+
+class Stream(object):
+    """Per-stream state of the multi-stream trackers: reader, tracker, MOT result file and counters."""
+    def __init__(self, stream_id, input, tracker, queue_size, live, save_images):
+        self.stream_id = stream_id
+        self.input = input
+        self.tracker = tracker
+        self.reader = StreamReader(input, queue_size, live)
+        self.frame_num = 0
+        self.start_time = None
+        self.last_time = None
+        self.save_dir = "results/streams/{}".format(stream_id) if save_images else None
+        if self.save_dir is not None:
+            os.makedirs(self.save_dir, exist_ok=True)
+        self.mot_saver = open("results/mot_eval/stream{}_{}.txt".format(
+            stream_id, os.path.splitext(os.path.basename(input.rstrip('/')))[0] or "camera"), "w")
+
+    def fps(self):
+        if self.start_time is None or self.frame_num == 0:
+            return 0.0
+        return self.frame_num / max(self.last_time - self.start_time, 1e-6)
+
+    def stats(self):
+        return "stream {}: fps: {:.2f}, frames: {}, drops: {}, queued: {}".format(
+            self.stream_id, self.fps(), self.frame_num, self.reader.drop_num, self.reader.frames.qsize())
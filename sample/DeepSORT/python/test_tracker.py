@@ -0,0 +1,71 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import numpy as np
+from deep_sort.sort.nn_matching import NearestNeighborDistanceMetric
+from deep_sort.sort.detection import Detection
+from deep_sort.sort.tracker import Tracker
+
+# Regression checks of Tracker and DeepSort on synthetic detections, needs no TPU
+# (the DeepSort check imports sophon.sail but loads no bmodel):
+#     python3 test_tracker.py    or    python3 -m pytest test_tracker.py
+
+def make_detections(identities, frame_id):
+    return [Detection(np.array([100.0 * i + 2 * frame_id, 50.0, 40.0, 80.0]), 0, 0.9, identities[i])
+            for i in range(len(identities))]
+
+def confirmed_tracker(identities, frames=5):
+    tracker = Tracker(NearestNeighborDistanceMetric("cosine", 0.2, 100), max_iou_distance=0.7, max_age=70, n_init=3)
+    for frame_id in range(frames):
+        tracker.predict()
+        tracker.update(make_detections(identities, frame_id))
+    return tracker
+
+def test_update_without_detections():
+    # a frame with no boxes, or with every confidence below min_confidence, keeps the live tracks
+    identities = np.random.default_rng(0).normal(size=(3, 128)).astype(np.float32)
+    tracker = confirmed_tracker(identities)
+    track_ids = sorted(t.track_id for t in tracker.tracks if t.is_confirmed())
+    assert len(track_ids) == 3
+    for _ in range(2):
+        tracker.predict()
+        tracker.update([])
+    assert sorted(t.track_id for t in tracker.tracks) == track_ids
+    assert all(t.time_since_update == 2 for t in tracker.tracks)
+
+    # the same targets are matched to their tracks again afterwards
+    tracker.predict()
+    tracker.update(make_detections(identities, 7))
+    assert sorted(t.track_id for t in tracker.tracks if t.time_since_update == 0) == track_ids
+
+def test_update_without_tracks():
+    tracker = Tracker(NearestNeighborDistanceMetric("cosine", 0.2, 100))
+    tracker.predict()
+    tracker.update([])
+    assert tracker.tracks == []
+
+def test_deepsort_update_empty_frame():
+    # the multi-stream runner passes the features of every frame, an empty list for a frame without boxes
+    from deep_sort.deep_sort import DeepSort
+    identities = np.random.default_rng(0).normal(size=(3, 128)).astype(np.float32)
+    tracker = DeepSort(None, 0, extractor=lambda crops: identities[:len(crops)])
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    bbox_xywh = np.array([[130.0 + 100 * i, 160.0, 60.0, 120.0] for i in range(3)])
+    for frame_id in range(1, 6):
+        tracker.update(bbox_xywh, [0.9] * 3, [0] * 3, frame, frame_id)
+    outputs = tracker.update(np.zeros((0, 4)), [], [], frame, 6, features=[])
+    assert len(outputs) == 3
+    # all boxes below min_confidence
+    tracker.update(bbox_xywh, [0.1] * 3, [0] * 3, frame, 7, features=identities)
+    assert len(tracker.tracker.tracks) == 3
+
+if __name__ == "__main__":
+    test_update_without_detections()
+    test_update_without_tracks()
+    test_deepsort_update_empty_frame()
+    print("tracker tests passed")
@@ -13,9 +13,9 @@ from functools import reduce
 import operator
 import os
 import random
+import sys
 from typing import Any, Callable, Dict, List, Optional, Union
 
-from diffusers import FlowMatchEulerDiscreteScheduler
 from diffusers.image_processor import VaeImageProcessor
 import diffusers.utils.logging as logging
 from diffusers.utils.torch_utils import randn_tensor
@@ -26,6 +26,11 @@ from transformers import CLIPTokenizer, T5TokenizerFast
 
 import sophon.sail as sail
 
+# np_schedulers.py and embedding_cache.py are shared with the SD1.5 sample
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../StableDiffusionV1_5/python"))
+from np_schedulers import FlowMatchEulerDiscreteScheduler
+from embedding_cache import EmbeddingCache, encoder_identity
+
 logger = logging.get_logger(__name__)
 
 # define an unsupported exception when type(flux type, quantization type, chip type...) is not supported
@@ -192,7 +197,8 @@ class FluxPipeline:
         device_ids: Union[int, List[int]] = [0, 1, 2], 
         quant_dtype: str = "bf16",
         flux_type: str = "dev",
-        use_tiny_vae: bool = False
+        use_tiny_vae: bool = False,
+        embedding_cache: Optional[EmbeddingCache] = None
     ):
         r"""
         Load both model and bmodel files from full model directory, then allocate input/ouput memory.
@@ -203,6 +209,7 @@ class FluxPipeline:
             device_ids: specify device number, 1 device for w4bf16 quant dtype, MULTI_DEVICES_NUM devices for bf16.
             quant_dtype: w4bf16(INT4 weight, BF16 activation), bf16(BF16 weight, BF16 activatetion). 
             use_tiny_vae: use taef1 if it is True, else use original vae 
+            embedding_cache: cache of the clip and t5 outputs, an in-memory EmbeddingCache() if None
         """
         # 1. process and check parameters
         if not os.path.isdir(full_model_path):
@@ -298,6 +305,9 @@ class FluxPipeline:
         # 5. load clip tokenizer, t5 tokenizer and vae_decoder bmodels
         self.text_encoder =  sail.EngineLLM(clip_path, [self.device_ids[0]]) if quant_dtype == "w4bf16" else sail.EngineLLM(clip_path, [self.device_ids[self.MULTI_DEVICE_ALLOCATION['clip']]])
         self.text_encoder_2 = sail.EngineLLM(t5_path, [self.device_ids[0]]) if quant_dtype == "w4bf16" else sail.EngineLLM(t5_path, [self.device_ids[self.MULTI_DEVICE_ALLOCATION['t5']]])
+        self.text_encoder_id = encoder_identity(clip_path)
+        self.text_encoder_2_id = encoder_identity(t5_path)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
         self.vae_decoder = sail.EngineLLM(vae_decoder_path, [self.device_ids[0]]) if quant_dtype =="w4bf16" else sail.EngineLLM(vae_decoder_path, [self.device_ids[self.MULTI_DEVICE_ALLOCATION['vae']]])
 
         # 6. load transformers.
@@ -487,6 +497,24 @@ class FluxPipeline:
             self.transformer_tail_inputs= {0: hidden_states_on_dev2, 1: tembs_dict[2]}
             self.transformer_tail_outputs= {0: predicted_noise}
 
+    def _run_clip(self, text_input_ids):
+        self.clip_head_inputs[0].update_data(text_input_ids)
+        self.text_encoder.process("clip_head", self.clip_head_inputs, self.clip_head_outputs)
+        for idx in range(self.CLIP_LAYER_NUM):
+            self.text_encoder.process(f"clip_block_{idx}", self.clip_block_inputs, self.clip_block_outputs)
+        self.text_encoder.process("clip_tail", self.clip_tail_inputs, self.clip_tail_outputs)
+        self.clip_tail_outputs[0].sync_d2s()
+        return [self.clip_tail_outputs[0].asnumpy()]
+
+    def _run_t5(self, text_input_ids):
+        self.t5_head_inputs[0].update_data(text_input_ids)
+        self.text_encoder_2.process("t5_head", self.t5_head_inputs, self.t5_head_outputs)
+        for idx in range(self.T5_LAYER_NUM):
+            self.text_encoder_2.process(f"t5_block_{idx}", self.t5_block_inputs, self.t5_block_outputs)
+        self.text_encoder_2.process("t5_tail", self.t5_tail_inputs, self.t5_tail_outputs) 
+        self.t5_tail_outputs[0].sync_d2s()
+        return [self.t5_tail_outputs[0].asnumpy()]
+
     def _get_clip_prompt_embeds(
         self,
         prompt: Union[str, List[str]],
@@ -530,17 +558,11 @@ class FluxPipeline:
                 f" {self.tokenizer_max_length} tokens: {removed_text}"
             )
 
-        # 2. process of clip bmodel, the input token needs converting to float32
+        # 2. process of clip bmodel, the input token needs converting to float32; skipped if the tokens are in the embedding cache
         text_input_ids = text_input_ids.numpy().astype(np.float32)
-        self.clip_head_inputs[0].update_data(text_input_ids)
-        self.text_encoder.process("clip_head", self.clip_head_inputs, self.clip_head_outputs)
-        for idx in range(self.CLIP_LAYER_NUM):
-            self.text_encoder.process(f"clip_block_{idx}", self.clip_block_inputs, self.clip_block_outputs)
-        self.text_encoder.process("clip_tail", self.clip_tail_inputs, self.clip_tail_outputs)
+        prompt_embeds = self.embedding_cache.encode(self.text_encoder_id, text_input_ids, self._run_clip)[0]
 
         # 3. convert to torch.Tensor
-        self.clip_tail_outputs[0].sync_d2s()
-        prompt_embeds = self.clip_tail_outputs[0].asnumpy()
         prompt_embeds = torch.from_numpy(prompt_embeds)
 
         # duplicate text embeddings for each generation per prompt, using mps friendly method
@@ -597,15 +619,9 @@ class FluxPipeline:
                 f" {self.tokenizer_2_max_length} tokens: {removed_text}"
             )
 
-        # 2. process of t5
+        # 2. process of t5, skipped if the tokens are in the embedding cache
         text_input_ids = text_input_ids.numpy().astype(np.float32)
-        self.t5_head_inputs[0].update_data(text_input_ids)
-        self.text_encoder_2.process("t5_head", self.t5_head_inputs, self.t5_head_outputs)
-        for idx in range(self.T5_LAYER_NUM):
-            self.text_encoder_2.process(f"t5_block_{idx}", self.t5_block_inputs, self.t5_block_outputs)
-        self.text_encoder_2.process("t5_tail", self.t5_tail_inputs, self.t5_tail_outputs) 
-        self.t5_tail_outputs[0].sync_d2s()
-        prompt_embeds = self.t5_tail_outputs[0].asnumpy()
+        prompt_embeds = self.embedding_cache.encode(self.text_encoder_2_id, text_input_ids, self._run_t5)[0]
         prompt_embeds = torch.from_numpy(prompt_embeds)
 
         _, seq_len, _ = prompt_embeds.shape
@@ -972,14 +988,15 @@ class FluxPipeline:
             self.transformer_block_inputs_on_dev1[3].update_data(self.image_rotary_emb)
             self.single_transformer_block_inputs_on_dev2[2].update_data(self.image_rotary_emb)
 
-        ## 6.2 denoising loop
+        ## 6.2 denoising loop, on numpy latents
+        latents = latents.numpy().astype(np.float32)
         with self.progress_bar(total=num_inference_steps) as progress_bar:
             for i, t in enumerate(timesteps):
                 if self.interrupt:
                     continue
 
                 # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
-                timestep = t.expand(latents.shape[0]).to(latents.dtype)
+                timestep = np.full(latents.shape[0], t, dtype=np.float32)
 
                 # handle guidance
                 if self.transformer_config_guidance_embeds and self.flux_type != "schnell":
@@ -991,8 +1008,8 @@ class FluxPipeline:
                 if self.quant_dtype == "bf16":
                     ## process on device 0                     
                     #### transformer head
-                    self.transformer_head_inputs[0].update_data(latents.numpy().astype(np.float32))
-                    self.transformer_head_inputs[1].update_data(timestep.numpy().astype(np.float32))
+                    self.transformer_head_inputs[0].update_data(latents)
+                    self.transformer_head_inputs[1].update_data(timestep)
                     if i == 0 and self.flux_type == "dev":
                         self.transformer_head_inputs[2].update_data(guidance.numpy().astype(np.float32)) 
                         self.transformer_head_inputs[3].update_data(pooled_prompt_embeds.numpy().astype(np.float32))
@@ -1050,11 +1067,10 @@ class FluxPipeline:
                     self.transformer_on_device2.process(f"{self.flux_type}_tail", self.transformer_tail_inputs, self.transformer_tail_outputs)
                     self.transformer_tail_outputs[0].sync_d2s()
                     noise_pred = self.transformer_tail_outputs[0].asnumpy()
-                    noise_pred = torch.from_numpy(noise_pred)
 
                 elif self.quant_dtype == "w4bf16":
-                    self.transformer_head_inputs[0].update_data(latents.numpy().astype(np.float32))
-                    self.transformer_head_inputs[1].update_data(timestep.numpy().astype(np.float32))
+                    self.transformer_head_inputs[0].update_data(latents)
+                    self.transformer_head_inputs[1].update_data(timestep)
                     if i == 0 and self.flux_type == "dev":
                         self.transformer_head_inputs[2].update_data(guidance.numpy().astype(np.float32))
                         self.transformer_head_inputs[3].update_data(pooled_prompt_embeds.numpy().astype(np.float32))
@@ -1080,15 +1096,15 @@ class FluxPipeline:
                     self.transformer_on_device0.process(f"{self.flux_type}_tail", self.transformer_tail_inputs, self.transformer_tail_outputs)
                     self.transformer_tail_outputs[0].sync_d2s()
                     noise_pred = self.transformer_tail_outputs[0].asnumpy()
-                    noise_pred = torch.from_numpy(noise_pred)
 
                 # compute the previous noisy sample x_t -> x_t-1
-                latents = self.scheduler.step(noise_pred, t, latents, return_dict=False)[0]
+                latents = self.scheduler.step(noise_pred, t, latents, out=latents)[0]
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
                     progress_bar.update()
 
+        latents = torch.from_numpy(latents)
         if output_type == "latent":
             image = latents
 
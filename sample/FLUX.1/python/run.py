@@ -9,8 +9,12 @@
 import argparse
 import logging as log
 import os
+import sys
 import time
 
+# embedding_cache.py is shared with the SD1.5 sample
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../StableDiffusionV1_5/python"))
+from embedding_cache import EmbeddingCache
 from flux_pipeline import FluxPipeline
 
 def load_pipeline(args):
@@ -23,6 +27,7 @@ def load_pipeline(args):
         quant_dtype = args.quant_type,
         flux_type = args.flux_type,
         use_tiny_vae = args.tiny_vae,
+        embedding_cache = EmbeddingCache(args.embed_cache_mb, args.embed_cache_dir),
     )
     load_time = time.time() - load_start
     log.info("load model time(s): {:.2f}".format(load_time))
@@ -62,6 +67,9 @@ if __name__ == "__main__":
     parser.add_argument("--tiny_vae", action="store_true", help="use taef1 model(distilled vae decoder) when add '--tiny_vae', please add '--tiny_vae' when using one device")
     # fix seed
     parser.add_argument("--seed", type=int, default=42, help="seed value, must be between 0 and 2**32 - 1")
+    # prompt embedding cache
+    parser.add_argument("--embed_cache_mb", type=float, default=64, help="memory for cached clip/t5 outputs in MB, 0 disables the cache")
+    parser.add_argument("--embed_cache_dir", type=str, default=None, help="directory to keep cached clip/t5 outputs across runs, in memory only if not set")
     try:
         args = parser.parse_args()
     except SystemExit as e:
@@ -0,0 +1,68 @@
+import argparse
+import time
+import numpy as np
+from PIL import Image
+from transformers import BertTokenizerFast
+from prompt_session import PromptSessionCache, normalize_caption
+from utils import generate_masks_with_special_tokens_and_transfer_map, gen_encoder_output_proposals
+
+import logging
+logging.basicConfig(level=logging.INFO)
+
+# host side preprocess time per image, with and without the prompt cache. Needs no TPU.
+
+def preprocess_image(image_pil):
+    image_np = np.array(image_pil.convert("RGB").resize((800, 800)))
+    mean = np.array([0.485, 0.456, 0.406])
+    std = np.array([0.229, 0.224, 0.225])
+    image_np = (image_np / 255.0 - mean) / std
+    return np.transpose(image_np, (2, 0, 1))[None, :, :, :]
+
+def preprocess_text_uncached(tokenizer, caption, max_text_len=256):
+    # what GroundingDINO.preprocess did for every image before the prompt cache
+    tokenized = tokenizer([normalize_caption(caption)], padding="max_length", return_tensors="np")
+    text_self_attention_masks, position_ids = generate_masks_with_special_tokens_and_transfer_map(tokenized)
+    text_self_attention_masks = text_self_attention_masks[:, :max_text_len, :max_text_len]
+    position_ids = position_ids[:, :max_text_len]
+    text_token_mask = tokenized["attention_mask"][:, :max_text_len].astype(bool)
+    proposals = gen_encoder_output_proposals()
+    return [position_ids, text_self_attention_masks, tokenized["input_ids"][:, :max_text_len],
+            tokenized["token_type_ids"][:, :max_text_len], text_self_attention_masks, text_token_mask, proposals]
+
+def main(args):
+    tokenizer = BertTokenizerFast.from_pretrained(args.tokenizer_path)
+    image = Image.open(args.image_path)
+    image.load()
+    prompt_cache = PromptSessionCache(tokenizer)
+
+    image_time, uncached_time, cached_time = 0.0, 0.0, 0.0
+    for _ in range(args.loops):
+        start_time = time.time()
+        samples = preprocess_image(image)
+        image_time += time.time() - start_time
+
+        start_time = time.time()
+        preprocess_text_uncached(tokenizer, args.text_prompt)
+        uncached_time += time.time() - start_time
+
+        start_time = time.time()
+        prompt_cache.get(args.text_prompt).inputs(samples)
+        cached_time += time.time() - start_time
+
+    logging.info("loops: {}, text prompt: {}".format(args.loops, args.text_prompt))
+    logging.info("image preprocess time per image(ms): {:.3f}".format(image_time / args.loops * 1000))
+    logging.info("text preprocess time per image without prompt cache(ms): {:.3f}".format(uncached_time / args.loops * 1000))
+    logging.info("text preprocess time per image with prompt cache(ms): {:.3f}".format(cached_time / args.loops * 1000))
+
+def argsparser():
+    parser = argparse.ArgumentParser("Grounding DINO preprocess benchmark", add_help=True)
+    parser.add_argument("--image_path", "-i", type=str, default="../datasets/test/zidane.jpg", help="path to image file")
+    parser.add_argument("--text_prompt", "-t", type=str, default="person", help="text prompt")
+    parser.add_argument("--tokenizer_path", type=str, default="../models/bert-base-uncased", help="tokenizer path")
+    parser.add_argument("--loops", type=int, default=100, help="number of images to preprocess")
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
@@ -2,8 +2,8 @@ import argparse
 import os
 import numpy as np
 from transformers import BertTokenizerFast
-from PostProcess import PostProcess
-from utils import plot_boxes_to_image, generate_masks_with_special_tokens_and_transfer_map, gen_encoder_output_proposals
+from prompt_session import PromptSessionCache
+from utils import plot_boxes_to_image
 
 import time
 from PIL import Image
@@ -72,14 +72,15 @@ class GroundingDINO():
         self.mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
         self.std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
 
-        # init postprocess
-        self.postprocess = PostProcess(
-            caption = self.text_prompt,
-            token_spans = eval(f"{self.token_spans}"),
-            tokenizer = self.tokenizer, 
-            box_threshold = self.box_threshold, 
+        # text side inputs and postprocess of every caption, computed once per caption
+        self.token_spans = eval(f"{self.token_spans}")
+        self.prompt_cache = PromptSessionCache(
+            tokenizer = self.tokenizer,
+            max_size = args.prompt_cache_size,
+            box_threshold = self.box_threshold,
             text_threshold = self.text_threshold
         )
+        self.postprocess = self.prompt_cache.get(self.text_prompt, self.token_spans).postprocess
 
         # init time
         self.preprocess_time = 0.0
@@ -105,52 +106,53 @@ class GroundingDINO():
     def decode(self, img_path):
         self.img = Image.open(img_path)
     
-    def preprocess(self, tokenizer, captions, np_image=None):
+    def preprocess_image(self, np_image=None):
         if np_image is None:
             self.image_pil, samples = load_image(self.img)
-            samples = samples[None, :, :, :]
         else:
             mean = np.array([0.485, 0.456, 0.406])
             std = np.array([0.229, 0.224, 0.225])
             samples = (np_image / 255.0 - mean) / std
             samples = np.transpose(samples, (2, 0, 1))
-            samples = samples[None, :, :, :]
-
-        captions = captions.lower().strip()
-        if not captions.endswith("."):
-            captions += "."
-
-        captions = [captions]
-
-        max_text_len = 256
-
-        # Tokenize and generate masks
-        tokenized = tokenizer(captions, padding="max_length", return_tensors="np")
-        text_self_attention_masks, position_ids = generate_masks_with_special_tokens_and_transfer_map(tokenized)
+        return samples[None, :, :, :]
 
-        if text_self_attention_masks.shape[1] > max_text_len:
-            text_self_attention_masks = text_self_attention_masks[:, :max_text_len, :max_text_len]
-            position_ids = position_ids[:, :max_text_len]
-            tokenized["input_ids"] = tokenized["input_ids"][:, :max_text_len]
-            tokenized["attention_mask"] = tokenized["attention_mask"][:, :max_text_len]
-            tokenized["token_type_ids"] = tokenized["token_type_ids"][:, :max_text_len]
-
-        # Extract relevant information
-        text_token_mask = tokenized["attention_mask"].astype(bool)
-        input_ids, token_type_ids, attention_mask = tokenized["input_ids"], tokenized["token_type_ids"], text_self_attention_masks
-        proposals = gen_encoder_output_proposals()
-
-        # Convert tensors to numpy arrays
-        data = [samples, position_ids,
-            text_self_attention_masks,
-            input_ids,
-            token_type_ids,
-            attention_mask,
-            text_token_mask,
-            proposals
-        ]
-
-        return data
+    def preprocess(self, tokenizer, captions, np_image=None):
+        # the text side inputs come from the prompt cache, which uses self.tokenizer
+        samples = self.preprocess_image(np_image)
+        session = self.prompt_cache.get(captions, self.token_spans)
+        self.postprocess = session.postprocess
+        return session.inputs(samples)
+
+    def detect_batch(self, images, caption=None):
+        """
+        Run many images against one caption, the text side inputs are prepared only once.
+
+        Args:
+            images: list of PIL images or RGB numpy arrays already resized to 800x800
+            caption: text prompt, default is args.text_prompt
+        Returns:
+            list of (boxes, phrases), one per image
+        """
+        session = self.prompt_cache.get(self.text_prompt if caption is None else caption, self.token_spans)
+        results = []
+        for image in images:
+            start_time = time.time()
+            if isinstance(image, Image.Image):
+                self.img = image
+                samples = self.preprocess_image()
+            else:
+                samples = self.preprocess_image(image)
+            data = session.inputs(samples)
+            self.preprocess_time += time.time() - start_time
+
+            start_time = time.time()
+            output = self(data)
+            self.inference_time += time.time() - start_time
+
+            start_time = time.time()
+            results.append(session.postprocess(output))
+            self.postprocess_time += time.time() - start_time
+        return results
 
     def __call__(self, data):
         if isinstance(data, list):
@@ -231,6 +233,7 @@ def argsparser():
     parser.add_argument("--text_threshold", type=float, default=0.25, help="text threshold")
     parser.add_argument("--dev_id", type=int, default=0, help="TPU id")
     parser.add_argument("--tokenizer_path", type=str, default="../models/bert-base-uncased", help="tokenizer path")
+    parser.add_argument("--prompt_cache_size", type=int, default=16, help="max number of captions whose text inputs are cached")
     parser.add_argument("--token_spans", type=str, default=None, help=
                         "The positions of start and end positions of phrases of interest. \
                         For example, a caption is 'a cat and a dog', \
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+import numpy as np
+from PostProcess import PostProcess
+from utils import generate_masks_with_special_tokens_and_transfer_map, ENCODER_OUTPUT_PROPOSALS
+
+
+def normalize_caption(caption):
+    caption = caption.lower().strip()
+    if not caption.endswith("."):
+        caption += "."
+    return caption
+
+
+class PromptSession():
+    """
+    Text side inputs of one caption: token ids, the text self-attention mask, position ids
+    and the postprocess (tokenized caption and positive maps). They only depend on the
+    caption, so they are computed once and every image of the prompt only adds its pixels.
+    """
+    def __init__(self, tokenizer, caption, token_spans=None, box_threshold=0.3, text_threshold=0.25, max_text_len=256):
+        self.caption = caption
+        tokenized = tokenizer([normalize_caption(caption)], padding="max_length", return_tensors="np")
+        text_self_attention_masks, position_ids = generate_masks_with_special_tokens_and_transfer_map(tokenized)
+
+        input_ids = tokenized["input_ids"]
+        token_type_ids = tokenized["token_type_ids"]
+        attention_mask = tokenized["attention_mask"]
+        if text_self_attention_masks.shape[1] > max_text_len:
+            text_self_attention_masks = text_self_attention_masks[:, :max_text_len, :max_text_len]
+            position_ids = position_ids[:, :max_text_len]
+            input_ids = input_ids[:, :max_text_len]
+            token_type_ids = token_type_ids[:, :max_text_len]
+            attention_mask = attention_mask[:, :max_text_len]
+        text_token_mask = attention_mask.astype(bool)
+
+        self.text_inputs = [position_ids, text_self_attention_masks, input_ids, token_type_ids,
+                            text_self_attention_masks, text_token_mask, ENCODER_OUTPUT_PROPOSALS]
+        for array in self.text_inputs:
+            array.flags.writeable = False
+
+        self.postprocess = PostProcess(
+            caption = caption,
+            token_spans = token_spans,
+            tokenizer = tokenizer,
+            box_threshold = box_threshold,
+            text_threshold = text_threshold
+        )
+
+    def inputs(self, samples):
+        """bmodel inputs of one preprocessed image (1, 3, H, W), in the bmodel input order"""
+        return [samples] + self.text_inputs
+
+
+class PromptSessionCache():
+    """LRU of PromptSession, keyed by caption and token spans"""
+    def __init__(self, tokenizer, max_size=16, box_threshold=0.3, text_threshold=0.25):
+        self.tokenizer = tokenizer
+        self.max_size = max(1, max_size)
+        self.box_threshold = box_threshold
+        self.text_threshold = text_threshold
+        self.sessions = OrderedDict()
+
+    def get(self, caption, token_spans=None):
+        key = (caption, str(token_spans))
+        session = self.sessions.get(key)
+        if session is None:
+            session = PromptSession(self.tokenizer, caption, token_spans,
+                                    box_threshold=self.box_threshold, text_threshold=self.text_threshold)
+            self.sessions[key] = session
+            while len(self.sessions) > self.max_size:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(key)
+        return session
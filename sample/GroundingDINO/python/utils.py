@@ -133,6 +133,10 @@ def gen_encoder_output_proposals():
     output_proposals = np.concatenate(proposals, axis=1)
     return output_proposals
 
+# the anchors only depend on the fixed 800x800 input, compute them once
+ENCODER_OUTPUT_PROPOSALS = gen_encoder_output_proposals()
+ENCODER_OUTPUT_PROPOSALS.flags.writeable = False
+
 def create_positive_map_from_span(tokenized, token_span, max_text_len=256):
     num_boxes = len(token_span)
     positive_map = np.zeros((num_boxes, max_text_len), dtype=np.float32)
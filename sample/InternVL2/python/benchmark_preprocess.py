@@ -0,0 +1,54 @@
+import time
+import argparse
+import io
+import numpy as np
+import cv2
+from preprocess import load_image, ImageTiler
+
+# Times the PIL/torchvision tiling (load_image) against the numpy/OpenCV ImageTiler on
+# synthetic JPEG images, decode included, and reports how far the two outputs are apart.
+
+def synthetic_jpeg(width, height, rng):
+    # smooth gradients plus noise, closer to a photo than pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    image = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    image += rng.normal(0, 20, image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+def time_loop(func, loop):
+    func()  # warm up
+    start_time = time.time()
+    for _ in range(loop):
+        result = func()
+    return (time.time() - start_time) / loop * 1000, result
+
+def main(args):
+    rng = np.random.default_rng(0)
+    print("| image size | max_num | tiles | pil(ms) | opencv(ms) | speedup | mean abs diff |")
+    print("| ---------- | ------- | ----- | ------- | ---------- | ------- | ------------- |")
+    for size in args.sizes:
+        width, height = [int(v) for v in size.split("x")]
+        image_data = synthetic_jpeg(width, height, rng)
+        for max_num in args.max_num:
+            tiler = ImageTiler(input_size=args.input_size, max_num=max_num)
+            pil_time, pil_values = time_loop(lambda: load_image(io.BytesIO(image_data), input_size=args.input_size, max_num=max_num), args.loop)
+            cv_time, cv_values = time_loop(lambda: tiler(image_data), args.loop)
+            pil_values = pil_values.numpy()
+            assert pil_values.shape == cv_values.shape, "tile grids differ: {} vs {}".format(pil_values.shape, cv_values.shape)
+            print("| {:>10} | {:>7} | {:>5} | {:>7.2f} | {:>10.2f} | {:>6.2f}x | {:>13.4f} |".format(
+                size, max_num, cv_values.shape[0], pil_time, cv_time, pil_time / cv_time, np.abs(pil_values - cv_values).mean()))
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--sizes', type=str, nargs='+', default=['448x448', '1280x720', '1920x1080', '4032x3024'], help='image sizes, widthxheight')
+    parser.add_argument('--max_num', type=int, nargs='+', default=[1, 6, 9, 12], help='max tiles per image')
+    parser.add_argument('--input_size', type=int, default=448, help='tile size')
+    parser.add_argument('--loop', type=int, default=10, help='timed runs per case')
+    args = parser.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
@@ -1,94 +1,14 @@
 import time
-import torch
 import argparse
-from PIL import Image
-import torchvision.transforms as T
 from transformers import AutoTokenizer
-from torchvision.transforms.functional import InterpolationMode
 import os
+import io
 import numpy as np
+from vision_cache import VisionEmbeddingCache
+from preprocess import load_image, ImageTiler
 import sophon.sail as sail
 sail.set_loglevel(sail.LogLevel.ERROR)
 
-# Preprocess the images
-IMAGENET_MEAN = (0.485, 0.456, 0.406)
-IMAGENET_STD = (0.229, 0.224, 0.225)
-
-
-def build_transform(input_size):
-    MEAN, STD = IMAGENET_MEAN, IMAGENET_STD
-    transform = T.Compose([
-        T.Lambda(lambda img: img.convert('RGB') if img.mode != 'RGB' else img),
-        T.Resize((input_size, input_size),
-                 interpolation=InterpolationMode.BICUBIC),
-        T.ToTensor(),
-        T.Normalize(mean=MEAN, std=STD)
-    ])
-    return transform
-
-def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
-    best_ratio_diff = float('inf')
-    best_ratio = (1, 1)
-    area = width * height
-    for ratio in target_ratios:
-        target_aspect_ratio = ratio[0] / ratio[1]
-        ratio_diff = abs(aspect_ratio - target_aspect_ratio)
-        if ratio_diff < best_ratio_diff:
-            best_ratio_diff = ratio_diff
-            best_ratio = ratio
-        elif ratio_diff == best_ratio_diff:
-            if area > 0.5 * image_size * image_size * ratio[0] * ratio[1]:
-                best_ratio = ratio
-    return best_ratio
-
-def dynamic_preprocess(image, min_num=1, max_num=12, image_size=448, use_thumbnail=False):
-    if max_num <= 0:
-        return [image.resize((image_size, image_size))]
-    orig_width, orig_height = image.size
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
-
-    # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
-
-    # calculate the target width and height
-    target_width = image_size * target_aspect_ratio[0]
-    target_height = image_size * target_aspect_ratio[1]
-    blocks = target_aspect_ratio[0] * target_aspect_ratio[1]
-
-    # resize the image
-    resized_img = image.resize((target_width, target_height))
-    processed_images = []
-    for i in range(blocks):
-        box = (
-            (i % (target_width // image_size)) * image_size,
-            (i // (target_width // image_size)) * image_size,
-            ((i % (target_width // image_size)) + 1) * image_size,
-            ((i // (target_width // image_size)) + 1) * image_size
-        )
-        # split the image
-        split_img = resized_img.crop(box)
-        processed_images.append(split_img)
-    assert len(processed_images) == blocks
-    if use_thumbnail and len(processed_images) != 1:
-        thumbnail_img = image.resize((image_size, image_size))
-        processed_images.append(thumbnail_img)
-    return processed_images
-
-def load_image(image_file, input_size=448, max_num=12):
-    image = Image.open(image_file).convert('RGB')
-    transform = build_transform(input_size=input_size)
-    images = dynamic_preprocess(image, max_num=max_num, image_size=input_size, use_thumbnail=False)
-    pixel_values = [transform(image) for image in images]
-    pixel_values = torch.stack(pixel_values)
-    return pixel_values
-
 class InternVL2():
     def __init__(self, args):
         self.version = "1.0.0"
@@ -175,6 +95,12 @@ class InternVL2():
         self.greedy = "greedy_head"
         self.penalty = "penalty_sample_head"
         self.name_vit = "intern_vit"
+        self.input_size = 448
+        self.vision_cache = VisionEmbeddingCache(args.vision_cache_size)
+        self.vision_key = None
+        self.vision_embeds = None
+        self.preprocess = args.preprocess
+        self.tilers = {}
 
         self.past_k = {}
         self.past_v = {}
@@ -267,19 +193,29 @@ class InternVL2():
             self.tensors[self.name_embed]["input"][i].update_data(input_ids.reshape(self.tensors[self.name_embed]["input"][i].shape()))
         self.model.process(self.name_embed, self.tensors[self.name_embed]["input"], self.tensors[self.name_embed]["output"])
 
-        # ViT Inference
-        for i in range(pixel_values.shape[0]):
-            self.vit_input = self.tensors[self.name_vit]["input"][0]
-            self.vit_output = self.tensors[self.name_vit]["output"][0]
-            assert self.vit_input.shape()[0] == 1, "vit only support bs=1"
-            if img_offset > 0 and pixel_values[i].numel() == np.prod(self.vit_input.shape()):
-                self.vit_input.update_data(np.expand_dims(pixel_values[i], axis=0))
-                input_vit_tensors = {0: self.vit_input}
-                output_vit_tensors = {0: self.vit_output}
-                self.model.process(self.name_vit, input_vit_tensors, output_vit_tensors)
+        # ViT Inference, or the cached ViT outputs of the same image
+        self.vit_input = self.tensors[self.name_vit]["input"][0]
+        self.vit_output = self.tensors[self.name_vit]["output"][0]
+        assert self.vit_input.shape()[0] == 1, "vit only support bs=1"
+        if self.vision_embeds is not None:
+            for i in range(self.vision_embeds.shape[0]):
+                self.vit_output.update_data(self.vision_embeds[i])
                 self.tensors[self.name_embed]["output"][0].sync_d2d(self.vit_output, 0, int((img_offset + i * self.vit_output.shape()[1]) * self.HIDDEN_SIZE), np.prod(self.vit_output.shape()))
-            else:
-                print("No image found or invalid vit data, skip vit inference.")
+        else:
+            vision_embeds = []
+            for i in range(len(pixel_values)):
+                if img_offset > 0 and np.prod(pixel_values[i].shape) == np.prod(self.vit_input.shape()):
+                    self.vit_input.update_data(np.expand_dims(pixel_values[i], axis=0))
+                    input_vit_tensors = {0: self.vit_input}
+                    output_vit_tensors = {0: self.vit_output}
+                    self.model.process(self.name_vit, input_vit_tensors, output_vit_tensors)
+                    self.tensors[self.name_embed]["output"][0].sync_d2d(self.vit_output, 0, int((img_offset + i * self.vit_output.shape()[1]) * self.HIDDEN_SIZE), np.prod(self.vit_output.shape()))
+                    vision_embeds.append(self.vit_output.asnumpy().copy())
+                else:
+                    print("No image found or invalid vit data, skip vit inference.")
+            # only cache images whose tiles all went through the ViT
+            if self.vision_key is not None and len(vision_embeds) > 0 and len(vision_embeds) == len(pixel_values):
+                self.vision_cache.put(self.vision_key, np.stack(vision_embeds))
             
         # blocks
         for i in range(len(self.dev_ids)):
@@ -377,16 +313,36 @@ class InternVL2():
             self.input_ids = self.tokenizer.encode(prompt)
             self.image_offset = 0
             self.pixel_values = []
+            self.vision_key = None
+            self.vision_embeds = None
             return
-        max_num = self.SEQLEN / self.tensors[self.name_vit]["output"][0].shape()[1] - 3 # 3072 / 256 - 3 = 9
-        self.pixel_values = load_image(self.image_str, max_num=int(max_num)) # 10,3,448,448
+        max_num = int(self.SEQLEN / self.tensors[self.name_vit]["output"][0].shape()[1] - 3) # 3072 / 256 - 3 = 9
+        # the same image asked about again skips preprocessing and ViT
+        with open(self.image_str, "rb") as f:
+            image_data = f.read()
+        self.vision_key = self.vision_cache.make_key(image_data, self.preprocess, self.input_size, max_num)
+        self.vision_embeds = self.vision_cache.get(self.vision_key)
+        if self.vision_embeds is None:
+            self.pixel_values = self.load_image(image_data, max_num) # 10,3,448,448
+            num_patches = len(self.pixel_values)
+        else:
+            self.pixel_values = []
+            num_patches = self.vision_embeds.shape[0]
         system_ids = self.tokenizer.encode(self.system_prompt + "<img>")
         self.image_offset = len(system_ids)
         prompt_ids = self.tokenizer.encode(
             "</img>{}<|im_end|><|im_start|>assistant\n".format(self.input_str))
-        image_ids = [0] * 256 * self.pixel_values.size(0)
+        image_ids = [0] * 256 * num_patches
         self.input_ids = system_ids + image_ids + prompt_ids
 
+    def load_image(self, image_data, max_num):
+        if self.preprocess == "pil":
+            return load_image(io.BytesIO(image_data), input_size=self.input_size, max_num=max_num)
+        # one tiler (and tile buffer) per max_num
+        if max_num not in self.tilers:
+            self.tilers[max_num] = ImageTiler(input_size=self.input_size, max_num=max_num)
+        return self.tilers[max_num](image_data)
+
     def chat(self):
         """
         Start a chat session.
@@ -453,5 +409,9 @@ if __name__ == "__main__":
                         default="./token_config_4B", help='path to the tokenizer file')
     parser.add_argument('-d', '--devid', type=int,
                         default=0, help='device ID to use')
+    parser.add_argument('-vc', '--vision_cache_size', type=int,
+                        default=16, help='number of images whose ViT outputs are cached, 0 disables the cache')
+    parser.add_argument('-pp', '--preprocess', type=str, choices=['opencv', 'pil'],
+                        default='opencv', help='image tiling: opencv (one resize, numpy normalize) or pil (torchvision transforms)')
     args = parser.parse_args()
     main(args)
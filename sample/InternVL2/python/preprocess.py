@@ -0,0 +1,183 @@
+import io
+import functools
+import numpy as np
+import torch
+from PIL import Image
+import torchvision.transforms as T
+from torchvision.transforms.functional import InterpolationMode
+try:
+    import cv2
+    # decode at 1/2, 1/4 or 1/8 scale, JPEG decoders do it in the DCT
+    REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+except ImportError:
+    cv2 = None
+
+# Preprocess the images
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def build_transform(input_size):
+    MEAN, STD = IMAGENET_MEAN, IMAGENET_STD
+    transform = T.Compose([
+        T.Lambda(lambda img: img.convert('RGB') if img.mode != 'RGB' else img),
+        T.Resize((input_size, input_size),
+                 interpolation=InterpolationMode.BICUBIC),
+        T.ToTensor(),
+        T.Normalize(mean=MEAN, std=STD)
+    ])
+    return transform
+
+@functools.lru_cache(maxsize=None)
+def get_target_ratios(min_num, max_num):
+    target_ratios = set(
+        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
+        i * j <= max_num and i * j >= min_num)
+    return tuple(sorted(target_ratios, key=lambda x: x[0] * x[1]))
+
+def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
+    best_ratio_diff = float('inf')
+    best_ratio = (1, 1)
+    area = width * height
+    for ratio in target_ratios:
+        target_aspect_ratio = ratio[0] / ratio[1]
+        ratio_diff = abs(aspect_ratio - target_aspect_ratio)
+        if ratio_diff < best_ratio_diff:
+            best_ratio_diff = ratio_diff
+            best_ratio = ratio
+        elif ratio_diff == best_ratio_diff:
+            if area > 0.5 * image_size * image_size * ratio[0] * ratio[1]:
+                best_ratio = ratio
+    return best_ratio
+
+def dynamic_preprocess(image, min_num=1, max_num=12, image_size=448, use_thumbnail=False):
+    if max_num <= 0:
+        return [image.resize((image_size, image_size))]
+    orig_width, orig_height = image.size
+    aspect_ratio = orig_width / orig_height
+
+    # calculate the existing image aspect ratio
+    target_ratios = get_target_ratios(min_num, max_num)
+
+    # find the closest aspect ratio to the target
+    target_aspect_ratio = find_closest_aspect_ratio(
+        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+
+    # calculate the target width and height
+    target_width = image_size * target_aspect_ratio[0]
+    target_height = image_size * target_aspect_ratio[1]
+    blocks = target_aspect_ratio[0] * target_aspect_ratio[1]
+
+    # resize the image
+    resized_img = image.resize((target_width, target_height))
+    processed_images = []
+    for i in range(blocks):
+        box = (
+            (i % (target_width // image_size)) * image_size,
+            (i // (target_width // image_size)) * image_size,
+            ((i % (target_width // image_size)) + 1) * image_size,
+            ((i // (target_width // image_size)) + 1) * image_size
+        )
+        # split the image
+        split_img = resized_img.crop(box)
+        processed_images.append(split_img)
+    assert len(processed_images) == blocks
+    if use_thumbnail and len(processed_images) != 1:
+        thumbnail_img = image.resize((image_size, image_size))
+        processed_images.append(thumbnail_img)
+    return processed_images
+
+def load_image(image_file, input_size=448, max_num=12):
+    image = Image.open(image_file).convert('RGB')
+    transform = build_transform(input_size=input_size)
+    images = dynamic_preprocess(image, max_num=max_num, image_size=input_size, use_thumbnail=False)
+    pixel_values = [transform(image) for image in images]
+    pixel_values = torch.stack(pixel_values)
+    return pixel_values
+
+
+class ImageTiler():
+    """
+    numpy/OpenCV version of load_image: the image is resized once to the tile grid, the
+    tiles are strided views of the resized image, and ToTensor + Normalize is one multiply-add
+    per pixel written straight into a [max_num(+1), 3, input_size, input_size] float32 buffer
+    allocated at init. The returned pixel_values is a view of that buffer, valid until the
+    next call.
+
+    Resampling is INTER_AREA when shrinking and INTER_CUBIC when enlarging, the closest OpenCV
+    match of PIL's antialiased bicubic; images much larger than the tile grid are decoded at a
+    reduced scale first. Results differ from load_image by resampling noise only.
+    """
+    def __init__(self, input_size=448, max_num=12, use_thumbnail=False):
+        if cv2 is None:
+            raise ImportError("ImageTiler needs opencv, install opencv-python or use the PIL preprocess")
+        self.input_size = input_size
+        self.max_num = max_num
+        self.use_thumbnail = use_thumbnail
+        self.buffer = np.empty((max(max_num, 1) + int(use_thumbnail), 3, input_size, input_size), dtype=np.float32)
+        # (x / 255 - mean) / std == x * scale + bias
+        self.scale = (1.0 / (255.0 * np.array(IMAGENET_STD, dtype=np.float32))).reshape(3, 1, 1)
+        self.bias = (-np.array(IMAGENET_MEAN, dtype=np.float32) / np.array(IMAGENET_STD, dtype=np.float32)).reshape(3, 1, 1)
+
+    def resize(self, image, width, height):
+        interpolation = cv2.INTER_AREA if width * height < image.shape[0] * image.shape[1] else cv2.INTER_CUBIC
+        return cv2.resize(image, (width, height), interpolation=interpolation)
+
+    def normalize(self, tiles, out):
+        # tiles: [..., size, size, 3] uint8 BGR view, out: [..., 3, size, size] float32 RGB
+        tiles = np.moveaxis(tiles[..., ::-1], -1, -3)
+        np.multiply(tiles, self.scale, out=out)
+        np.add(out, self.bias, out=out)
+
+    def grid(self, width, height):
+        # (cols, rows) of the tiles
+        if self.max_num <= 0:
+            return 1, 1
+        return find_closest_aspect_ratio(width / height, get_target_ratios(1, self.max_num),
+                                         width, height, self.input_size)
+
+    def decode(self, image_data):
+        """
+        BGR uint8 image from encoded bytes and the (cols, rows) tile grid of its full size.
+        EXIF orientation is ignored, as PIL.Image.open does.
+        """
+        # the header is enough for the size, the grid depends on the full size only
+        width, height = Image.open(io.BytesIO(image_data)).size
+        cols, rows = self.grid(width, height)
+        flag = cv2.IMREAD_COLOR
+        for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+            if width // factor >= cols * self.input_size and height // factor >= rows * self.input_size:
+                flag = reduced_flag
+                break
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            raise ValueError("failed to decode image")
+        return image, (cols, rows)
+
+    def __call__(self, image_data):
+        """
+        Args:
+            image_data: encoded image bytes, or a decoded BGR uint8 image
+        Returns:
+            pixel_values: [num_tiles, 3, input_size, input_size] float32
+        """
+        if isinstance(image_data, (bytes, bytearray)):
+            image, (cols, rows) = self.decode(image_data)
+        else:
+            image = image_data
+            cols, rows = self.grid(image.shape[1], image.shape[0])
+        size = self.input_size
+        if self.max_num <= 0:
+            self.normalize(self.resize(image, size, size)[None], self.buffer[:1])
+            return self.buffer[:1]
+
+        resized = self.resize(image, cols * size, rows * size)
+        # [rows, cols, size, size, 3] view, tile i is at row i // cols, column i % cols,
+        # the crop order of dynamic_preprocess
+        tiles = resized.reshape(rows, size, cols, size, 3).transpose(0, 2, 1, 3, 4)
+        num_tiles = rows * cols
+        self.normalize(tiles, self.buffer[:num_tiles].reshape(rows, cols, 3, size, size))
+        if self.use_thumbnail and num_tiles != 1:
+            self.normalize(self.resize(image, size, size)[None], self.buffer[num_tiles:num_tiles + 1])
+            num_tiles += 1
+        return self.buffer[:num_tiles]
@@ -0,0 +1,61 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class VisionEmbeddingCache:
+    """
+    Bounded LRU cache of ViT outputs, so follow-up questions about the same image or video
+    do not run the ViT again.
+
+    Keys are sha1 digests of the image content and the preprocessing parameters, built with
+    `make_key`; values are the embeddings as numpy arrays. `max_size` <= 0 disables the cache.
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts):
+        digest = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                part = np.ascontiguousarray(part)
+                digest.update("{}{}".format(part.dtype.str, part.shape).encode("utf-8"))
+                digest.update(part.data)
+            elif isinstance(part, (bytes, bytearray)):
+                digest.update(part)
+            else:
+                digest.update(repr(part).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return "vision cache entries: {}, hits: {}, misses: {}".format(len(self.entries), self.hits, self.misses)
@@ -43,6 +43,8 @@ class MP_SENET(object):
         self.norm_factor = 0
         self.handle = sail.Handle(args.dev_id)
         self.bmcv = sail.Bmcv(self.handle)
+        # sail releases without bmcv stft/istft use the librosa path
+        self.use_bmcv_stft = hasattr(self.bmcv, "stft") and hasattr(self.bmcv, "istft")
 
         self.preprocess_time = 0
         self.postprocess_time = 0
@@ -135,7 +137,7 @@ class MP_SENET(object):
         return clean_wav
 
     def mag_pha_stft(self, y):
-        if 0:
+        if not self.use_bmcv_stft:
             spec_left = librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_size,win_length=self.win_size,window='hann',center=True,pad_mode='reflect')
             real_part = spec_left.real
             imag_part = spec_left.imag
@@ -144,10 +146,7 @@ class MP_SENET(object):
             stft_R, stft_I = self.bmcv.stft(y, y, True, False, self.n_fft, self.hop_size, 1, 0)
             stft_spec = np.stack((stft_R, stft_I), axis=-1)
 
-        mag = np.sqrt(np.sum(np.square(stft_spec), axis=-1) + 1e-9)
-        pha = np.arctan2(stft_spec[:, :, :, 1] + 1e-10, stft_spec[:, :, :, 0] + 1e-5)
-        # Magnitude Compression
-        mag = np.power(mag, self.compress_factor)
+        mag, pha = self.compress(stft_spec[..., 0], stft_spec[..., 1])
         
         # Calculate the real and imaginary parts of complex numbers
         real = mag * np.cos(pha)
@@ -157,14 +156,26 @@ class MP_SENET(object):
         com = np.stack((real, imag), axis=-1)
         return mag, pha, com
 
-    def mag_pha_istft(self, mag, pha, wav_L):
+    def compress(self, real, imag):
+        # compressed magnitude and phase of a spectrum
+        mag = np.sqrt(np.square(real) + np.square(imag) + 1e-9)
+        pha = np.arctan2(imag + 1e-10, real + 1e-5)
+        # Magnitude Compression
+        mag = np.power(mag, self.compress_factor)
+        return mag, pha
 
+    def decompress(self, mag, pha):
+        # complex spectrum of a compressed magnitude and phase
         mag = np.power(mag, 1.0 / self.compress_factor)
-        real_part = mag * np.cos(pha)
-        imag_part = mag * np.sin(pha)
+        return mag * np.cos(pha) + 1j * (mag * np.sin(pha))
+
+    def mag_pha_istft(self, mag, pha, wav_L):
 
         # Create a complex array
-        com = real_part + 1j * imag_part
+        com = self.decompress(mag, pha)
+        if not self.use_bmcv_stft:
+            wav = librosa.istft(com, hop_length=self.hop_size, win_length=self.win_size, n_fft=self.n_fft, window='hann', center=True, length=wav_L)
+            return wav.astype(np.float32)
         wav = self.bmcv.istft(com.real, com.imag, True, False, wav_L, self.hop_size, 1, 0)
 
         return wav[0]
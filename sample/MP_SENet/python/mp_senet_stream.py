@@ -0,0 +1,248 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import os
+import argparse
+import logging
+import librosa
+import numpy as np
+import soundfile as sf
+import time
+from mp_senet_sail import MP_SENET
+
+logging.basicConfig(level=logging.INFO)
+
+
+class StreamEnhancer(object):
+    """
+    Block-wise speech enhancement with MP_SENET.
+
+    PCM blocks of any size go into `process`, which returns the enhanced samples that are final
+    so far; `flush` returns the rest at the end of the stream. Frame k of the STFT is centered on
+    input sample k * hop_size. Each inference takes a window of max_length STFT frames: `history`
+    frames already output, `step` new frames whose model output is kept and `lookahead` frames
+    after them. The kept frames are inverse transformed frame by frame and overlap-added, so the
+    windows join through the synthesis window instead of at hard cuts. Frames before the start of
+    the stream are the spectrum of silence.
+
+    The input is scaled by the rms of all the samples seen so far, the streaming counterpart
+    of the whole-file norm_factor of MP_SENET.preprocess.
+    """
+    def __init__(self, mp_senet, step=0, lookahead=0):
+        self.mp_senet = mp_senet
+        self.n_fft = mp_senet.n_fft
+        self.hop_size = mp_senet.hop_size
+        self.window_frames = mp_senet.max_length
+        self.step = step if step > 0 else self.window_frames // 2
+        self.lookahead = lookahead if lookahead > 0 else self.window_frames // 4
+        self.history = self.window_frames - self.step - self.lookahead
+        if self.history < 0:
+            raise ValueError("step + lookahead must not exceed the {} frames of the bmodel".format(self.window_frames))
+        window = librosa.filters.get_window('hann', mp_senet.win_size, fftbins=True)
+        self.window = librosa.util.pad_center(window, size=self.n_fft).astype(np.float32)
+        self.window_sq = np.square(self.window)
+        # same model input layout as MP_SENET.preprocess, one window in batch slot 0
+        self.input_amp = np.zeros(mp_senet.input_shape, dtype=np.float32)
+        self.input_pha = np.zeros(mp_senet.input_shape, dtype=np.float32)
+        self.stream_time = 0.0
+        self.reset()
+
+    def reset(self):
+        num_bins = self.n_fft // 2 + 1
+        self.pad = self.n_fft // 2
+        # input samples from buffer index 0, sample n of the stream is at index n + pad
+        self.samples = np.zeros(self.pad, dtype=np.float32)
+        self.samples_start = 0
+        self.num_samples = 0
+        self.sum_sq = 0.0
+        # raw STFT frames [num_bins, n], first frame index spec_start; negative frames are silence
+        self.spec = np.zeros((num_bins, self.history), dtype=np.complex64)
+        self.spec_start = -self.history
+        self.next_frame = 0
+        self.next_out = 0
+        # overlap-add of the output frames and of the squared synthesis window, from buffer index ola_start
+        self.ola = np.zeros(self.n_fft, dtype=np.float32)
+        self.ola_weight = np.zeros(self.n_fft, dtype=np.float32)
+        self.ola_start = 0
+
+    @property
+    def latency(self):
+        """
+        Algorithmic latency in samples: the last input sample a kept frame depends on, minus
+        the first output sample it completes, maximized over the frames of a step.
+        """
+        return (self.step + self.lookahead - 1) * self.hop_size + self.n_fft
+
+    def norm_factor(self):
+        if self.sum_sq <= 0:
+            return 1.0
+        return float(np.sqrt(self.num_samples / self.sum_sq))
+
+    def analyze(self):
+        # STFT frames whose samples have all arrived
+        end = (len(self.samples) + self.samples_start - self.n_fft) // self.hop_size + 1
+        if end <= self.next_frame:
+            return
+        starts = np.arange(self.next_frame, end) * self.hop_size - self.samples_start
+        frames = self.samples[starts[:, None] + np.arange(self.n_fft)] * self.window
+        self.spec = np.concatenate((self.spec, np.fft.rfft(frames, axis=1).T.astype(np.complex64)), axis=1)
+        self.next_frame = end
+
+    def synthesize(self, spec):
+        # overlap-add of the inverse transform of frames next_out.., spec [num_bins, n]
+        frames = np.fft.irfft(spec.T, n=self.n_fft, axis=1).astype(np.float32) * self.window
+        start = self.next_out * self.hop_size - self.ola_start
+        end = start + (spec.shape[1] - 1) * self.hop_size + self.n_fft
+        if end > len(self.ola):
+            self.ola = np.concatenate((self.ola, np.zeros(end - len(self.ola), dtype=np.float32)))
+            self.ola_weight = np.concatenate((self.ola_weight, np.zeros(end - len(self.ola_weight), dtype=np.float32)))
+        for i in range(spec.shape[1]):
+            offset = start + i * self.hop_size
+            self.ola[offset:offset + self.n_fft] += frames[i]
+            self.ola_weight[offset:offset + self.n_fft] += self.window_sq
+
+    def infer_step(self, num_frames=None):
+        # num_frames of the step frames are kept, all of them by default
+        mp_senet = self.mp_senet
+        num_frames = self.step if num_frames is None else num_frames
+        # frames next_out - history .. next_out + step + lookahead
+        first = self.next_out - self.history
+        spec = self.spec[:, first - self.spec_start:first - self.spec_start + self.window_frames]
+        norm_factor = self.norm_factor()
+
+        start_time = time.time()
+        mag, pha = mp_senet.compress(spec.real * norm_factor, spec.imag * norm_factor)
+        self.input_amp[0] = mag
+        self.input_pha[0] = pha
+        mp_senet.preprocess_time += time.time() - start_time
+
+        start_time = time.time()
+        res_dic = mp_senet.net.process(mp_senet.graph_name, {mp_senet.input_names[0]: self.input_amp, mp_senet.input_names[1]: self.input_pha})
+        mp_senet.inference_time += time.time() - start_time
+
+        start_time = time.time()
+        amp_g = res_dic[mp_senet.output_names[0]][0, :, self.history:self.history + num_frames]
+        pha_g = res_dic[mp_senet.output_names[1]][0, :, self.history:self.history + num_frames]
+        self.synthesize(mp_senet.decompress(amp_g, pha_g) / norm_factor)
+        self.next_out += self.step
+        # drop the frames and samples no later window needs
+        keep = self.next_out - self.history
+        self.spec = self.spec[:, keep - self.spec_start:]
+        self.spec_start = keep
+        mp_senet.postprocess_time += time.time() - start_time
+
+    def emit(self, end):
+        # output samples of buffer index ola_start..end, without the pad before the stream start
+        count = end - self.ola_start
+        if count > len(self.ola):
+            self.ola = np.concatenate((self.ola, np.zeros(count - len(self.ola), dtype=np.float32)))
+            self.ola_weight = np.concatenate((self.ola_weight, np.zeros(count - len(self.ola_weight), dtype=np.float32)))
+        out = self.ola[:count] / np.maximum(self.ola_weight[:count], 1e-11)
+        skip = max(self.pad - self.ola_start, 0)
+        self.ola = self.ola[count:]
+        self.ola_weight = self.ola_weight[count:]
+        self.ola_start = end
+        return out[skip:]
+
+    def process(self, pcm):
+        """
+        Args:
+            pcm: 1-D float32 block of input samples at the sampling rate of the model
+        Returns:
+            enhanced samples that no later input changes, possibly empty
+        """
+        start_time = time.time()
+        pcm = np.asarray(pcm, dtype=np.float32).reshape(-1)
+        self.samples = np.concatenate((self.samples, pcm))
+        self.num_samples += len(pcm)
+        self.sum_sq += float(np.dot(pcm, pcm))
+        self.analyze()
+        outputs = []
+        while self.next_frame >= self.next_out + self.step + self.lookahead:
+            self.infer_step()
+            # buffer samples before the first frame of the next step are complete
+            outputs.append(self.emit(self.next_out * self.hop_size))
+        # drop the samples no later frame needs
+        keep = self.next_frame * self.hop_size - self.samples_start
+        self.samples = self.samples[keep:]
+        self.samples_start += keep
+        self.stream_time += time.time() - start_time
+        return np.concatenate(outputs) if outputs else np.zeros(0, dtype=np.float32)
+
+    def flush(self):
+        """Enhanced samples left at the end of the stream; the enhancer is reset afterwards."""
+        start_time = time.time()
+        total = self.num_samples
+        # the last frame is centered on the last sample, as with center=True in librosa;
+        # silence after the end gives the last windows their samples and lookahead
+        last_frame = total // self.hop_size
+        needed = (last_frame + self.step + self.lookahead - 1) * self.hop_size + self.n_fft - self.pad - total
+        self.samples = np.concatenate((self.samples, np.zeros(max(needed, 0), dtype=np.float32)))
+        self.analyze()
+        while self.next_out <= last_frame:
+            self.infer_step(min(self.step, last_frame + 1 - self.next_out))
+        out = self.emit(total + self.pad)
+        self.stream_time += time.time() - start_time
+        self.reset()
+        return out
+
+
+def main():
+    print('Initializing Inference Process..')
+    parser = argparse.ArgumentParser(
+        description='Streaming inference code for mp_senet models')
+    parser.add_argument('--mp_senet_model', type=str, default='./models/BM1684X/mpsenet_vb_1b_bf16.bmodel', help='path of bmodel')
+    parser.add_argument('--wav_files', type=str, default='./datasets/', help='path of wav files')
+    parser.add_argument('--result_files', type=str, default='./python/results_stream/', help='path of result files')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--compress_factor',type=float, default=0.30, help='compress factor')
+    parser.add_argument('--sampling_rate',type=int, default=16000, help='sampling rate')
+    parser.add_argument('--n_fft',type=int, default=400, help='n_fft')
+    parser.add_argument('--hop_size',type=int, default=100, help='hop_size')
+    parser.add_argument('--win_size',type=int, default=400, help='win_size')
+    parser.add_argument('--block_size',type=int, default=1600, help='input samples per process call, the size of the pcm blocks of a live source')
+    parser.add_argument('--step',type=int, default=0, help='new stft frames per inference, 0 means half the bmodel frames')
+    parser.add_argument('--lookahead',type=int, default=0, help='stft frames after the new ones in each inference, 0 means a quarter of the bmodel frames')
+    args = parser.parse_args()
+
+    if 'bf16' in args.mp_senet_model:
+        args.compress_factor = 0.27
+        args.hop_size = 150
+
+    mp_senet = MP_SENET(args)
+    enhancer = StreamEnhancer(mp_senet, args.step, args.lookahead)
+    logging.info("window: {} frames, step: {}, history: {}, lookahead: {}, algorithmic latency(ms): {:.2f}".format(
+        enhancer.window_frames, enhancer.step, enhancer.history, enhancer.lookahead, enhancer.latency * 1000 / args.sampling_rate))
+    test_indexes = os.listdir(args.wav_files)
+    os.makedirs(args.result_files, exist_ok=True)
+
+    n = 0
+    audio_time = 0.0
+    for index in test_indexes:
+        noisy_wav, _ = librosa.load(os.path.join(args.wav_files, index), sr=args.sampling_rate)
+        clean_blocks = []
+        for start in range(0, len(noisy_wav), args.block_size):
+            clean_blocks.append(enhancer.process(noisy_wav[start:start + args.block_size]))
+        clean_blocks.append(enhancer.flush())
+        clean_wav = np.concatenate(clean_blocks)
+
+        n += 1
+        audio_time += len(noisy_wav) / args.sampling_rate
+        output_file = os.path.join(args.result_files, index)
+        sf.write(output_file, clean_wav, args.sampling_rate, 'PCM_16')
+
+    # calculate speed
+    logging.info("------------------ Predict Time Info ----------------------")
+    logging.info("wav nums: {}, preprocess_time(ms): {:.2f}".format(n, mp_senet.preprocess_time * 1000))
+    logging.info("wav nums: {}, inference_time(ms): {:.2f}".format(n, mp_senet.inference_time * 1000))
+    logging.info("wav nums: {}, postprocess_time(ms): {:.2f}".format(n, mp_senet.postprocess_time * 1000))
+    logging.info("wav nums: {}, stream_time(ms): {:.2f}".format(n, enhancer.stream_time * 1000))
+    logging.info("audio(s): {:.2f}, real time factor: {:.3f}".format(audio_time, enhancer.stream_time / max(audio_time, 1e-6)))
+
+if __name__ == "__main__":
+    main()
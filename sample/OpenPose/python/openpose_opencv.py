@@ -16,6 +16,7 @@ import argparse
 import json
 import sophon.sail as sail
 from scipy.ndimage import gaussian_filter
+from pose_grouping import PoseGrouper
 import matplotlib.pyplot as plt
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -60,9 +61,15 @@ class Pose(object):
                            [30,31], [34,35], [36,37], [38,39], [56,57], [58,59], [62,63], [60,61], [64,65], \
                            [46,47], [54,55], [66,67], [68,69], [70,71], [72,73], [74,75], [76,77]]
 
+        # vectorized (default), loop, or check: run both and require identical results
+        self.grouping = args.grouping
+        self.grouper = PoseGrouper(self.POSE_PAIRS, self.mapIdx, self.point_num, self.thre1, self.thre2)
+
         self.preprocess_time = 0.0
         self.inference_time = 0.0
         self.postprocess_time = 0.0
+        self.grouping_time = 0.0
+        self.loop_grouping_time = 0.0
     
     def preprocess(self, ori_img):
         h, w, _ = ori_img.shape
@@ -96,142 +103,164 @@ class Pose(object):
             output = cv2.resize(output, (0, 0), fx=self.stride, fy=self.stride, interpolation=cv2.INTER_CUBIC)
             output = output[:self.net_h - pad[0], :self.net_w - pad[1], :]
             output = cv2.resize(output, (ori_img.shape[1], ori_img.shape[0]), interpolation=cv2.INTER_CUBIC)
-            
-            all_peaks = []
-            peak_counter = 0
-            
-            for part in range(self.point_num):
-                map_ori = output[:, :, part]
-                one_heatmap = gaussian_filter(map_ori, sigma=3)
-                
-                map_left = np.zeros(one_heatmap.shape)
-                map_left[1:, :] = one_heatmap[:-1, :]
-                map_right = np.zeros(one_heatmap.shape)
-                map_right[:-1, :] = one_heatmap[1:, :]
-                map_up = np.zeros(one_heatmap.shape)
-                map_up[:, 1:] = one_heatmap[:, :-1]
-                map_down = np.zeros(one_heatmap.shape)
-                map_down[:, :-1] = one_heatmap[:, 1:]
-                
-                peaks_binary = np.logical_and.reduce(
-                    (one_heatmap >= map_left, one_heatmap >= map_right, one_heatmap >= map_up, one_heatmap >= map_down, one_heatmap > self.thre1))
-                peaks = list(zip(np.nonzero(peaks_binary)[1], np.nonzero(peaks_binary)[0]))  # note reverse
-                peaks_with_score = [x + (map_ori[x[1], x[0]],) for x in peaks]
-                peak_id = range(peak_counter, peak_counter + len(peaks))
-                peaks_with_score_and_id = [peaks_with_score[i] + (peak_id[i],) for i in range(len(peak_id))]
 
-                all_peaks.append(peaks_with_score_and_id)
-                peak_counter += len(peaks)
+            if self.grouping == 'loop':
+                candidate, subset = self.group_loop(output, ori_img)
+            else:
+                start_time = time.time()
+                candidate, subset = self.grouper(output, ori_img.shape[0])
+                self.grouping_time += time.time() - start_time
+                if self.grouping == 'check':
+                    start_time = time.time()
+                    ref_candidate, ref_subset = self.group_loop(output, ori_img)
+                    self.loop_grouping_time += time.time() - start_time
+                    if not (np.array_equal(candidate, ref_candidate) and np.array_equal(subset, ref_subset)):
+                        raise RuntimeError("vectorized grouping differs from the loop grouping")
+            results.append((candidate, subset))
+
+        return results
+
+    def group_loop(self, output, ori_img):
+        """
+        Peak detection and part affinity grouping with per-part and per-pair python loops.
+        Returns candidate: [n, 4] -- x, y, score, id, and subset: [persons, point_num + 2].
+        """
+        all_peaks = []
+        peak_counter = 0
+        
+        for part in range(self.point_num):
+            map_ori = output[:, :, part]
+            one_heatmap = gaussian_filter(map_ori, sigma=3)
             
-            connection_all = []
-            special_k = []
-            mid_num = 10
+            map_left = np.zeros(one_heatmap.shape)
+            map_left[1:, :] = one_heatmap[:-1, :]
+            map_right = np.zeros(one_heatmap.shape)
+            map_right[:-1, :] = one_heatmap[1:, :]
+            map_up = np.zeros(one_heatmap.shape)
+            map_up[:, 1:] = one_heatmap[:, :-1]
+            map_down = np.zeros(one_heatmap.shape)
+            map_down[:, :-1] = one_heatmap[:, 1:]
             
-            for k in range(len(self.mapIdx)):
-                score_mid = output[:, :, [x for x in self.mapIdx[k]]]
-                candA = all_peaks[self.POSE_PAIRS[k][0]]
-                candB = all_peaks[self.POSE_PAIRS[k][1]]
-                nA = len(candA)
-                nB = len(candB)
-                indexA, indexB = np.array(self.POSE_PAIRS[k]) + 1
-                if (nA != 0 and nB != 0):
-                    connection_candidate = []
-                    for i in range(nA):
-                        for j in range(nB):
-                            vec = np.subtract(candB[j][:2], candA[i][:2])
-                            norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
-                            norm = max(0.001, norm)
-                            vec = np.divide(vec, norm)
+            peaks_binary = np.logical_and.reduce(
+                (one_heatmap >= map_left, one_heatmap >= map_right, one_heatmap >= map_up, one_heatmap >= map_down, one_heatmap > self.thre1))
+            peaks = list(zip(np.nonzero(peaks_binary)[1], np.nonzero(peaks_binary)[0]))  # note reverse
+            peaks_with_score = [x + (map_ori[x[1], x[0]],) for x in peaks]
+            peak_id = range(peak_counter, peak_counter + len(peaks))
+            peaks_with_score_and_id = [peaks_with_score[i] + (peak_id[i],) for i in range(len(peak_id))]
 
-                            startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
-                                                np.linspace(candA[i][1], candB[j][1], num=mid_num)))
+            all_peaks.append(peaks_with_score_and_id)
+            peak_counter += len(peaks)
+        
+        connection_all = []
+        special_k = []
+        mid_num = 10
+        
+        for k in range(len(self.mapIdx)):
+            score_mid = output[:, :, [x for x in self.mapIdx[k]]]
+            candA = all_peaks[self.POSE_PAIRS[k][0]]
+            candB = all_peaks[self.POSE_PAIRS[k][1]]
+            nA = len(candA)
+            nB = len(candB)
+            indexA, indexB = np.array(self.POSE_PAIRS[k]) + 1
+            if (nA != 0 and nB != 0):
+                connection_candidate = []
+                for i in range(nA):
+                    for j in range(nB):
+                        vec = np.subtract(candB[j][:2], candA[i][:2])
+                        norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
+                        norm = max(0.001, norm)
+                        vec = np.divide(vec, norm)
 
-                            vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
-                                            for I in range(len(startend))])
-                            vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
-                                            for I in range(len(startend))])
+                        startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
+                                            np.linspace(candA[i][1], candB[j][1], num=mid_num)))
 
-                            score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
-                            score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
-                                0.5 * ori_img.shape[0] / norm - 1, 0)
-                            criterion1 = len(np.nonzero(score_midpts > self.thre2)[0]) > 0.8 * len(score_midpts)
-                            criterion2 = score_with_dist_prior > 0
-                            if criterion1 and criterion2:
-                                connection_candidate.append(
-                                    [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
+                        vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
+                                        for I in range(len(startend))])
+                        vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
+                                        for I in range(len(startend))])
 
-                    connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
-                    connection = np.zeros((0, 5))
-                    for c in range(len(connection_candidate)):
-                        i, j, s = connection_candidate[c][0:3]
-                        if (i not in connection[:, 3] and j not in connection[:, 4]):
-                            connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
-                            if (len(connection) >= min(nA, nB)):
-                                break
+                        score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
+                        score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
+                            0.5 * ori_img.shape[0] / norm - 1, 0)
+                        criterion1 = len(np.nonzero(score_midpts > self.thre2)[0]) > 0.8 * len(score_midpts)
+                        criterion2 = score_with_dist_prior > 0
+                        if criterion1 and criterion2:
+                            connection_candidate.append(
+                                [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
 
-                    connection_all.append(connection)
-                else:
-                    special_k.append(k)
-                    connection_all.append([])
+                connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
+                connection = np.zeros((0, 5))
+                for c in range(len(connection_candidate)):
+                    i, j, s = connection_candidate[c][0:3]
+                    if (i not in connection[:, 3] and j not in connection[:, 4]):
+                        connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
+                        if (len(connection) >= min(nA, nB)):
+                            break
 
-            # last number in each row is the total parts number of that person
-            # the second last number in each row is the score of the overall configuration
-            subset = -1 * np.ones((0, self.point_num + 2))
-            candidate = np.array([item for sublist in all_peaks for item in sublist])
+                connection_all.append(connection)
+            else:
+                special_k.append(k)
+                connection_all.append([])
 
-            for k in range(len(self.mapIdx)):
-                if k not in special_k:
-                    partAs = connection_all[k][:, 0]
-                    partBs = connection_all[k][:, 1]
-                    indexA, indexB = self.POSE_PAIRS[k]
+        # last number in each row is the total parts number of that person
+        # the second last number in each row is the score of the overall configuration
+        subset = -1 * np.ones((0, self.point_num + 2))
+        candidate = np.array([item for sublist in all_peaks for item in sublist])
 
-                    for i in range(len(connection_all[k])):  # = 1:size(temp,1)
-                        found = 0
-                        subset_idx = [-1, -1]
-                        for j in range(len(subset)):  # 1:size(subset,1):
-                            if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
-                                subset_idx[found] = j
-                                found += 1
+        for k in range(len(self.mapIdx)):
+            if k not in special_k:
+                partAs = connection_all[k][:, 0]
+                partBs = connection_all[k][:, 1]
+                indexA, indexB = self.POSE_PAIRS[k]
 
-                        if found == 1:
-                            j = subset_idx[0]
-                            if subset[j][indexB] != partBs[i]:
-                                subset[j][indexB] = partBs[i]
-                                subset[j][-1] += 1
-                                subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-                        elif found == 2:  # if found 2 and disjoint, merge them
-                            j1, j2 = subset_idx
-                            membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
-                            if len(np.nonzero(membership == 2)[0]) == 0:  # merge
-                                subset[j1][:-2] += (subset[j2][:-2] + 1)
-                                subset[j1][-2:] += subset[j2][-2:]
-                                subset[j1][-2] += connection_all[k][i][2]
-                                subset = np.delete(subset, j2, 0)
-                            else:  # as like found == 1
-                                subset[j1][indexB] = partBs[i]
-                                subset[j1][-1] += 1
-                                subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+                for i in range(len(connection_all[k])):  # = 1:size(temp,1)
+                    found = 0
+                    subset_idx = [-1, -1]
+                    for j in range(len(subset)):  # 1:size(subset,1):
+                        if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
+                            subset_idx[found] = j
+                            found += 1
 
-                        # if find no partA in the subset, create a new subset
-                        elif not found and k < self.point_num - 1:
-                            row = -1 * np.ones(self.point_num + 2)
-                            row[indexA] = partAs[i]
-                            row[indexB] = partBs[i]
-                            row[-1] = 2
-                            row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
-                            subset = np.vstack([subset, row])
-            # delete some rows of subset which has few parts occur
-            deleteIdx = []
-            for i in range(len(subset)):
-                if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
-                    deleteIdx.append(i)
-            subset = np.delete(subset, deleteIdx, axis=0)
+                    if found == 1:
+                        j = subset_idx[0]
+                        if subset[j][indexB] != partBs[i]:
+                            subset[j][indexB] = partBs[i]
+                            subset[j][-1] += 1
+                            subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+                    elif found == 2:  # if found 2 and disjoint, merge them
+                        j1, j2 = subset_idx
+                        membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
+                        if len(np.nonzero(membership == 2)[0]) == 0:  # merge
+                            subset[j1][:-2] += (subset[j2][:-2] + 1)
+                            subset[j1][-2:] += subset[j2][-2:]
+                            subset[j1][-2] += connection_all[k][i][2]
+                            subset = np.delete(subset, j2, 0)
+                        else:  # as like found == 1
+                            subset[j1][indexB] = partBs[i]
+                            subset[j1][-1] += 1
+                            subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
 
-            # subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
-            # candidate: x, y, score, id
-            results.append((candidate, subset))    
+                    # if find no partA in the subset, create a new subset
+                    elif not found and k < self.point_num - 1:
+                        row = -1 * np.ones(self.point_num + 2)
+                        row[indexA] = partAs[i]
+                        row[indexB] = partBs[i]
+                        row[-1] = 2
+                        row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
+                        subset = np.vstack([subset, row])
+        # delete some rows of subset which has few parts occur
+        deleteIdx = []
+        for i in range(len(subset)):
+            if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
+                deleteIdx.append(i)
+        subset = np.delete(subset, deleteIdx, axis=0)
 
-        return results
+        # subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
+        # candidate: x, y, score, id
+
+        # subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
+        # candidate: x, y, score, id
+        return candidate, subset
 
     def __call__(self, img_list):
         img_num = len(img_list)
@@ -446,6 +475,10 @@ def main(args):
     logging.info("preprocess_time(ms): {:.2f}".format(preprocess_time * 1000))
     logging.info("inference_time(ms): {:.2f}".format(inference_time * 1000))
     logging.info("postprocess_time(ms): {:.2f}".format(postprocess_time * 1000))
+    if args.grouping != 'loop':
+        logging.info("grouping_time(ms): {:.2f}".format(pose.grouping_time / cn * 1000))
+    if args.grouping == 'check':
+        logging.info("loop grouping_time(ms): {:.2f}, results identical".format(pose.loop_grouping_time / cn * 1000))
     # average_latency = decode_time + preprocess_time + inference_time + postprocess_time
     # qps = 1 / average_latency
     # logging.info("average latency time(ms): {:.2f}, QPS: {:2f}".format(average_latency * 1000, qps))
@@ -455,6 +488,7 @@ def argsparser():
     parser.add_argument('--input', type=str, default='../datasets/test', help='path of input')
     parser.add_argument('--bmodel', type=str, default='../models/BM1684/pose_coco_fp32_1b.bmodel', help='path of bmodel')
     parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--grouping', type=str, default='vectorized', choices=['vectorized', 'loop', 'check'], help='keypoint grouping, check runs both and stops if they differ')
     args = parser.parse_args()
     return args
 
@@ -0,0 +1,185 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+
+def scalar_dtype(value):
+    return np.asarray(value).dtype
+
+
+class PoseGrouper(object):
+    """
+    Vectorized version of the peak detection and part affinity grouping of Pose.group_loop, with
+    the same candidate and subset, bit for bit:
+
+    - peaks of all heatmaps come from one gaussian_filter over the [h, w, parts] stack and one
+      neighbourhood comparison;
+    - for each limb the PAF is sampled at the mid_num points of every A-B candidate pair with a
+      single gather, and the pair scores are computed as arrays;
+    - subset assembly looks up the persons containing a limb's parts with array comparisons.
+
+    The loop version scores a pair with numpy scalar arithmetic, whose result types depend on
+    the numpy version (value-based casting before numpy 2, NEP 50 after); the dtypes of every
+    step are probed once at init so the arrays here are computed in the same precision.
+    """
+    def __init__(self, pose_pairs, map_idx, point_num, thre1=0.1, thre2=0.05, mid_num=10):
+        self.pose_pairs = pose_pairs
+        self.map_idx = map_idx
+        self.point_num = point_num
+        self.thre1 = thre1
+        self.thre2 = thre2
+        self.mid_num = mid_num
+        self.sample_pos = np.arange(mid_num, dtype=np.float64)
+
+        # dtypes of the pair score steps: PAF sample (float32) times unit vector component (np.float64),
+        # the running python sum from 0, the mean, and the mean plus the distance prior, which
+        # min(..., 0) makes a python float or the int 0
+        self.mul_dtype = (np.ones(1, np.float32) * np.float64(1)).dtype
+        self.sum_dtypes = []
+        acc = 0
+        for _ in range(mid_num):
+            acc = acc + self.mul_dtype.type(1)
+            self.sum_dtypes.append(scalar_dtype(acc))
+        self.mean_dtype = scalar_dtype(acc / mid_num)
+        self.prior_dtype = scalar_dtype(self.mean_dtype.type(1) + 1.5)
+        self.zero_prior_dtype = scalar_dtype(self.mean_dtype.type(1) + 0)
+
+    def find_peaks(self, output):
+        """
+        Returns:
+            candidate: [n, 4] float64 -- x, y, score, id, ordered by part
+            part_start: [point_num + 1] -- rows of part p are part_start[p]:part_start[p + 1]
+        """
+        heatmaps = output[:, :, :self.point_num]
+        smoothed = gaussian_filter(heatmaps, sigma=(3, 3, 0))
+        padded = np.zeros((smoothed.shape[0] + 2, smoothed.shape[1] + 2, smoothed.shape[2]), dtype=smoothed.dtype)
+        padded[1:-1, 1:-1] = smoothed
+        peaks_binary = np.logical_and.reduce(
+            (smoothed >= padded[:-2, 1:-1], smoothed >= padded[2:, 1:-1], smoothed >= padded[1:-1, :-2],
+             smoothed >= padded[1:-1, 2:], smoothed > self.thre1))
+        part, y, x = np.nonzero(peaks_binary.transpose(2, 0, 1))
+        candidate = np.stack((x, y, heatmaps[y, x, part], np.arange(len(part))), axis=1).astype(np.float64)
+        part_start = np.searchsorted(part, np.arange(self.point_num + 1))
+        return candidate, part_start
+
+    def score_pairs(self, output, candA, candB, paf_x, paf_y, img_h):
+        # scores of all A-B pairs in i-major order and whether they pass both criteria
+        dx = (candB[None, :, 0] - candA[:, None, 0]).reshape(-1)
+        dy = (candB[None, :, 1] - candA[:, None, 1]).reshape(-1)
+        norm = np.maximum(np.sqrt(dx * dx + dy * dy), 0.001)
+        ux, uy = dx / norm, dy / norm
+
+        # np.linspace(A, B, mid_num) of every pair
+        ax = np.repeat(candA[:, 0], len(candB))
+        ay = np.repeat(candA[:, 1], len(candB))
+        xs = self.sample_pos * (dx / (self.mid_num - 1))[:, None] + ax[:, None]
+        ys = self.sample_pos * (dy / (self.mid_num - 1))[:, None] + ay[:, None]
+        xs[:, -1] = ax + dx
+        ys[:, -1] = ay + dy
+        xi = np.rint(xs).astype(np.int64)
+        yi = np.rint(ys).astype(np.int64)
+
+        mul = self.mul_dtype
+        score_midpts = output[yi, xi, paf_x].astype(mul) * ux.astype(mul)[:, None] + \
+                       output[yi, xi, paf_y].astype(mul) * uy.astype(mul)[:, None]
+        acc = score_midpts[:, 0].astype(self.sum_dtypes[0])
+        for i in range(1, self.mid_num):
+            acc = acc.astype(self.sum_dtypes[i]) + score_midpts[:, i].astype(self.sum_dtypes[i])
+        mean = acc.astype(self.mean_dtype) / self.mean_dtype.type(self.mid_num)
+        prior = 0.5 * img_h / norm - 1
+        score = np.where(prior <= 0,
+                         (mean.astype(self.prior_dtype) + prior.astype(self.prior_dtype)).astype(np.float64),
+                         (mean.astype(self.zero_prior_dtype) + 0).astype(np.float64))
+        criterion1 = np.count_nonzero(score_midpts > self.thre2, axis=1) > 0.8 * self.mid_num
+        return score, criterion1 & (score > 0)
+
+    def connect(self, output, candidate, part_start, img_h):
+        connection_all = []
+        special_k = []
+        for k in range(len(self.map_idx)):
+            partA, partB = self.pose_pairs[k]
+            candA = candidate[part_start[partA]:part_start[partA + 1]]
+            candB = candidate[part_start[partB]:part_start[partB + 1]]
+            nA, nB = len(candA), len(candB)
+            if nA == 0 or nB == 0:
+                special_k.append(k)
+                connection_all.append([])
+                continue
+            score, valid = self.score_pairs(output, candA, candB, self.map_idx[k][0], self.map_idx[k][1], img_h)
+            pairs = np.nonzero(valid)[0]
+            # stable, ties keep the i-major order as sorted(..., reverse=True) does
+            pairs = pairs[np.argsort(-score[pairs], kind='stable')]
+            usedA = np.zeros(nA, dtype=bool)
+            usedB = np.zeros(nB, dtype=bool)
+            rows = []
+            for pair in pairs:
+                i, j = divmod(int(pair), nB)
+                if not usedA[i] and not usedB[j]:
+                    usedA[i] = usedB[j] = True
+                    rows.append([candA[i, 3], candB[j, 3], score[pair], i, j])
+                    if len(rows) >= min(nA, nB):
+                        break
+            connection_all.append(np.array(rows, dtype=np.float64).reshape(-1, 5))
+        return connection_all, special_k
+
+    def assemble(self, candidate, connection_all, special_k):
+        subset = -1 * np.ones((0, self.point_num + 2))
+        for k in range(len(self.map_idx)):
+            if k in special_k:
+                continue
+            indexA, indexB = self.pose_pairs[k]
+            for conn in connection_all[k]:
+                partA, partB = conn[0], conn[1]
+                found_idx = np.nonzero((subset[:, indexA] == partA) | (subset[:, indexB] == partB))[0]
+                found = len(found_idx)
+                if found == 1:
+                    j = found_idx[0]
+                    if subset[j, indexB] != partB:
+                        subset[j, indexB] = partB
+                        subset[j, -1] += 1
+                        subset[j, -2] += candidate[int(partB), 2] + conn[2]
+                elif found == 2:  # if found 2 and disjoint, merge them
+                    j1, j2 = found_idx
+                    if not np.any((subset[j1, :-2] >= 0) & (subset[j2, :-2] >= 0)):  # merge
+                        subset[j1, :-2] += (subset[j2, :-2] + 1)
+                        subset[j1, -2:] += subset[j2, -2:]
+                        subset[j1, -2] += conn[2]
+                        subset = np.delete(subset, j2, 0)
+                    else:  # as like found == 1
+                        subset[j1, indexB] = partB
+                        subset[j1, -1] += 1
+                        subset[j1, -2] += candidate[int(partB), 2] + conn[2]
+                # if find no partA in the subset, create a new subset
+                elif not found and k < self.point_num - 1:
+                    row = -1 * np.ones(self.point_num + 2)
+                    row[indexA] = partA
+                    row[indexB] = partB
+                    row[-1] = 2
+                    row[-2] = candidate[int(partA), 2] + candidate[int(partB), 2] + conn[2]
+                    subset = np.vstack([subset, row])
+        # delete some rows of subset which has few parts occur
+        keep = ~((subset[:, -1] < 4) | (subset[:, -2] / subset[:, -1] < 0.4))
+        return subset[keep]
+
+    def __call__(self, output, img_h):
+        """
+        Args:
+            output: [h, w, channels] float32 network output resized to the original image
+            img_h: original image height, used by the limb length prior
+        Returns:
+            candidate: [n, 4] -- x, y, score, id
+            subset: [persons, point_num + 2] -- candidate index per part, total score, part number
+        """
+        candidate, part_start = self.find_peaks(output)
+        connection_all, special_k = self.connect(output, candidate, part_start, img_h)
+        subset = self.assemble(candidate, connection_all, special_k)
+        if len(candidate) == 0:
+            candidate = np.array([])
+        return candidate, subset
@@ -4,13 +4,13 @@ from sophon import sail
 from transformers import AutoProcessor, AutoTokenizer, Qwen2VLConfig, BatchFeature
 from transformers.models.qwen2_vl.processing_qwen2_vl import Qwen2VLProcessorKwargs
 from vision_process import process_vision_info
+from vision_cache import VisionEmbeddingCache
 import json
 import os
 import torch
 from typing import Optional, Tuple
 from typing import List
 import numpy as np
-import torch.nn.functional as F
 import copy
 import SILK2.Tools.logger as Logger
 
@@ -188,6 +188,7 @@ class Qwen2VL():
         self.name_sample = "greedy_head" if self.is_greedy_sample else ""
         self.name_penalty = "penalty_sample_head" if self.is_greedy_sample else ""
         self.name_vit = "vit"
+        self.vision_cache = VisionEmbeddingCache(kwargs.get("vision_cache_size", 16))
 
         # initialize vision tensors (inputs & outputs)
         self.input_tensors[self.name_vit] = self.net.create_max_input_tensors(self.name_vit)
@@ -484,16 +485,11 @@ class Qwen2VL():
         return pos_ids
 
     def get_vision_mask(self, grid_thw):
-        cu_seqlens = torch.repeat_interleave(grid_thw[:, 1] * grid_thw[:, 2], grid_thw[:, 0]).cumsum(
-            dim=0, dtype=torch.int32
-        )
-        cu_seqlens = F.pad(cu_seqlens, (1, 0), value=0)
-        seq_length = cu_seqlens.max()
-
-        attention_mask = torch.zeros([1, seq_length, seq_length], device="cpu", dtype=torch.bool)
-        for i in range(1, cu_seqlens.shape[0]):
-            attention_mask[..., cu_seqlens[i - 1] : cu_seqlens[i], cu_seqlens[i - 1] : cu_seqlens[i]] = True
-        return attention_mask
+        # block diagonal: a patch attends to the patches of its own image/frame only
+        seqlens = np.repeat(grid_thw[:, 1] * grid_thw[:, 2], grid_thw[:, 0])
+        segment_ids = np.repeat(np.arange(seqlens.shape[0]), seqlens)
+        attention_mask = segment_ids[:, None] == segment_ids[None, :]
+        return attention_mask[None]
 
     def vision_process(
             self, 
@@ -519,6 +515,39 @@ class Qwen2VL():
         self,
         pixel_values,
         grid_thw,
+    ):
+        """ ViT outputs of every image/video in grid_thw, concatenated. Embeddings are cached per image/video,
+            keyed by its preprocessed pixels and grid (which carry the resize parameters), and the ViT only runs
+            on the ones not in the cache.
+        """
+        grid_thw = np.asarray(grid_thw).reshape(-1, 3)
+        merge_size = self.loaded_config.vision_config.spatial_merge_size ** 2
+        patch_nums = np.prod(grid_thw, axis=-1)
+        offsets = np.concatenate([[0], np.cumsum(patch_nums)])
+        keys, vision_embeds, miss_ids = [], [], []
+        for i in range(grid_thw.shape[0]):
+            keys.append(self.vision_cache.make_key(pixel_values[offsets[i]:offsets[i + 1]], grid_thw[i]))
+            vision_embeds.append(self.vision_cache.get(keys[i]))
+            if vision_embeds[i] is None:
+                miss_ids.append(i)
+        self.logger.debug(f"{Logger.file_lineno()} {len(miss_ids)} of {grid_thw.shape[0]} vision inputs need ViT, {self.vision_cache.stats()}")
+        if len(miss_ids) == 0:
+            return np.concatenate(vision_embeds)
+
+        miss_embeds = self.vit_forward(
+            np.concatenate([pixel_values[offsets[i]:offsets[i + 1]] for i in miss_ids]), grid_thw[miss_ids])
+        start = 0
+        for i in miss_ids:
+            end = start + patch_nums[i] // merge_size
+            vision_embeds[i] = miss_embeds[start:end]
+            self.vision_cache.put(keys[i], vision_embeds[i])
+            start = end
+        return np.concatenate(vision_embeds)
+
+    def vit_forward(
+        self,
+        pixel_values,
+        grid_thw,
     ):
         # ViT prepare inputs & infer
         real_len = pixel_values.shape[0]
@@ -527,17 +556,15 @@ class Qwen2VL():
         rotary_pos_emb = self.rot_pos_emb(grid_thw)
         pos_ids_prefill = np.zeros(self.vit_pos_ids_input_shape, dtype=type_convert(self.input_tensors[self.name_vit][1].dtype()))
         pos_ids_prefill[:rotary_pos_emb.shape[0],:] = rotary_pos_emb
-        pos_ids_prefill = pos_ids_prefill
-        visual_attention_mask = self.get_vision_mask(torch.from_numpy(grid_thw))
-        visual_attention_mask_fp = torch.zeros((visual_attention_mask.shape), dtype=torch.float32)
-        visual_attention_mask = visual_attention_mask_fp.masked_fill(visual_attention_mask.logical_not(), -10000).numpy()
+        visual_attention_mask = self.get_vision_mask(grid_thw)
         visual_attention_mask_prefill = np.zeros(self.vit_attention_mask_input_shape, dtype=type_convert(self.input_tensors[self.name_vit][2].dtype()))
-        visual_attention_mask_prefill[:, :visual_attention_mask.shape[1], :visual_attention_mask.shape[2]] = visual_attention_mask
+        visual_attention_mask_prefill[:, :real_len, :real_len] = np.where(visual_attention_mask, 0, -10000)
         self.input_tensors[self.name_vit][0].update_data(pixel_values_prefill)
         self.input_tensors[self.name_vit][1].update_data(pos_ids_prefill)
         self.input_tensors[self.name_vit][2].update_data(visual_attention_mask_prefill)
         self.net.process(self.name_vit, self.input_tensors[self.name_vit], self.output_tensors[self.name_vit])
-        vision_embeds = torch.from_numpy(self.output_tensors[self.name_vit][0].asnumpy()[:real_len//4]).type( \
+        merge_size = self.loaded_config.vision_config.spatial_merge_size ** 2
+        vision_embeds = torch.from_numpy(self.output_tensors[self.name_vit][0].asnumpy()[:real_len//merge_size]).type( \
                                             torch.bfloat16).view(torch.uint16).detach().numpy() # uint16(bfloat16)
         return vision_embeds
 
@@ -738,7 +765,8 @@ class Qwen2VL():
 
 def main(args):
     history_messages = []
-    model = Qwen2VL(dev_id=args.dev_id, bmodel_path=args.bmodel_path, log_level=args.log_level)
+    model = Qwen2VL(dev_id=args.dev_id, bmodel_path=args.bmodel_path, log_level=args.log_level,
+                    vision_cache_size=args.vision_cache_size)
     video_embeds = None
     image_embeds = None
     video_grid_thw = None
@@ -784,13 +812,12 @@ def main(args):
             pixel_values_images = inputs.pixel_values if "pixel_values" in inputs else None
             pixel_values_videos = inputs.pixel_values_videos if "pixel_values_videos" in inputs else None
 
-        # vision
-        if image_embeds is None and video_embeds is None:
-            image_embeds, video_embeds = model.vision_process(
-                pixel_values_images=pixel_values_images.numpy() if pixel_values_images is not None else None,
-                pixel_values_videos=pixel_values_videos.numpy() if pixel_values_videos is not None else None, 
-                image_grid_thw=image_grid_thw.numpy() if image_grid_thw is not None else None,
-                video_grid_thw=video_grid_thw.numpy() if video_grid_thw is not None else None)
+        # vision, the ViT only runs for images/videos not in the vision cache
+        image_embeds, video_embeds = model.vision_process(
+            pixel_values_images=pixel_values_images.numpy() if pixel_values_images is not None else None,
+            pixel_values_videos=pixel_values_videos.numpy() if pixel_values_videos is not None else None, 
+            image_grid_thw=image_grid_thw.numpy() if image_grid_thw is not None else None,
+            video_grid_thw=video_grid_thw.numpy() if video_grid_thw is not None else None)
 
         # Chat
         print("\nAnswer: ", end = '')
@@ -869,5 +896,10 @@ if __name__ == "__main__":
                         choices=["DEBUG", "INFO", "WARNING", "ERROR"],
                         default="INFO",
                         help='log level, default: INFO, option[DEBUG, INFO, WARNING, ERROR]')
+    parser.add_argument('-vc',
+                        '--vision_cache_size',
+                        type=int,
+                        default=16,
+                        help='number of images/videos whose ViT outputs are cached, 0 disables the cache')
     args = parser.parse_args()
     main(args)
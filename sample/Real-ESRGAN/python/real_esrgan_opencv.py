@@ -7,7 +7,9 @@
 #
 #===----------------------------------------------------------------------===#
 import os
+import math
 import time
+import tempfile
 import argparse
 import numpy as np
 import sophon.sail as sail
@@ -160,6 +162,162 @@ class Real_ESRGAN:
         self.postprocess_time += time.time() - start_time
         return clipped_arr
 
+
+def tile_starts(size, tile, overlap):
+    """
+    Start positions of tiles of length `tile` covering `size`, spread evenly so that neighbouring
+    tiles overlap by at least `overlap`.
+    """
+    if size <= tile:
+        return [0]
+    n = math.ceil((size - overlap) / (tile - overlap))
+    return [round(k * (size - tile) / (n - 1)) for k in range(n)]
+
+
+def feather_weights(starts, tile, scale, overlap):
+    """
+    Per-tile blending weights along one axis at output resolution: a linear ramp of `overlap`
+    input pixels at both tile ends, normalized so that the weights of all tiles sum to 1.
+    """
+    tile_out = tile * scale
+    ramp = max(overlap * scale, 1)
+    pos = np.arange(tile_out, dtype=np.float32) + 0.5
+    profile = np.minimum(np.minimum(pos, tile_out - pos) / ramp, 1.0)
+    total = np.zeros((starts[-1] + tile) * scale, dtype=np.float32)
+    for start in starts:
+        total[start * scale:start * scale + tile_out] += profile
+    return [profile / total[start * scale:start * scale + tile_out] for start in starts]
+
+
+class PendingSum:
+    """
+    Running sum of blocks that overlap along axis 0 and arrive in order. Only the rows that a later
+    block can still add to are kept; `add` returns the rows that are complete.
+    """
+    def __init__(self, max_rows, row_shape):
+        self.buffer = np.zeros((max_rows,) + tuple(row_shape), dtype=np.float32)
+        self.rows = 0
+
+    def add(self, block, final_rows):
+        """
+        Args:
+            block: float32 rows starting at the first pending row, modified in place
+            final_rows: leading rows of `block` no later block overlaps
+        """
+        block[:self.rows] += self.buffer[:self.rows]
+        rest = block[final_rows:]
+        self.buffer[:len(rest)] = rest
+        self.rows = len(rest)
+        return block[:final_rows]
+
+
+class TiledUpscaler:
+    """
+    Super-resolution of images of any size with a fixed-shape Real_ESRGAN bmodel. The image is
+    split into overlapping tiles of the bmodel input size, tiles are batched to fill the bmodel
+    batch, and the tile outputs are blended with feathered weights straight into a preallocated
+    uint8 output, an np.memmap when it is larger than `memmap_mb`.
+
+    Tiles are consumed row by row and left to right, so only the overlap of the current tile
+    with the next one, and of the current tile row with the next row, is held in float32.
+    """
+    def __init__(self, model, overlap=32, memmap_mb=1024, memmap_dir=None):
+        self.model = model
+        self.scale = int(round(model.upsample_scale))
+        self.overlap = overlap
+        if not 0 <= overlap < min(model.net_h, model.net_w) // 2:
+            raise ValueError("tile overlap must be in [0, {})".format(min(model.net_h, model.net_w) // 2))
+        self.memmap_bytes = memmap_mb * 1024 * 1024
+        self.memmap_dir = memmap_dir
+        self.input_data = np.zeros((model.batch_size, 3, model.net_h, model.net_w), dtype=np.float32)
+
+    def allocate(self, height, width):
+        shape = (height, width, 3)
+        if height * width * 3 <= self.memmap_bytes:
+            return np.empty(shape, dtype=np.uint8)
+        # the file is unlinked at once, the mapping lives as long as the array
+        with tempfile.NamedTemporaryFile(dir=self.memmap_dir, suffix='.u8') as f:
+            return np.memmap(f, dtype=np.uint8, mode='w+', shape=shape)
+
+    def tile_outputs(self, img, ys, xs):
+        # (row, column, [h * scale, w * scale, 3] float32 BGR) in row-major order, batch_size tiles per inference
+        model = self.model
+        tiles = [(r, c) for r in range(len(ys)) for c in range(len(xs))]
+        for begin in range(0, len(tiles), model.batch_size):
+            batch = tiles[begin:begin + model.batch_size]
+            start_time = time.time()
+            for i, (r, c) in enumerate(batch):
+                tile = img[ys[r]:ys[r] + model.net_h, xs[c]:xs[c] + model.net_w]
+                # HWC to CHW, BGR to RGB
+                np.multiply(tile.transpose((2, 0, 1))[::-1], 1.0 / 255.0, out=self.input_data[i])
+            model.preprocess_time += time.time() - start_time
+
+            start_time = time.time()
+            outputs_arr = model.net.process(model.graph_name, {model.input_name: self.input_data})[model.output_name]
+            model.inference_time += time.time() - start_time
+
+            for i, (r, c) in enumerate(batch):
+                # CHW to HWC, RGB to BGR
+                yield r, c, outputs_arr[i][::-1].transpose(1, 2, 0).astype(np.float32)
+
+    def __call__(self, img):
+        """
+        Args:
+            img: numpy.ndarray -- (h,w,3) BGR uint8
+        Returns:
+            (h*scale, w*scale, 3) BGR uint8, np.ndarray or np.memmap
+        """
+        model = self.model
+        scale = self.scale
+        height, width = img.shape[:2]
+        # images smaller than a tile are padded to the tile size and the output is cropped
+        pad_h, pad_w = max(model.net_h - height, 0), max(model.net_w - width, 0)
+        if pad_h or pad_w:
+            img = cv2.copyMakeBorder(img, 0, pad_h, 0, pad_w, cv2.BORDER_REPLICATE)
+        ys = tile_starts(img.shape[0], model.net_h, self.overlap)
+        xs = tile_starts(img.shape[1], model.net_w, self.overlap)
+        wys = feather_weights(ys, model.net_h, scale, self.overlap)
+        wxs = feather_weights(xs, model.net_w, scale, self.overlap)
+        tile_h, tile_w = model.net_h * scale, model.net_w * scale
+        out_w = img.shape[1] * scale
+        # output rows/columns of a tile that no later tile row/column covers
+        final_ys = [(b - a) * scale for a, b in zip(ys, ys[1:])] + [tile_h]
+        final_xs = [(b - a) * scale for a, b in zip(xs, xs[1:])] + [tile_w]
+
+        out = self.allocate(img.shape[0] * scale, out_w)
+        # rows of the current tile row still pending for the next one, all columns; the next tile row's
+        # pending rows start where this row's final rows end
+        rows_pending = PendingSum(tile_h - min(final_ys), (out_w, 3))
+        rows_next = PendingSum(tile_h - min(final_ys), (out_w, 3))
+        cols_pending = PendingSum(tile_w - min(final_xs), (tile_h, 3))
+        x_done = 0
+        for r, c, tile in self.tile_outputs(img, ys, xs):
+            start_time = time.time()
+            if c == 0:
+                cols_pending.rows = 0
+                x_done = 0
+            tile *= 255.0 * wys[r][:, None, None] * wxs[c][None, :, None]
+            # complete columns of this tile row, [tile_h, cols, 3]
+            cols = cols_pending.add(tile.transpose(1, 0, 2), final_xs[c]).transpose(1, 0, 2)
+            x_end = x_done + cols.shape[1]
+            # add the pending rows of the previous tile row for these columns
+            block = np.ascontiguousarray(cols)
+            block[:rows_pending.rows] += rows_pending.buffer[:rows_pending.rows, x_done:x_end]
+            final_rows = final_ys[r]
+            y0 = ys[r] * scale
+            np.clip(block[:final_rows] + 0.5, 0, 255, out=block[:final_rows])
+            out[y0:y0 + final_rows, x_done:x_end] = block[:final_rows]
+            rest = block[final_rows:]
+            rows_next.buffer[:len(rest), x_done:x_end] = rest
+            rows_next.rows = len(rest)
+            x_done = x_end
+            if c == len(xs) - 1:
+                rows_pending, rows_next = rows_next, rows_pending
+            model.postprocess_time += time.time() - start_time
+        if isinstance(out, np.memmap):
+            out.flush()
+        return out[:height * scale, :width * scale]
+
         
 def main(args):
     # check params
@@ -172,13 +330,14 @@ def main(args):
     output_dir = "./results"
     if not os.path.exists(output_dir):
         os.mkdir(output_dir)
-    output_img_dir = os.path.join(output_dir, 'images_opencv')
+    output_img_dir = os.path.join(output_dir, 'images_opencv_tiled' if args.tile else 'images_opencv')
     if not os.path.exists(output_img_dir):
         os.mkdir(output_img_dir)
 
     # initialize net
     real_esrgan = Real_ESRGAN(args)
     batch_size = real_esrgan.batch_size
+    tiler = TiledUpscaler(real_esrgan, args.tile_overlap, args.memmap_mb, output_dir) if args.tile else None
     
     handle = sail.Handle(args.dev_id)
     bmcv = sail.Bmcv(handle)
@@ -204,6 +363,10 @@ def main(args):
                     continue
                 decode_time += time.time() - start_time
                 logging.info("{}, img_file: {}, shape: [{},{}]".format(cn, img_file, cvimg.shape[0], cvimg.shape[1]))
+                if tiler is not None:
+                    # the tiles of one image fill the bmodel batch
+                    cv2.imwrite(os.path.join(output_img_dir, filename), tiler(cvimg))
+                    continue
                 cvimg_list.append(cvimg)
                 filename_list.append(filename)
                 if (len(cvimg_list) == batch_size or cn == len(filenames)) and len(cvimg_list):
@@ -233,6 +396,9 @@ def argsparser():
     parser.add_argument('--input', type=str, default='../datasets/coco128', help='path of input')
     parser.add_argument('--bmodel', type=str, default='../models/BM1684X/real_esrgan_int8_1b.bmodel', help='path of bmodel')
     parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--tile', action='store_true', help='upscale images of any size tile by tile at full resolution instead of letterboxing them to the bmodel input')
+    parser.add_argument('--tile_overlap', type=int, default=16, help='overlap of neighbouring tiles in input pixels, blended with feathered weights')
+    parser.add_argument('--memmap_mb', type=int, default=1024, help='tiled outputs larger than this many MB are written to a memory-mapped file under results/')
     args = parser.parse_args()
     return args
 
@@ -291,6 +291,20 @@ class seamless_stream_s2tt:
         self.cur_target_indices = []
         self.cur_input = []
 
+    def get_state(self):
+        # streaming buffers of the current stream, lets one instance serve several streams in turn
+        return {'previous_residual_samples': self.previous_residual_samples,
+                'cur_target_indices': self.cur_target_indices,
+                'cur_input': self.cur_input}
+
+    def set_state(self, state):
+        if not state:
+            self.reset()
+            return
+        self.previous_residual_samples = state['previous_residual_samples']
+        self.cur_target_indices = state['cur_target_indices']
+        self.cur_input = state['cur_input']
+
     def preprocess(self, ori_audio):
         preprocessed_audio = {}
         if self.use_slience_remover:
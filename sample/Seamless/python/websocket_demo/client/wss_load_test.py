@@ -0,0 +1,150 @@
+# -*- encoding: utf-8 -*-
+import ssl
+import json
+import time
+import wave
+import asyncio
+import argparse
+import websockets
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--host",
+                    type=str,
+                    default="localhost",
+                    help="server ip")
+parser.add_argument("--port",
+                    type=int,
+                    default=10095,
+                    help="server port")
+parser.add_argument("--audio_in",
+                    type=str,
+                    default="../../datasets/test/demo.wav",
+                    help="16k 16bit mono wav file sent by every stream")
+parser.add_argument("--mode",
+                    type=str,
+                    default="online",
+                    help="online or offline, must match the model loaded by the server")
+parser.add_argument("--chunk_duration_ms",
+                    type=int,
+                    default=1000,
+                    help="sent chunk duration (ms)")
+parser.add_argument("--concurrency",
+                    nargs='+',
+                    type=int,
+                    default=[1, 10, 50],
+                    help="numbers of concurrent streams to test, one round per number")
+parser.add_argument("--no_realtime",
+                    action='store_true',
+                    default=False,
+                    help="send the chunks as fast as possible instead of at real time speed")
+parser.add_argument("--ssl",
+                    type=int,
+                    default=0,
+                    help="1 for ssl connect, 0 for no ssl")
+args = parser.parse_args()
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100.
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def load_audio(path):
+    with wave.open(path, "rb") as wav_file:
+        assert wav_file.getsampwidth() == 2 and wav_file.getnchannels() == 1, "only support 16bit mono wav"
+        return wav_file.getframerate(), wav_file.readframes(wav_file.getnframes())
+
+
+async def run_stream(stream_id, uri, ssl_context, sample_rate, audio_bytes):
+    """
+    Send one wav with the wss_client.py protocol and measure, for every result, the time
+    between sending the chunk with `last_segment_id` and receiving its text.
+    """
+    stride = int(sample_rate * (args.chunk_duration_ms / 1000.0) * 2)
+    chunk_num = (len(audio_bytes) - 1) // stride + 1
+    send_time = {}
+    latencies = []
+    final_latency = float('nan')
+    async with websockets.connect(uri, subprotocols=["binary"], ping_interval=None, ssl=ssl_context, max_queue=None) as websocket:
+        async def send():
+            await websocket.send(json.dumps({"mode": args.mode,
+                                             "chunk_size": stride,
+                                             "chunk_interval": 1,
+                                             "audio_fs": sample_rate,
+                                             "wav_name": "stream_{}".format(stream_id),
+                                             "wav_format": "pcm",
+                                             "is_speaking": True,
+                                             "chunk_duration_ms": args.chunk_duration_ms}))
+            for i in range(chunk_num):
+                message = audio_bytes[i * stride:(i + 1) * stride] + i.to_bytes(2, byteorder='little', signed=False)
+                send_time[i] = time.time()
+                await websocket.send(message)
+                if not args.no_realtime:
+                    await asyncio.sleep(args.chunk_duration_ms / 1000.)
+            send_time["end"] = time.time()
+            await websocket.send(json.dumps({"is_speaking": False}))
+
+        async def receive():
+            nonlocal final_latency
+            while True:
+                meg = json.loads(await websocket.recv())
+                now = time.time()
+                if meg.get("is_final", False):
+                    final_latency = now - send_time.get("end", now)
+                    return
+                segment_id = meg.get("last_segment_id")
+                if segment_id in send_time:
+                    latencies.append(now - send_time[segment_id])
+
+        await asyncio.gather(send(), receive())
+    return latencies, final_latency
+
+
+async def run_round(concurrency, sample_rate, audio_bytes):
+    if args.ssl == 1:
+        ssl_context = ssl.SSLContext()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        uri = "wss://{}:{}".format(args.host, args.port)
+    else:
+        ssl_context = None
+        uri = "ws://{}:{}".format(args.host, args.port)
+    start_time = time.time()
+    results = await asyncio.gather(*[run_stream(i, uri, ssl_context, sample_rate, audio_bytes) for i in range(concurrency)],
+                                   return_exceptions=True)
+    total_time = time.time() - start_time
+
+    all_latencies = []
+    final_latencies = []
+    failed = 0
+    print("concurrency: {}".format(concurrency))
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            failed += 1
+            print("  stream {}: failed, {}".format(i, result))
+            continue
+        latencies, final_latency = result
+        all_latencies += latencies
+        final_latencies.append(final_latency)
+        print("  stream {}: results {}, p50 {:.1f} ms, p99 {:.1f} ms, end of stream {:.1f} ms".format(
+            i, len(latencies), percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, final_latency * 1000))
+    print("  all streams: p50 {:.1f} ms, p99 {:.1f} ms, end of stream p50 {:.1f} ms, p99 {:.1f} ms, failed {}, total time {:.2f} s".format(
+        percentile(all_latencies, 50) * 1000, percentile(all_latencies, 99) * 1000,
+        percentile(final_latencies, 50) * 1000, percentile(final_latencies, 99) * 1000, failed, total_time))
+
+
+def main():
+    sample_rate, audio_bytes = load_audio(args.audio_in)
+    loop = asyncio.get_event_loop()
+    for concurrency in args.concurrency:
+        loop.run_until_complete(run_round(concurrency, sample_rate, audio_bytes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceExecutor:
+	"""
+	Runs the calls of one model off the websocket event loop.
+
+	Every model gets a single worker thread, so its bmodel/torch state is only ever
+	touched by one thread, while the event loop keeps receiving audio of the other
+	connections. Requests that arrive within `max_wait_ms` of each other are collected
+	into one batch of at most `max_batch_size` items: if `batch_fn` is given the batch is
+	passed to it in one call, otherwise the items are run back to back with `fn` in a
+	single worker job (the Seamless bmodels are compiled with batch size 1).
+	"""
+	def __init__(self, name, fn, batch_fn=None, max_batch_size=8, max_wait_ms=5):
+		self.name = name
+		self.fn = fn
+		self.batch_fn = batch_fn
+		self.max_batch_size = max(1, max_batch_size)
+		self.max_wait = max_wait_ms / 1000.
+		self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+		self.queue = None
+		self.worker = None
+		self.batch_num = 0
+		self.request_num = 0
+
+	async def submit(self, request):
+		if self.worker is None:
+			self.queue = asyncio.Queue()
+			self.worker = asyncio.ensure_future(self._collect())
+		future = asyncio.get_event_loop().create_future()
+		await self.queue.put((request, future))
+		return await future
+
+	async def _collect(self):
+		loop = asyncio.get_event_loop()
+		while True:
+			batch = [await self.queue.get()]
+			deadline = loop.time() + self.max_wait
+			while len(batch) < self.max_batch_size:
+				timeout = deadline - loop.time()
+				if timeout <= 0:
+					break
+				try:
+					batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+				except asyncio.TimeoutError:
+					break
+			requests = [request for request, _ in batch]
+			results = await loop.run_in_executor(self.pool, self._run, requests)
+			for (_, future), (ok, result) in zip(batch, results):
+				if future.done():
+					continue
+				if ok:
+					future.set_result(result)
+				else:
+					future.set_exception(result)
+
+	def _run(self, requests):
+		start_time = time.time()
+		self.batch_num += 1
+		self.request_num += len(requests)
+		if self.batch_fn is not None and len(requests) > 1:
+			try:
+				results = [(True, result) for result in self.batch_fn(requests)]
+			except Exception as e:
+				results = [(False, e)] * len(requests)
+		else:
+			results = []
+			for request in requests:
+				try:
+					results.append((True, self.fn(request)))
+				except Exception as e:
+					results.append((False, e))
+		logging.info("{} batch size: {}, cost time(ms): {}".format(self.name, len(requests), (time.time() - start_time) * 1000.))
+		return results
+
+	def stats(self):
+		avg = self.request_num / self.batch_num if self.batch_num else 0.
+		return "{}: {} requests in {} batches, avg batch size {:.2f}".format(self.name, self.request_num, self.batch_num, avg)
@@ -4,6 +4,7 @@ import websockets
 import argparse
 import ssl
 import logging
+from inference_executor import InferenceExecutor
 
 
 parser = argparse.ArgumentParser()
@@ -142,6 +143,14 @@ parser.add_argument("--keyfile",
                     default="",
                     required=False,
                     help="keyfile for ssl. option: server.key")
+parser.add_argument("--max_batch_size",
+                    type=int,
+                    default=8,
+                    help="max number of requests from concurrent connections collected into one inference batch")
+parser.add_argument("--batch_wait_ms",
+                    type=float,
+                    default=5,
+                    help="how long the inference executor waits for other connections before running a batch")
 args = parser.parse_args()
 
 
@@ -211,13 +220,44 @@ else:
 	sv_pipeline = None
 
 
-print("model loaded! only support one client at the same time now!!!!")
+
+def asr_online_infer(request):
+	audio_in, status, stream_state = request
+	# the streaming model is shared, swap in the buffers of the calling connection
+	model_asr_streaming.model.set_state(stream_state.get("state"))
+	rec_result = model_asr_streaming.generate(input=audio_in, **status)[0]
+	stream_state["state"] = model_asr_streaming.model.get_state()
+	return rec_result
+
+
+def asr_infer(request):
+	audio_in, status = request
+	return model_asr.generate(input=audio_in, **status)[0]
+
+
+def punc_infer(request):
+	text, status = request
+	return model_punc.generate(input=text, **status)[0]
+
+
+def sv_infer(audio_in):
+	return sv_pipeline.infer_sv(audio_in)[1]
+
+
+executor_kwargs = {"max_batch_size": args.max_batch_size, "max_wait_ms": args.batch_wait_ms}
+asr_online_executor = InferenceExecutor("asr_online", asr_online_infer, **executor_kwargs) if model_asr_streaming is not None else None
+asr_executor = InferenceExecutor("asr_offline", asr_infer, **executor_kwargs) if model_asr is not None else None
+punc_executor = InferenceExecutor("punc", punc_infer, **executor_kwargs) if model_punc is not None else None
+sv_executor = InferenceExecutor("sv", sv_infer, **executor_kwargs) if sv_pipeline is not None else None
+
+print("model loaded! model calls run in background executors, concurrent clients are supported")
 
 async def ws_reset(websocket):
 	print("ws reset now, total num is ",len(websocket_users))
 
 	websocket.status_dict_asr_online["cache"] = {}
 	websocket.status_dict_asr_online["is_final"] = True
+	websocket.stream_state = {}
 	websocket.status_dict_vad["cache"] = {}
 	websocket.status_dict_vad["is_final"] = True
 	websocket.status_dict_punc["cache"] = {}
@@ -242,6 +282,7 @@ async def ws_serve(websocket, path):
 	websocket_users.add(websocket)
 	websocket.status_dict_asr = {}
 	websocket.status_dict_asr_online = {"cache": {}, "is_final": False}
+	websocket.stream_state = {}
 	websocket.status_dict_vad = {'cache': {}, "is_final": False}
 	websocket.status_dict_punc = {'cache': {}}
 	websocket.chunk_interval = 10
@@ -341,7 +382,7 @@ async def ws_serve(websocket, path):
 						audio_in = frames_asr_bytes
 						# speaker
 						if sv_pipeline is not None:
-							_, sp_id = sv_pipeline.infer_sv(audio_in)
+							sp_id = await sv_executor.submit(audio_in)
 						else:
 							sp_id = None
 						try:
@@ -353,6 +394,7 @@ async def ws_serve(websocket, path):
 					speech_start = False
 					frames_asr_online = []
 					websocket.status_dict_asr_online["cache"] = {}
+					websocket.stream_state = {}
 					if not websocket.is_speaking:
 						websocket.vad_pre_idx = 0
 						frames = []
@@ -405,11 +447,11 @@ async def async_asr(websocket, audio_in, last_segment_id, sp_id):
 		h, m = divmod(m, 60)
 		ess = "%d:%02d:%02d" % (h, m, s)
 		logging.info('audio segment in ' + ess)
-		rec_result = model_asr.generate(input=audio_in, **websocket.status_dict_asr)[0]
+		rec_result = await asr_executor.submit((audio_in, websocket.status_dict_asr))
 		# print("offline_asr, ", rec_result)
 		if model_punc is not None and len(rec_result["text"])>0:
 			# print("offline, before punc", rec_result, "cache", websocket.status_dict_punc)
-			rec_result = model_punc.generate(input=rec_result['text'], **websocket.status_dict_punc)[0]
+			rec_result = await punc_executor.submit((rec_result['text'], websocket.status_dict_punc))
 			# print("offline, after punc", rec_result)
 		if len(rec_result["text"])>0:
 			# print("offline", rec_result)
@@ -434,7 +476,7 @@ async def async_asr_online(websocket, audio_in, last_segment_id):
 		h, m = divmod(m, 60)
 		ess = "%d:%02d:%02d" % (h, m, s)
 		logging.info('audio segment in ' + ess)
-		rec_result = model_asr_streaming.generate(input=audio_in, **websocket.status_dict_asr_online)[0]
+		rec_result = await asr_online_executor.submit((audio_in, websocket.status_dict_asr_online, websocket.stream_state))
 		# print("online, ", rec_result)
 		if len(rec_result["text"]):
 			mode = websocket.mode
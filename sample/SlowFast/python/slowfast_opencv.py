@@ -85,13 +85,16 @@ class SlowFast:
         self.decode_time += time.time() - start_decode
         return input_frame_array_batch
     
+    def preprocess_frame(self, frame):
+        # color conversion, normalization and center crop of one frame, [size, size, 3]
+        frame2 = cv2.cvtColor(frame,cv2.COLOR_RGB2BGR)
+        frame3 = (frame2/255.0 - 0.45)/0.225
+        return self.center_crop(frame3)
+
     def preprocess(self, input_frame_array):
         input_numpy_array = []
-        for counter, frame in enumerate(input_frame_array):
-            frame2 = cv2.cvtColor(frame,cv2.COLOR_RGB2BGR)
-            frame3 = (frame2/255.0 - 0.45)/0.225
-            frame4 = self.center_crop(frame3)
-            input_numpy_array.append(frame4)
+        for frame in input_frame_array:
+            input_numpy_array.append(self.preprocess_frame(frame))
         while len(input_numpy_array) < self.input_shape_fast[2]:
             input_numpy_array.append(input_numpy_array[-1])
         if self.input_dtype == sail.BM_FLOAT32:
@@ -101,6 +104,15 @@ class SlowFast:
         input_numpy_array = np.transpose(input_numpy_array, (3, 0, 1, 2))
         return input_numpy_array
           
+    def inference(self, preprocessed_video_data):
+        start_inference = time.time()
+        input_tensor_fast = sail.Tensor(self.handle, preprocessed_video_data)
+        input_tensor_slow = sail.Tensor(self.handle, preprocessed_video_data[:, :, ::4, :, :])
+        input_tensors = {self.input_fast: input_tensor_fast, self.input_slow: input_tensor_slow}
+        self.net.process(self.graph_name, input_tensors, self.output_tensors)
+        self.inference_time += time.time() - start_inference
+        return self.output_tensors[self.output_name].asnumpy()
+
     def __call__(self, input_frame_array_batch):
         vid_num = len(input_frame_array_batch)
         start_preprocess = time.time()
@@ -115,13 +127,7 @@ class SlowFast:
             preprocessed_video_data = np.zeros(self.input_shape_fast)
             preprocessed_video_data[:vid_num] = np.stack(preprocessed_video_data_raw)
         self.preprocess_time += time.time() - start_preprocess
-        start_inference = time.time()
-        input_tensor_fast = sail.Tensor(self.handle, preprocessed_video_data)
-        input_tensor_slow = sail.Tensor(self.handle, preprocessed_video_data[:, :, ::4, :, :])
-        input_tensors = {self.input_fast: input_tensor_fast, self.input_slow: input_tensor_slow}
-        self.net.process(self.graph_name, input_tensors, self.output_tensors)
-        self.inference_time += time.time() - start_inference        
-        output_tensor = self.output_tensors[self.output_name].asnumpy()
+        output_tensor = self.inference(preprocessed_video_data)
         
         start_postprocess = time.time()
         result_list = []
@@ -0,0 +1,28 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import os
+import sys
+from slowfast_opencv import SlowFast
+# the reader thread, frame ring and sliding-window loop are those of C3D/python/c3d_stream.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../C3D/python"))
+from c3d_stream import argsparser, check_args, run_stream
+
+def main(args):
+    class_names = check_args(args)
+    slowfast = SlowFast(args)
+    # the ring keeps the fast pathway frames, SlowFast.inference takes every 4th frame of a
+    # window for the slow pathway
+    run_stream(slowfast, args, class_names, (slowfast.size, slowfast.size, slowfast.input_shape_fast[1]),
+               slowfast.input_shape_fast)
+
+if __name__ == "__main__":
+    args = argsparser(bmodel='../models/BM1684X/slowfast_bm1684x_fp32_1b.bmodel',
+                      classnames='../datasets/kinetics_classnames.txt')
+    main(args)
+    print('all done.')
@@ -0,0 +1,324 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2024 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import argparse
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+
+
+class DenoiseRequest(object):
+    """
+    One txt2img request. Every request has its own scheduler instance, since the schedulers
+    keep per-sample state (step index, PNDM history) between steps.
+    """
+    def __init__(self, prompt, negative_prompt, height, width, num_inference_steps, guidance_scale, seed, scheduler):
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.height = height
+        self.width = width
+        self.num_inference_steps = num_inference_steps
+        self.guidance_scale = guidance_scale
+        self.seed = seed
+        self.scheduler = scheduler
+        self.do_classifier_free_guidance = guidance_scale > 1.0
+        # unet rows of one step: uncond and text with classifier free guidance
+        self.rows = 2 if self.do_classifier_free_guidance else 1
+
+        # filled in when the request joins the denoising loop
+        self.latents = None
+        self.prompt_embeds = None
+        self.timesteps = None
+        self.step_index = 0
+
+        self.image = None
+        self.error = None
+        self.done = threading.Event()
+        self.submit_time = time.time()
+        self.finish_time = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.image
+
+
+class DenoiseQueue(threading.Thread):
+    """
+    Runs the denoising loops of concurrent requests in shared unet calls.
+
+    Between two denoising steps the worker admits queued requests, in arrival order, while
+    their unet rows fit in max_rows (the batch of the unet bmodel by default); a request
+    larger than that runs alone. Then every active request does one step: the rows of the
+    requests at the same resolution and timestep (at any timestep if the bmodel takes one
+    timestep per row) are stacked into one unet batch, each with its own latents and prompt
+    embeddings, and padded to the static batch of the bmodel. Guidance and the scheduler
+    step are applied per request. Finished requests are decoded by the vae and leave,
+    which frees their rows for the requests still queued.
+    """
+    def __init__(self, pipeline, max_rows=0):
+        super().__init__(daemon=True)
+        self.pipeline = pipeline
+        # unet inputs in the order the pipeline passes them: latent, t, prompt_embeds
+        latent_shape, t_shape = pipeline.unet.input_shape[:2]
+        self.unet_batch = latent_shape[0]
+        self.row_timesteps = self.unet_batch > 1 and t_shape[0] == self.unet_batch
+        self.max_rows = max_rows if max_rows > 0 else self.unet_batch
+        self.pending = queue.Queue()
+        self.waiting = []
+        self.active = []
+        self.stopped = False
+
+        self.images = 0
+        self.unet_calls = 0
+        self.unet_rows = 0
+        self.unet_time = 0.0
+
+    def submit(self, request):
+        self.pending.put(request)
+        return request
+
+    def generate(self, prompt, negative_prompt, height, width, num_inference_steps, guidance_scale, seed, scheduler):
+        return self.submit(DenoiseRequest(prompt, negative_prompt, height, width, num_inference_steps,
+                                          guidance_scale, seed, scheduler)).wait()
+
+    def idle(self):
+        return not self.active and not self.waiting and self.pending.empty()
+
+    def stop(self):
+        self.stopped = True
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self.stopped:
+            self.admit()
+            if not self.active:
+                continue
+            try:
+                self.step()
+            except Exception as e:
+                logging.exception("denoising step failed")
+                for request in self.active:
+                    self.finish(request, e)
+                self.active = []
+        # requests left when the queue is stopped
+        while not self.pending.empty():
+            self.waiting.append(self.pending.get())
+        for request in self.active + self.waiting:
+            self.finish(request, RuntimeError("denoise queue stopped"))
+        self.active = []
+        self.waiting = []
+
+    def admit(self):
+        # blocks only while there is nothing to run, so running requests are never delayed
+        while True:
+            try:
+                block = not self.active and not self.waiting
+                self.waiting.append(self.pending.get(block=block, timeout=0.1 if block else None))
+            except queue.Empty:
+                break
+        rows = sum(request.rows for request in self.active)
+        while self.waiting and (not self.active or rows + self.waiting[0].rows <= self.max_rows):
+            request = self.waiting.pop(0)
+            try:
+                self.prepare(request)
+            except Exception as e:
+                self.finish(request, e)
+                continue
+            self.active.append(request)
+            rows += request.rows
+
+    def prepare(self, request):
+        pipeline = self.pipeline
+        request.prompt_embeds = pipeline._encode_prompt(
+            request.prompt, 1, request.do_classifier_free_guidance, request.negative_prompt)
+        scheduler = request.scheduler
+        scheduler.set_timesteps(request.num_inference_steps)
+        request.timesteps = scheduler.timesteps
+        shape = [1, pipeline.unet_config_in_channels, request.height // pipeline.vae_scale_factor,
+                 request.width // pipeline.vae_scale_factor]
+        # seeded per request, so an image does not depend on the requests it was batched with
+        generator = np.random.default_rng(int(request.seed))
+        latents = generator.standard_normal(shape, dtype=np.float32)
+        request.latents = latents * np.float32(scheduler.init_noise_sigma)
+
+    def step(self):
+        groups = {}
+        for request in self.active:
+            key = (request.height, request.width)
+            if not self.row_timesteps:
+                key += (float(request.timesteps[request.step_index]),)
+            groups.setdefault(key, []).append(request)
+        for requests in groups.values():
+            self.denoise(requests)
+        finished = [request for request in self.active if request.step_index == len(request.timesteps)]
+        self.active = [request for request in self.active if request.step_index < len(request.timesteps)]
+        for request in finished:
+            self.finish(request)
+
+    def denoise(self, requests):
+        latent_rows = []
+        t_rows = []
+        embeds_rows = []
+        for request in requests:
+            t = request.timesteps[request.step_index]
+            latents = np.concatenate([request.latents] * 2) if request.do_classifier_free_guidance else request.latents
+            latent_rows.append(request.scheduler.scale_model_input(latents, t))
+            t_rows += [t] * request.rows
+            embeds_rows.append(request.prompt_embeds)
+        latent_rows = np.concatenate(latent_rows)
+        embeds_rows = np.concatenate(embeds_rows)
+        noise_pred = np.concatenate([
+            self.unet(latent_rows[i:i + self.unet_batch], t_rows[i:i + self.unet_batch], embeds_rows[i:i + self.unet_batch])
+            for i in range(0, len(latent_rows), self.unet_batch)])
+
+        offset = 0
+        for request in requests:
+            t = request.timesteps[request.step_index]
+            pred = noise_pred[offset:offset + request.rows]
+            offset += request.rows
+            if request.do_classifier_free_guidance:
+                pred = pred[:1] + request.guidance_scale * (pred[1:] - pred[:1])
+            request.scheduler.step(pred, t, request.latents, out=request.latents)
+            request.step_index += 1
+
+    def unet(self, latents, timesteps, prompt_embeds):
+        # one call of the static batch unet, unused rows are zero
+        rows = len(latents)
+        if rows < self.unet_batch:
+            pad = [(0, self.unet_batch - rows)] + [(0, 0)] * (latents.ndim - 1)
+            latents = np.pad(latents, pad)
+            prompt_embeds = np.pad(prompt_embeds, [(0, self.unet_batch - rows)] + [(0, 0)] * (prompt_embeds.ndim - 1))
+            timesteps = timesteps + [timesteps[-1]] * (self.unet_batch - rows)
+        newt = np.array(timesteps) if self.row_timesteps else np.array(timesteps[:1])
+        start_time = time.time()
+        noise_pred = self.pipeline.unet({'latent.1': latents,
+                                         't.1': newt,
+                                         'prompt_embeds.1': prompt_embeds})[0]
+        self.unet_time += time.time() - start_time
+        self.unet_calls += 1
+        self.unet_rows += rows
+        return noise_pred[:rows]
+
+    def finish(self, request, error=None):
+        if error is None:
+            try:
+                request.image = self.pipeline.decode_latents(request.latents)
+                self.images += 1
+            except Exception as e:
+                error = e
+        request.error = error
+        request.finish_time = time.time()
+        request.done.set()
+
+
+def make_scheduler(sd_turbo):
+    from np_schedulers import PNDMScheduler, EulerDiscreteScheduler
+    if sd_turbo:
+        return EulerDiscreteScheduler(#sd-turbo
+            beta_end=0.012,
+            beta_start=0.00085,
+            num_train_timesteps=1000,
+            beta_schedule="scaled_linear",
+            final_sigmas_type="zero",
+            interpolation_type="linear",
+            prediction_type="epsilon",
+            rescale_betas_zero_snr=False,
+            steps_offset=1,
+            timestep_spacing="trailing",
+            timestep_type="discrete"
+        )
+    return PNDMScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        beta_schedule="scaled_linear",
+        skip_prk_steps = True,
+    )
+
+
+def benchmark(pipeline, args, users):
+    # closed loop: every user sends its next request when the previous one is done
+    denoiser = DenoiseQueue(pipeline, args.max_rows)
+    denoiser.start()
+    height, width = args.img_size
+    latencies = []
+
+    def user(index):
+        for k in range(args.requests_per_user):
+            request = denoiser.submit(DenoiseRequest(args.prompt, args.neg_prompt, height, width, args.num_inference_steps,
+                                                     args.guidance_scale, args.seed + index * args.requests_per_user + k,
+                                                     make_scheduler(args.sd_turbo)))
+            request.wait()
+            latencies.append(request.finish_time - request.submit_time)
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.time() - start_time
+    denoiser.stop()
+    logging.info("users: {}, images: {}, images/minute: {:.2f}, latency(s): {:.2f}, unet calls: {}, rows per call: {:.2f}, unet_time(s): {:.2f}".format(
+        users, denoiser.images, denoiser.images * 60 / total_time, np.mean(latencies), denoiser.unet_calls,
+        denoiser.unet_rows / max(denoiser.unet_calls, 1), denoiser.unet_time))
+
+
+def main(args):
+    from web_stable_diffusion import StableDiffusionPipeline
+    pipeline = StableDiffusionPipeline(
+        scheduler = make_scheduler(args.sd_turbo),
+        model_path = args.model_path,
+        vae_decoder_path = args.vae_decoder_model_path,
+        vae_encoder_path = args.vae_encoder_model_path,
+        unet_path = args.unet_model_path,
+        text_encoder_path = args.text_encoder_model_path,
+        stage = args.stage,
+        dev_id = args.dev_id,
+        tokenizer = args.tokenizer
+    )
+    logging.info("unet batch: {}, timestep per row: {}".format(
+        pipeline.unet.input_shape[0][0], pipeline.unet.input_shape[1][0] == pipeline.unet.input_shape[0][0]))
+    for users in args.users:
+        benchmark(pipeline, args, users)
+
+
+def argsparser():
+    parser = argparse.ArgumentParser(prog=__file__)
+    parser.add_argument('--model_path', type=str, default='../models/BM1688/', help='path of the model dir')
+    parser.add_argument('--stage', type=str, default='singlize', help='singlize or multilize')
+    parser.add_argument('--tokenizer', type=str, default='../models/tokenizer_path', help='path of the tokenizer')
+    parser.add_argument('--vae_decoder_model_path', type=str, default='../models/BM1688/singlize/vae_decoder_1688_f16.bmodel', help='path of the vae decoder bmodel')
+    parser.add_argument('--vae_encoder_model_path', type=str, default='../models/BM1688/singlize/vae_encoder_1688_f16.bmodel', help='path of the vae encoder bmodel')
+    parser.add_argument('--unet_model_path', type=str, default='../models/BM1688/singlize/unet_1688_core_1_f16.bmodel', help='path of the unet bmodel')
+    parser.add_argument('--text_encoder_model_path', type=str, default='../models/BM1688/singlize/text_encoder_1688_bf16.bmodel', help='path of the text encoder bmodel')
+    parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--img_size', type=lambda s: tuple(map(int, s.split(','))), default=(512, 512), help='height,width of the images')
+    parser.add_argument('--prompt', type=str, default='a cat', help='prompt of every request')
+    parser.add_argument('--neg_prompt', type=str, default='None', help='negative prompt of every request')
+    parser.add_argument('--num_inference_steps', type=int, default=1, help='denoising steps per request')
+    parser.add_argument('--guidance_scale', type=float, default=0.0, help='guidance scale, classifier free guidance above 1')
+    parser.add_argument('--sd_turbo', type=int, default=1, help='1 for the sd-turbo euler scheduler, 0 for pndm')
+    parser.add_argument('--seed', type=int, default=2048, help='seed of the first request, the others count up')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 4, 8], help='concurrent users to measure')
+    parser.add_argument('--requests_per_user', type=int, default=4, help='requests sent by every user')
+    parser.add_argument('--max_rows', type=int, default=0, help='unet rows of the active requests, 0 means the batch of the unet bmodel')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = argsparser()
+    main(args)
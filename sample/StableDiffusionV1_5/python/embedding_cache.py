@@ -0,0 +1,170 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2024 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+"""
+Cache of text encoder outputs, so a prompt that was already encoded, such as the fixed negative
+prompt or the same prompt with another seed, does not run the text encoder again. Also used by
+the SDXL and FLUX.1 samples, which add this directory to sys.path.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+
+def encoder_identity(model_path, *extra):
+    """Identity of an encoder bmodel: path, size and mtime, so a replaced bmodel does not reuse old entries."""
+    try:
+        stat = os.stat(model_path)
+        fields = [os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        fields = [model_path]
+    return ":".join(str(field) for field in fields + list(extra))
+
+
+class EmbeddingCache(object):
+    """
+    LRU cache of the output arrays of text encoders (embeddings and pooled embeddings), keyed by
+    the encoder identity and the token ids given to the encoder.
+
+    At most max_mb of arrays are kept in memory, max_mb=0 disables the cache. With cache_dir,
+    every entry is also saved there as <key>.npz and read back on a miss in memory, so the cache
+    survives restarts; the least recently used files beyond max_disk_mb are removed.
+    One cache can be shared by the threads of a server.
+    """
+    def __init__(self, max_mb=64, cache_dir=None, max_disk_mb=1024):
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.cache_dir = cache_dir if self.max_bytes > 0 else None
+        self.max_disk_bytes = int(max_disk_mb * 2 ** 20)
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return "EmbeddingCache(entries={}, {:.1f}MB, hits={}, misses={}, cache_dir={})".format(
+            len(self.entries), self.nbytes / 2 ** 20, self.hits, self.misses, self.cache_dir)
+
+    @staticmethod
+    def key(encoder_id, token_ids):
+        token_ids = np.ascontiguousarray(token_ids)
+        digest = hashlib.sha1(encoder_id.encode())
+        digest.update(str((token_ids.dtype.str, token_ids.shape)).encode())
+        digest.update(token_ids.tobytes())
+        return digest.hexdigest()
+
+    def encode(self, encoder_id, token_ids, encoder):
+        """
+        Args:
+            encoder_id: identity of the encoder, see encoder_identity
+            token_ids: array given to the encoder
+            encoder: called with token_ids on a miss, returns the list of output arrays
+        Returns:
+            list of output arrays, copies the caller may modify
+        """
+        if self.max_bytes <= 0:
+            return list(encoder(token_ids))
+        key = self.key(encoder_id, token_ids)
+        outputs = self.get(key)
+        if outputs is None:
+            # copied, engine outputs may be views of buffers the next inference overwrites
+            outputs = [np.array(output) for output in encoder(token_ids)]
+            self.put(key, outputs)
+            self.save(key, outputs)
+        return [output.copy() for output in outputs]
+
+    def get(self, key):
+        with self.lock:
+            outputs = self.entries.get(key)
+            if outputs is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return outputs
+        outputs = self.load(key)
+        with self.lock:
+            if outputs is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.put(key, outputs)
+        return outputs
+
+    def put(self, key, outputs):
+        nbytes = sum(output.nbytes for output in outputs)
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = outputs
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= sum(output.nbytes for output in evicted)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                outputs = [data["arr_{}".format(i)] for i in range(len(data.files))]
+            # the mtime orders the files for pruning
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            logging.warning("ignoring unreadable embedding cache file {}: {}".format(path, e))
+            return None
+        return outputs
+
+    def save(self, key, outputs):
+        if not self.cache_dir:
+            return
+        # written to a temporary file and renamed, so other processes never read a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, *outputs)
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            logging.warning("failed to save embedding cache file {}: {}".format(self.path(key), e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.prune()
+
+    def prune(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,814 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2024 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+"""
+numpy versions of the diffusers schedulers used by the samples: PNDM (PLMS steps), DPM-Solver
+multistep, Euler, Euler ancestral, LCM and flow matching Euler.
+
+They take the constructor arguments of diffusers 0.30 and compute the same timesteps, sigmas and
+updates, without torch. Every update is a linear combination of the sample, the model output and
+the scheduler history with scalar coefficients; `step(..., out=array)` accumulates it into a
+preallocated array, which may be the sample itself, and the history lives in buffers allocated at
+the first step. `step` returns a tuple, as diffusers does with return_dict=False.
+"""
+import math
+import numpy as np
+
+
+class SchedulerConfig(dict):
+    """Constructor arguments with attribute access, like the config of the diffusers schedulers."""
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def betas_for_alpha_bar(num_diffusion_timesteps, max_beta=0.999):
+    def alpha_bar_fn(t):
+        return math.cos((t + 0.008) / 1.008 * math.pi / 2) ** 2
+
+    betas = []
+    for i in range(num_diffusion_timesteps):
+        t1 = i / num_diffusion_timesteps
+        t2 = (i + 1) / num_diffusion_timesteps
+        betas.append(min(1 - alpha_bar_fn(t2) / alpha_bar_fn(t1), max_beta))
+    return np.array(betas, dtype=np.float32)
+
+
+def rescale_zero_terminal_snr(betas):
+    alphas_bar_sqrt = np.sqrt(np.cumprod(1.0 - betas, dtype=np.float64).astype(np.float32))
+    alphas_bar_sqrt_0 = alphas_bar_sqrt[0]
+    alphas_bar_sqrt_T = alphas_bar_sqrt[-1]
+    alphas_bar_sqrt = (alphas_bar_sqrt - alphas_bar_sqrt_T) * (alphas_bar_sqrt_0 / (alphas_bar_sqrt_0 - alphas_bar_sqrt_T))
+    alphas_bar = alphas_bar_sqrt ** 2
+    alphas = np.concatenate([alphas_bar[:1], alphas_bar[1:] / alphas_bar[:-1]])
+    return (1 - alphas).astype(np.float32)
+
+
+def make_betas(config):
+    if config.trained_betas is not None:
+        betas = np.asarray(config.trained_betas, dtype=np.float32)
+    elif config.beta_schedule == "linear":
+        betas = np.linspace(config.beta_start, config.beta_end, config.num_train_timesteps).astype(np.float32)
+    elif config.beta_schedule == "scaled_linear":
+        betas = np.linspace(config.beta_start ** 0.5, config.beta_end ** 0.5, config.num_train_timesteps).astype(np.float32) ** 2
+    elif config.beta_schedule == "squaredcos_cap_v2":
+        betas = betas_for_alpha_bar(config.num_train_timesteps)
+    else:
+        raise NotImplementedError("{} is not implemented".format(config.beta_schedule))
+    if config.get("rescale_betas_zero_snr"):
+        betas = rescale_zero_terminal_snr(betas)
+    return betas
+
+
+def draw_noise(shape, generator=None, noise=None):
+    # explicit noise first, then a numpy Generator, then the global numpy random state
+    if noise is not None:
+        return np.asarray(noise, dtype=np.float32)
+    if generator is not None:
+        return generator.standard_normal(shape, dtype=np.float32)
+    return np.random.standard_normal(shape).astype(np.float32)
+
+
+def check_float_timestep(timestep):
+    if isinstance(timestep, (int, np.integer)):
+        raise ValueError("Passing integer indices (e.g. from `enumerate(timesteps)`) as timesteps to `step()` is not "
+                         "supported, pass one of the `scheduler.timesteps` as a timestep.")
+
+
+class _Scheduler(object):
+    order = 1
+    # constructor arguments and their defaults, as in diffusers
+    defaults = {}
+
+    def __init__(self, **kwargs):
+        # keys starting with "_" (_class_name, _diffusers_version) come with diffusers config files
+        unknown = sorted(key for key in kwargs if key not in self.defaults and not key.startswith("_"))
+        if unknown:
+            raise TypeError("{} got unexpected arguments: {}".format(type(self).__name__, ", ".join(unknown)))
+        config = dict(self.defaults)
+        config.update((key, value) for key, value in kwargs.items() if not key.startswith("_"))
+        self.config = SchedulerConfig(config)
+        self.num_inference_steps = None
+        self.timesteps = None
+        self._step_index = None
+        self._begin_index = None
+        self._buffers = {}
+
+    def __len__(self):
+        return self.config.num_train_timesteps
+
+    @property
+    def step_index(self):
+        return self._step_index
+
+    @property
+    def begin_index(self):
+        return self._begin_index
+
+    def set_begin_index(self, begin_index=0):
+        self._begin_index = begin_index
+
+    def index_for_timestep(self, timestep, schedule_timesteps=None):
+        if schedule_timesteps is None:
+            schedule_timesteps = self.timesteps
+        indices = np.flatnonzero(schedule_timesteps == timestep)
+        # the second match when the first timestep repeats, so img2img starting mid schedule
+        # does not skip a sigma
+        return int(indices[1] if len(indices) > 1 else indices[0])
+
+    def _init_step_index(self, timestep):
+        if self._begin_index is None:
+            self._step_index = self.index_for_timestep(timestep)
+        else:
+            self._step_index = self._begin_index
+
+    def _step_indices(self, timesteps):
+        timesteps = np.atleast_1d(timesteps)
+        if self._begin_index is None:
+            return [self.index_for_timestep(t) for t in timesteps]
+        if self._step_index is not None:
+            return [self._step_index] * len(timesteps)
+        return [self._begin_index] * len(timesteps)
+
+    def scale_model_input(self, sample, *args, **kwargs):
+        return sample
+
+    def _buffer(self, name, shape):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=np.float32)
+        return buffer
+
+    def _combine(self, out, terms):
+        """
+        out = sum of coef * array over the (coef, array) terms, without temporaries; out may be
+        one of the arrays. The arrays broadcast to out, e.g. a [4, h, w] guided noise prediction
+        to [1, 4, h, w] latents.
+        """
+        # the array sharing memory with out is read first, before out is overwritten
+        terms = sorted(terms, key=lambda term: not np.may_share_memory(term[1], out))
+        coef, array = terms[0]
+        np.multiply(array, float(coef), out=out)
+        if len(terms) > 1:
+            work = self._buffer("work", out.shape)
+            for coef, array in terms[1:]:
+                np.multiply(array, float(coef), out=work)
+                out += work
+        return out
+
+    def _output(self, out, model_output, sample):
+        if out is None:
+            out = np.empty(np.broadcast_shapes(np.shape(model_output), np.shape(sample)), dtype=np.float32)
+        return out
+
+
+def _alphas_cumprod(config):
+    # accumulated in float64 like torch.cumprod on cpu
+    alphas_cumprod = np.cumprod(1.0 - make_betas(config), dtype=np.float64).astype(np.float32)
+    if config.get("rescale_betas_zero_snr"):
+        alphas_cumprod[-1] = 2 ** -24
+    return alphas_cumprod
+
+
+def _ddpm_add_noise(alphas_cumprod, original_samples, noise, timesteps):
+    alpha_prod = alphas_cumprod[np.atleast_1d(timesteps)].reshape((-1,) + (1,) * (np.ndim(original_samples) - 1))
+    return np.sqrt(alpha_prod) * original_samples + np.sqrt(1 - alpha_prod) * noise
+
+
+class PNDMScheduler(_Scheduler):
+    """PNDM with skip_prk_steps=True, i.e. the linear multistep (PLMS) steps only, as the samples use it."""
+    defaults = dict(num_train_timesteps=1000, beta_start=0.0001, beta_end=0.02, beta_schedule="linear",
+                    trained_betas=None, skip_prk_steps=False, set_alpha_to_one=False, prediction_type="epsilon",
+                    timestep_spacing="leading", steps_offset=0)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if not self.config.skip_prk_steps:
+            raise NotImplementedError("only the PLMS steps of PNDM are implemented, set skip_prk_steps=True")
+        if self.config.prediction_type not in ("epsilon", "v_prediction"):
+            raise ValueError("prediction_type given as {} must be one of `epsilon` or `v_prediction`".format(
+                self.config.prediction_type))
+        self.alphas_cumprod = _alphas_cumprod(self.config)
+        self.final_alpha_cumprod = 1.0 if self.config.set_alpha_to_one else self.alphas_cumprod[0]
+        self.init_noise_sigma = 1.0
+        self.pndm_order = 4
+        self.counter = 0
+        self.num_ets = 0
+
+    def set_timesteps(self, num_inference_steps, device=None):
+        config = self.config
+        self.num_inference_steps = num_inference_steps
+        if config.timestep_spacing == "linspace":
+            timesteps = np.linspace(0, config.num_train_timesteps - 1, num_inference_steps).round().astype(np.int64)
+        elif config.timestep_spacing == "leading":
+            step_ratio = config.num_train_timesteps // num_inference_steps
+            timesteps = (np.arange(0, num_inference_steps) * step_ratio).round() + config.steps_offset
+        elif config.timestep_spacing == "trailing":
+            step_ratio = config.num_train_timesteps / num_inference_steps
+            timesteps = np.round(np.arange(config.num_train_timesteps, 0, -step_ratio))[::-1].astype(np.int64) - 1
+        else:
+            raise ValueError("{} is not supported".format(config.timestep_spacing))
+        # the second to last timestep twice, for the warm up step of PLMS
+        self.timesteps = np.concatenate([timesteps[:-1], timesteps[-2:-1], timesteps[-1:]])[::-1].astype(np.int64)
+        self.counter = 0
+        self.num_ets = 0
+
+    def step(self, model_output, timestep, sample, out=None):
+        if self.num_inference_steps is None:
+            raise ValueError("Number of inference steps is 'None', you need to run 'set_timesteps' after creating the scheduler")
+        out = self._output(out, model_output, sample)
+        ets = self._buffer("ets", (self.pndm_order,) + out.shape)
+        timestep = int(timestep)
+        prev_timestep = timestep - self.config.num_train_timesteps // self.num_inference_steps
+
+        # the model output of the last four steps, ets[-k] of diffusers is slot (num_ets - k) % 4
+        if self.counter != 1:
+            np.copyto(ets[self.num_ets % self.pndm_order], model_output)
+            self.num_ets += 1
+        else:
+            prev_timestep = timestep
+            timestep = timestep + self.config.num_train_timesteps // self.num_inference_steps
+
+        def last(k):
+            return ets[(self.num_ets - k) % self.pndm_order]
+
+        num_ets = min(self.num_ets, self.pndm_order)
+        if num_ets == 1 and self.counter == 0:
+            weights = [(1.0, model_output)]
+            # x_t is needed again at the second step, out may be the sample
+            cur_sample = self._buffer("cur_sample", out.shape)
+            np.copyto(cur_sample, sample)
+        elif num_ets == 1 and self.counter == 1:
+            weights = [(0.5, model_output), (0.5, last(1))]
+            sample = self._buffers["cur_sample"]
+        elif num_ets == 2:
+            weights = [(3 / 2, last(1)), (-1 / 2, last(2))]
+        elif num_ets == 3:
+            weights = [(23 / 12, last(1)), (-16 / 12, last(2)), (5 / 12, last(3))]
+        else:
+            weights = [(55 / 24, last(1)), (-59 / 24, last(2)), (37 / 24, last(3)), (-9 / 24, last(4))]
+
+        # prev_sample = sample_coeff * sample - model_output_coeff * model_output
+        alpha_prod_t = float(self.alphas_cumprod[timestep])
+        alpha_prod_t_prev = float(self.alphas_cumprod[prev_timestep]) if prev_timestep >= 0 else float(self.final_alpha_cumprod)
+        beta_prod_t = 1 - alpha_prod_t
+        beta_prod_t_prev = 1 - alpha_prod_t_prev
+        sample_coeff = (alpha_prod_t_prev / alpha_prod_t) ** 0.5
+        model_output_coeff = (alpha_prod_t_prev - alpha_prod_t) / (
+            alpha_prod_t * beta_prod_t_prev ** 0.5 + (alpha_prod_t * beta_prod_t * alpha_prod_t_prev) ** 0.5)
+        if self.config.prediction_type == "v_prediction":
+            # epsilon = sqrt(alpha_prod_t) * v + sqrt(beta_prod_t) * sample
+            sample_coeff -= model_output_coeff * beta_prod_t ** 0.5
+            model_output_coeff *= alpha_prod_t ** 0.5
+        self._combine(out, [(sample_coeff, sample)] + [(-model_output_coeff * w, array) for w, array in weights])
+        self.counter += 1
+        return (out,)
+
+    def add_noise(self, original_samples, noise, timesteps):
+        return _ddpm_add_noise(self.alphas_cumprod, original_samples, noise, timesteps)
+
+
+class DPMSolverMultistepScheduler(_Scheduler):
+    """DPM-Solver and DPM-Solver++ multistep of order 1 to 3, the deterministic variants."""
+    defaults = dict(num_train_timesteps=1000, beta_start=0.0001, beta_end=0.02, beta_schedule="linear",
+                    trained_betas=None, solver_order=2, prediction_type="epsilon", thresholding=False,
+                    dynamic_thresholding_ratio=0.995, sample_max_value=1.0, algorithm_type="dpmsolver++",
+                    solver_type="midpoint", lower_order_final=True, euler_at_final=False, use_karras_sigmas=False,
+                    use_lu_lambdas=False, final_sigmas_type="zero", lambda_min_clipped=-float("inf"),
+                    variance_type=None, timestep_spacing="linspace", steps_offset=0, rescale_betas_zero_snr=False)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        config = self.config
+        if config.algorithm_type == "deis":
+            config["algorithm_type"] = "dpmsolver++"
+        if config.solver_type in ("logrho", "bh1", "bh2"):
+            config["solver_type"] = "midpoint"
+        if config.algorithm_type not in ("dpmsolver", "dpmsolver++"):
+            raise NotImplementedError("{} is not implemented, use dpmsolver or dpmsolver++".format(config.algorithm_type))
+        if config.solver_type not in ("midpoint", "heun"):
+            raise NotImplementedError("{} is not implemented".format(config.solver_type))
+        if config.thresholding or config.use_lu_lambdas or config.variance_type in ("learned", "learned_range"):
+            raise NotImplementedError("thresholding, use_lu_lambdas and learned variance are not implemented")
+        if config.algorithm_type != "dpmsolver++" and config.final_sigmas_type == "zero":
+            raise ValueError("`final_sigmas_type` {} is not supported for `algorithm_type` {}. Please choose `sigma_min` instead.".format(
+                config.final_sigmas_type, config.algorithm_type))
+        self.alphas_cumprod = _alphas_cumprod(config)
+        alpha_t = np.sqrt(self.alphas_cumprod)
+        sigma_t = np.sqrt(1 - self.alphas_cumprod)
+        self.lambda_t = np.log(alpha_t) - np.log(sigma_t)
+        self.sigmas = np.sqrt((1 - self.alphas_cumprod) / self.alphas_cumprod)
+        self.init_noise_sigma = 1.0
+        self.lower_order_nums = 0
+
+    def set_timesteps(self, num_inference_steps=None, device=None, timesteps=None):
+        config = self.config
+        if (num_inference_steps is None) == (timesteps is None):
+            raise ValueError("Must pass exactly one of `num_inference_steps` or `timesteps`.")
+        if timesteps is not None and config.use_karras_sigmas:
+            raise ValueError("Cannot use `timesteps` with `config.use_karras_sigmas = True`")
+        if timesteps is not None:
+            timesteps = np.array(timesteps).astype(np.int64)
+        else:
+            clipped_idx = int(np.searchsorted(self.lambda_t[::-1], config.lambda_min_clipped))
+            last_timestep = config.num_train_timesteps - clipped_idx
+            if config.timestep_spacing == "linspace":
+                timesteps = np.linspace(0, last_timestep - 1, num_inference_steps + 1).round()[::-1][:-1].astype(np.int64)
+            elif config.timestep_spacing == "leading":
+                step_ratio = last_timestep // (num_inference_steps + 1)
+                timesteps = (np.arange(0, num_inference_steps + 1) * step_ratio).round()[::-1][:-1].astype(np.int64)
+                timesteps += config.steps_offset
+            elif config.timestep_spacing == "trailing":
+                step_ratio = config.num_train_timesteps / num_inference_steps
+                timesteps = np.arange(last_timestep, 0, -step_ratio).round().astype(np.int64) - 1
+            else:
+                raise ValueError("{} is not supported".format(config.timestep_spacing))
+
+        sigmas = np.sqrt((1 - self.alphas_cumprod) / self.alphas_cumprod)
+        log_sigmas = np.log(sigmas)
+        if config.use_karras_sigmas:
+            sigmas = karras_sigmas(config, sigmas[::-1], num_inference_steps)
+            timesteps = np.array([sigma_to_t(sigma, log_sigmas) for sigma in sigmas]).round()
+        else:
+            sigmas = np.interp(timesteps, np.arange(0, len(sigmas)), sigmas)
+        sigmas = np.concatenate([sigmas, [final_sigma(config, self.alphas_cumprod)]]).astype(np.float32)
+
+        self.sigmas = sigmas
+        self.timesteps = timesteps.astype(np.int64)
+        self.num_inference_steps = len(timesteps)
+        self.lower_order_nums = 0
+        self._history = None
+        self._step_index = None
+        self._begin_index = None
+
+    def index_for_timestep(self, timestep, schedule_timesteps=None):
+        if schedule_timesteps is None:
+            schedule_timesteps = self.timesteps
+        indices = np.flatnonzero(schedule_timesteps == timestep)
+        if len(indices) == 0:
+            return len(self.timesteps) - 1
+        return int(indices[1] if len(indices) > 1 else indices[0])
+
+    def _alpha_sigma_lambda(self, index):
+        sigma = np.float64(self.sigmas[index])
+        alpha_t = 1 / (sigma ** 2 + 1) ** 0.5
+        sigma_t = sigma * alpha_t
+        with np.errstate(divide="ignore"):
+            return alpha_t, sigma_t, np.log(alpha_t) - np.log(sigma_t)
+
+    def _update_coefficients(self, order):
+        """
+        Coefficients of the sample and of the data (dpmsolver++) or noise (dpmsolver) predictions
+        m0, m1, m2 of this and the previous steps in the update of the given order.
+        """
+        index = self._step_index
+        alpha_t, sigma_t, lambda_t = self._alpha_sigma_lambda(index + 1)
+        alpha_s0, sigma_s0, lambda_s0 = self._alpha_sigma_lambda(index)
+        h = lambda_t - lambda_s0
+        plus = self.config.algorithm_type == "dpmsolver++"
+        if plus:
+            sample_coeff = sigma_t / sigma_s0
+            phi_1 = alpha_t * (np.exp(-h) - 1.0)
+        else:
+            sample_coeff = alpha_t / alpha_s0
+            phi_1 = sigma_t * (np.exp(h) - 1.0)
+        if order == 1:
+            return sample_coeff, [-phi_1]
+
+        # x_t = sample_coeff * sample + b0 * D0 + b1 * D1 (+ b2 * D2), D0 = m0
+        if plus:
+            phi_2 = alpha_t * ((np.exp(-h) - 1.0) / h + 1.0)
+        else:
+            phi_2 = -sigma_t * ((np.exp(h) - 1.0) / h - 1.0)
+        _, _, lambda_s1 = self._alpha_sigma_lambda(index - 1)
+        r0 = (lambda_s0 - lambda_s1) / h
+        if order == 2:
+            # D1 = (m0 - m1) / r0
+            b1 = -0.5 * phi_1 if self.config.solver_type == "midpoint" else phi_2
+            return sample_coeff, [-phi_1 + b1 / r0, -b1 / r0]
+
+        if plus:
+            phi_3 = -alpha_t * ((np.exp(-h) - 1.0 + h) / h ** 2 - 0.5)
+        else:
+            phi_3 = -sigma_t * ((np.exp(h) - 1.0 - h) / h ** 2 - 0.5)
+        _, _, lambda_s2 = self._alpha_sigma_lambda(index - 2)
+        r1 = (lambda_s1 - lambda_s2) / h
+        # D1_0 = (m0 - m1) / r0, D1_1 = (m1 - m2) / r1,
+        # D1 = D1_0 + r0 / (r0 + r1) * (D1_0 - D1_1), D2 = (D1_0 - D1_1) / (r0 + r1)
+        c10 = phi_2 * (1 + r0 / (r0 + r1)) + phi_3 / (r0 + r1)
+        c11 = -phi_2 * r0 / (r0 + r1) - phi_3 / (r0 + r1)
+        return sample_coeff, [-phi_1 + c10 / r0, -c10 / r0 + c11 / r1, -c11 / r1]
+
+    def step(self, model_output, timestep, sample, generator=None, out=None):
+        if self.num_inference_steps is None:
+            raise ValueError("Number of inference steps is 'None', you need to run 'set_timesteps' after creating the scheduler")
+        if self._step_index is None:
+            self._init_step_index(timestep)
+        config = self.config
+        out = self._output(out, model_output, sample)
+        num_timesteps = len(self.timesteps)
+        lower_order_final = self._step_index == num_timesteps - 1 and (
+            config.euler_at_final or (config.lower_order_final and num_timesteps < 15) or config.final_sigmas_type == "zero")
+        lower_order_second = self._step_index == num_timesteps - 2 and config.lower_order_final and num_timesteps < 15
+
+        # converted model outputs of the last solver_order steps, the newest last
+        if self._history is None or self._history[0].shape != out.shape:
+            self._history = [np.empty(out.shape, dtype=np.float32) for _ in range(config.solver_order)]
+        converted = self._history.pop(0)
+        self._history.append(converted)
+        alpha_t, sigma_t, _ = self._alpha_sigma_lambda(self._step_index)
+        if config.algorithm_type == "dpmsolver++":
+            # data prediction x0
+            if config.prediction_type == "epsilon":
+                terms = [(1 / alpha_t, sample), (-sigma_t / alpha_t, model_output)]
+            elif config.prediction_type == "sample":
+                terms = [(1.0, model_output)]
+            elif config.prediction_type == "v_prediction":
+                terms = [(alpha_t, sample), (-sigma_t, model_output)]
+            else:
+                raise ValueError("prediction_type given as {} must be one of `epsilon`, `sample`, or `v_prediction`".format(config.prediction_type))
+        else:
+            # noise prediction epsilon
+            if config.prediction_type == "epsilon":
+                terms = [(1.0, model_output)]
+            elif config.prediction_type == "sample":
+                terms = [(1 / sigma_t, sample), (-alpha_t / sigma_t, model_output)]
+            elif config.prediction_type == "v_prediction":
+                terms = [(alpha_t, model_output), (sigma_t, sample)]
+            else:
+                raise ValueError("prediction_type given as {} must be one of `epsilon`, `sample`, or `v_prediction`".format(config.prediction_type))
+        self._combine(converted, terms)
+
+        if config.solver_order == 1 or self.lower_order_nums < 1 or lower_order_final:
+            order = 1
+        elif config.solver_order == 2 or self.lower_order_nums < 2 or lower_order_second:
+            order = 2
+        else:
+            order = 3
+        sample_coeff, coeffs = self._update_coefficients(order)
+        history = self._history[::-1]
+        self._combine(out, [(sample_coeff, sample)] + list(zip(coeffs, history)))
+
+        if self.lower_order_nums < config.solver_order:
+            self.lower_order_nums += 1
+        self._step_index += 1
+        return (out,)
+
+    def add_noise(self, original_samples, noise, timesteps):
+        sigma = self.sigmas[self._step_indices(timesteps)].reshape((-1,) + (1,) * (np.ndim(original_samples) - 1))
+        alpha_t = 1 / np.sqrt(sigma ** 2 + 1)
+        return alpha_t * original_samples + sigma * alpha_t * noise
+
+
+def sigma_to_t(sigma, log_sigmas):
+    log_sigma = np.log(np.maximum(sigma, 1e-10))
+    dists = log_sigma - log_sigmas[:, np.newaxis]
+    low_idx = np.cumsum((dists >= 0), axis=0).argmax(axis=0).clip(max=log_sigmas.shape[0] - 2)
+    high_idx = low_idx + 1
+    low = log_sigmas[low_idx]
+    high = log_sigmas[high_idx]
+    w = np.clip((low - log_sigma) / (low - high), 0, 1)
+    t = (1 - w) * low_idx + w * high_idx
+    return t.reshape(np.shape(sigma))
+
+
+def karras_sigmas(config, in_sigmas, num_inference_steps):
+    sigma_min = config.get("sigma_min")
+    sigma_max = config.get("sigma_max")
+    sigma_min = sigma_min if sigma_min is not None else float(in_sigmas[-1])
+    sigma_max = sigma_max if sigma_max is not None else float(in_sigmas[0])
+    rho = 7.0
+    ramp = np.linspace(0, 1, num_inference_steps)
+    min_inv_rho = sigma_min ** (1 / rho)
+    max_inv_rho = sigma_max ** (1 / rho)
+    return (max_inv_rho + ramp * (min_inv_rho - max_inv_rho)) ** rho
+
+
+def final_sigma(config, alphas_cumprod):
+    if config.final_sigmas_type == "sigma_min":
+        return ((1 - alphas_cumprod[0]) / alphas_cumprod[0]) ** 0.5
+    if config.final_sigmas_type == "zero":
+        return 0
+    raise ValueError("`final_sigmas_type` must be one of 'zero', or 'sigma_min', but got {}".format(config.final_sigmas_type))
+
+
+def euler_timesteps(config, num_inference_steps):
+    if config.timestep_spacing == "linspace":
+        return np.linspace(0, config.num_train_timesteps - 1, num_inference_steps, dtype=np.float32)[::-1].copy()
+    if config.timestep_spacing == "leading":
+        step_ratio = config.num_train_timesteps // num_inference_steps
+        timesteps = (np.arange(0, num_inference_steps) * step_ratio).round()[::-1].astype(np.float32)
+        return timesteps + config.steps_offset
+    if config.timestep_spacing == "trailing":
+        step_ratio = config.num_train_timesteps / num_inference_steps
+        return np.arange(config.num_train_timesteps, 0, -step_ratio).round().astype(np.float32) - 1
+    raise ValueError("{} is not supported".format(config.timestep_spacing))
+
+
+class EulerDiscreteScheduler(_Scheduler):
+    defaults = dict(num_train_timesteps=1000, beta_start=0.0001, beta_end=0.02, beta_schedule="linear",
+                    trained_betas=None, prediction_type="epsilon", interpolation_type="linear",
+                    use_karras_sigmas=False, sigma_min=None, sigma_max=None, timestep_spacing="linspace",
+                    timestep_type="discrete", steps_offset=0, rescale_betas_zero_snr=False, final_sigmas_type="zero")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.config.get("timestep_type") == "continuous" and self.config.prediction_type == "v_prediction":
+            raise NotImplementedError("continuous timesteps are not implemented")
+        self.alphas_cumprod = _alphas_cumprod(self.config)
+        sigmas = np.sqrt((1 - self.alphas_cumprod) / self.alphas_cumprod)[::-1]
+        self.sigmas = np.concatenate([sigmas, [0.0]]).astype(np.float32)
+        self.timesteps = np.linspace(0, self.config.num_train_timesteps - 1, self.config.num_train_timesteps)[::-1].astype(np.float32)
+
+    @property
+    def init_noise_sigma(self):
+        max_sigma = self.sigmas.max()
+        if self.config.timestep_spacing in ("linspace", "trailing"):
+            return float(max_sigma)
+        return float((max_sigma ** 2 + 1) ** 0.5)
+
+    def set_timesteps(self, num_inference_steps=None, device=None, timesteps=None, sigmas=None):
+        config = self.config
+        if timesteps is not None and sigmas is not None:
+            raise ValueError("Only one of `timesteps` or `sigmas` should be set.")
+        if num_inference_steps is None and timesteps is None and sigmas is None:
+            raise ValueError("Must pass exactly one of `num_inference_steps` or `timesteps` or `sigmas.")
+        if num_inference_steps is not None and (timesteps is not None or sigmas is not None):
+            raise ValueError("Can only pass one of `num_inference_steps` or `timesteps` or `sigmas`.")
+        if timesteps is not None and config.use_karras_sigmas:
+            raise ValueError("Cannot set `timesteps` with `config.use_karras_sigmas = True`.")
+        if num_inference_steps is None:
+            num_inference_steps = len(timesteps) if timesteps is not None else len(sigmas) - 1
+        self.num_inference_steps = num_inference_steps
+
+        train_sigmas = np.sqrt((1 - self.alphas_cumprod) / self.alphas_cumprod)
+        log_sigmas = np.log(train_sigmas)
+        if sigmas is not None:
+            sigmas = np.array(sigmas).astype(np.float32)
+            timesteps = np.array([sigma_to_t(sigma, log_sigmas) for sigma in sigmas[:-1]])
+        else:
+            if timesteps is not None:
+                timesteps = np.array(timesteps).astype(np.float32)
+            else:
+                timesteps = euler_timesteps(config, num_inference_steps)
+            if config.interpolation_type == "linear":
+                sigmas = np.interp(timesteps, np.arange(0, len(train_sigmas)), train_sigmas)
+            elif config.interpolation_type == "log_linear":
+                sigmas = np.exp(np.linspace(np.log(train_sigmas[-1]), np.log(train_sigmas[0]), num_inference_steps + 1).astype(np.float32))
+            else:
+                raise ValueError("{} is wrong, please choose one of 'linear' or 'log_linear'".format(config.interpolation_type))
+            if config.use_karras_sigmas:
+                sigmas = karras_sigmas(config, sigmas, num_inference_steps)
+                timesteps = np.array([sigma_to_t(sigma, log_sigmas) for sigma in sigmas])
+            sigmas = np.concatenate([sigmas, [final_sigma(config, self.alphas_cumprod)]]).astype(np.float32)
+
+        self.sigmas = sigmas
+        self.timesteps = timesteps.astype(np.float32)
+        self._step_index = None
+        self._begin_index = None
+
+    def scale_model_input(self, sample, timestep):
+        if self._step_index is None:
+            self._init_step_index(timestep)
+        sigma = self.sigmas[self._step_index]
+        return sample / float((sigma ** 2 + 1) ** 0.5)
+
+    def _prediction_coefficients(self, sigma, sigma_hat, dt):
+        # prev_sample = sample + (sample - pred_original_sample) / sigma_hat * dt, as coefficients
+        # of the sample and the model output
+        prediction_type = self.config.prediction_type
+        if prediction_type == "epsilon":
+            return 1.0, dt
+        if prediction_type in ("original_sample", "sample"):
+            return 1.0 + dt / sigma_hat, -dt / sigma_hat
+        if prediction_type == "v_prediction":
+            return 1.0 + dt / sigma_hat * (1 - 1 / (sigma ** 2 + 1)), dt / sigma_hat * sigma / (sigma ** 2 + 1) ** 0.5
+        raise ValueError("prediction_type given as {} must be one of `epsilon`, or `v_prediction`".format(prediction_type))
+
+    def step(self, model_output, timestep, sample, s_churn=0.0, s_tmin=0.0, s_tmax=float("inf"), s_noise=1.0,
+             generator=None, noise=None, out=None):
+        check_float_timestep(timestep)
+        if self._step_index is None:
+            self._init_step_index(timestep)
+        out = self._output(out, model_output, sample)
+        sigma = float(self.sigmas[self._step_index])
+        gamma = min(s_churn / (len(self.sigmas) - 1), 2 ** 0.5 - 1) if s_tmin <= sigma <= s_tmax else 0.0
+        sigma_hat = sigma * (gamma + 1)
+        dt = float(self.sigmas[self._step_index + 1]) - sigma_hat
+        sample_coeff, model_output_coeff = self._prediction_coefficients(sigma, sigma_hat, dt)
+        terms = [(sample_coeff, sample), (model_output_coeff, model_output)]
+        if gamma > 0:
+            # sample_hat = sample + noise * s_noise * (sigma_hat ** 2 - sigma ** 2) ** 0.5
+            noise = draw_noise(out.shape, generator, noise)
+            terms.append((sample_coeff * s_noise * (sigma_hat ** 2 - sigma ** 2) ** 0.5, noise))
+        self._combine(out, terms)
+        self._step_index += 1
+        return (out,)
+
+    def add_noise(self, original_samples, noise, timesteps):
+        sigma = self.sigmas[self._step_indices(timesteps)].reshape((-1,) + (1,) * (np.ndim(original_samples) - 1))
+        return original_samples + noise * sigma
+
+
+class EulerAncestralDiscreteScheduler(EulerDiscreteScheduler):
+    defaults = dict(num_train_timesteps=1000, beta_start=0.0001, beta_end=0.02, beta_schedule="linear",
+                    trained_betas=None, prediction_type="epsilon", timestep_spacing="linspace", steps_offset=0,
+                    rescale_betas_zero_snr=False)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.config.prediction_type not in ("epsilon", "v_prediction"):
+            raise NotImplementedError("prediction_type not implemented yet: {}".format(self.config.prediction_type))
+        # the fixed settings of the ancestral scheduler, for the shared set_timesteps
+        self.config.update(interpolation_type="linear", use_karras_sigmas=False, final_sigmas_type="zero")
+
+    def set_timesteps(self, num_inference_steps, device=None):
+        super().set_timesteps(num_inference_steps)
+
+    def step(self, model_output, timestep, sample, generator=None, noise=None, out=None):
+        check_float_timestep(timestep)
+        if self._step_index is None:
+            self._init_step_index(timestep)
+        out = self._output(out, model_output, sample)
+        sigma_from = float(self.sigmas[self._step_index])
+        sigma_to = float(self.sigmas[self._step_index + 1])
+        sigma_up = (sigma_to ** 2 * (sigma_from ** 2 - sigma_to ** 2) / sigma_from ** 2) ** 0.5
+        sigma_down = (sigma_to ** 2 - sigma_up ** 2) ** 0.5
+        sample_coeff, model_output_coeff = self._prediction_coefficients(sigma_from, sigma_from, sigma_down - sigma_from)
+        noise = draw_noise(out.shape, generator, noise)
+        self._combine(out, [(sample_coeff, sample), (model_output_coeff, model_output), (sigma_up, noise)])
+        self._step_index += 1
+        return (out,)
+
+
+class LCMScheduler(_Scheduler):
+    defaults = dict(num_train_timesteps=1000, beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+                    trained_betas=None, original_inference_steps=50, clip_sample=False, clip_sample_range=1.0,
+                    set_alpha_to_one=True, steps_offset=0, prediction_type="epsilon", thresholding=False,
+                    dynamic_thresholding_ratio=0.995, sample_max_value=1.0, timestep_spacing="leading",
+                    timestep_scaling=10.0, rescale_betas_zero_snr=False)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.config.thresholding:
+            raise NotImplementedError("thresholding is not implemented")
+        self.alphas_cumprod = _alphas_cumprod(self.config)
+        self.final_alpha_cumprod = 1.0 if self.config.set_alpha_to_one else float(self.alphas_cumprod[0])
+        self.init_noise_sigma = 1.0
+        self.sigma_data = 0.5
+        self.timesteps = np.arange(0, self.config.num_train_timesteps)[::-1].astype(np.int64)
+
+    def set_timesteps(self, num_inference_steps=None, device=None, original_inference_steps=None, timesteps=None, strength=1.0):
+        config = self.config
+        if (num_inference_steps is None) == (timesteps is None):
+            raise ValueError("Must pass exactly one of `num_inference_steps` or `custom_timesteps`.")
+        original_steps = original_inference_steps if original_inference_steps is not None else config.original_inference_steps
+        if original_steps > config.num_train_timesteps:
+            raise ValueError("`original_steps`: {} cannot be larger than `num_train_timesteps`: {}".format(
+                original_steps, config.num_train_timesteps))
+        # the timesteps of the LCM distillation schedule
+        k = config.num_train_timesteps // original_steps
+        lcm_origin_timesteps = np.arange(1, int(original_steps * strength) + 1) * k - 1
+
+        if timesteps is not None:
+            timesteps = np.array(timesteps, dtype=np.int64)
+            if np.any(timesteps[1:] >= timesteps[:-1]):
+                raise ValueError("`custom_timesteps` must be in descending order.")
+            if timesteps[0] >= config.num_train_timesteps:
+                raise ValueError("`timesteps` must start before `self.config.train_timesteps`: {}.".format(config.num_train_timesteps))
+            self.num_inference_steps = len(timesteps)
+            init_timestep = min(int(self.num_inference_steps * strength), self.num_inference_steps)
+            t_start = max(self.num_inference_steps - init_timestep, 0)
+            timesteps = timesteps[t_start * self.order:]
+        else:
+            if num_inference_steps > config.num_train_timesteps:
+                raise ValueError("`num_inference_steps`: {} cannot be larger than `self.config.train_timesteps`: {}".format(
+                    num_inference_steps, config.num_train_timesteps))
+            if len(lcm_origin_timesteps) // num_inference_steps < 1:
+                raise ValueError("The combination of `original_steps x strength`: {} x {} is smaller than `num_inference_steps`: {}".format(
+                    original_steps, strength, num_inference_steps))
+            self.num_inference_steps = num_inference_steps
+            lcm_origin_timesteps = lcm_origin_timesteps[::-1]
+            inference_indices = np.floor(np.linspace(0, len(lcm_origin_timesteps), num=num_inference_steps, endpoint=False)).astype(np.int64)
+            timesteps = lcm_origin_timesteps[inference_indices]
+
+        self.timesteps = timesteps.astype(np.int64)
+        self._step_index = None
+        self._begin_index = None
+
+    def get_scalings_for_boundary_condition_discrete(self, timestep):
+        scaled_timestep = timestep * self.config.timestep_scaling
+        c_skip = self.sigma_data ** 2 / (scaled_timestep ** 2 + self.sigma_data ** 2)
+        c_out = scaled_timestep / (scaled_timestep ** 2 + self.sigma_data ** 2) ** 0.5
+        return c_skip, c_out
+
+    def step(self, model_output, timestep, sample, generator=None, noise=None, out=None):
+        """
+        Returns:
+            (prev_sample, denoised): denoised is a scheduler buffer, valid until the next step
+        """
+        if self.num_inference_steps is None:
+            raise ValueError("Number of inference steps is 'None', you need to run 'set_timesteps' after creating the scheduler")
+        if self._step_index is None:
+            self._init_step_index(timestep)
+        config = self.config
+        out = self._output(out, model_output, sample)
+        timestep = int(timestep)
+        prev_step_index = self._step_index + 1
+        prev_timestep = int(self.timesteps[prev_step_index]) if prev_step_index < len(self.timesteps) else timestep
+
+        alpha_prod_t = float(self.alphas_cumprod[timestep])
+        alpha_prod_t_prev = float(self.alphas_cumprod[prev_timestep]) if prev_timestep >= 0 else self.final_alpha_cumprod
+        beta_prod_t = 1 - alpha_prod_t
+        beta_prod_t_prev = 1 - alpha_prod_t_prev
+        c_skip, c_out = self.get_scalings_for_boundary_condition_discrete(timestep)
+
+        # predicted x0, then denoised = c_out * x0 + c_skip * sample
+        denoised = self._buffer("denoised", out.shape)
+        if config.prediction_type == "epsilon":
+            terms = [(1 / alpha_prod_t ** 0.5, sample), (-(beta_prod_t / alpha_prod_t) ** 0.5, model_output)]
+        elif config.prediction_type == "sample":
+            terms = [(1.0, model_output)]
+        elif config.prediction_type == "v_prediction":
+            terms = [(alpha_prod_t ** 0.5, sample), (-beta_prod_t ** 0.5, model_output)]
+        else:
+            raise ValueError("prediction_type given as {} must be one of `epsilon`, `sample` or `v_prediction` for `LCMScheduler`.".format(
+                config.prediction_type))
+        if config.clip_sample:
+            self._combine(denoised, terms)
+            np.clip(denoised, -config.clip_sample_range, config.clip_sample_range, out=denoised)
+            self._combine(denoised, [(c_out, denoised), (c_skip, sample)])
+        else:
+            self._combine(denoised, [(coef * c_out, array) for coef, array in terms] + [(c_skip, sample)])
+
+        if self._step_index != self.num_inference_steps - 1:
+            noise = draw_noise(out.shape, generator, noise)
+            self._combine(out, [(alpha_prod_t_prev ** 0.5, denoised), (beta_prod_t_prev ** 0.5, noise)])
+        else:
+            np.copyto(out, denoised)
+        self._step_index += 1
+        return (out, denoised)
+
+    def add_noise(self, original_samples, noise, timesteps):
+        return _ddpm_add_noise(self.alphas_cumprod, original_samples, noise, timesteps)
+
+
+class FlowMatchEulerDiscreteScheduler(_Scheduler):
+    defaults = dict(num_train_timesteps=1000, shift=1.0, use_dynamic_shifting=False, base_shift=0.5, max_shift=1.15,
+                    base_image_seq_len=256, max_image_seq_len=4096)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        config = self.config
+        timesteps = np.linspace(1, config.num_train_timesteps, config.num_train_timesteps, dtype=np.float32)[::-1].copy()
+        sigmas = timesteps / config.num_train_timesteps
+        if not config.use_dynamic_shifting:
+            sigmas = config.shift * sigmas / (1 + (config.shift - 1) * sigmas)
+        self.sigmas = sigmas.astype(np.float32)
+        self.timesteps = self.sigmas * config.num_train_timesteps
+        self.sigma_min = float(self.sigmas[-1])
+        self.sigma_max = float(self.sigmas[0])
+
+    def time_shift(self, mu, sigma, t):
+        return math.exp(mu) / (math.exp(mu) + (1 / t - 1) ** sigma)
+
+    def set_timesteps(self, num_inference_steps=None, device=None, sigmas=None, mu=None):
+        config = self.config
+        if config.use_dynamic_shifting and mu is None:
+            raise ValueError(" you have a pass a value for `mu` when `use_dynamic_shifting` is set to be `True`")
+        if sigmas is None:
+            self.num_inference_steps = num_inference_steps
+            timesteps = np.linspace(self.sigma_max * config.num_train_timesteps, self.sigma_min * config.num_train_timesteps, num_inference_steps)
+            sigmas = timesteps / config.num_train_timesteps
+        sigmas = np.asarray(sigmas, dtype=np.float64)
+        if config.use_dynamic_shifting:
+            sigmas = self.time_shift(mu, 1.0, sigmas)
+        else:
+            sigmas = config.shift * sigmas / (1 + (config.shift - 1) * sigmas)
+        sigmas = sigmas.astype(np.float32)
+        self.timesteps = sigmas * config.num_train_timesteps
+        self.sigmas = np.concatenate([sigmas, np.zeros(1, dtype=np.float32)])
+        self._step_index = None
+        self._begin_index = None
+
+    def scale_noise(self, sample, timestep, noise):
+        sigma = self.sigmas[self._step_indices(timestep)].reshape((-1,) + (1,) * (np.ndim(sample) - 1))
+        return sigma * noise + (1.0 - sigma) * sample
+
+    def step(self, model_output, timestep, sample, out=None):
+        check_float_timestep(timestep)
+        if self._step_index is None:
+            self._init_step_index(timestep)
+        out = self._output(out, model_output, sample)
+        # difference of the float32 sigmas, as diffusers computes it
+        dt = self.sigmas[self._step_index + 1] - self.sigmas[self._step_index]
+        self._combine(out, [(1.0, sample), (dt, model_output)])
+        self._step_index += 1
+        return (out,)
@@ -10,7 +10,8 @@ import argparse
 import os
 import numpy as np
 from stable_diffusion import StableDiffusionPipeline
-from diffusers import PNDMScheduler,EulerDiscreteScheduler
+from np_schedulers import PNDMScheduler,EulerDiscreteScheduler
+from embedding_cache import EmbeddingCache
 
 provided_img_size = [(128, 384), (128, 448), (128, 512), (192, 384), (192, 448), (192, 512), (256, 384), 
             (256, 448), (256, 512), (320, 384), (320, 448), (320, 512), (384, 384), (384, 448), 
@@ -70,7 +71,8 @@ def load_pipeline(args):
         controlnet_name = args.controlnet_name,
         processor_name = args.processor_name,
         dev_id = args.dev_id,
-        tokenizer = args.tokenizer
+        tokenizer = args.tokenizer,
+        embedding_cache = EmbeddingCache(args.embed_cache_mb, args.embed_cache_dir)
     )
     return pipeline
 
@@ -112,6 +114,9 @@ if __name__ == "__main__":
     # dev_id
     parser.add_argument("--dev_id", type=int, default=0, help="device id")
     parser.add_argument("--sd_turbo", type=int, default=0, help="sd turbo")
+    # prompt embedding cache
+    parser.add_argument("--embed_cache_mb", type=float, default=64, help="memory of the prompt embedding cache in MB, 0 disables it")
+    parser.add_argument("--embed_cache_dir", type=str, default=None, help="directory to keep prompt embeddings between runs")
 
     try:
         args = parser.parse_args()
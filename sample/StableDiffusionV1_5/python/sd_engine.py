@@ -24,6 +24,7 @@ class EngineOV:
         self.graph_name = self.model.get_graph_names()[0]
         self.input_name = self.model.get_input_names(self.graph_name)
         self.output_name= self.model.get_output_names(self.graph_name)
+        self.input_shape = [self.model.get_input_shape(self.graph_name, name) for name in self.input_name]
 
     def __str__(self):
         return "EngineOV: model_path={}, device_id={}".format(self.model_path,self.device_id)
@@ -11,12 +11,12 @@ import time
 import numpy as np
 from tqdm import tqdm
 from sd_engine import EngineOV
+from embedding_cache import EmbeddingCache, encoder_identity
 import cv2
 from transformers import CLIPTokenizer
 from diffusers.utils import logging, load_image
 import PIL
 from PIL import Image
-import torch
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -62,6 +62,7 @@ class StableDiffusionPipeline():
         controlnet_name = None,
         processor_name = None,
         tokenizer = None,
+        embedding_cache = None,
     ):
         self.version = "1.0.0"
         super().__init__()
@@ -108,6 +109,8 @@ class StableDiffusionPipeline():
         self.vae_encoder = EngineOV(vae_encoder_path, device_id = dev_id)
         self.vae_decoder = EngineOV(vae_decoder_path, device_id = dev_id)
         self.text_encoder = EngineOV(text_encoder_path, device_id = dev_id)
+        self.text_encoder_id = encoder_identity(text_encoder_path)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
         self.unet = EngineOV(unet_path, device_id = dev_id)
 
         # other config
@@ -130,6 +133,10 @@ class StableDiffusionPipeline():
         self.inference_time = 0.0
         self.vae_decoder_time = 0.0
 
+    def _encode_tokens(self, token_ids):
+        # text encoder outputs, from the embedding cache if these tokens were encoded before
+        return self.embedding_cache.encode(self.text_encoder_id, token_ids, lambda ids: self.text_encoder({"tokens": ids}))
+
     def _encode_prompt(
         self,
         prompt,
@@ -157,7 +164,7 @@ class StableDiffusionPipeline():
                 padding="max_length",
                 max_length=self.tokenizer.model_max_length,
                 truncation=True,
-                return_tensors="pt",
+                return_tensors="np",
             )
             text_input_ids = text_inputs.input_ids
 
@@ -173,7 +180,7 @@ class StableDiffusionPipeline():
             #         f" {self.tokenizer.model_max_length} tokens: {removed_text}"
             #     )
 
-            prompt_embeds = self.text_encoder({"tokens": np.array(text_input_ids)})
+            prompt_embeds = self._encode_tokens(np.array(text_input_ids))
             prompt_embeds = prompt_embeds[0]
 
         # get unconditional embeddings for classifier free guidance
@@ -203,11 +210,11 @@ class StableDiffusionPipeline():
                 padding="max_length",
                 max_length=max_length,
                 truncation=True,
-                return_tensors="pt",
+                return_tensors="np",
             )
 
             uncond_input_text_input_ids = uncond_input.input_ids
-            negative_prompt_embeds = self.text_encoder({"tokens": np.array(uncond_input_text_input_ids)})
+            negative_prompt_embeds = self._encode_tokens(np.array(uncond_input_text_input_ids))
 
             negative_prompt_embeds = negative_prompt_embeds[0]
 
@@ -406,8 +413,8 @@ class StableDiffusionPipeline():
         shape = [batch_size, num_channels_latents, height // self.vae_scale_factor, width // self.vae_scale_factor]
 
         if init_image is None:
-            latents = torch.randn(shape, dtype=torch.float32)
-            latents = latents * self.scheduler.init_noise_sigma            
+            latents = np.random.randn(*shape).astype(np.float32)
+            latents = latents * np.float32(self.scheduler.init_noise_sigma)
             timesteps = self.scheduler.timesteps + offset
         else:
             init_image = cv2.imread(init_image)
@@ -423,7 +430,7 @@ class StableDiffusionPipeline():
             # timesteps = torch.tensor(timesteps)
             # latents = self.scheduler.add_noise(init_latents, noise, timesteps[0])
             # latents = latents.numpy()
-            latents = init_latents
+            latents = init_latents.astype(np.float32)
 
         # 6. prepare controlnet_img
         if self.controlnet:
@@ -496,13 +503,7 @@ class StableDiffusionPipeline():
 
                 # compute the previous noisy sample x_t -> x_t-1
                 # (4,64,64) () (1, 4, 64, 64)
-                temp_noise_pred = torch.from_numpy(noise_pred)
-                if(type(latents)==np.ndarray):
-                    temp_latents = torch.from_numpy(latents)
-                else:
-                    temp_latents = latents
-                latents = self.scheduler.step(temp_noise_pred, t, temp_latents, return_dict=False)[0]
-                latents = latents.numpy()
+                latents = self.scheduler.step(noise_pred, t, latents, out=latents)[0]
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
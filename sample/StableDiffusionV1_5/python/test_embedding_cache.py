@@ -0,0 +1,141 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2024 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+"""
+Tests of embedding_cache, the text encoder output cache shared by the SD1.5, SDXL and FLUX.1
+samples. Needs only numpy, a counting fake encoder stands in for the bmodels.
+
+    python3 test_embedding_cache.py    or    python3 -m pytest test_embedding_cache.py
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+ENCODER = "fake-encoder"
+# one 1MB float32 output per prompt
+ROWS = 2 ** 18
+
+
+class FakeEncoder(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, token_ids):
+        self.calls += 1
+        value = np.float32(np.sum(token_ids))
+        return [np.full(ROWS, value, dtype=np.float32), np.full((1, 4), value, dtype=np.float32)]
+
+
+def tokens(i):
+    return np.array([[49406, i, 49407]], dtype=np.int32)
+
+
+def npz_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith(".npz"))
+
+
+def test_hit_returns_copies():
+    cache = EmbeddingCache(max_mb=4)
+    encoder = FakeEncoder()
+    first = cache.encode(ENCODER, tokens(1), encoder)
+    first[0][:] = -1
+    second = cache.encode(ENCODER, tokens(1), encoder)
+    assert encoder.calls == 1 and cache.hits == 1 and cache.misses == 1
+    assert second[0][0] == 49406 + 1 + 49407
+    # another encoder identity is another entry
+    cache.encode("other-encoder", tokens(1), encoder)
+    assert encoder.calls == 2
+
+
+def test_lru_eviction_by_size():
+    # every entry is a bit over 1MB, so a 3MB cache keeps two of them
+    cache = EmbeddingCache(max_mb=3)
+    encoder = FakeEncoder()
+    for i in range(3):
+        cache.encode(ENCODER, tokens(i), encoder)
+    assert len(cache.entries) == 2 and cache.nbytes <= cache.max_bytes
+    # 0 was evicted, 1 and 2 are kept
+    cache.encode(ENCODER, tokens(1), encoder)
+    cache.encode(ENCODER, tokens(2), encoder)
+    assert encoder.calls == 3
+    # a hit on 1 makes 2 the least recently used entry
+    cache.encode(ENCODER, tokens(1), encoder)
+    cache.encode(ENCODER, tokens(3), encoder)
+    cache.encode(ENCODER, tokens(1), encoder)
+    assert encoder.calls == 4
+    cache.encode(ENCODER, tokens(2), encoder)
+    assert encoder.calls == 5
+
+
+def test_disabled():
+    cache = EmbeddingCache(max_mb=0, cache_dir=None)
+    encoder = FakeEncoder()
+    cache.encode(ENCODER, tokens(1), encoder)
+    cache.encode(ENCODER, tokens(1), encoder)
+    assert encoder.calls == 2 and not cache.entries
+
+
+def test_disk_round_trip():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        encoder = FakeEncoder()
+        expected = EmbeddingCache(max_mb=4, cache_dir=cache_dir).encode(ENCODER, tokens(1), encoder)
+        assert len(npz_files(cache_dir)) == 1
+        # a new process: read from disk, not encoded again
+        cache = EmbeddingCache(max_mb=4, cache_dir=cache_dir)
+        outputs = cache.encode(ENCODER, tokens(1), encoder)
+        assert encoder.calls == 1 and cache.hits == 1
+        assert all(np.array_equal(a, b) and a.dtype == b.dtype and a.shape == b.shape
+                   for a, b in zip(expected, outputs))
+        assert not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
+
+
+def test_unreadable_file_is_a_miss():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(max_mb=4, cache_dir=cache_dir)
+        with open(cache.path(cache.key(ENCODER, tokens(1))), "wb") as f:
+            f.write(b"not a npz file")
+        encoder = FakeEncoder()
+        outputs = cache.encode(ENCODER, tokens(1), encoder)
+        assert encoder.calls == 1 and outputs[0][0] == 49406 + 1 + 49407
+        # replaced by a good file
+        assert EmbeddingCache(max_mb=4, cache_dir=cache_dir).encode(ENCODER, tokens(1), encoder)[1].shape == (1, 4)
+        assert encoder.calls == 1
+
+
+def test_max_disk_mb_pruning():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        encoder = FakeEncoder()
+        # the files are about 1MB each, a 2.5MB limit keeps the two most recently used
+        cache = EmbeddingCache(max_mb=0.5, cache_dir=cache_dir, max_disk_mb=2.5)
+        paths = [cache.path(cache.key(ENCODER, tokens(i))) for i in range(4)]
+        for i in range(3):
+            cache.encode(ENCODER, tokens(i), encoder)
+            # mtimes one second apart, file systems with coarse timestamps still order them
+            os.utime(paths[i], (time.time() - 10 + i, time.time() - 10 + i))
+        assert [os.path.exists(path) for path in paths[:3]] == [False, True, True]
+        # reading 1 from disk refreshes its mtime, so 2 is pruned when 3 is saved
+        cache.encode(ENCODER, tokens(1), encoder)
+        assert encoder.calls == 3
+        cache.encode(ENCODER, tokens(3), encoder)
+        assert [os.path.exists(path) for path in paths] == [False, True, False, True]
+        total = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in npz_files(cache_dir))
+        assert total <= cache.max_disk_bytes
+
+
+if __name__ == "__main__":
+    test_hit_returns_copies()
+    test_lru_eviction_by_size()
+    test_disabled()
+    test_disk_round_trip()
+    test_unreadable_file_is_a_miss()
+    test_max_disk_mb_pruning()
+    print("embedding cache tests passed")
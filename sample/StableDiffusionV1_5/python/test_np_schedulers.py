@@ -0,0 +1,348 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2024 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+"""
+Tests of np_schedulers, the numpy schedulers shared by the SD1.5, SDXL and FLUX.1 samples.
+
+The numpy-only checks run everywhere: timestep and sigma tables against values taken from
+diffusers 0.30.3, the closed form of the Euler and flow-match steps, and DPM-Solver++ order 1
+against a DDIM step. The parity checks run the same fake unet through np_schedulers and the
+diffusers schedulers they replace and compare timesteps, sigmas and the latents of every step;
+they need torch and diffusers (>= 0.30 for FlowMatchEulerDiscreteScheduler).
+
+    python3 test_np_schedulers.py                 # fails if torch or diffusers is missing
+    python3 test_np_schedulers.py --numpy_only    # only the checks without torch and diffusers
+    python3 -m pytest test_np_schedulers.py       # the parity tests are reported as skipped without them
+"""
+import argparse
+import itertools
+import sys
+
+import numpy as np
+
+import np_schedulers as ns
+
+try:
+    import torch
+    import diffusers
+except ImportError as e:
+    torch = diffusers = None
+    missing = str(e)
+
+SHAPE = (1, 4, 8, 8)
+SD_BETAS = dict(beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear")
+# max error relative to the largest latent or x0 prediction value, the float32 rounding scales with it
+TOLERANCE = 2e-5
+
+
+def fake_unet(sample, step):
+    # deterministic in the sample and the step, so both implementations see the same predictions
+    noise = np.random.default_rng(1000 + step).standard_normal(SHAPE).astype(np.float32)
+    return (0.3 * sample + noise).astype(np.float32)
+
+
+def calculate_shift(image_seq_len, base_seq_len=256, max_seq_len=4096, base_shift=0.5, max_shift=1.15):
+    m = (max_shift - base_shift) / (max_seq_len - base_seq_len)
+    return image_seq_len * m + base_shift - m * base_seq_len
+
+
+def compare(name, config, steps, set_kwargs=None, step_kwargs=None, fixed_noise=False, inplace=False, cfg_shape=False):
+    """
+    Run one scheduler config through diffusers and np_schedulers, returns the max relative error.
+    fixed_noise: pass the noise diffusers draws from its generator to the numpy step
+    inplace: step with out=sample, as the pipelines do
+    cfg_shape: give the step a [4, h, w] noise prediction, as the cfg split in stable_diffusion.py does
+    """
+    set_kwargs = dict(set_kwargs or {})
+    step_kwargs = dict(step_kwargs or {})
+    ref = getattr(diffusers, name)(**config)
+    sch = getattr(ns, name)(**config)
+    if "sigmas" in set_kwargs:
+        ref.set_timesteps(**set_kwargs)
+        sch.set_timesteps(**set_kwargs)
+    else:
+        ref.set_timesteps(steps, **set_kwargs)
+        sch.set_timesteps(steps, **set_kwargs)
+
+    ref_timesteps = ref.timesteps.numpy()
+    assert ref_timesteps.dtype == sch.timesteps.dtype, (name, ref_timesteps.dtype, sch.timesteps.dtype)
+    if sch.timesteps.dtype == np.int64:
+        assert np.array_equal(ref_timesteps, sch.timesteps), (name, ref_timesteps, sch.timesteps)
+    else:
+        assert np.allclose(ref_timesteps, sch.timesteps, rtol=1e-5, atol=1e-4), (name, ref_timesteps, sch.timesteps)
+    has_sigmas = hasattr(ref, "sigmas") and name not in ("PNDMScheduler", "LCMScheduler")
+    if has_sigmas:
+        assert np.allclose(ref.sigmas.numpy(), sch.sigmas, rtol=1e-6, atol=1e-7), (name, ref.sigmas, sch.sigmas)
+    init_sigma = float(getattr(ref, "init_noise_sigma", 1.0))
+    assert abs(init_sigma - getattr(sch, "init_noise_sigma", 1.0)) <= 1e-6 * max(1.0, init_sigma), name
+
+    latents = np.random.default_rng(0).standard_normal(SHAPE).astype(np.float32) * np.float32(init_sigma)
+    ref_latents = torch.from_numpy(latents.copy())
+    generator = torch.Generator().manual_seed(5)
+    scale = 1.0
+    err = 0.0
+    for i, t in enumerate(ref.timesteps):
+        ref_input = ref.scale_model_input(ref_latents, t).numpy() if hasattr(ref, "scale_model_input") else ref_latents.numpy()
+        np_input = sch.scale_model_input(latents, sch.timesteps[i])
+        err = max(err, np.abs(ref_input - np_input).max() / max(scale, np.abs(ref_input).max()))
+
+        ref_pred = fake_unet(ref_input, i)
+        np_pred = fake_unet(np_input, i)
+        if cfg_shape:
+            ref_pred, np_pred = ref_pred[0], np_pred[0]
+        kwargs = dict(step_kwargs)
+        if fixed_noise:
+            # the noise diffusers draws next, taken from a copy of its generator
+            peek = torch.Generator()
+            peek.set_state(generator.get_state())
+            kwargs["noise"] = torch.randn(SHAPE, generator=peek, dtype=torch.float32).numpy()
+            ref_latents = ref.step(torch.from_numpy(ref_pred), t, ref_latents, generator=generator, return_dict=False, **step_kwargs)[0]
+        else:
+            ref_latents = ref.step(torch.from_numpy(ref_pred), t, ref_latents, return_dict=False, **step_kwargs)[0]
+        latents = sch.step(np_pred, sch.timesteps[i], latents, out=latents if inplace else None, **kwargs)[0]
+
+        expected = ref_latents.numpy()
+        assert np.array_equal(np.isfinite(expected), np.isfinite(latents)), name
+        if has_sigmas:
+            scale = max(scale, np.abs(ref_pred).max() * float(ref.sigmas.max()))
+        scale = max(scale, np.nanmax(np.abs(expected)))
+        if not np.isnan(latents).all():
+            err = max(err, np.nanmax(np.abs(expected - latents)) / scale)
+    return err
+
+
+def step_cases(steps):
+    """(label, scheduler name, config, kwargs of compare) of every scheduler config the pipelines can use."""
+    euler_d = dict(SD_BETAS, interpolation_type="linear", prediction_type="epsilon", steps_offset=1,
+                   timestep_spacing="leading", use_karras_sigmas=False)
+    sd_turbo = dict(SD_BETAS, final_sigmas_type="zero", interpolation_type="linear", prediction_type="epsilon",
+                    rescale_betas_zero_snr=False, steps_offset=1, timestep_spacing="trailing", timestep_type="discrete")
+    yield "pndm plms", "PNDMScheduler", dict(SD_BETAS, skip_prk_steps=True), {}
+    yield "pndm v_prediction trailing", "PNDMScheduler", dict(SD_BETAS, skip_prk_steps=True, prediction_type="v_prediction",
+                                                              timestep_spacing="trailing"), {}
+    yield "euler sdxl", "EulerDiscreteScheduler", euler_d, {}
+    yield "euler sd-turbo", "EulerDiscreteScheduler", sd_turbo, {}
+    yield "euler karras v_prediction sigma_min", "EulerDiscreteScheduler", dict(SD_BETAS, use_karras_sigmas=True, prediction_type="v_prediction",
+                                                                              final_sigmas_type="sigma_min"), {}
+    yield "euler churn", "EulerDiscreteScheduler", euler_d, dict(fixed_noise=True, step_kwargs=dict(s_churn=0.5))
+    yield "euler ancestral", "EulerAncestralDiscreteScheduler", SD_BETAS, dict(fixed_noise=True)
+    yield "euler ancestral v_prediction leading", "EulerAncestralDiscreteScheduler", dict(SD_BETAS, prediction_type="v_prediction",
+                                                                                        timestep_spacing="leading", steps_offset=1), dict(fixed_noise=True)
+    for order, algorithm, solver, karras, final in itertools.product([1, 2, 3], ["dpmsolver++", "dpmsolver"], ["midpoint", "heun"],
+                                                                     [False, True], ["zero", "sigma_min"]):
+        if algorithm == "dpmsolver" and final == "zero":
+            # rejected by diffusers
+            continue
+        for prediction in ["epsilon", "v_prediction", "sample"]:
+            if prediction != "epsilon" and (karras or solver == "heun"):
+                continue
+            yield ("dpm {} order {} {} karras={} final={} {}".format(algorithm, order, solver, karras, final, prediction),
+                   "DPMSolverMultistepScheduler",
+                   dict(SD_BETAS, solver_order=order, algorithm_type=algorithm, solver_type=solver, use_karras_sigmas=karras,
+                        final_sigmas_type=final, prediction_type=prediction), {})
+    lcm_steps = min(steps, 8)
+    yield "lcm", "LCMScheduler", {}, dict(steps=lcm_steps, fixed_noise=True)
+    yield "lcm clip_sample v_prediction", "LCMScheduler", dict(clip_sample=True, prediction_type="v_prediction"), dict(steps=lcm_steps, fixed_noise=True)
+    flux_sigmas = np.linspace(1.0, 1 / steps, steps)
+    yield "flow match schnell", "FlowMatchEulerDiscreteScheduler", dict(shift=1.0, use_dynamic_shifting=False), dict(set_kwargs=dict(sigmas=flux_sigmas))
+    yield "flow match dev mu", "FlowMatchEulerDiscreteScheduler", dict(shift=3.0, use_dynamic_shifting=True), dict(
+        set_kwargs=dict(sigmas=flux_sigmas, mu=calculate_shift(4096)))
+    yield "flow match shift", "FlowMatchEulerDiscreteScheduler", dict(shift=3.0), {}
+
+
+def check_steps(step_counts=(1, 2, 4, 20, 50), verbose=False):
+    worst = 0.0
+    cases = 0
+    for steps, inplace, cfg_shape in itertools.product(step_counts, [False, True], [False, True]):
+        for label, name, config, kwargs in step_cases(steps):
+            kwargs = dict(kwargs)
+            kwargs.setdefault("steps", steps)
+            err = compare(name, config, inplace=inplace, cfg_shape=cfg_shape, **kwargs)
+            label = "{} steps={}{}{}".format(label, kwargs["steps"], " inplace" if inplace else "", " cfg_shape" if cfg_shape else "")
+            if verbose:
+                print("{:<80} rel err {:.2e}".format(label, err))
+            assert err < TOLERANCE, (label, err)
+            worst = max(worst, err)
+            cases += 1
+    return cases, worst
+
+
+def check_add_noise():
+    samples = np.random.default_rng(0).standard_normal((2, 4, 16, 16)).astype(np.float32)
+    noise = np.random.default_rng(1).standard_normal((2, 4, 16, 16)).astype(np.float32)
+    for name, config in [("PNDMScheduler", dict(SD_BETAS, skip_prk_steps=True)),
+                         ("EulerDiscreteScheduler", dict(SD_BETAS, timestep_spacing="leading", steps_offset=1)),
+                         ("EulerAncestralDiscreteScheduler", SD_BETAS),
+                         ("DPMSolverMultistepScheduler", SD_BETAS),
+                         ("LCMScheduler", {})]:
+        ref = getattr(diffusers, name)(**config)
+        sch = getattr(ns, name)(**config)
+        ref.set_timesteps(10)
+        sch.set_timesteps(10)
+        # a strength < 1 img2img start, both batch rows at the same timestep
+        index = 1 if name == "LCMScheduler" else 3
+        timesteps = ref.timesteps[index:index + 1].repeat(2)
+        expected = ref.add_noise(torch.from_numpy(samples), torch.from_numpy(noise), timesteps).numpy()
+        result = sch.add_noise(samples, noise, timesteps.numpy())
+        assert np.allclose(expected, result, rtol=1e-5, atol=1e-5), (name, np.abs(expected - result).max())
+
+
+def check_scale_noise():
+    samples = np.random.default_rng(0).standard_normal((1, 16, 64)).astype(np.float32)
+    noise = np.random.default_rng(1).standard_normal((1, 16, 64)).astype(np.float32)
+    ref = diffusers.FlowMatchEulerDiscreteScheduler(shift=3.0)
+    sch = ns.FlowMatchEulerDiscreteScheduler(shift=3.0)
+    ref.set_timesteps(8)
+    sch.set_timesteps(8)
+    expected = ref.scale_noise(torch.from_numpy(samples), ref.timesteps[2:3], torch.from_numpy(noise)).numpy()
+    result = sch.scale_noise(samples, sch.timesteps[2:3], noise)
+    assert np.allclose(expected, result, rtol=1e-5, atol=1e-5), np.abs(expected - result).max()
+
+
+# (label, scheduler name, config, set_timesteps kwargs, timesteps, sigmas) printed by diffusers 0.30.3
+REFERENCE_TABLES = [
+    ("pndm", "PNDMScheduler", dict(SD_BETAS, skip_prk_steps=True, steps_offset=1), dict(num_inference_steps=10),
+     [901, 801, 801, 701, 601, 501, 401, 301, 201, 101, 1], None),
+    ("euler leading", "EulerDiscreteScheduler", dict(SD_BETAS, timestep_spacing="leading", steps_offset=1),
+     dict(num_inference_steps=4), [751.0, 501.0, 251.0, 1.0], [4.116698, 1.623693, 0.6983986, 0.04131448, 0.0]),
+    ("euler sd-turbo", "EulerDiscreteScheduler", dict(SD_BETAS, timestep_spacing="trailing", steps_offset=1, final_sigmas_type="zero"),
+     dict(num_inference_steps=1), [999.0], [14.61465, 0.0]),
+    ("dpm++", "DPMSolverMultistepScheduler", SD_BETAS, dict(num_inference_steps=8),
+     [999, 874, 749, 624, 500, 375, 250, 125],
+     [14.61465, 7.297354, 4.081731, 2.492532, 1.61828, 1.072486, 0.6957995, 0.3999823, 0.0]),
+    ("dpm++ karras", "DPMSolverMultistepScheduler", dict(SD_BETAS, use_karras_sigmas=True), dict(num_inference_steps=6),
+     [999, 837, 594, 249, 30, 0], [14.61465, 6.082159, 2.232161, 0.692574, 0.169758, 0.02916753, 0.0]),
+    ("lcm", "LCMScheduler", {}, dict(num_inference_steps=4), [999, 759, 499, 259], None),
+    ("flow match shift", "FlowMatchEulerDiscreteScheduler", dict(shift=3.0), dict(num_inference_steps=4),
+     [1000.0, 857.6923217773438, 602.1505737304688, 8.928571701049805], [1.0, 0.8576923, 0.6021506, 0.008928572, 0.0]),
+    ("flow match dev mu", "FlowMatchEulerDiscreteScheduler", dict(shift=3.0, use_dynamic_shifting=True),
+     dict(sigmas=np.linspace(1.0, 1 / 4, 4), mu=calculate_shift(4096)),
+     [1000.0, 904.53076171875, 759.5109252929688, 512.8441162109375], [1.0, 0.9045308, 0.7595109, 0.5128441, 0.0]),
+]
+
+
+def check_timestep_tables():
+    for label, name, config, set_kwargs, timesteps, sigmas in REFERENCE_TABLES:
+        sch = getattr(ns, name)(**config)
+        sch.set_timesteps(**set_kwargs)
+        if sch.timesteps.dtype == np.int64:
+            assert sch.timesteps.tolist() == timesteps, (label, sch.timesteps)
+        else:
+            assert np.allclose(sch.timesteps, timesteps, rtol=1e-6, atol=1e-4), (label, sch.timesteps)
+        if sigmas is not None:
+            assert np.allclose(sch.sigmas, sigmas, rtol=1e-6, atol=1e-7), (label, sch.sigmas)
+
+
+def assert_close(label, expected, result):
+    err = np.abs(expected - result).max() / max(1.0, np.abs(expected).max())
+    assert err < TOLERANCE, (label, err)
+
+
+def check_euler_closed_form():
+    # epsilon prediction: x0 = x - sigma * eps, so the Euler step is x + (sigma_next - sigma) * eps
+    sch = ns.EulerDiscreteScheduler(**dict(SD_BETAS, timestep_spacing="leading", steps_offset=1))
+    sch.set_timesteps(4)
+    latents = np.random.default_rng(0).standard_normal(SHAPE).astype(np.float32) * np.float32(sch.init_noise_sigma)
+    for i, t in enumerate(sch.timesteps):
+        sigma, sigma_next = float(sch.sigmas[i]), float(sch.sigmas[i + 1])
+        model_input = sch.scale_model_input(latents, t)
+        assert_close("euler scale_model_input {}".format(i), latents / np.sqrt(sigma ** 2 + 1), model_input)
+        eps = fake_unet(model_input, i)
+        expected = latents + (sigma_next - sigma) * eps
+        latents = sch.step(eps, t, latents)[0]
+        assert_close("euler step {}".format(i), expected, latents)
+
+
+def check_flow_match_closed_form():
+    # velocity prediction: x + (sigma_next - sigma) * v, the last step lands on sigma 0
+    sch = ns.FlowMatchEulerDiscreteScheduler(shift=3.0, use_dynamic_shifting=True)
+    sch.set_timesteps(sigmas=np.linspace(1.0, 1 / 4, 4), mu=calculate_shift(4096))
+    latents = np.random.default_rng(0).standard_normal(SHAPE).astype(np.float32)
+    for i, t in enumerate(sch.timesteps):
+        v = fake_unet(latents, i)
+        expected = latents + (float(sch.sigmas[i + 1]) - float(sch.sigmas[i])) * v
+        latents = sch.step(v, t, latents)[0]
+        assert_close("flow match step {}".format(i), expected, latents)
+
+
+def check_dpm_order1_matches_ddim():
+    # first order DPM-Solver++ is the deterministic DDIM step between the same timesteps
+    sch = ns.DPMSolverMultistepScheduler(**dict(SD_BETAS, solver_order=1, algorithm_type="dpmsolver++", final_sigmas_type="zero"))
+    sch.set_timesteps(10)
+    alphas_cumprod = sch.alphas_cumprod.astype(np.float64)
+    latents = np.random.default_rng(0).standard_normal(SHAPE).astype(np.float32)
+    for i, t in enumerate(sch.timesteps):
+        eps = fake_unet(latents, i)
+        alpha_prod = alphas_cumprod[t]
+        # final_sigmas_type="zero": the last step goes to the clean sample
+        alpha_prod_prev = alphas_cumprod[sch.timesteps[i + 1]] if i + 1 < len(sch.timesteps) else 1.0
+        x0 = (latents - np.sqrt(1 - alpha_prod) * eps) / np.sqrt(alpha_prod)
+        expected = np.sqrt(alpha_prod_prev) * x0 + np.sqrt(1 - alpha_prod_prev) * eps
+        latents = sch.step(eps, t, latents)[0]
+        assert_close("dpm++ order 1 step {}".format(i), expected, latents)
+
+
+def check_numpy_only():
+    check_timestep_tables()
+    check_euler_closed_form()
+    check_flow_match_closed_form()
+    check_dpm_order1_matches_ddim()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tests of np_schedulers, parity against diffusers")
+    # step counts
+    parser.add_argument("--steps", type=int, nargs="+", default=[1, 2, 4, 20, 50], help="numbers of inference steps to test")
+    # print every case
+    parser.add_argument("--verbose", action="store_true", help="print the error of every case")
+    # skip the diffusers parity checks
+    parser.add_argument("--numpy_only", action="store_true", help="only run the checks that need no torch and diffusers")
+    args = parser.parse_args()
+    check_numpy_only()
+    print("timestep tables, euler, flow match and dpm++ order 1 checks passed")
+    if args.numpy_only:
+        return 0
+    if diffusers is None:
+        print("parity checks not run, torch and diffusers are needed: {}".format(missing))
+        return 1
+    print("diffusers {}, torch {}".format(diffusers.__version__, torch.__version__))
+    cases, worst = check_steps(args.steps, args.verbose)
+    check_add_noise()
+    check_scale_noise()
+    print("{} step cases, max relative error {:.2e}; add_noise and scale_noise match".format(cases, worst))
+    return 0
+
+
+# pytest entry points
+def test_numpy_only():
+    check_numpy_only()
+
+
+def require_diffusers():
+    if diffusers is None:
+        import pytest
+        pytest.skip("torch and diffusers are needed: {}".format(missing))
+
+
+def test_parity_steps():
+    require_diffusers()
+    check_steps()
+
+
+def test_parity_add_noise():
+    require_diffusers()
+    check_add_noise()
+
+
+def test_parity_scale_noise():
+    require_diffusers()
+    check_scale_noise()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
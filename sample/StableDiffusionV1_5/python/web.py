@@ -17,11 +17,18 @@ import threading
 
 import gradio as gr
 import numpy as np
-import torch
 from web_stable_diffusion import StableDiffusionPipeline
-from diffusers import PNDMScheduler,EulerDiscreteScheduler
+from np_schedulers import PNDMScheduler,EulerDiscreteScheduler
+from denoise_queue import DenoiseQueue, DenoiseRequest
+from embedding_cache import EmbeddingCache
 from argparse import Namespace
 timer = None
+# 同时处理的请求数，同分辨率、同时间步的请求合并为一次unet推理
+max_concurrency = 8
+denoiser = None
+# 文本编码结果的缓存，空闲释放模型后重新加载时仍然保留
+embedding_cache = EmbeddingCache()
+lock = threading.Lock()
 
 need_load=True
 args=Namespace(controlnet_img=None, controlnet_name=None, dev_id=0, guidance_scale=0.0, model_path='../models/BM1688/',img_size=(512, 512), init_img=None, neg_prompt='None', num_inference_steps=1, processor_name=None, prompt='a cat', sd_turbo=1, stage='singlize', strength=1.0, tokenizer='../models/tokenizer_path',vae_decoder_model_path='../models/BM1688/singlize/vae_decoder_1688_f16.bmodel',vae_encoder_model_path='../models/BM1688/singlize/vae_encoder_1688_f16.bmodel',unet_model_path='../models/BM1688/singlize/unet_1688_core_1_f16.bmodel',text_encoder_model_path='../models/BM1688/singlize/text_encoder_1688_bf16.bmodel')
@@ -34,45 +41,30 @@ provided_img_size = [(128, 384), (128, 448), (128, 512), (192, 384), (192, 448),
             (448, 320), (512, 320), (448, 384), (512, 384), (512, 448), (576, 512), (640, 512), 
             (704, 512), (768, 512), (832, 512), (896, 512)]
 def timeout_callback():
-    global need_load,engine
+    global need_load,engine,denoiser
     print(need_load)
-    if(need_load == False):
-        need_load=True
-        del engine
+    with lock:
+        # 仍有请求在排队或推理时不释放模型
+        if need_load == False and denoiser.idle():
+            denoiser.stop()
+            denoiser = None
+            need_load=True
+            del engine
       
     print("5秒内没有收到新的请求")
 def reset_timer():
     global timer
-    # 如果计时器已经存在，先取消它
-    if timer:
-        timer.cancel()
-    # 重新设置计时器
-    timer = threading.Timer(10, timeout_callback)
-    timer.start()
+    with lock:
+        # 如果计时器已经存在，先取消它
+        if timer:
+            timer.cancel()
+        # 重新设置计时器
+        timer = threading.Timer(10, timeout_callback)
+        timer.start()
 def run(prompt, negative_prompt, num_inference_steps, guidance_scale, seed,width,height,strength,vae_decoder_model_path,vae_encoder_model_path,unet_model_path,text_encoder_model_path,sample):
-    global need_load,engine,args
+    global need_load,engine,denoiser,args
     print(need_load)
-    
-    args.prompt=prompt
-    args.neg_prompt=negative_prompt
-    args.num_inference_steps=num_inference_steps
-    args.guidance_scale=guidance_scale
-    args.seed=seed
-    args.strength=strength
-    if(sample=="sd_turbo"):
-        args.sd_turbo=1
-    else :
-        args.sd_turbo=0
-
-    args.vae_decoder_model_path=vae_decoder_model_path
-    args.vae_encoder_model_path=vae_encoder_model_path
-    args.text_encoder_model_path=text_encoder_model_path
-
-    args.unet_model_path=unet_model_path
-    if need_load:
-        engine = load_pipeline(args)
-     
-   
+
     print(negative_prompt)
     if args.img_size:
         height, width = args.img_size
@@ -80,38 +72,44 @@ def run(prompt, negative_prompt, num_inference_steps, guidance_scale, seed,width
             print(f'{height},{width} is not supported.')
     else:
         print('Please provide image size using --img_size.')
-    if args.prompt:
-        np.random.seed(int(seed))
-        image = engine(
-            prompt = args.prompt,
-            height = height,
-            width = width,
-            negative_prompt = args.neg_prompt,
-            init_image = args.init_img,
-            controlnet_img = args.controlnet_img,
-            strength = args.strength,
-            num_inference_steps = args.num_inference_steps,
-            guidance_scale = args.guidance_scale
-        )
-    image.save("result.png")
+    sd_turbo = 1 if sample=="sd_turbo" else 0
+    # 0表示随机种子
+    seed = int(seed) or random.randint(1, 4294967295)
+    # 每个请求使用独立的scheduler，在时间步边界加入正在进行的unet批处理
+    request = DenoiseRequest(prompt, negative_prompt, height, width, int(num_inference_steps),
+                             guidance_scale, seed, make_scheduler(sd_turbo))
+    with lock:
+        if need_load:
+            args.sd_turbo=sd_turbo
+            args.seed=seed
+            args.vae_decoder_model_path=vae_decoder_model_path
+            args.vae_encoder_model_path=vae_encoder_model_path
+            args.text_encoder_model_path=text_encoder_model_path
+            args.unet_model_path=unet_model_path
+            engine = load_pipeline(args)
+            denoiser = DenoiseQueue(engine)
+            denoiser.start()
+        # 在锁内提交，保证请求不会进入已被超时释放的队列
+        denoiser.submit(request)
+    image = request.wait()
+    # 并发请求各自保存结果
+    result_path = "result_{}.png".format(seed)
+    image.save(result_path)
     reset_timer()
 
-    return image,"result.png"
+    return image,result_path
 def signal_handler(sig, frame):
     demo.close()
     exit(0)
 
-def load_pipeline(args):
-    global need_load
-    print("开始初始化...")
-
+def make_scheduler(sd_turbo):
     scheduler = PNDMScheduler(
         beta_start=0.00085,
         beta_end=0.012,
         beta_schedule="scaled_linear",
         skip_prk_steps = True,
     )
-    if(args.sd_turbo):
+    if(sd_turbo):
         scheduler = EulerDiscreteScheduler(#sd-turbo
             beta_end=0.012,
             beta_start=0.00085,
@@ -125,8 +123,14 @@ def load_pipeline(args):
             timestep_spacing="trailing",
             timestep_type="discrete"
         )
+    return scheduler
+
+def load_pipeline(args):
+    global need_load
+    print("开始初始化...")
+
     pipeline = StableDiffusionPipeline(
-        scheduler = scheduler,
+        scheduler = make_scheduler(args.sd_turbo),
         model_path = args.model_path,
         vae_decoder_path = args.vae_decoder_model_path,
         vae_encoder_path = args.vae_encoder_model_path,
@@ -137,7 +141,8 @@ def load_pipeline(args):
         processor_name = args.processor_name,
         dev_id = args.dev_id,
         tokenizer = args.tokenizer,
-        seed=args.seed
+        seed=args.seed,
+        embedding_cache = embedding_cache
     )
     need_load=False
     print(need_load)
@@ -190,5 +195,6 @@ if __name__ == "__main__":
             fn=run,
             inputs=[prompt, negative_prompt, num_steps, guidance, seed,width,height,strength,vae_decoder_model_path,vae_encoder_model_path,unet_model_path,text_decoder_model_path,sample],
             outputs=[output_image, download_btn],
+            concurrency_limit=max_concurrency,
         )
     demo.launch(server_name="0.0.0.0")
\ No newline at end of file
@@ -11,12 +11,12 @@ import time
 import numpy as np
 from tqdm import tqdm
 from sd_engine import EngineOV
+from embedding_cache import EmbeddingCache, encoder_identity
 # import cv2
 from transformers import CLIPTokenizer
 from diffusers.utils import logging, load_image
 import PIL
 from PIL import Image
-import torch
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -66,6 +66,7 @@ class StableDiffusionPipeline():
         controlnet_name = None,
         processor_name = None,
         tokenizer = None,
+        embedding_cache = None,
         seed = -1
     
     ):
@@ -113,6 +114,8 @@ class StableDiffusionPipeline():
         # self.vae_encoder = EngineOV(vae_encoder_path, device_id = dev_id)
         self.vae_decoder = EngineOV(vae_decoder_path, device_id = dev_id)
         self.text_encoder = EngineOV(text_encoder_path, device_id = dev_id)
+        self.text_encoder_id = encoder_identity(text_encoder_path)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
         self.unet = EngineOV(unet_path, device_id = dev_id)
 
         # other config
@@ -135,6 +138,10 @@ class StableDiffusionPipeline():
         self.inference_time = 0.0
         self.vae_decoder_time = 0.0
 
+    def _encode_tokens(self, token_ids):
+        # text encoder outputs, from the embedding cache if these tokens were encoded before
+        return self.embedding_cache.encode(self.text_encoder_id, token_ids, lambda ids: self.text_encoder({"tokens": ids}))
+
     def _encode_prompt(
         self,
         prompt,
@@ -162,7 +169,7 @@ class StableDiffusionPipeline():
                 padding="max_length",
                 max_length=self.tokenizer.model_max_length,
                 truncation=True,
-                return_tensors="pt",
+                return_tensors="np",
             )
             text_input_ids = text_inputs.input_ids
 
@@ -178,7 +185,7 @@ class StableDiffusionPipeline():
             #         f" {self.tokenizer.model_max_length} tokens: {removed_text}"
             #     )
 
-            prompt_embeds = self.text_encoder({"tokens": np.array(text_input_ids)})
+            prompt_embeds = self._encode_tokens(np.array(text_input_ids))
             prompt_embeds = prompt_embeds[0]
 
         # get unconditional embeddings for classifier free guidance
@@ -208,11 +215,11 @@ class StableDiffusionPipeline():
                 padding="max_length",
                 max_length=max_length,
                 truncation=True,
-                return_tensors="pt",
+                return_tensors="np",
             )
 
             uncond_input_text_input_ids = uncond_input.input_ids
-            negative_prompt_embeds = self.text_encoder({"tokens": np.array(uncond_input_text_input_ids)})
+            negative_prompt_embeds = self._encode_tokens(np.array(uncond_input_text_input_ids))
 
             negative_prompt_embeds = negative_prompt_embeds[0]
 
@@ -342,6 +349,15 @@ class StableDiffusionPipeline():
         image = image.transpose(0, 3, 1, 2)
         return image
 
+    def decode_latents(self, latents):
+        vae_decoder_time = time.time()
+        image = self.vae_decoder({"x.1": latents / 0.18215})[0]
+        self.vae_decoder_time = time.time()-vae_decoder_time
+
+        image = (image / 2 + 0.5).clip(0, 1)
+        image = (image[0].transpose(1, 2, 0) * 255).round().astype(np.uint8)
+        return Image.fromarray(image)
+
     def __call__(
         self,
         prompt = None,
@@ -411,8 +427,8 @@ class StableDiffusionPipeline():
         shape = [batch_size, num_channels_latents, height // self.vae_scale_factor, width // self.vae_scale_factor]
 
         if init_image is None:
-            latents = torch.randn(shape, dtype=torch.float32)
-            latents = latents * self.scheduler.init_noise_sigma            
+            latents = np.random.randn(*shape).astype(np.float32)
+            latents = latents * np.float32(self.scheduler.init_noise_sigma)
             timesteps = self.scheduler.timesteps + offset
         else:
             init_image = cv2.imread(init_image)
@@ -428,7 +444,7 @@ class StableDiffusionPipeline():
             # timesteps = torch.tensor(timesteps)
             # latents = self.scheduler.add_noise(init_latents, noise, timesteps[0])
             # latents = latents.numpy()
-            latents = init_latents
+            latents = init_latents.astype(np.float32)
 
         # 6. prepare controlnet_img
         if self.controlnet:
@@ -501,13 +517,7 @@ class StableDiffusionPipeline():
 
                 # compute the previous noisy sample x_t -> x_t-1
                 # (4,64,64) () (1, 4, 64, 64)
-                temp_noise_pred = torch.from_numpy(noise_pred)
-                if(type(latents)==np.ndarray):
-                    temp_latents = torch.from_numpy(latents)
-                else:
-                    temp_latents = latents
-                latents = self.scheduler.step(temp_noise_pred, t, temp_latents, return_dict=False)[0]
-                latents = latents.numpy()
+                latents = self.scheduler.step(noise_pred, t, latents, out=latents)[0]
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
@@ -517,15 +527,8 @@ class StableDiffusionPipeline():
 
             self.inference_time = time.time()-inference_start_time
 
-        #8. vae decoder
-        vae_decoder_time = time.time()
-        image = self.vae_decoder({"x.1": latents / 0.18215})[0]
-        self.vae_decoder_time = time.time()-vae_decoder_time
-
-        #9. postprocess
-        image = (image / 2 + 0.5).clip(0, 1)
-        image = (image[0].transpose(1, 2, 0) * 255).round().astype(np.uint8)
-        pil_img = Image.fromarray(image)
+        #8. vae decoder and postprocess
+        pil_img = self.decode_latents(latents)
 
         logging.info("prompt_encoder_time(ms): {:.2f}".format(self.prompt_encoder_time * 1000))
         logging.info("inference_time(ms): {:.2f}".format(self.inference_time * 1000))
@@ -1,4 +1,6 @@
 import inspect
+import os
+import sys
 from typing import Optional
 import numpy as np
 import torch
@@ -16,6 +18,9 @@ import logging as log
 log.basicConfig(level=log.INFO)
 
 from sd_engine import EngineOV
+# embedding_cache.py is shared with the SD1.5 sample
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../StableDiffusionV1_5/python"))
+from embedding_cache import EmbeddingCache, encoder_identity
 
 HEIGHT = 1024
 WIDTH = 1024
@@ -75,8 +80,8 @@ def rescale_noise_cfg(noise_cfg, noise_pred_text, guidance_rescale=0.0):
     Rescale `noise_cfg` according to `guidance_rescale`. Based on findings of [Common Diffusion Noise Schedules and
     Sample Steps are Flawed](https://arxiv.org/pdf/2305.08891.pdf). See Section 3.4
     """
-    std_text = noise_pred_text.std(dim=list(range(1, noise_pred_text.ndim)), keepdim=True)
-    std_cfg = noise_cfg.std(dim=list(range(1, noise_cfg.ndim)), keepdim=True)
+    std_text = noise_pred_text.std(axis=tuple(range(1, noise_pred_text.ndim)), ddof=1, keepdims=True)
+    std_cfg = noise_cfg.std(axis=tuple(range(1, noise_cfg.ndim)), ddof=1, keepdims=True)
     # rescale the results from guidance (fixes overexposure)
     noise_pred_rescaled = noise_cfg * (std_text / std_cfg)
     # mix with the original results from guidance by factor guidance_rescale to avoid "plain looking" images
@@ -94,7 +99,8 @@ class StableDiffusionXLImg2ImgPipeline:
         tokenizer_2,
         unet_path,
         scheduler,
-        dev_id = 0):
+        dev_id = 0,
+        embedding_cache = None):
         self.version = "1.0.0"
 
         # module config parameter
@@ -119,6 +125,7 @@ class StableDiffusionXLImg2ImgPipeline:
         self.vae_decoder = EngineOV(vae_decoder_path, device_id = dev_id)
         self.vae_encoder = EngineOV(vae_encoder_path, device_id = dev_id)
         self.text_encoder_2 = EngineOV(te_encoder_2_path, device_id = dev_id)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
         self.text_encoder = EngineOV(te_encoder_path, device_id = dev_id)
 
     def progress_bar(self, iterable=None, total=None):
@@ -368,12 +375,18 @@ class StableDiffusionXLImg2ImgPipeline:
             shape = init_latents.shape
             noise = torch.randn(shape, generator=generator, dtype=dtype)
             # get latents
-            init_latents = self.scheduler.add_noise(init_latents, noise, timestep)
+            init_latents = self.scheduler.add_noise(init_latents.numpy(), noise.numpy(), timestep)
+        else:
+            init_latents = init_latents.numpy()
 
-        latents = init_latents
+        latents = init_latents.astype(np.float32)
 
         return latents
 
+    def _encode_tokens(self, text_encoder, token_ids):
+        # text encoder outputs (pooled and hidden states), from the embedding cache if these tokens were encoded before
+        return self.embedding_cache.encode(encoder_identity(text_encoder.model_path), token_ids, lambda ids: text_encoder({"tokens": ids}))
+
     def encode_prompt(
         self,
         prompt,
@@ -458,7 +471,7 @@ class StableDiffusionXLImg2ImgPipeline:
                         f" {tokenizer.model_max_length} tokens: {removed_text}"
                     )
 
-                prompt_embeds = text_encoder({"tokens": np.array(text_input_ids).astype("int32")})
+                prompt_embeds = self._encode_tokens(text_encoder, np.array(text_input_ids).astype("int32"))
 
                 pooled_prompt_embeds = torch.tensor(prompt_embeds[0])
 
@@ -512,7 +525,7 @@ class StableDiffusionXLImg2ImgPipeline:
                     return_tensors="pt",
                 )
 
-                negative_prompt_embeds = text_encoder({"tokens": np.array(uncond_input.input_ids)})
+                negative_prompt_embeds = self._encode_tokens(text_encoder, np.array(uncond_input.input_ids))
                 # We are only ALWAYS interested in the pooled output of the final text encoder
                 negative_pooled_prompt_embeds = torch.tensor(negative_prompt_embeds[0])
                 negative_prompt_embeds = negative_prompt_embeds[1]
@@ -708,6 +721,11 @@ class StableDiffusionXLImg2ImgPipeline:
             if self.do_classifier_free_guidance:
                 image_embeds = torch.cat([negative_image_embeds, image_embeds])
 
+        # the denoising loop runs on numpy arrays, the unet inputs are converted once here
+        prompt_embeds = prompt_embeds.numpy().astype(np.float32)
+        add_text_embeds = add_text_embeds.numpy().astype(np.float32)
+        add_time_ids = add_time_ids.numpy().astype(np.float32)
+
         # 9. Denoising loop
         num_warmup_steps = max(len(timesteps) - num_inference_steps * self.scheduler.order, 0) 
 
@@ -741,18 +759,18 @@ class StableDiffusionXLImg2ImgPipeline:
             inference_start_time = time.time()
             for i, t in enumerate(timesteps):
                 # expand the latents if we are doing classifier free guidance
-                latent_model_input = torch.cat([latents] * 2) if self.do_classifier_free_guidance else latents
+                latent_model_input = np.concatenate([latents] * 2) if self.do_classifier_free_guidance else latents
 
                 latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
 
                 # # predict the noise residual
                 timestep = np.array([t]).astype(np.float32)
                 noise_pred = self.unet(
-                    {'latent.1':latent_model_input.numpy().astype(np.float32),
+                    {'latent.1':latent_model_input,
                     't.1': timestep,
-                    'prompt_embeds.1': prompt_embeds.numpy().astype(np.float32),
-                    "text_embeds": add_text_embeds.numpy().astype(np.float32),
-                    "time_ids": add_time_ids.numpy().astype(np.float32)}
+                    'prompt_embeds.1': prompt_embeds,
+                    "text_embeds": add_text_embeds,
+                    "time_ids": add_time_ids}
                 )[0]
 
                 # perform guidance
@@ -762,12 +780,10 @@ class StableDiffusionXLImg2ImgPipeline:
 
                 if self.do_classifier_free_guidance and self.guidance_rescale > 0.0:
                     # # Based on 3.4. in https://arxiv.org/pdf/2305.08891.pdf
-                    noise_pred = rescale_noise_cfg(torch.from_numpy(noise_pred), torch.from_numpy(noise_pred_text), guidance_rescale=self.guidance_rescale)
-                    noise_pred.numpy()
+                    noise_pred = rescale_noise_cfg(noise_pred, noise_pred_text, guidance_rescale=self.guidance_rescale)
 
                 # compute the previous noisy sample x_t -> x_t-1
-                temp_noise_pred = torch.from_numpy(noise_pred)
-                latents = self.scheduler.step(temp_noise_pred, t, latents, **extra_step_kwargs, return_dict=False)[0]
+                latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs, out=latents)[0]
 
                 # call the callback, if provided
                 if i == len(timesteps) - 1 or ((i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0):
@@ -779,7 +795,7 @@ class StableDiffusionXLImg2ImgPipeline:
 
         # self.vae.config.scaleing_factor is 0.13025, varies among different vae
         vae_decoder_start_time = time.time()
-        image = self.vae_decoder({"x.1": (latents / self.vae_config_scaling_factor).numpy().astype(np.float32)})[0]
+        image = self.vae_decoder({"x.1": latents / np.float32(self.vae_config_scaling_factor)})[0]
         self.vae_decoder_time = time.time()-vae_decoder_start_time
         image = self.image_processor.postprocess(torch.from_numpy(image), output_type = 'pil')
 
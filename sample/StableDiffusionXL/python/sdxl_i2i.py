@@ -1,9 +1,13 @@
-from StableDiffusionPipelineImg2Img import StableDiffusionXLImg2ImgPipeline
 import argparse
 import os
+import sys
+# np_schedulers.py and embedding_cache.py are shared with the SD1.5 sample
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../StableDiffusionV1_5/python"))
+from StableDiffusionPipelineImg2Img import StableDiffusionXLImg2ImgPipeline
 from PIL import Image
 from transformers import CLIPTokenizer
-from diffusers.schedulers import EulerDiscreteScheduler
+from np_schedulers import EulerDiscreteScheduler
+from embedding_cache import EmbeddingCache
 
 scheduler_config = {'Euler D':{
         "_class_name": "EulerDiscreteScheduler",
@@ -32,7 +36,8 @@ def load_pipe(args):
         tokenizer_2 = tokenzier_2,
         unet_path = os.path.join(args.model_path, "unet_base_1684x_bf16.bmodel"),
         scheduler = EulerDiscreteScheduler(**(scheduler_config["Euler D"])),
-        dev_id = args.dev_id)
+        dev_id = args.dev_id,
+        embedding_cache = EmbeddingCache(args.embed_cache_mb, args.embed_cache_dir))
 
     return pipe
 
@@ -71,6 +76,9 @@ if __name__ == "__main__":
     parser.add_argument("--strength", type=float, default=0.7, help="strength for referenced image, it is an inverse proportional weight")
     # dev_id
     parser.add_argument("--dev_id", type=int, default=0, help="device id")
+    # prompt embedding cache
+    parser.add_argument("--embed_cache_mb", type=float, default=64, help="memory of the prompt embedding cache in MB, 0 disables it")
+    parser.add_argument("--embed_cache_dir", type=str, default=None, help="directory to keep prompt embeddings between runs")
     try:
         args = parser.parse_args()
     except SystemExit as e:
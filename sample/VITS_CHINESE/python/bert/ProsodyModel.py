@@ -14,6 +14,7 @@ class TTSProsody(object):
         self.input_names = self.net.get_input_names(self.graph_name)
         self.output_names = self.net.get_output_names(self.graph_name)
         self.input_shape = self.net.get_input_shape(self.graph_name, self.input_names[0])
+        self.batch_size = self.input_shape[0]
         self.max_length = self.input_shape[1]
 
         self.tokenizer = BertTokenizer.from_pretrained("./python/bert")
@@ -53,6 +54,31 @@ class TTSProsody(object):
 
         return char_embeds
 
+    def get_char_embeds_batch(self, texts):
+        """
+        Run BERT over several texts, packing up to `batch_size` texts into one call.
+        Returns one [max_length, hidden] array per text, the same as get_char_embeds.
+        """
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            input_ids_array = np.zeros((self.batch_size, self.max_length), dtype=np.int32)
+            input_masks_array = np.zeros((self.batch_size, self.max_length), dtype=np.int32)
+            type_ids_array = np.zeros((self.batch_size, self.max_length), dtype=np.int32)
+            for i, text in enumerate(batch):
+                input_ids = self.text2Token(text)
+                assert len(input_ids) <= self.max_length
+                input_ids_array[i, :len(input_ids)] = input_ids
+                input_masks_array[i, :len(input_ids)] = 1
+
+            input_data = {self.input_names[0]: input_ids_array,
+                          self.input_names[1]: input_masks_array,
+                          self.input_names[2]: type_ids_array}
+            output_data = self.net.process(self.graph_name, input_data)
+            char_embeds = output_data[self.output_names[0]]
+            results.extend(char_embeds[i] for i in range(len(batch)))
+        return results
+
     def expand_for_phone(self, char_embeds: np.ndarray, length):  # length of phones for char
         assert char_embeds.shape[0] >= len(length)
 
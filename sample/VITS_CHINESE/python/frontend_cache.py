@@ -0,0 +1,117 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class FrontEndCache:
+    """
+    Bounded cache of the VITS text front-end results: phoneme ids, BERT char embeddings
+    (one row per char, before expand_for_phone) and the phone count of every char.
+
+    Entries are kept in a memory LRU of `max_size` texts; if `cache_dir` is set they are
+    also stored as npz files, so repeated prompts survive restarts. `namespace` (usually
+    the BERT bmodel name) is part of the on-disk key, so switching models never returns
+    stale embeddings. The directory is bounded by `max_disk_mb`: after every write the least
+    recently used files (by mtime, refreshed on every disk hit) beyond it are removed.
+    """
+    def __init__(self, max_size=1024, cache_dir=None, namespace="", max_disk_mb=256):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = int(max_disk_mb * 2 ** 20)
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 or bool(self.cache_dir)
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split())
+
+    def _path(self, key):
+        digest = hashlib.sha1((self.namespace + "\n" + key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".npz")
+
+    def _remember(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, text):
+        """Return (input_ids, char_embeds, count_phone) of `text`, or None."""
+        if not self.enabled:
+            return None
+        key = self.normalize(text)
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with np.load(path) as f:
+                    char_embeds = f["char_embeds"] if "char_embeds" in f else None
+                    value = (f["input_ids"], char_embeds, f["count_phone"].tolist())
+                # the mtime orders the files for pruning
+                os.utime(path)
+            except FileNotFoundError:
+                # never written, or pruned meanwhile
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, text, input_ids, char_embeds, count_phone):
+        if not self.enabled:
+            return
+        key = self.normalize(text)
+        self._remember(key, (input_ids, char_embeds, count_phone))
+        if self.cache_dir:
+            arrays = {"input_ids": input_ids, "count_phone": np.array(count_phone, dtype=np.int32)}
+            if char_embeds is not None:
+                arrays["char_embeds"] = char_embeds
+            path = self._path(key)
+            tmp_path = "{}.{}.tmp.npz".format(path[:-len(".npz")], os.getpid())
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path)
+            self.prune()
+
+    def prune(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        return "cache hits: {}, disk hits: {}, misses: {}".format(self.hits, self.disk_hits, self.misses)
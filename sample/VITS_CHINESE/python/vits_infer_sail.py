@@ -13,6 +13,7 @@ if platform.machine() != 'aarch64':
 from pypinyin import lazy_pinyin, Style
 from pypinyin.core import load_phrases_dict
 from bert import TTSProsody
+from frontend_cache import FrontEndCache
 logging.basicConfig(level=logging.INFO)
 
 
@@ -29,7 +30,9 @@ class VITS:
         self.input_shape = self.net.get_input_shape(self.graph_name, self.input_names[0])
         self.max_length = self.input_shape[1]
 
-        self.tts_front = VITS_PinYin(args.bert_model, args.dev_id, hasBert=True)
+        self.tts_front = VITS_PinYin(args.bert_model, args.dev_id, hasBert=True,
+                                     cache_size=args.cache_size, cache_dir=args.cache_dir,
+                                     cache_disk_mb=args.cache_disk_mb)
         self.preprocess_time = 0.0
         self.inference_time = 0.0
         self.postprocess_time = 0.0
@@ -128,16 +131,20 @@ class VITS:
         return split_texts
 
     def preprocess(self, split_item:list):
-        logging.info(split_item)
-        phonemes, char_embeds = self.tts_front.chinese_to_phonemes(split_item)
-        input_ids = cleaned_text_to_sequence(phonemes)
-        char_embeds = np.expand_dims(char_embeds, 0)
-        x = np.array(input_ids, dtype=np.int32)
-        x = np.expand_dims(x, axis=0) if x.ndim == 1 else x
-        if x.shape[1] < self.max_length:
-            padding_size = self.max_length - x.shape[1]
-            x = np.pad(x, [(0, 0), (0, padding_size)], mode='constant', constant_values=0)
-        return x,char_embeds
+        return self.preprocess_batch([split_item])[0]
+
+    def preprocess_batch(self, split_items:list):
+        # cached sentences skip pypinyin and BERT, the others share BERT calls
+        results = []
+        for split_item, (x, char_embeds) in zip(split_items, self.tts_front.batch_text_to_inputs(split_items)):
+            logging.info(split_item)
+            char_embeds = np.expand_dims(char_embeds, 0)
+            x = np.expand_dims(x, axis=0) if x.ndim == 1 else x
+            if x.shape[1] < self.max_length:
+                padding_size = self.max_length - x.shape[1]
+                x = np.pad(x, [(0, 0), (0, padding_size)], mode='constant', constant_values=0)
+            results.append((x, char_embeds))
+        return results
 
     def postprocess(self,output_data:dict,outputs:list):
         y_max, y_segment = output_data.values()
@@ -212,13 +219,15 @@ def load_pinyin_dict():
 
 
 class VITS_PinYin:
-    def __init__(self, bert_model, dev_id, hasBert=True):
+    def __init__(self, bert_model, dev_id, hasBert=True, cache_size=1024, cache_dir=None, cache_disk_mb=256):
         load_pinyin_dict()
         self.hasBert = hasBert
         if self.hasBert:
             self.prosody = TTSProsody(bert_model, dev_id)
         if platform.machine() != 'aarch64':
             self.normalizer = Normalizer()
+        self.cache = FrontEndCache(cache_size, cache_dir, namespace=os.path.basename(bert_model),
+                                   max_disk_mb=cache_disk_mb)
 
     def get_phoneme4pinyin(self, pinyins):
         result = []
@@ -232,7 +241,7 @@ class VITS_PinYin:
                 count_phone.append(2)
         return result, count_phone
 
-    def chinese_to_phonemes(self, text):
+    def text_to_chars(self, text):
         if platform.machine() != 'aarch64':
             text = self.normalizer.normalize(text)
         text = clean_chinese(text)
@@ -255,6 +264,10 @@ class VITS_PinYin:
         count_phone.append(1)
         chars.append('[PAD]')
         chars = "".join(chars)
+        return phonemes, chars, count_phone
+
+    def chinese_to_phonemes(self, text):
+        phonemes, chars, count_phone = self.text_to_chars(text)
         char_embeds = None
 
         if self.hasBert:
@@ -262,6 +275,46 @@ class VITS_PinYin:
             char_embeds = self.prosody.expand_for_phone(char_embeds, count_phone)
         return " ".join(phonemes), char_embeds
 
+    def batch_text_to_inputs(self, texts):
+        """
+        Return (phoneme ids, expanded char embeds) for every text. Results come from
+        self.cache when possible; the uncached texts are converted to pinyin and sent
+        to BERT together, and then added to the cache.
+        """
+        entries = {}
+        pending = {}
+        for text in texts:
+            key = self.cache.normalize(text)
+            if key in entries or key in pending:
+                continue
+            cached = self.cache.get(text)
+            if cached is not None:
+                entries[key] = cached
+                continue
+            phonemes, chars, count_phone = self.text_to_chars(text)
+            input_ids = np.array(cleaned_text_to_sequence(" ".join(phonemes)), dtype=np.int32)
+            pending[key] = (text, input_ids, chars, count_phone)
+
+        if pending:
+            items = list(pending.items())
+            if self.hasBert:
+                char_embeds_list = self.prosody.get_char_embeds_batch([item[2] for _, item in items])
+            else:
+                char_embeds_list = [None] * len(items)
+            for (key, (text, input_ids, chars, count_phone)), char_embeds in zip(items, char_embeds_list):
+                if char_embeds is not None:
+                    char_embeds = char_embeds[:len(count_phone)].astype(np.float32)
+                entries[key] = (input_ids, char_embeds, count_phone)
+                self.cache.put(text, input_ids, char_embeds, count_phone)
+
+        results = []
+        for text in texts:
+            input_ids, char_embeds, count_phone = entries[self.cache.normalize(text)]
+            if char_embeds is not None:
+                char_embeds = self.prosody.expand_for_phone(char_embeds, count_phone)
+            results.append((input_ids, char_embeds))
+        return results
+
     def correct_pinyin_tone3(self, text):
         pinyin_list = lazy_pinyin(text,
                                   style=Style.TONE3,
@@ -279,6 +332,9 @@ def main():
     parser.add_argument('--bert_model', type=str, default='./bmodel/bert_1684x_f32.bmodel', help='path of bert config')
     parser.add_argument('--text_file', type=str, default='vits_infer_item.txt', help='path of text')
     parser.add_argument('--dev_id', type=int, default=0, help='dev id')
+    parser.add_argument('--cache_size', type=int, default=1024, help='number of sentences kept in the front-end memory cache, 0 to disable')
+    parser.add_argument('--cache_dir', type=str, default=None, help='directory of the on-disk front-end cache, disabled by default')
+    parser.add_argument('--cache_disk_mb', type=float, default=256, help='size limit of the on-disk front-end cache in MB, least recently used files beyond it are removed')
     args = parser.parse_args()
     vits = VITS(args)
 
@@ -301,9 +357,12 @@ def main():
         n += 1
         # cut log items, str len <= 64
         split_items = vits.split_text_near_punctuation(item, int(vits.max_length / 2 - 5))
+        start_time = time.time()
+        inputs = vits.preprocess_batch(split_items)
+        vits.preprocess_time += time.time() - start_time
         output_audio =[]
-        for split_item in split_items:
-            output_audio.append(vits(split_item))
+        for x, char_embeds in inputs:
+            output_audio.append(vits.inference(x, char_embeds))
 
         audio_path = f"{results_path}sail_{n}.wav"
         soundfile.write(
@@ -319,6 +378,7 @@ def main():
     logging.info("text nums: {}, inference_time(ms): {:.2f}".format(n, vits.inference_time * 1000))
     logging.info("text nums: {}, postprocess_time(ms): {:.2f}".format(n, vits.postprocess_time * 1000))
     logging.info("text nums: {}, total_time(ms): {:.2f}".format(n, total_time * 1000))
+    logging.info("front-end {}".format(vits.tts_front.cache.stats()))
 
 
 if __name__ == "__main__":
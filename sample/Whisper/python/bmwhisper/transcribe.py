@@ -21,11 +21,13 @@ from .utils import (
     N_FRAMES,
     N_SAMPLES,
     SAMPLE_RATE,
+    load_audio,
     log_mel_spectrogram,
     pad_or_trim,
 )
 from .decoding import DecodingOptions, DecodingResult
 from .tokenizer import LANGUAGES, TO_LANGUAGE_CODE, get_tokenizer
+from .vad import VadOptions, SpeechTimestampsMap, collect_chunks, get_speech_timestamps
 from .utils import (
     exact_div,
     format_timestamp,
@@ -55,6 +57,8 @@ def transcribe(
     word_timestamps: bool = False,
     prepend_punctuations: str = "\"'“¿([{-",
     append_punctuations: str = "\"'.。,，!！?？:：”)]}、",
+    vad_filter: bool = False,
+    vad_options: Optional[VadOptions] = None,
     **decode_options,
 ):
     """
@@ -106,6 +110,14 @@ def transcribe(
         "prompt-engineer" a context for transcription, e.g. custom vocabularies or proper nouns
         to make it more likely to predict those word correctly.
 
+    vad_filter: bool
+        Run an energy/spectral voice activity detector before decoding and only feed the speech
+        regions to the model, so that silent windows never reach the encoder and decoder.
+        Timestamps are mapped back to the original audio.
+
+    vad_options: Optional[VadOptions]
+        Thresholds of the voice activity detector, see `VadOptions`
+
     decode_options: dict
         Keyword arguments to construct `DecodingOptions` instances
 
@@ -118,6 +130,22 @@ def transcribe(
     dtype = torch.float16
 
     start_time = time.time()
+    speech_map = None
+    if vad_filter:
+        if isinstance(audio, str):
+            audio = load_audio(audio)
+        elif torch.is_tensor(audio):
+            audio = audio.numpy()
+        audio_duration = audio.shape[-1] / SAMPLE_RATE
+        # drop the silences, windows are then packed with speech and start at speech onsets
+        speech_chunks = get_speech_timestamps(audio, vad_options or VadOptions())
+        audio = collect_chunks(audio, speech_chunks)
+        speech_map = SpeechTimestampsMap(speech_chunks)
+        if verbose is not None:
+            print(
+                f"VAD kept {audio.shape[-1] / SAMPLE_RATE:.2f}s of speech out of {audio_duration:.2f}s"
+            )
+
     # Pad 30-seconds of silence to the input audio, for slicing
     mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
 
@@ -381,6 +409,9 @@ def transcribe(
             # update progress bar
             pbar.update(min(content_frames, seek) - previous_seek)
 
+    if speech_map is not None:
+        speech_map.restore_segments(all_segments)
+
     return dict(
         text=tokenizer.decode(all_tokens[len(initial_prompt_tokens) :]),
         segments=all_segments,
@@ -426,6 +457,9 @@ def cli():
     parser.add_argument("--highlight_words", type=str2bool, default=False, help="(requires --word_timestamps True) underline each word as it is spoken in srt and vtt")
     parser.add_argument("--max_line_width", type=optional_int, default=None, help="(requires --word_timestamps True) the maximum number of characters in a line before breaking the line")
     parser.add_argument("--max_line_count", type=optional_int, default=None, help="(requires --word_timestamps True) the maximum number of lines in a segment")
+    parser.add_argument("--vad_filter", type=str2bool, default=False, help="whether to skip the silent parts of the audio with an energy/spectral voice activity detector before decoding")
+    parser.add_argument("--vad_threshold", type=float, default=12.0, help="(requires --vad_filter True) energy in dB above the estimated noise floor for a frame to count as speech")
+    parser.add_argument("--vad_min_silence_duration_ms", type=int, default=1000, help="(requires --vad_filter True) silences shorter than this do not split speech regions")
     parser.add_argument("--threads", type=optional_int, default=0, help="number of threads used by torch for CPU inference; supercedes MKL_NUM_THREADS/OMP_NUM_THREADS")
     parser.add_argument("--padding_size", type=optional_int, default=448, help="max pre-allocation size for the key-value cache")
     parser.add_argument("--loop_profile", action="store_true", help="whether to print loop times")
@@ -452,6 +486,11 @@ def cli():
     else:
         temperature = [temperature]
 
+    args["vad_options"] = VadOptions(
+        energy_threshold_db=args.pop("vad_threshold"),
+        min_silence_duration_ms=args.pop("vad_min_silence_duration_ms"),
+    )
+
     if (threads := args.pop("threads")) > 0:
         torch.set_num_threads(threads)
 
@@ -0,0 +1,198 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2024 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from .utils import HOP_LENGTH, N_FFT, SAMPLE_RATE
+
+
+@dataclass(frozen=True)
+class VadOptions:
+    # a frame is speech when its energy is this many dB above the estimated noise floor
+    energy_threshold_db: float = 12.0
+    # never put the threshold lower than `peak - max_dynamic_range_db`, so recordings
+    # without any silence are not cut inside words
+    max_dynamic_range_db: float = 30.0
+    # percentile of the frame energies used as the noise floor estimate
+    noise_floor_percentile: float = 10.0
+    # minimum share of the frame energy inside the 300-3400 Hz speech band
+    min_speech_band_ratio: float = 0.3
+    # spectral flatness above this value is treated as noise (white noise is 1.0)
+    max_spectral_flatness: float = 0.5
+    # speech regions shorter than this are dropped
+    min_speech_duration_ms: int = 250
+    # silences shorter than this do not split speech regions
+    min_silence_duration_ms: int = 1000
+    # padding added to both sides of every speech region
+    speech_pad_ms: int = 200
+
+
+def frame_features(
+    audio: np.ndarray,
+    frame_length: int = N_FFT,
+    hop_length: int = HOP_LENGTH * 2,
+    sample_rate: int = SAMPLE_RATE,
+    block_frames: int = 4096,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the per-frame energy (dB), speech band energy ratio and spectral flatness.
+
+    The frames are strided views into `audio`; the FFT is computed in blocks of
+    `block_frames` frames so that memory does not grow with the audio length.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.shape[-1] < frame_length:
+        audio = np.pad(audio, (0, frame_length - audio.shape[-1]))
+    frames = np.lib.stride_tricks.sliding_window_view(audio, frame_length)[::hop_length]
+    n_frames = frames.shape[0]
+
+    window = np.hanning(frame_length).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_length, 1.0 / sample_rate)
+    band = (freqs >= 300) & (freqs <= 3400)
+
+    energy_db = np.empty(n_frames, dtype=np.float32)
+    band_ratio = np.empty(n_frames, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+    for start in range(0, n_frames, block_frames):
+        end = min(start + block_frames, n_frames)
+        power = np.abs(np.fft.rfft(frames[start:end] * window, axis=-1)) ** 2 + 1e-10
+        total = power.sum(axis=-1)
+        energy_db[start:end] = 10.0 * np.log10(total)
+        band_ratio[start:end] = power[:, band].sum(axis=-1) / total
+        flatness[start:end] = np.exp(np.log(power).mean(axis=-1)) / power.mean(axis=-1)
+
+    return energy_db, band_ratio, flatness
+
+
+def _mask_to_regions(mask: np.ndarray) -> np.ndarray:
+    """Return [start, end) frame index pairs of the runs of True in `mask`."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=-1)
+
+
+def get_speech_timestamps(
+    audio: np.ndarray,
+    options: VadOptions = VadOptions(),
+    sample_rate: int = SAMPLE_RATE,
+) -> List[Tuple[int, int]]:
+    """
+    Find the speech regions of a waveform with an energy/spectral voice activity detector
+
+    Parameters
+    ----------
+    audio: np.ndarray, shape = (n_samples,)
+        The waveform in float32, sampled at `sample_rate`
+
+    options: VadOptions
+        The detector thresholds and smoothing durations
+
+    Returns
+    -------
+    A list of (start, end) sample offsets of the speech regions, sorted and non-overlapping.
+    """
+    hop_length = HOP_LENGTH * 2
+    n_samples = audio.shape[-1]
+    energy_db, band_ratio, flatness = frame_features(audio, hop_length=hop_length, sample_rate=sample_rate)
+
+    noise_floor = np.percentile(energy_db, options.noise_floor_percentile)
+    threshold = min(
+        noise_floor + options.energy_threshold_db,
+        energy_db.max() - options.max_dynamic_range_db,
+    )
+    is_speech = (
+        (energy_db > threshold)
+        & (band_ratio > options.min_speech_band_ratio)
+        & (flatness < options.max_spectral_flatness)
+    )
+
+    regions = _mask_to_regions(is_speech)
+    if len(regions) == 0:
+        return []
+
+    frames_per_ms = sample_rate / hop_length / 1000.0
+    # close the gaps that are too short to count as silence
+    min_silence = options.min_silence_duration_ms * frames_per_ms
+    keep = np.concatenate(([True], regions[1:, 0] - regions[:-1, 1] >= min_silence))
+    last = np.r_[np.flatnonzero(keep)[1:] - 1, len(regions) - 1]
+    merged = np.stack([regions[keep, 0], regions[last, 1]], axis=-1)
+
+    # drop blips that are too short to be speech
+    min_speech = options.min_speech_duration_ms * frames_per_ms
+    merged = merged[merged[:, 1] - merged[:, 0] >= min_speech]
+    if len(merged) == 0:
+        return []
+
+    # frames -> samples, pad and merge the regions that overlap after padding
+    pad = options.speech_pad_ms * sample_rate // 1000
+    starts = np.maximum(merged[:, 0] * hop_length - pad, 0)
+    ends = np.minimum((merged[:, 1] - 1) * hop_length + N_FFT + pad, n_samples)
+    speech = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if speech and start <= speech[-1][1]:
+            speech[-1] = (speech[-1][0], max(speech[-1][1], end))
+        else:
+            speech.append((start, end))
+    return speech
+
+
+def collect_chunks(audio: np.ndarray, chunks: List[Tuple[int, int]]) -> np.ndarray:
+    """Concatenate the speech regions of `audio` into one contiguous waveform."""
+    if not chunks:
+        return np.zeros(0, dtype=audio.dtype)
+    return np.concatenate([audio[start:end] for start, end in chunks])
+
+
+class SpeechTimestampsMap:
+    """
+    Map timestamps measured on the collected (speech only) waveform back to the original audio
+    """
+
+    def __init__(self, chunks: List[Tuple[int, int]], sample_rate: int = SAMPLE_RATE):
+        chunks = np.asarray(chunks, dtype=np.int64).reshape(-1, 2)
+        lengths = chunks[:, 1] - chunks[:, 0]
+        self.sample_rate = sample_rate
+        # start of every chunk on the collected and on the original timeline, in samples
+        self.chunk_end_collected = np.cumsum(lengths)
+        self.chunk_start_collected = self.chunk_end_collected - lengths
+        self.chunk_start_original = chunks[:, 0]
+
+    def get_original_time(self, time: float, is_end: bool = False) -> float:
+        """
+        Parameters
+        ----------
+        time: float
+            Seconds on the collected timeline
+
+        is_end: bool
+            If True, a time that falls exactly on a chunk boundary is mapped to the end of the
+            previous chunk instead of the start of the next one
+        """
+        if len(self.chunk_start_original) == 0:
+            return time
+        sample = time * self.sample_rate
+        side = "left" if is_end else "right"
+        index = np.searchsorted(self.chunk_start_collected, sample, side=side) - 1
+        index = int(np.clip(index, 0, len(self.chunk_start_original) - 1))
+        offset = self.chunk_start_original[index] - self.chunk_start_collected[index]
+        return round(float(sample + offset) / self.sample_rate, 3)
+
+    def restore_segments(self, segments: List[dict]):
+        """Rewrite the segment, word and seek timestamps of a transcription in place."""
+        for segment in segments:
+            if "words" in segment:
+                for word in segment["words"]:
+                    word["start"] = self.get_original_time(word["start"])
+                    word["end"] = self.get_original_time(word["end"], is_end=True)
+            seek_time = self.get_original_time(segment["seek"] * HOP_LENGTH / self.sample_rate)
+            segment["seek"] = round(seek_time * self.sample_rate / HOP_LENGTH)
+            segment["start"] = self.get_original_time(segment["start"])
+            segment["end"] = self.get_original_time(segment["end"], is_end=True)
+        return segments
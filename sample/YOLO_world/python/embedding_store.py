@@ -0,0 +1,101 @@
+#===----------------------------------------------------------------------===#
+#
+# Copyright (C) 2022 Sophgo Technologies Inc.  All rights reserved.
+#
+# SOPHON-DEMO is licensed under the 2-Clause BSD License except for the
+# third-party components.
+#
+#===----------------------------------------------------------------------===#
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+
+
+def model_hash(path, extra=b""):
+    """sha1 of the text model file (plus e.g. the text projection), used to key the store"""
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    sha1.update(extra)
+    return sha1.hexdigest()[:16]
+
+
+class EmbeddingStore:
+    """
+    Normalized CLIP text embedding of every class name seen so far.
+
+    With `cache_dir` the store lives in `cache_dir/<model hash>/`: `embeddings.npy` holds one
+    row per class and is opened as a memmap, `classes.json` maps the rows to the class names.
+    Unseen names are appended, so switching vocabularies only encodes the new words, also
+    across restarts. Without `cache_dir` the store is kept in memory only.
+    """
+    def __init__(self, cache_dir=None, model_key=""):
+        self.store_dir = os.path.join(cache_dir, model_key) if cache_dir else None
+        self.index = {}
+        self.embeddings = None
+        if self.store_dir is not None:
+            os.makedirs(self.store_dir, exist_ok=True)
+            self.load()
+
+    @property
+    def classes_path(self):
+        return os.path.join(self.store_dir, "classes.json")
+
+    @property
+    def embeddings_path(self):
+        return os.path.join(self.store_dir, "embeddings.npy")
+
+    def load(self):
+        if not os.path.exists(self.classes_path) or not os.path.exists(self.embeddings_path):
+            return
+        with open(self.classes_path, "r", encoding="utf-8") as f:
+            names = json.load(f)
+        embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        # rows are written before the names, a row without a name is ignored
+        names = names[:embeddings.shape[0]]
+        self.index = {name: i for i, name in enumerate(names)}
+        self.embeddings = embeddings
+        logging.info("load {} text embeddings from {}".format(len(names), self.store_dir))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def lookup(self, names):
+        """dict of name -> embedding for the names already in the store"""
+        return {name: np.array(self.embeddings[self.index[name]]) for name in names if name in self.index}
+
+    def add(self, names, embeddings):
+        new = {}
+        for name, embedding in zip(names, embeddings):
+            if name not in self.index and name not in new:
+                new[name] = embedding
+        if not new:
+            return
+        names = list(new)
+        rows = np.stack(list(new.values())).astype(np.float32)
+        start = len(self.index)
+        if self.embeddings is None:
+            merged = rows
+        else:
+            merged = np.concatenate([self.embeddings[:start], rows], axis=0)
+        for i, name in enumerate(names):
+            self.index[name] = start + i
+
+        if self.store_dir is None:
+            self.embeddings = merged
+            return
+        tmp_path = "{}.{}.tmp".format(self.embeddings_path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.save(f, merged)
+        os.replace(tmp_path, self.embeddings_path)
+        tmp_path = "{}.{}.tmp".format(self.classes_path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sorted(self.index, key=self.index.get), f, ensure_ascii=False)
+        os.replace(tmp_path, self.classes_path)
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
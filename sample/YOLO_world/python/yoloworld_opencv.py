@@ -15,39 +15,44 @@ import numpy as np
 import clip as clip
 import sophon.sail as sail
 import logging
-import torch
 
 from postprocess_numpy import PostProcess
+from embedding_store import EmbeddingStore, model_hash
 from utils import COCO_CLASSES, COLORS
 logging.basicConfig(level=logging.INFO)
 
 class TextEmbedder:
-    def __init__(self,args):
+    def __init__(self, args):
         # self.device = select_device(device)
         self.clip_model, _ = clip.load(args.clip_bmodel, args.dev_id)
+        model_key = model_hash(args.clip_bmodel, self.clip_model.text_projection.tobytes()) if args.embedding_cache_dir else ""
+        self.store = EmbeddingStore(args.embedding_cache_dir, model_key)
 
     def __call__(self, text):
         return self.embed_text(text)
 
+    def encode(self, text):
+        # all names in one call, encode_text splits them by the clip bmodel batch size
+        text_token = clip.tokenize(text).numpy()
+        txt_feats = self.clip_model.encode_text(text_token).astype(np.float32)
+        txt_feats /= np.linalg.norm(txt_feats, axis=1, keepdims=True)
+        return txt_feats
+
     def embed_text(self, text):
         if not isinstance(text, list):
             text = [text]
 
-        text_token = clip.tokenize(text).to("cpu")
-        tokens = text_token.split(1)
-        txt_feats = []
-        for token in tokens:
-            encoded_token = self.clip_model.encode_text(token)  # 编码
-            #print("encoded_token:",encoded_token)
-            detached_token =torch.Tensor(encoded_token).detach()
-            #detached_token = encoded_token.detach()              # 分离
-            txt_feats.append(detached_token)                     # 添加到列表中
+        # only the names never seen before go through the clip text model
+        txt_feats = self.store.lookup(text)
+        unseen = [name for name in dict.fromkeys(text) if name not in txt_feats]
+        if unseen:
+            logging.info("encode {} new class names: {}".format(len(unseen), unseen))
+            encoded = self.encode(unseen)
+            self.store.add(unseen, encoded)
+            txt_feats.update(zip(unseen, encoded))
 
-        txt_feats = torch.cat(txt_feats, dim=0)
-        txt_feats /= txt_feats.norm(dim=1, keepdim=True)
-        txt_feats = txt_feats.unsqueeze(0)
-
-        return txt_feats
+        txt_feats = np.stack([txt_feats[name] for name in text])
+        return txt_feats[None]
 
 class YOLOworld:
     def __init__(self, args):
@@ -106,13 +111,7 @@ class YOLOworld:
         self.postprocess_time = 0.0
 
         self.text_embedder = TextEmbedder(args)
-        num_nan_to_add = self.num_classes - len(args.class_names)
-        num_classes_extended = args.class_names + ['nan'] * num_nan_to_add
-
-        self.class_embeddings = self.text_embedder(num_classes_extended)
-
-        class_embeddings = self.prepare_embeddings(self.class_embeddings)
-        return class_embeddings
+        return self.set_classes(args.class_names)
 
     def preprocess(self, ori_img):
         """
@@ -139,11 +138,29 @@ class YOLOworld:
         img = np.ascontiguousarray(img / 255.0)
         return img, ratio, (tx1, ty1) 
 
+    def set_classes(self, class_names):
+        """
+        class embeddings of a new vocabulary, the embeddings of known class names come from the store
+        Args:
+            class_names: list of str, not more than the class number of the bmodel
+
+        Returns: (1, num_classes, dim) numpy.ndarray
+        """
+        if len(class_names) > self.num_classes:
+            raise ValueError("the bmodel supports at most {} class names".format(self.num_classes))
+        num_nan_to_add = self.num_classes - len(class_names)
+        num_classes_extended = list(class_names) + ['nan'] * num_nan_to_add
+
+        self.class_embeddings = self.text_embedder(num_classes_extended)
+
+        class_embeddings = self.prepare_embeddings(self.class_embeddings)
+        return class_embeddings
+
     def prepare_embeddings(self, class_embeddings):
         if class_embeddings.shape[1] != self.num_classes:
-            class_embeddings = torch.nn.functional.pad(class_embeddings, (0, 0, 0, self.num_classes - class_embeddings.shape[1]), mode='constant', value=0)
+            class_embeddings = np.pad(class_embeddings, ((0, 0), (0, self.num_classes - class_embeddings.shape[1]), (0, 0)), mode='constant')
         
-        return class_embeddings.cpu().numpy().astype(np.float32)
+        return class_embeddings.astype(np.float32)
 
     def letterbox(self, im, new_shape=(640, 640), color=(114, 114, 114), auto=False, scaleFill=False, scaleup=True, stride=32):
         # Resize and pad image while meeting stride-multiple constraints
@@ -421,6 +438,7 @@ def argsparser():
     parser.add_argument('--bmodel', type=str, default='yolov8s_text_world.bmodel', help='path of bmodel')
     parser.add_argument('--clip_bmodel', type=str, default='clip_text_vitb32_bm1684x_f16_1b.bmodel', help='path of clip')
     parser.add_argument('--class_names', nargs='+', default=["person", "car", "dog", "cat"], help='dev id')
+    parser.add_argument('--embedding_cache_dir', type=str, default='', help='dir of the persistent class embedding store, empty means in memory only')
     parser.add_argument('--dev_id', type=int, default=0, help='dev id')
     parser.add_argument('--conf_thresh', type=float, default=0.25, help='confidence threshold')
     parser.add_argument('--nms_thresh', type=float, default=0.7, help='nms threshold')
@@ -63,6 +63,14 @@ class SegFormer(object):
         self.std = [58.395, 57.12, 57.375]
         self.size_divisor=32
 
+        # 输出模式，label/rle时只在需要可视化时保留resize后的图片
+        self.output_mode = args.output_mode
+        self.label_scale = args.label_scale
+        self.vis = args.vis
+        self.keep_resize_imgs = self.output_mode == 'image' or (self.vis and self.label_scale == 'net')
+        self.palette_lut = dp.palette_lut(dp.get_palette(args.palette))
+        self.input_data = np.zeros(self.input_shape, dtype=np.float32)
+
         # 时间计算
         self.preprocess_time = 0.0
         self.inference_time = 0.0
@@ -158,7 +166,9 @@ class SegFormer(object):
 
         """Resize images with ``results['scale']``."""
 
-        self.resize_imgs.append(self._resize_img(results))
+        resize_img = self._resize_img(results)
+        if self.keep_resize_imgs:
+            self.resize_imgs.append(resize_img)
         """Call function to flip bounding boxes, masks, semantic segmentation maps"""
         self._flip(results)
         self._normalize(results)
@@ -218,6 +228,70 @@ class SegFormer(object):
 
         return outputs[0],color_seg_img
 
+    def _unpad_box(self, shape):
+        # top, left, height, width of the image inside the network input, as placed by _resize_img
+        if not self.keep_ratio:
+            return 0, 0, self.net_h, self.net_w
+        r = min(self.net_sacle[0] / shape[1], self.net_sacle[1] / shape[0])
+        new_w, new_h = int(round(shape[1] * r)), int(round(shape[0] * r))
+        top = int(round((self.net_h - new_h) / 2 - 0.1))
+        left = int(round((self.net_w - new_w) / 2 - 0.1))
+        return top, left, new_h, new_w
+
+    def to_label(self, output, shape):
+        """
+        uint8 label map of one image. The classes are reduced at the output resolution of the
+        bmodel, then for label_scale origin the letterbox padding is cropped and only the label
+        map is upsampled to the image size, with nearest neighbour.
+        Args:
+            output: [1, h, w] class map of bmodels exported with argmax, or [num_classes, h, w] scores
+            shape: shape of the original image
+        """
+        if output.ndim == 2:
+            output = output[None]
+        if output.shape[0] == 1:
+            label = output[0].astype(np.uint8)
+        else:
+            label = output.argmax(axis=0).astype(np.uint8)
+        if self.label_scale == 'origin':
+            top, left, h, w = self._unpad_box(shape)
+            sy, sx = label.shape[0] / self.net_h, label.shape[1] / self.net_w
+            label = label[int(round(top * sy)):int(round((top + h) * sy)), int(round(left * sx)):int(round((left + w) * sx))]
+            label = cv2.resize(label, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+        return label
+
+    def segment(self, img_list):
+        """
+        Label maps of a batch for the label and rle output modes, nothing is kept across calls.
+        Returns:
+            labels: uint8 label map per image
+            vis_imgs: palette blended images when vis is set, otherwise empty
+        """
+        img_num = len(img_list)
+        for i, ori_img in enumerate(img_list):
+            start_time = time.time()
+            self.input_data[i] = self.preprocess(ori_img)
+            self.preprocess_time += time.time() - start_time
+
+        start_time = time.time()
+        outputs = self.net.process(self.graph_name, {self.input_name: self.input_data})
+        output = list(outputs.values())[0]
+        self.inference_time += time.time() - start_time
+
+        start_time = time.time()
+        labels = []
+        vis_imgs = []
+        for i in range(img_num):
+            label = self.to_label(output[i], img_list[i].shape)
+            labels.append(label)
+            if self.vis:
+                # 调色板通过查找表着色
+                base_img = img_list[i] if self.label_scale == 'origin' else self.resize_imgs[i]
+                vis_imgs.append(cv2.addWeighted(base_img, 0.5, self.palette_lut[label], 0.5, 0))
+        self.resize_imgs = []
+        self.postprocess_time += time.time() - start_time
+        return labels, vis_imgs
+
     def get_time(self):
         return self.dt
     
@@ -237,7 +311,131 @@ data = dict(
         img_suffix='_leftImg8bit.png',
         seg_map_suffix='_gtFine_labelTrainIds.png')
 
+def batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_images(segformer, image_files):
+    for filepath in image_files:
+        start_time = time.time()
+        src_img = cv2.imdecode(np.fromfile(filepath, dtype=np.uint8), -1)
+        if src_img is None:
+            logging.error("{} imdecode is None.".format(filepath))
+            continue
+        if len(src_img.shape) != 3:
+            src_img = cv2.cvtColor(src_img, cv2.COLOR_GRAY2BGR)
+        segformer.decode_time += time.time() - start_time
+        yield filepath, src_img
+
+
+def read_video(segformer, cap):
+    frame_id = 0
+    while True:
+        start_time = time.time()
+        ret, frame = cap.read()
+        segformer.decode_time += time.time() - start_time
+        if not ret or frame is None:
+            break
+        frame_id += 1
+        yield frame_id, frame
+
+
+def main_label(args):
+    """
+    label/rle output modes: the uint8 label maps of every batch are written out (png files, or
+    run-length encoded in the result json) as soon as the batch is done, palette images only with --vis.
+    """
+    output_dir = "python/results"
+    output_img_dir = os.path.join(output_dir, 'images')
+    os.makedirs(output_img_dir, exist_ok=True)
+
+    segformer = SegFormer(args)
+    frame_num = 0
+    if os.path.isdir(args.input):
+        res_dir = "datasets/result_cl"
+        os.makedirs(res_dir, exist_ok=True)
+        data["data_root"]=args.input
+        img_dir = osp.join(data["data_root"], data["img_dir"])
+        ann_dir = osp.join(data["data_root"], data["ann_dir"])
+        image_files = get_image_files_recursive(img_dir)
+
+        result_jsons={}
+        result_jsons["data_root"]=data["data_root"]
+        result_jsons["img_dir"]=img_dir
+        result_jsons["ann_dir"]=ann_dir
+        img_info=[]
+        for batch in batches(read_images(segformer, image_files), segformer.batch_size):
+            labels, vis_imgs = segformer.segment([img for _, img in batch])
+            for i, (filepath, _) in enumerate(batch):
+                filename = os.path.basename(filepath)
+                logging.info("{}, img_file: {}".format(frame_num, filename))
+                frame_num += 1
+                result_json={}
+                if args.output_mode == 'rle':
+                    result_json["res"] = dp.rle_encode(labels[i])
+                else:
+                    res_file = os.path.join(res_dir, os.path.splitext(filename)[0] + '.png')
+                    cv2.imwrite(res_file, labels[i])
+                    result_json["res"] = res_file
+                relative_path = os.path.relpath(filepath, img_dir)
+                result_json["filename"]=relative_path
+                result_json["ann"]={"seg_map":relative_path.replace(data["img_suffix"], data["seg_map_suffix"])}
+                img_info.append(result_json)
+                if args.vis:
+                    cv2.imwrite(os.path.join(output_img_dir, filename), vis_imgs[i])
+        result_jsons["img_info"]=img_info
+        json_name = os.path.split(args.bmodel)[-1] + "_" + os.path.split(args.input.rstrip('/'))[-1] + "_opencv_" + args.output_mode + "_python_result.json"
+        with open(os.path.join(output_dir, json_name), 'w') as jf:
+            json.dump(result_jsons, jf, indent=4, ensure_ascii=False)
+        logging.info("result saved in {}".format(os.path.join(output_dir, json_name)))
+    else:
+        video_output_dir = 'python/results/video'
+        os.makedirs(video_output_dir, exist_ok=True)
+        cap = cv2.VideoCapture()
+        if not cap.open(args.input):
+            raise Exception("can not open the video")
+        # rle results of a video are appended line by line, one json object per frame
+        rle_file = None
+        if args.output_mode == 'rle':
+            rle_name = os.path.splitext(os.path.basename(args.input))[0] + "_rle.jsonl"
+            rle_file = open(os.path.join(video_output_dir, rle_name), 'w')
+        for batch in batches(read_video(segformer, cap), segformer.batch_size):
+            labels, vis_imgs = segformer.segment([frame for _, frame in batch])
+            for i, (frame_id, _) in enumerate(batch):
+                frame_num += 1
+                save_name = os.path.join(video_output_dir, str(frame_id))
+                if rle_file is not None:
+                    rle = dp.rle_encode(labels[i])
+                    rle["frame"] = frame_id
+                    rle_file.write(json.dumps(rle) + "\n")
+                else:
+                    cv2.imwrite(save_name + ".png", labels[i])
+                if args.vis:
+                    cv2.imwrite(save_name + ".jpg", vis_imgs[i])
+        if rle_file is not None:
+            rle_file.close()
+        cap.release()
+        logging.info("result saved in {}".format(video_output_dir))
+
+    frame_num = max(frame_num, 1)
+    logging.info("------------------ Inference Time Info ----------------------")
+    logging.info("decode_time(ms): {:.2f}".format(segformer.decode_time / frame_num * 1000))
+    logging.info("preprocess_time(ms): {:.2f}".format(segformer.preprocess_time / frame_num * 1000))
+    logging.info("inference_time(ms): {:.2f}".format(segformer.inference_time / frame_num * 1000))
+    logging.info("postprocess_time(ms): {:.2f}".format(segformer.postprocess_time / frame_num * 1000))
+
+
 def main(args):
+    if args.output_mode != 'image':
+        main_label(args)
+        return
 # creat save path
     output_dir = "python/results"
     if not os.path.exists(output_dir):
@@ -404,6 +602,9 @@ def argsparser():
         '--palette',
         default='cityscapes',
         help='Color palette used for segmentation map')
+    parser.add_argument('--output_mode', type=str, default='image', choices=['image', 'label', 'rle'], help='image: palette blended images, label: uint8 label maps as png, rle: run-length encoded label maps')
+    parser.add_argument('--label_scale', type=str, default='net', choices=['net', 'origin'], help='size of label maps in label/rle mode, net: network input size, origin: original image size')
+    parser.add_argument('--vis', action='store_true', help='also save palette blended images in label/rle mode')
     args = parser.parse_args()
     return args
 
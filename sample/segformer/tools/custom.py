@@ -125,6 +125,8 @@ def intersect_and_union(pred_label,
     if isinstance(pred_label, str):
         pred_label = cv2.imread(pred_label,cv2.IMREAD_GRAYSCALE)
         # pred_label=np.load(pred_label)
+    elif isinstance(pred_label, dict):
+        pred_label = rle_decode(pred_label)
 
     if isinstance(label, str):
         label = imread_to_array(label, flag='unchanged', backend='pillow')
@@ -278,6 +280,29 @@ def palette_bmcv(result, palette=None):
     color_seg = color_seg[..., ::-1]
     return color_seg
 
+def palette_lut(palette=None):
+    """BGR color of every uint8 label, lut[label_map] is the color image of a label map."""
+    if palette is None:
+        palette = PALETTE
+    palette = np.array(palette, dtype=np.uint8)
+    assert len(palette.shape) == 2 and palette.shape[1] == 3
+    lut = np.zeros((256, 3), dtype=np.uint8)
+    lut[:palette.shape[0]] = palette[:, ::-1]
+    return lut
+
+def rle_encode(label_map):
+    """Run-length encoding of a label map in row-major order."""
+    flat = label_map.reshape(-1)
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    counts = np.diff(np.append(starts, flat.size))
+    return {"size": list(label_map.shape[:2]),
+            "values": flat[starts].tolist(),
+            "counts": counts.tolist()}
+
+def rle_decode(rle):
+    return np.repeat(np.array(rle["values"], dtype=np.uint8),
+                     rle["counts"]).reshape(rle["size"])
+
 def save_and_show_palette_img(palette_img,fig_size=(15, 10),
                     win_name='',
                     show=False,